@@ -7,8 +7,11 @@ from __future__ import annotations
 
 from typing import Optional, List, Dict, Any
 import psycopg2
+from psycopg2.extras import execute_values
 from datetime import datetime
 
+from backend.prepared import execute_prepared
+
 
 def assign_card_to_rep(
     conn: Any,
@@ -73,6 +76,86 @@ def assign_card_to_rep(
             return False
 
 
+def assign_cards_bulk(
+    conn: Any,
+    assignments: List[Dict[str, Any]],
+    assigned_by: str,
+) -> int:
+    """
+    Assign many cards at once. Each item is {"card_id", "user_id", "notes"?}.
+    Returns the number of (card_id, user_id) pairs written.
+    
+    Same upsert and handoff rules as assign_card_to_rep(), but the current owners are
+    read in one query and all rows are written by one INSERT ... VALUES (...), (...).
+    Markov reset + handoff logging still runs per card, only for cards whose rep changes.
+    """
+    from backend.handoffs import (
+        get_conversation_state,
+        reset_markov_for_card,
+        log_handoff
+    )
+    
+    # Last entry wins for a repeated pair (one VALUES list cannot upsert a row twice)
+    rows_by_pair = {}
+    for item in assignments:
+        rows_by_pair[(item["card_id"], item["user_id"])] = (
+            item["card_id"], item["user_id"], assigned_by, item.get("notes"), "assigned"
+        )
+    if not rows_by_pair:
+        return 0
+    rows = list(rows_by_pair.values())
+    card_ids = list({row[0] for row in rows})
+    
+    with conn.cursor() as cur:
+        # Current owner per card (same row get_card_assignment() returns)
+        cur.execute("""
+            SELECT DISTINCT ON (card_id) card_id, user_id
+            FROM card_assignments
+            WHERE card_id = ANY(%s)
+            ORDER BY card_id, assigned_at DESC
+        """, (card_ids,))
+        from_reps = dict(cur.fetchall())
+        
+        # A card listed for several reps hands off to the last one
+        to_reps = {row[0]: row[1] for row in rows}
+        handoffs = [
+            (card_id, from_reps[card_id], to_rep)
+            for card_id, to_rep in to_reps.items()
+            if from_reps.get(card_id) and from_reps[card_id] != to_rep
+        ]
+        states_before = {card_id: get_conversation_state(conn, card_id) for card_id, _, _ in handoffs}
+        
+        execute_values(cur, """
+            INSERT INTO card_assignments (card_id, user_id, assigned_by, notes, status)
+            VALUES %s
+            ON CONFLICT (card_id, user_id) 
+            DO UPDATE SET
+                assigned_by = EXCLUDED.assigned_by,
+                assigned_at = NOW(),
+                notes = COALESCE(EXCLUDED.notes, card_assignments.notes),
+                status = CASE 
+                    WHEN card_assignments.status = 'closed' THEN 'closed'
+                    WHEN card_assignments.status = 'lost' THEN 'lost'
+                    ELSE 'assigned'
+                END
+        """, rows, page_size=500)
+    
+    for card_id, from_rep, to_rep in handoffs:
+        reset_markov_for_card(conn, card_id, to_rep, 'rep_reassign', assigned_by)
+        log_handoff(
+            conn=conn,
+            card_id=card_id,
+            from_rep=from_rep,
+            to_rep=to_rep,
+            reason='rep_reassign',
+            state_before=states_before[card_id],
+            state_after='initial_outreach',
+            assigned_by=assigned_by
+        )
+    
+    return len(rows)
+
+
 def get_rep_assigned_cards(
     conn: Any,
     user_id: str,
@@ -97,20 +180,22 @@ def get_rep_assigned_cards(
             ca.assigned_at, ca.status as assignment_status, ca.notes, ca.assigned_by
         FROM card_assignments ca
         INNER JOIN cards c ON ca.card_id = c.id
-        WHERE ca.user_id = %s
+        WHERE ca.user_id = $1
     """
     params = [user_id]
+    name = "assignments_rep_cards"
     
     if status:
-        query += " AND ca.status = %s"
+        query += " AND ca.status = $2"
         params.append(status)
+        name = "assignments_rep_cards_by_status"
     
     query += " ORDER BY ca.assigned_at DESC"
     
     print(f"[ASSIGNMENTS] Executing query: {query[:100]}... with params: {params}")
     
     with conn.cursor() as cur:
-        cur.execute(query, params)
+        execute_prepared(cur, name, query, params)
         rows = cur.fetchall()
         
         print(f"[ASSIGNMENTS] Query returned {len(rows)} rows for user_id={user_id}")
@@ -151,12 +236,44 @@ def get_rep_assigned_cards(
         return cards
 
 
+def get_authorized_card_ids(
+    conn: Any,
+    user_id: str,
+    card_ids: Optional[List[str]] = None,
+    status: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[str]:
+    """
+    IDs of existing cards assigned to user_id, most recently assigned first, in one query.
+    
+    card_ids restricts the result to those IDs (authorization check for an explicit list);
+    status filters on the assignment status; limit caps the number returned.
+    Same INNER JOIN on cards as get_rep_assigned_cards(), but only the IDs come back.
+    """
+    if not user_id or card_ids == []:
+        return []
+    
+    with conn.cursor() as cur:
+        execute_prepared(cur, "assignments_authorized_card_ids", """
+            SELECT ca.card_id
+            FROM card_assignments ca
+            INNER JOIN cards c ON c.id = ca.card_id
+            WHERE ca.user_id = $1
+              AND ($2::text[] IS NULL OR ca.card_id = ANY($2::text[]))
+              AND ($3::text IS NULL OR ca.status = $3::text)
+            ORDER BY ca.assigned_at DESC
+            LIMIT $4::bigint
+        """, (user_id, list(card_ids) if card_ids is not None else None, status, limit))
+        
+        return [row[0] for row in cur.fetchall()]
+
+
 def unassign_card(conn: Any, card_id: str, user_id: str) -> bool:
     """Unassign a card from a rep."""
     with conn.cursor() as cur:
-        cur.execute("""
+        execute_prepared(cur, "assignments_unassign", """
             DELETE FROM card_assignments
-            WHERE card_id = %s AND user_id = %s
+            WHERE card_id = $1 AND user_id = $2
         """, (card_id, user_id))
         
         return cur.rowcount > 0
@@ -165,12 +282,12 @@ def unassign_card(conn: Any, card_id: str, user_id: str) -> bool:
 def get_card_assignment(conn: Any, card_id: str) -> Optional[Dict[str, Any]]:
     """Get the assignment for a card (if any)."""
     with conn.cursor() as cur:
-        cur.execute("""
+        execute_prepared(cur, "assignments_by_card", """
             SELECT ca.card_id, ca.user_id, ca.assigned_at, ca.assigned_by,
                    ca.status, ca.notes, u.username
             FROM card_assignments ca
             JOIN users u ON ca.user_id = u.id
-            WHERE ca.card_id = %s
+            WHERE ca.card_id = $1
             ORDER BY ca.assigned_at DESC
             LIMIT 1
         """, (card_id,))
@@ -193,7 +310,9 @@ def get_card_assignment(conn: Any, card_id: str) -> Optional[Dict[str, Any]]:
 # Export get_card_assignment for use in handoffs module
 __all__ = [
     'assign_card_to_rep',
+    'assign_cards_bulk',
     'get_rep_assigned_cards',
+    'get_authorized_card_ids',
     'unassign_card',
     'get_card_assignment',
     'update_assignment_status',
@@ -7,9 +7,12 @@ from __future__ import annotations
 
 import secrets
 import hashlib
+from dataclasses import dataclass
 from typing import Optional, Dict, Any
 import psycopg2
 
+from backend.prepared import execute_prepared
+
 
 def generate_api_token() -> str:
     """Generate a secure random API token."""
@@ -26,78 +29,101 @@ def verify_token(token: str, hashed: str) -> bool:
     return hash_token(token) == hashed
 
 
-def get_user_by_token(conn: Any, token: str) -> Optional[Dict[str, Any]]:
+_USER_COLUMNS = """
+    id, username, role, twilio_phone_number, twilio_account_sid,
+    twilio_auth_token, created_at, updated_at, is_active
+"""
+
+
+def _user_from_row(row: Any) -> Dict[str, Any]:
+    return {
+        "id": row[0],
+        "username": row[1],
+        "role": row[2],
+        "twilio_phone_number": row[3],
+        "twilio_account_sid": row[4],
+        "twilio_auth_token": row[5],
+        "created_at": row[6],
+        "updated_at": row[7],
+        "is_active": row[8],
+    }
+
+
+@dataclass(frozen=True, slots=True)
+class AuthUser:
+    """
+    Authenticated user, as returned by get_user_by_token().
+    
+    Fields follow _USER_COLUMNS order. Frozen so one instance can be shared through the
+    token cache; `user["id"]` and `user.get("role")` still work for dict-style callers.
+    """
+    id: str
+    username: str
+    role: str
+    twilio_phone_number: Optional[str]
+    twilio_account_sid: Optional[str]
+    twilio_auth_token: Optional[str]
+    created_at: Any
+    updated_at: Any
+    is_active: bool
+    
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+
+def get_user_by_token(conn: Any, token: str, hashed_token: Optional[str] = None) -> Optional[AuthUser]:
     """
-    Lookup user by API token. Returns user dict or None.
+    Lookup user by API token. Returns an AuthUser or None.
     
     Token matching strategy:
     - Owner/Admin tokens: Hashed and stored in api_token column
     - Rep tokens: Stored in plaintext in api_token_plaintext column
     - We check both to support both token types
+    
+    The hash is computed here (or passed in as hashed_token by callers that already
+    have it) and matched with a single probe of the unique users.api_token index;
+    tokens are never compared row by row.
     """
     if not token:
         return None
     
-    hashed_token = hash_token(token)
+    if hashed_token is None:
+        hashed_token = hash_token(token)
     
     with conn.cursor() as cur:
         # First, try to match against hashed token (for owner/admin)
-        cur.execute("""
-            SELECT id, username, role, twilio_phone_number, twilio_account_sid, 
-                   twilio_auth_token, created_at, updated_at, is_active
+        execute_prepared(cur, "auth_user_by_token_hash", f"""
+            SELECT {_USER_COLUMNS}
             FROM users
-            WHERE api_token = %s AND is_active = TRUE
+            WHERE api_token = $1 AND is_active = TRUE
+            LIMIT 1
         """, (hashed_token,))
         
         row = cur.fetchone()
         if row:
-            return {
-                "id": row[0],
-                "username": row[1],
-                "role": row[2],
-                "twilio_phone_number": row[3],
-                "twilio_account_sid": row[4],
-                "twilio_auth_token": row[5],
-                "created_at": row[6],
-                "updated_at": row[7],
-                "is_active": row[8],
-            }
+            return AuthUser(*row)
         
-        # If no match on hashed token, try plaintext token (for reps)
-        # Check if api_token_plaintext column exists first
+        # If no match on hashed token, try plaintext token (for reps).
+        # api_token_plaintext comes from migration 004; tolerate schemas that predate it.
         try:
-            cur.execute("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = 'public'
-                AND table_name = 'users'
-                AND column_name = 'api_token_plaintext'
-            """)
-            column_exists = cur.fetchone() is not None
-        except Exception:
-            column_exists = False
-        
-        if column_exists:
-            cur.execute("""
-                SELECT id, username, role, twilio_phone_number, twilio_account_sid, 
-                       twilio_auth_token, created_at, updated_at, is_active
+            execute_prepared(cur, "auth_user_by_token_plaintext", f"""
+                SELECT {_USER_COLUMNS}
                 FROM users
-                WHERE api_token_plaintext = %s AND is_active = TRUE
+                WHERE api_token_plaintext = $1 AND is_active = TRUE
+                LIMIT 1
             """, (token,))
-            
-            row = cur.fetchone()
-            if row:
-                return {
-                    "id": row[0],
-                    "username": row[1],
-                    "role": row[2],
-                    "twilio_phone_number": row[3],
-                    "twilio_account_sid": row[4],
-                    "twilio_auth_token": row[5],
-                    "created_at": row[6],
-                    "updated_at": row[7],
-                    "is_active": row[8],
-                }
+        except psycopg2.errors.UndefinedColumn:
+            return None
+        
+        row = cur.fetchone()
+        if row:
+            return AuthUser(*row)
         
         # No match found
         return None
@@ -223,28 +249,17 @@ def update_user_twilio_config(
 def get_user(conn: Any, user_id: str) -> Optional[Dict[str, Any]]:
     """Get user by ID."""
     with conn.cursor() as cur:
-        cur.execute("""
-            SELECT id, username, role, twilio_phone_number, twilio_account_sid,
-                   twilio_auth_token, created_at, updated_at, is_active
+        execute_prepared(cur, "auth_user_by_id", f"""
+            SELECT {_USER_COLUMNS}
             FROM users
-            WHERE id = %s
+            WHERE id = $1
         """, (user_id,))
         
         row = cur.fetchone()
         if not row:
             return None
         
-        return {
-            "id": row[0],
-            "username": row[1],
-            "role": row[2],
-            "twilio_phone_number": row[3],
-            "twilio_account_sid": row[4],
-            "twilio_auth_token": row[5],
-            "created_at": row[6],
-            "updated_at": row[7],
-            "is_active": row[8],
-        }
+        return _user_from_row(row)
 
 
 def list_users(conn: Any, include_inactive: bool = False) -> list[Dict[str, Any]]:
@@ -278,15 +293,19 @@ def list_users(conn: Any, include_inactive: bool = False) -> list[Dict[str, Any]
             FROM users
         """
     
-    params = []
-    
     if not include_inactive:
         query += " WHERE is_active = TRUE"
     
     query += " ORDER BY created_at DESC"
     
+    # One prepared statement per query variant (schema x active filter)
+    name = "auth_list_users_{}_{}".format(
+        "plaintext" if column_exists else "legacy",
+        "all" if include_inactive else "active",
+    )
+    
     with conn.cursor() as cur:
-        cur.execute(query, params)
+        execute_prepared(cur, name, query)
         
         users = []
         for row in cur.fetchall():
@@ -313,25 +332,21 @@ def delete_user(conn: Any, user_id: str) -> bool:
     1. Clear rep_user_id in conversations (to avoid foreign key constraint violation)
     2. Delete all card assignments for this user
     3. Delete the user
+    
+    The three statements are sent as one query string: a single round-trip, and
+    PostgreSQL runs a multi-statement query as one implicit transaction.
+    rowcount is that of the last statement (the user DELETE).
     """
     with conn.cursor() as cur:
-        # Step 1: Clear rep_user_id in conversations that reference this user
-        # This prevents foreign key constraint violation
         cur.execute("""
             UPDATE conversations
             SET rep_user_id = NULL, updated_at = NOW()
-            WHERE rep_user_id = %s
-        """, (user_id,))
-        
-        # Step 2: Delete all card assignments for this user
-        cur.execute("""
-            DELETE FROM card_assignments WHERE user_id = %s
-        """, (user_id,))
-        
-        # Step 3: Delete the user
-        cur.execute("""
-            DELETE FROM users WHERE id = %s
-        """, (user_id,))
+            WHERE rep_user_id = %(user_id)s;
+            
+            DELETE FROM card_assignments WHERE user_id = %(user_id)s;
+            
+            DELETE FROM users WHERE id = %(user_id)s;
+        """, {"user_id": user_id})
         
         return cur.rowcount > 0
 
@@ -11,12 +11,15 @@ Runs outbound blasts for a specific set of card IDs by:
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Callable, ContextManager, Dict, List, Tuple, Optional
 from datetime import datetime
 from pathlib import Path
 import json
 import logging
+import time
+import traceback
 
+import orjson
 import psycopg2
 
 # ✅ CRITICAL: Define logger at module level (required for all logger.error() calls)
@@ -56,6 +59,37 @@ if _RAW_TWILIO_PHONE:
 else:
     TWILIO_PHONE_E164 = ""
 
+# Verbose stdout banners for send failures (the logger record already carries the traceback)
+BLAST_DEBUG = os.getenv("BLAST_DEBUG", "").lower() in ("1", "true", "yes")
+
+# Resolved, created and opened once, so per-send debug traces do no path, mkdir or open work.
+# O_APPEND keeps each single-line os.write() whole when blasts run on several threads.
+_DEBUG_LOG_PATH = PROJECT_ROOT / ".cursor" / "debug.log"
+try:
+    _DEBUG_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    _DEBUG_LOG_FD: Optional[int] = os.open(_DEBUG_LOG_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+except OSError:
+    _DEBUG_LOG_FD = None
+
+
+def _write_debug_log(location: str, message: str, data: Dict[str, Any], hypothesis_id: str) -> None:
+    """Append one debug trace line to .cursor/debug.log (best effort)."""
+    if _DEBUG_LOG_FD is None:
+        return
+    try:
+        # orjson returns the newline-terminated UTF-8 bytes directly - no str concat or encode step
+        os.write(_DEBUG_LOG_FD, orjson.dumps({
+            "sessionId": "debug-session",
+            "runId": "run1",
+            "timestamp": time.time_ns() // 1_000_000,
+            "location": location,
+            "message": message,
+            "data": data,
+            "hypothesisId": hypothesis_id
+        }, option=orjson.OPT_APPEND_NEWLINE, default=str))
+    except Exception as e:
+        print(f"[DEBUG_LOG] Failed to write debug log: {e}", flush=True)
+
 
 def _fetch_cards_by_ids(conn: Any, card_ids: List[str]) -> List[Dict[str, Any]]:
     """Fetch person cards by IDs from cards table."""
@@ -80,10 +114,8 @@ def _fetch_cards_by_ids(conn: Any, card_ids: List[str]) -> List[Dict[str, Any]]:
         card_data = row[2]
         # card_data is JSONB; ensure dict
         if isinstance(card_data, str):
-            import json as _json
-
             try:
-                card_data = _json.loads(card_data)
+                card_data = json.loads(card_data)
             except Exception:
                 pass
 
@@ -291,7 +323,7 @@ def _insert_blast_run_row(
 
 
 def run_blast_for_cards(
-    conn: Any,
+    borrow_conn: Callable[[], ContextManager[Any]],
     card_ids: List[str],
     limit: Optional[int],
     owner: str,
@@ -309,7 +341,8 @@ def run_blast_for_cards(
     - Always uses system Twilio credentials from environment variables
     
     Args:
-        conn: Database connection
+        borrow_conn: Returns a context manager yielding a database connection. A connection
+            is borrowed per database step and never held across a Twilio send.
         card_ids: List of card IDs to blast
         limit: Optional limit on number of cards
         owner: Owner identifier
@@ -345,29 +378,30 @@ def run_blast_for_cards(
     from backend.handoffs import resolve_current_rep
     from backend.assignments import assign_card_to_rep, unassign_card
     
-    for card_id in card_ids:
-        current_rep = resolve_current_rep(conn, card_id)
+    with borrow_conn() as conn:
+        for card_id in card_ids:
+            current_rep = resolve_current_rep(conn, card_id)
         
-        if rep_user_id:
-            # Rep is blasting - claim ownership
-            if current_rep != rep_user_id:
-                print(f"[BLAST_RUN] 🔄 Blast claim (rep): card {card_id} currently assigned to {current_rep}, claiming for {rep_user_id}", flush=True)
-                assign_card_to_rep(conn, card_id, rep_user_id, rep_user_id, notes="Blast claim - ownership transferred via blast")
-                print(f"[BLAST_RUN] ✅ Card {card_id} reassigned to {rep_user_id} via blast claim", flush=True)
-        else:
-            # Owner is blasting - claim ownership by clearing ALL rep assignments (unconditional)
-            # POLICY A: Owner blast = hard reclaim - delete ALL assignments for this card
-            print(f"[BLAST_RUN] 🔄 Blast claim (owner): clearing ALL assignments for card {card_id}", flush=True)
-            with conn.cursor() as cur:
-                cur.execute("""
-                    DELETE FROM card_assignments
-                    WHERE card_id = %s
-                """, (card_id,))
-                deleted_count = cur.rowcount
-                if deleted_count > 0:
-                    print(f"[BLAST_RUN] ✅ Card {card_id} - deleted {deleted_count} assignment(s) - owner now owns via blast claim", flush=True)
-                else:
-                    print(f"[BLAST_RUN] ✅ Card {card_id} - no assignments to delete (already owner-owned)", flush=True)
+            if rep_user_id:
+                # Rep is blasting - claim ownership
+                if current_rep != rep_user_id:
+                    print(f"[BLAST_RUN] 🔄 Blast claim (rep): card {card_id} currently assigned to {current_rep}, claiming for {rep_user_id}", flush=True)
+                    assign_card_to_rep(conn, card_id, rep_user_id, rep_user_id, notes="Blast claim - ownership transferred via blast")
+                    print(f"[BLAST_RUN] ✅ Card {card_id} reassigned to {rep_user_id} via blast claim", flush=True)
+            else:
+                # Owner is blasting - claim ownership by clearing ALL rep assignments (unconditional)
+                # POLICY A: Owner blast = hard reclaim - delete ALL assignments for this card
+                print(f"[BLAST_RUN] 🔄 Blast claim (owner): clearing ALL assignments for card {card_id}", flush=True)
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        DELETE FROM card_assignments
+                        WHERE card_id = %s
+                    """, (card_id,))
+                    deleted_count = cur.rowcount
+                    if deleted_count > 0:
+                        print(f"[BLAST_RUN] ✅ Card {card_id} - deleted {deleted_count} assignment(s) - owner now owns via blast claim", flush=True)
+                    else:
+                        print(f"[BLAST_RUN] ✅ Card {card_id} - no assignments to delete (already owner-owned)", flush=True)
 
     if not card_ids:
         return {
@@ -380,7 +414,8 @@ def run_blast_for_cards(
 
     # Fetch cards from DB
     print(f"[BLAST_RUN] Fetching {len(card_ids)} cards from database...", flush=True)
-    cards = _fetch_cards_by_ids(conn, card_ids)
+    with borrow_conn() as conn:
+        cards = _fetch_cards_by_ids(conn, card_ids)
     
     # 🔥 STEP 4: Log DB fetch result (THIS is where it's dying)
     resolved_ids = [c["id"] for c in cards] if cards else []
@@ -615,7 +650,7 @@ def run_blast_for_cards(
         message = None
         try:
             # Check for configured initial outreach (rep-specific first, then global)
-            with conn.cursor() as cur:
+            with borrow_conn() as conn, conn.cursor() as cur:
                 if rep_user_id:
                     # Try rep-specific first
                     cur.execute("""
@@ -663,23 +698,12 @@ def run_blast_for_cards(
 
         try:
             # #region agent log - Before send attempt
-            try:
-                import json as _json
-                from pathlib import Path
-                debug_log_path = Path(__file__).resolve().parent.parent / ".cursor" / "debug.log"
-                debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(debug_log_path, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(datetime.utcnow().timestamp() * 1000),
-                        "location": "backend/blast.py:send_attempt:BEFORE",
-                        "message": "About to attempt SMS send",
-                        "data": {"card_id": card_id, "phone": phone, "message_length": len(message), "rep_user_id": rep_user_id},
-                        "hypothesisId": "F"
-                    }) + "\n")
-            except Exception as e:
-                print(f"[DEBUG_LOG] Failed to write debug log: {e}", flush=True)
+            _write_debug_log(
+                "backend/blast.py:send_attempt:BEFORE",
+                "About to attempt SMS send",
+                {"card_id": card_id, "phone": phone, "message_length": len(message), "rep_user_id": rep_user_id},
+                "F",
+            )
             # #endregion
             
             print("=" * 80, flush=True)
@@ -729,15 +753,15 @@ def run_blast_for_cards(
                     exc_info=True,
                     extra={"card_id": card_id, "phone": phone, "error": str(send_error)}
                 )
-                print("=" * 80, flush=True)
-                print(f"[BLAST_SEND_ATTEMPT] ❌ EXCEPTION in send_sms()", flush=True)
-                print("=" * 80, flush=True)
-                print(f"[BLAST_SEND_ATTEMPT] Error type: {type(send_error).__name__}", flush=True)
-                print(f"[BLAST_SEND_ATTEMPT] Error message: {str(send_error)}", flush=True)
-                import traceback
-                print(f"[BLAST_SEND_ATTEMPT] Full traceback:", flush=True)
-                traceback.print_exc()
-                print("=" * 80, flush=True)
+                if BLAST_DEBUG:
+                    print("=" * 80, flush=True)
+                    print(f"[BLAST_SEND_ATTEMPT] ❌ EXCEPTION in send_sms()", flush=True)
+                    print("=" * 80, flush=True)
+                    print(f"[BLAST_SEND_ATTEMPT] Error type: {type(send_error).__name__}", flush=True)
+                    print(f"[BLAST_SEND_ATTEMPT] Error message: {str(send_error)}", flush=True)
+                    print(f"[BLAST_SEND_ATTEMPT] Full traceback:", flush=True)
+                    traceback.print_exc()
+                    print("=" * 80, flush=True)
                 # Skip this card instead of crashing the entire blast
                 skip_card("SEND_ERROR", card_id, phone=phone, error=str(send_error))
                 continue
@@ -746,23 +770,12 @@ def run_blast_for_cards(
             print(f"[BLAST_SEND_ATTEMPT] Response timestamp: {datetime.utcnow().isoformat()}", flush=True)
             
             # #region agent log - After send attempt
-            try:
-                import json as _json
-                from pathlib import Path
-                debug_log_path = Path(__file__).resolve().parent.parent / ".cursor" / "debug.log"
-                debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(debug_log_path, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(datetime.utcnow().timestamp() * 1000),
-                        "location": "backend/blast.py:send_attempt:AFTER",
-                        "message": "SMS send attempt completed",
-                        "data": {"twilio_sid": sms_result.get('sid'), "status": sms_result.get('status'), "error_code": sms_result.get('error_code')},
-                        "hypothesisId": "G"
-                    }) + "\n")
-            except Exception as e:
-                print(f"[DEBUG_LOG] Failed to write debug log: {e}", flush=True)
+            _write_debug_log(
+                "backend/blast.py:send_attempt:AFTER",
+                "SMS send attempt completed",
+                {"twilio_sid": sms_result.get('sid'), "status": sms_result.get('status'), "error_code": sms_result.get('error_code')},
+                "G",
+            )
             # #endregion
             
             print("=" * 80, flush=True)
@@ -818,7 +831,7 @@ def run_blast_for_cards(
             
             # Record conversation row directly into conversations table
             # Also store outbound message in history
-            with conn.cursor() as cur:
+            with borrow_conn() as conn, conn.cursor() as cur:
                 # First, get existing history for this environment
                 try:
                     cur.execute("""
@@ -837,8 +850,7 @@ def run_blast_for_cards(
                 existing_history = []
                 if row and row[0]:
                     try:
-                        import json as _json
-                        existing_history = _json.loads(row[0]) if isinstance(row[0], str) else row[0]
+                        existing_history = json.loads(row[0]) if isinstance(row[0], str) else row[0]
                     except:
                         existing_history = []
                 
@@ -1228,7 +1240,6 @@ def run_blast_for_cards(
             )
         except Exception as e:
             skipped_count += 1
-            import traceback
             error_trace = traceback.format_exc()
             print(
                 f"[BLAST_ERROR] card_id={card_id} phone={phone} error={e}",
@@ -1246,16 +1257,17 @@ def run_blast_for_cards(
 
     # Write blast_run summary row
     try:
-        _insert_blast_run_row(
-            conn=conn,
-            blast_id=blast_id,
-            owner=owner,
-            source=source,
-            limit_count=limit or 0,
-            total_targets=len(cards),
-            sent_count=sent_count,
-            status="completed",
-        )
+        with borrow_conn() as conn:
+            _insert_blast_run_row(
+                conn=conn,
+                blast_id=blast_id,
+                owner=owner,
+                source=source,
+                limit_count=limit or 0,
+                total_targets=len(cards),
+                sent_count=sent_count,
+                status="completed",
+            )
     except psycopg2.Error:
         # Don't fail entire response on logging issues
         pass
@@ -921,6 +921,37 @@ def store_relationships(conn: Any, card: Dict[str, Any]) -> None:
                 """, (card_id, contact_id))
 
 
+def card_from_row(row: tuple) -> Dict[str, Any]:
+    """Build the API card dict from (id, type, card_data, sales_state, owner, created_at, updated_at)."""
+    # Normalize the card_data to ensure it's in 7-field format
+    card_data = row[2] or {}
+    if isinstance(card_data, dict):
+        # Create full card dict for normalization
+        full_card = {
+            "id": row[0],
+            "type": row[1],
+            "sales_state": row[3],
+            "owner": row[4],
+            **card_data
+        }
+        normalized = normalize_card(full_card)
+        # Extract just the card_data portion (exclude system fields)
+        card_data = {
+            k: v for k, v in normalized.items()
+            if k not in ["id", "type", "sales_state", "owner", "vertical", "members", "contacts"]
+        }
+    
+    return {
+        "id": row[0],
+        "type": row[1],
+        "card_data": card_data,
+        "sales_state": row[3],
+        "owner": row[4],
+        "created_at": row[5].isoformat() if row[5] else None,
+        "updated_at": row[6].isoformat() if row[6] else None,
+    }
+
+
 def get_card(conn: Any, card_id: str) -> Optional[Dict[str, Any]]:
     """Get a single card by ID. Normalizes card_data to ensure 7-field format."""
     with conn.cursor() as cur:
@@ -934,33 +965,7 @@ def get_card(conn: Any, card_id: str) -> Optional[Dict[str, Any]]:
         if not row:
             return None
         
-        # Normalize the card_data to ensure it's in 7-field format
-        card_data = row[2] or {}
-        if isinstance(card_data, dict):
-            # Create full card dict for normalization
-            full_card = {
-                "id": row[0],
-                "type": row[1],
-                "sales_state": row[3],
-                "owner": row[4],
-                **card_data
-            }
-            normalized = normalize_card(full_card)
-            # Extract just the card_data portion (exclude system fields)
-            card_data = {
-                k: v for k, v in normalized.items()
-                if k not in ["id", "type", "sales_state", "owner", "vertical", "members", "contacts"]
-            }
-        
-        return {
-            "id": row[0],
-            "type": row[1],
-            "card_data": card_data,
-            "sales_state": row[3],
-            "owner": row[4],
-            "created_at": row[5].isoformat() if row[5] else None,
-            "updated_at": row[6].isoformat() if row[6] else None,
-        }
+        return card_from_row(row)
 
 
 def delete_card(conn: Any, card_id: str, deleted_by: str) -> tuple[bool, Optional[str]]:
@@ -282,6 +282,9 @@ def run_migration() -> Tuple[bool, Optional[str]]:
             print("✅ Migration SQL executed")
         
         # Run additional migrations (always check, migrations use IF NOT EXISTS)
+        # Each file is sent as one multi-statement query, which Postgres runs as a single
+        # implicit transaction, so migrations cannot use CREATE INDEX CONCURRENTLY. Every
+        # file also re-runs on each startup and must stay idempotent and cheap.
         migrations_dir = Path(__file__).resolve().parent / "migrations"
         if migrations_dir.exists():
             migration_files = sorted([f for f in migrations_dir.glob("*.sql")])
@@ -16,7 +16,6 @@ CREATE TABLE IF NOT EXISTS users (
 );
 
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-CREATE INDEX IF NOT EXISTS idx_users_api_token ON users(api_token);
 CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
 
 -- 2. Card assignments table - Track which cards are assigned to which reps
@@ -31,7 +30,6 @@ CREATE TABLE IF NOT EXISTS card_assignments (
     UNIQUE(card_id, user_id)
 );
 
-CREATE INDEX IF NOT EXISTS idx_card_assignments_user_id ON card_assignments(user_id);
 CREATE INDEX IF NOT EXISTS idx_card_assignments_card_id ON card_assignments(card_id);
 CREATE INDEX IF NOT EXISTS idx_card_assignments_status ON card_assignments(status);
 
@@ -0,0 +1,10 @@
+-- Migration 011: Composite index for the merged Markov response lookup
+-- get_markov_response() reads the rep-specific and global rows for a state in one query:
+--   WHERE state_key = $1 AND (user_id = $2 OR user_id IS NULL) ORDER BY user_id NULLS LAST
+-- The partial unique indexes from migration 006 each cover only one side of the OR;
+-- this index serves both branches (and the ordering) with a single index scan.
+
+CREATE INDEX IF NOT EXISTS idx_markov_responses_state_user_id
+ON markov_responses(state_key, user_id NULLS LAST);
+
+COMMENT ON INDEX idx_markov_responses_state_user_id IS 'Lookup index for rep-then-global Markov response resolution: (state_key, user_id NULLS LAST)';
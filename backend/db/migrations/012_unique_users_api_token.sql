@@ -0,0 +1,23 @@
+-- Migration 012: Single unique index for API token lookups
+-- get_user_by_token() hashes the bearer token in Python and probes users.api_token once.
+-- The UNIQUE constraint from migration 002 already provides that index (users_api_token_key);
+-- the plain idx_users_api_token was a duplicate that only added write and storage cost.
+
+DROP INDEX IF EXISTS idx_users_api_token;
+
+-- Tables created before the UNIQUE constraint existed get an equivalent unique index
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = i.indkey[0]
+        WHERE t.relname = 'users'
+        AND i.indisunique
+        AND i.indnatts = 1
+        AND a.attname = 'api_token'
+    ) THEN
+        CREATE UNIQUE INDEX idx_users_api_token_unique ON users(api_token);
+    END IF;
+END $$;
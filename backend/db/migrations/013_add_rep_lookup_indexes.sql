@@ -0,0 +1,14 @@
+-- Migration 013: Indexes for the rep card / lead endpoints
+-- The plain idx_card_assignments_user_id from migration 002 is dropped; the per-rep
+-- covering index that replaces it lives in migration 014.
+-- /rep/leads reads conversations WHERE card_id IS NOT NULL AND last_inbound_at IS NOT NULL
+-- ORDER BY last_inbound_at DESC; the partial index matches that predicate and order.
+-- conversations(card_id) for the join is already covered by idx_conversations_card_id (schema.sql).
+
+DROP INDEX IF EXISTS idx_card_assignments_user_id;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_leads
+ON conversations(last_inbound_at DESC)
+WHERE card_id IS NOT NULL AND last_inbound_at IS NOT NULL;
+
+COMMENT ON INDEX idx_conversations_leads IS 'Partial index for lead listings: conversations with a card and at least one inbound message';
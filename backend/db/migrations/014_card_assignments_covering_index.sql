@@ -0,0 +1,9 @@
+-- Migration 014: Widen the per-rep card_assignments index to cover assignment metadata
+-- get_authorized_card_ids() and get_rep_assigned_cards() filter on user_id (and optionally
+-- status) and order by assigned_at. Carrying card_id, assigned_at and status in the index
+-- lets the assignment side of those queries run as an index-only scan.
+
+CREATE INDEX IF NOT EXISTS idx_card_assignments_user_covering
+ON card_assignments(user_id) INCLUDE (card_id, assigned_at, status);
+
+COMMENT ON INDEX idx_card_assignments_user_covering IS 'Covering index for per-rep assignment lookups: (user_id) INCLUDE (card_id, assigned_at, status)';
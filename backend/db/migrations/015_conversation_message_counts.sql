@@ -0,0 +1,51 @@
+-- Migration 015: Per-conversation message counters
+-- /rep/stats and /rep/leads used to unnest every history array on every call to count
+-- messages. outbound_count / inbound_count hold those counts on the row instead.
+-- history is rewritten wholesale by several writers (blasts, inbound webhooks, rep sends,
+-- scripts), so the counters are kept in step by a trigger rather than by each writer.
+-- Inbound follows the lead listings' rule: direction = 'inbound', or a bare string
+-- (the legacy inbound format appended by the intelligence handler).
+
+-- 1. Recount on every write that touches history (one pass over the new array)
+CREATE OR REPLACE FUNCTION conversations_count_messages()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF jsonb_typeof(NEW.history) = 'array' THEN
+        SELECT COUNT(*) FILTER (WHERE e->>'direction' = 'outbound'),
+               COUNT(*) FILTER (WHERE e->>'direction' = 'inbound' OR jsonb_typeof(e) = 'string')
+        INTO NEW.outbound_count, NEW.inbound_count
+        FROM jsonb_array_elements(NEW.history) e;
+    ELSE
+        NEW.outbound_count := 0;
+        NEW.inbound_count := 0;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_conversations_count_messages ON conversations;
+CREATE TRIGGER trg_conversations_count_messages
+BEFORE INSERT OR UPDATE OF history ON conversations
+FOR EACH ROW EXECUTE PROCEDURE conversations_count_messages();
+
+-- 2. Columns, backfilled only when first added (migrations re-run on every startup).
+-- The backfill rewrites history onto itself so the trigger above does the counting:
+-- rows are keyed by (phone, environment_id), and this keeps one counting rule per row.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public'
+        AND table_name = 'conversations'
+        AND column_name = 'outbound_count'
+    ) THEN
+        ALTER TABLE conversations
+        ADD COLUMN outbound_count INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN inbound_count INTEGER NOT NULL DEFAULT 0;
+
+        UPDATE conversations SET history = history WHERE jsonb_typeof(history) = 'array';
+    END IF;
+END $$;
+
+COMMENT ON COLUMN conversations.outbound_count IS 'Outbound messages in history (maintained by trg_conversations_count_messages)';
+COMMENT ON COLUMN conversations.inbound_count IS 'Inbound messages in history (maintained by trg_conversations_count_messages)';
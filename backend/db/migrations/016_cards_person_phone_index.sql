@@ -0,0 +1,10 @@
+-- Migration 016: Expression index for person-card lookups by phone
+-- /rep/messages/send resolves a bare phone number to a card with
+-- card_data->>'phone' = $phone AND type = 'person'. The GIN index on card_data only serves
+-- containment (@>) queries, so without this the lookup scans every card.
+
+CREATE INDEX IF NOT EXISTS idx_cards_person_phone
+ON cards ((card_data->>'phone'))
+WHERE type = 'person';
+
+COMMENT ON INDEX idx_cards_person_phone IS 'Partial expression index: person cards by card_data->>''phone''';
@@ -0,0 +1,14 @@
+-- Migration 017: Single "last activity" timestamp for conversations
+-- /rep/stats counts a conversation as active when any of last_inbound_at, last_outbound_at
+-- or updated_at falls inside the window. A stored generated column folds the three into
+-- one value (GREATEST skips NULLs), so the filter is one comparison against one btree.
+-- Adding a stored column rewrites the table once; IF NOT EXISTS makes re-runs no-ops.
+
+ALTER TABLE conversations
+ADD COLUMN IF NOT EXISTS last_activity_at TIMESTAMP
+GENERATED ALWAYS AS (GREATEST(last_inbound_at, last_outbound_at, updated_at)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_last_activity
+ON conversations(last_activity_at DESC);
+
+COMMENT ON COLUMN conversations.last_activity_at IS 'GREATEST(last_inbound_at, last_outbound_at, updated_at), maintained by PostgreSQL';
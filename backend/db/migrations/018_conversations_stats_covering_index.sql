@@ -0,0 +1,13 @@
+-- Migration 018: Covering index for the per-rep /rep/stats conversation pass
+-- messages_received no longer scans history: it is COUNT(*) FILTER (WHERE inbound_count > 0)
+-- over the trigger-maintained counter from migration 015. The remaining cost is the join
+-- from the rep's assignments to conversations by card_id, which fetches each heap row for
+-- a handful of small columns. Carrying those columns in the index lets the rep stats
+-- statement answer the whole conversation pass with an index-only scan.
+
+CREATE INDEX IF NOT EXISTS idx_conversations_card_stats
+ON conversations(card_id)
+INCLUDE (phone, outbound_count, inbound_count, last_inbound_at, last_activity_at)
+WHERE card_id IS NOT NULL;
+
+COMMENT ON INDEX idx_conversations_card_stats IS 'Covering index for /rep/stats: (card_id) INCLUDE (phone, message counters, activity timestamps)';
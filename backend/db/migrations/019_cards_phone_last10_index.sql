@@ -0,0 +1,11 @@
+-- Migration 019: Expression index for person-card lookups by the last 10 phone digits
+-- The inbound handlers link a conversation to a card whatever way the card's phone was
+-- typed (+19843695080, 19843695080, 984-369-5080). The lookup compares the digits-only
+-- last 10 of card_data->>'phone'; this index is on exactly that expression, so it is one
+-- index probe instead of a LIKE '%...' scan over every card.
+
+CREATE INDEX IF NOT EXISTS idx_cards_person_phone_last10
+ON cards ((right(regexp_replace(card_data->>'phone', '\D', '', 'g'), 10)))
+WHERE type = 'person';
+
+COMMENT ON INDEX idx_cards_person_phone_last10 IS 'Partial expression index: person cards by the last 10 digits of card_data->>''phone''';
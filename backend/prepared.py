@@ -0,0 +1,60 @@
+"""
+Server-side prepared statements for hot queries.
+Each statement is PREPAREd once per connection and then run with EXECUTE,
+so PostgreSQL skips parse/plan on every call.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Sequence
+import threading
+import weakref
+import psycopg2
+
+
+# connection -> names already PREPAREd on it (entries vanish with the connection)
+_prepared: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def execute_prepared(cur: Any, name: str, sql: str, params: Sequence[Any] = ()) -> None:
+    """
+    Execute `sql` on `cur` as the prepared statement `name`.
+
+    `sql` uses PostgreSQL positional placeholders ($1, $2, ...), not %s.
+    `name` must be a constant identifier; it is interpolated into the SQL.
+    Intended for autocommit connections (a failed PREPARE must not abort a transaction).
+    """
+    conn = cur.connection
+    with _prepared_lock:
+        names = _prepared.setdefault(conn, set())
+        needs_prepare = name not in names
+
+    if params:
+        placeholders = ", ".join(["%s"] * len(params))
+        execute_sql = f"EXECUTE {name} ({placeholders})"
+    else:
+        execute_sql = f"EXECUTE {name}"
+
+    if needs_prepare:
+        # First use on this connection: PREPARE and EXECUTE go out as one query string,
+        # so the statement costs a single round-trip even the first time
+        prepare_sql = f"PREPARE {name} AS {sql}; "
+        try:
+            if params:
+                # The statement text passes through %-interpolation along with the EXECUTE
+                cur.execute(prepare_sql.replace("%", "%%") + execute_sql, tuple(params))
+            else:
+                cur.execute(prepare_sql + execute_sql)
+        except psycopg2.errors.DuplicatePreparedStatement:
+            # Another thread sharing this connection prepared it first (the batch
+            # stopped at the PREPARE, so the EXECUTE still has to run)
+            cur.execute(execute_sql, tuple(params) if params else None)
+        with _prepared_lock:
+            names.add(name)
+        return
+
+    if params:
+        cur.execute(execute_sql, tuple(params))
+    else:
+        cur.execute(execute_sql)
@@ -14,6 +14,7 @@ from twilio.rest import Client
 
 from backend.auth import get_user
 from backend.cards import get_card
+from backend.prepared import execute_prepared
 
 
 def send_rep_message(
@@ -266,6 +267,27 @@ def switch_conversation_to_rep(
         return True
 
 
+# Unread = inbound messages after the last outbound one (every inbound if nothing was sent).
+# Computed in SQL so conversation listings never pull the history transcript.
+# Expects the conversations table to be aliased as c.
+UNREAD_COUNT_SQL = """
+    (
+        SELECT count(*)
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(c.history) = 'array' THEN c.history ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS m(msg, idx)
+        WHERE m.msg->>'direction' = 'inbound'
+          AND m.idx > COALESCE((
+              SELECT max(o.idx)
+              FROM jsonb_array_elements(
+                  CASE WHEN jsonb_typeof(c.history) = 'array' THEN c.history ELSE '[]'::jsonb END
+              ) WITH ORDINALITY AS o(msg, idx)
+              WHERE o.msg->>'direction' = 'outbound'
+          ), 0)
+    )
+"""
+
+
 def get_rep_conversations(conn: Any, user_id: str) -> List[Dict[str, Any]]:
     """
     Get all conversations for a rep.
@@ -284,42 +306,22 @@ def get_rep_conversations(conn: Any, user_id: str) -> List[Dict[str, Any]]:
         # 🔒 FIX: Only show conversations for assigned cards
         # Filter: card_id IS NOT NULL AND card is assigned to this rep
         # This prevents showing conversations for unassigned cards (like Shiva)
-        cur.execute("""
+        execute_prepared(cur, "rep_conversations_by_user", f"""
             SELECT DISTINCT
                 c.phone, c.card_id, c.state, c.routing_mode, c.rep_phone_number,
                 c.last_outbound_at, c.last_inbound_at, c.created_at, c.updated_at,
-                c.history,
+                {UNREAD_COUNT_SQL} AS unread_count,
                 COALESCE(c.last_inbound_at, c.last_outbound_at, c.updated_at) as sort_date
             FROM conversations c
             INNER JOIN card_assignments ca ON c.card_id = ca.card_id
             WHERE c.card_id IS NOT NULL
-              AND ca.user_id = %s
+              AND ca.user_id = $1
             ORDER BY sort_date DESC NULLS LAST
         """, (user_id,))
         
         conversations = []
         for row in cur.fetchall():
-            history = row[9] or []  # history is at index 9 (sort_date is at index 10, not used in Python)
-            if isinstance(history, str):
-                try:
-                    history = json.loads(history)
-                except:
-                    history = []
-            
-            # Get unread count (messages after last outbound)
-            unread_count = 0
-            if history:
-                last_outbound_idx = -1
-                for i, msg in enumerate(reversed(history)):
-                    if msg.get("direction") == "outbound":
-                        last_outbound_idx = len(history) - 1 - i
-                        break
-                    
-                if last_outbound_idx >= 0:
-                    unread_count = len([m for m in history[last_outbound_idx+1:] if m.get("direction") == "inbound"])
-                else:
-                    unread_count = len([m for m in history if m.get("direction") == "inbound"])
-            
+            # unread_count is at index 9 (sort_date is at index 10, not used in Python)
             # Convert all datetime objects to ISO strings
             conversations.append({
                 "phone": row[0],
@@ -331,7 +333,7 @@ def get_rep_conversations(conn: Any, user_id: str) -> List[Dict[str, Any]]:
                 "last_inbound_at": to_iso(row[6]),
                 "created_at": to_iso(row[7]),
                 "updated_at": to_iso(row[8]),
-                "unread_count": unread_count,
+                "unread_count": row[9],
             })
         
         return conversations
@@ -340,10 +342,10 @@ def get_rep_conversations(conn: Any, user_id: str) -> List[Dict[str, Any]]:
 def get_conversation_messages(conn: Any, phone: str) -> List[Dict[str, Any]]:
     """Get full message history for a phone number."""
     with conn.cursor() as cur:
-        cur.execute("""
+        execute_prepared(cur, "rep_conversation_history", """
             SELECT history
             FROM conversations
-            WHERE phone = %s
+            WHERE phone = $1
         """, (phone,))
         
         row = cur.fetchone()
@@ -368,41 +370,28 @@ def add_message_to_history(
     sender: str,
     twilio_sid: Optional[str] = None,
 ) -> None:
-    """Add a message to conversation history."""
+    """
+    Add a message to conversation history.
+    
+    One UPDATE appends the message server-side, so there is no read of the existing
+    history and no extra round-trip; a missing or non-array history starts a new array.
+    """
+    new_message = {
+        "direction": direction,
+        "text": text,
+        "timestamp": datetime.utcnow().isoformat(),
+        "sender": sender,
+    }
+    if twilio_sid:
+        new_message["twilio_sid"] = twilio_sid
+    
     with conn.cursor() as cur:
-        # Get existing history
-        cur.execute("""
-            SELECT COALESCE(history::text, '[]') as history
-            FROM conversations
-            WHERE phone = %s
-        """, (phone,))
-        
-        row = cur.fetchone()
-        existing_history = []
-        if row and row[0]:
-            try:
-                existing_history = json.loads(row[0]) if isinstance(row[0], str) else row[0]
-            except:
-                existing_history = []
-        
-        # Add new message
-        new_message = {
-            "direction": direction,
-            "text": text,
-            "timestamp": datetime.utcnow().isoformat(),
-            "sender": sender,
-        }
-        if twilio_sid:
-            new_message["twilio_sid"] = twilio_sid
-        
-        updated_history = existing_history + [new_message]
-        
-        # Update conversation
         cur.execute("""
             UPDATE conversations
-            SET history = %s::jsonb,
+            SET history = CASE WHEN jsonb_typeof(history) = 'array' THEN history ELSE '[]'::jsonb END
+                          || jsonb_build_array(%s::jsonb),
                 updated_at = NOW(),
                 last_outbound_at = CASE WHEN %s = 'outbound' THEN NOW() ELSE last_outbound_at END,
                 last_inbound_at = CASE WHEN %s = 'inbound' THEN NOW() ELSE last_inbound_at END
             WHERE phone = %s
-        """, (json.dumps(updated_history), direction, direction, phone))
+        """, (json.dumps(new_message), direction, direction, phone))
@@ -6,27 +6,55 @@ PROJECT_ROOT = Path(__file__).resolve().parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
 # Now we can import everything
-from fastapi import FastAPI, HTTPException, Form, Query, Body
-from fastapi.responses import PlainTextResponse, JSONResponse, Response
+from fastapi import FastAPI, HTTPException, Form, Query, Body, BackgroundTasks
+from fastapi.responses import PlainTextResponse, JSONResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRoute
 from starlette.requests import Request
-from datetime import datetime
-from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from contextlib import asynccontextmanager, contextmanager
+from pydantic import BaseModel
+import asyncio
+import hashlib
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import orjson
 import psycopg2
+from psycopg2.extras import execute_values, RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 import os
 import json
 import logging
-from typing import List, Optional, Dict, Any
+import logging.handlers
+import atexit
+import queue
+import traceback
+from typing import List, Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 from twilio.rest import Client
 
-# Set up logging
+# Set up logging. Records go through a queue to a listener thread that does the
+# stdout write, so logging from the event loop never blocks on the stream.
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# QueueHandler pre-renders the message (and any traceback); the listener adds the prefix
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s'
+    handlers=[_log_queue_handler]
 )
 logger = logging.getLogger(__name__)
 markov_logger = logging.getLogger("markov")
@@ -34,6 +62,39 @@ markov_logger = logging.getLogger("markov")
 # Load environment variables from .env file
 load_dotenv()
 
+# Include Python tracebacks in 500 response bodies (off in production)
+DEBUG_TRACEBACKS = os.getenv("DEBUG_TRACEBACKS", "").lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class TwilioConfig:
+    """System Twilio credentials, read from the environment once at import."""
+    phone_number: str
+    account_sid: str
+    auth_token: str
+    # First required variable that is unset/empty, or None when blasting is possible
+    missing: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> "TwilioConfig":
+        values = {name: os.getenv(name) or "" for name in ("TWILIO_PHONE_NUMBER", "TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN")}
+        return cls(
+            phone_number=values["TWILIO_PHONE_NUMBER"],
+            account_sid=values["TWILIO_ACCOUNT_SID"],
+            auth_token=values["TWILIO_AUTH_TOKEN"],
+            missing=next((name for name, value in values.items() if not value), None),
+        )
+
+
+# Not fatal when incomplete: the lifespan reports missing values and blast endpoints refuse
+TWILIO = TwilioConfig.from_env()
+
+
+def _err(status: int, payload: Dict[str, Any]) -> ORJSONResponse:
+    """Error response serialized directly with orjson (payload must already be JSON-safe)."""
+    return ORJSONResponse(payload, status_code=status)
+
+
 # Now import local modules (using proper package paths)
 from intelligence.handler import handle_inbound
 from intelligence.utils import normalize_phone
@@ -45,6 +106,7 @@ from backend.cards import (
     normalize_card,
     store_card,
     get_card,
+    card_from_row,
     get_card_relationships,
     delete_card,
     get_vertical_info,
@@ -54,19 +116,21 @@ from backend.cards import (
     classify_with_batch_context,
 )
 from backend.query import build_list_query
-from backend.resolve import resolve_target, extract_phones_from_cards
+from backend.resolve import resolve_target
+from backend.prepared import execute_prepared
 from backend.webhook_config import WEBHOOK_CONFIG, WebhookConfig
 from backend.blast import run_blast_for_cards
 from backend.auth import (
-    get_user_by_token, create_user, list_users, update_user_twilio_config, get_user,
+    AuthUser, get_user_by_token, create_user, list_users, update_user_twilio_config, get_user,
     delete_user, regenerate_api_token, clear_twilio_config
 )
 from backend.assignments import (
-    assign_card_to_rep, get_rep_assigned_cards, get_card_assignment,
-    update_assignment_status, list_assignments
+    assign_card_to_rep, assign_cards_bulk, get_rep_assigned_cards, get_authorized_card_ids,
+    get_card_assignment, list_assignments
 )
 from backend.rep_messaging import (
-    send_rep_message, get_rep_conversations, get_conversation_messages
+    send_rep_message, get_rep_conversations, get_conversation_messages, add_message_to_history,
+    UNREAD_COUNT_SQL
 )
 from fastapi import Depends, Header
 from starlette.responses import RedirectResponse
@@ -83,7 +147,6 @@ try:
     print(f"✅ run_migration function: {run_migration}")
 except ImportError as e:
     print(f"❌ Failed to import migration module: {e}")
-    import traceback
     traceback.print_exc()
     # Create a stub function if import fails
     def run_migration():
@@ -107,23 +170,88 @@ def _get_run_blast():
             run_blast = _stub_blast
     return run_blast
 
-# #region agent log - Lifespan definition
 _log_file = Path(__file__).resolve().parent / ".cursor" / "debug.log"
 try:
-    import json as _json
-    with open(_log_file, "a") as f:
-        f.write(_json.dumps({
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "timestamp": int(__import__("time").time() * 1000),
-            "location": f"{__file__}:LIFESPAN_DEFINITION",
-            "message": "Defining lifespan function",
-            "data": {"migration_function": str(run_migration)},
-            "hypothesisId": "A"
-        }) + "\n")
-except:
+    # Created once here; the trace writer below never touches the directory again
+    _log_file.parent.mkdir(parents=True, exist_ok=True)
+except OSError:
     pass
-# #endregion
+
+# Debug traces are queued as raw tuples and a single daemon thread serializes them and
+# appends them to debug.log in batches, so a request never pays for the encode or the write.
+_DEBUG_LOG_Q: "queue.SimpleQueue" = queue.SimpleQueue()
+_DEBUG_LOG_BATCH_BYTES = 64 * 1024
+_DEBUG_LOG_BATCH_SECONDS = 0.05
+_DEBUG_LOG_STOP = object()
+# Tracebacks in traces are cut to their last 8 KiB (the innermost frames) to bound encode cost
+_DEBUG_LOG_TRACEBACK_MAX = 8 * 1024
+
+
+def _encode_debug_entry(entry: Tuple[int, str, str, Dict[str, Any], str]) -> bytes:
+    ts, location, message, data, hypothesis_id = entry
+    # orjson emits the newline-terminated bytes directly - no str concat or encode step
+    return orjson.dumps({
+        "sessionId": "debug-session",
+        "runId": "run1",
+        "timestamp": ts,
+        "location": f"{__file__}:{location}",
+        "message": message,
+        "data": data,
+        "hypothesisId": hypothesis_id
+    }, option=orjson.OPT_APPEND_NEWLINE, default=str)
+
+
+def _drain_debug_log() -> None:
+    """Drain _DEBUG_LOG_Q, issuing one write() per batch of up to 64 KiB / 50 ms."""
+    try:
+        fd = os.open(_log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    except OSError:
+        fd = None
+    stopping = False
+    while not stopping:
+        entry = _DEBUG_LOG_Q.get()
+        buf = bytearray()
+        deadline = time.monotonic() + _DEBUG_LOG_BATCH_SECONDS
+        while True:
+            if entry is _DEBUG_LOG_STOP:
+                stopping = True
+                break
+            try:
+                buf += _encode_debug_entry(entry)
+            except Exception:
+                pass
+            remaining = deadline - time.monotonic()
+            if len(buf) >= _DEBUG_LOG_BATCH_BYTES or remaining <= 0:
+                break
+            try:
+                entry = _DEBUG_LOG_Q.get(timeout=remaining)
+            except queue.Empty:
+                break
+        if buf and fd is not None:
+            try:
+                os.write(fd, buf)
+            except OSError:
+                pass
+    if fd is not None:
+        os.close(fd)
+
+
+_debug_log_thread = threading.Thread(target=_drain_debug_log, name="debug-log-writer", daemon=True)
+_debug_log_thread.start()
+
+
+def _stop_debug_log() -> None:
+    # Flush whatever is still queued before the interpreter exits
+    _DEBUG_LOG_Q.put(_DEBUG_LOG_STOP)
+    _debug_log_thread.join(timeout=1.0)
+
+
+atexit.register(_stop_debug_log)
+
+
+def _agent_log(location: str, message: str, data: Dict[str, Any], hypothesis_id: str) -> None:
+    """Best-effort debug trace. Only enqueues; serialization and I/O happen on the writer thread."""
+    _DEBUG_LOG_Q.put_nowait((time.time_ns() // 1_000_000, location, message, data, hypothesis_id))
 
 # Lifespan context manager for startup/shutdown events
 @asynccontextmanager
@@ -132,50 +260,22 @@ async def lifespan(app: FastAPI):
     Lifespan context manager for FastAPI app.
     Runs database migration on startup.
     """
-    # #region agent log - Lifespan start
-    try:
-        with open(_log_file, "a") as f:
-            f.write(_json.dumps({
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "timestamp": int(__import__("time").time() * 1000),
-                "location": f"{__file__}:LIFESPAN_START",
-                "message": "Lifespan function entered",
-                "data": {"app": str(app)},
-                "hypothesisId": "A"
-            }) + "\n")
-    except:
-        pass
-    # #endregion
+    # run_db uses the loop's default executor. Size it to the pool: more threads than
+    # connections would only queue on acquire_conn() while holding a worker. Blasts hold a
+    # thread through every Twilio send, so they run on _blast_executor instead.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="db")
+    )
     
     print("=" * 60)
     print("🚀 LIFESPAN START: Running database migration...")
     print("=" * 60)
     try:
-        # #region agent log - Before migration call
-        try:
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(__import__("time").time() * 1000),
-                    "location": f"{__file__}:BEFORE_MIGRATION",
-                    "message": "About to call run_migration",
-                    "data": {"migration_function": str(run_migration), "has_database_url": bool(os.getenv("DATABASE_URL"))},
-                    "hypothesisId": "C"
-                }) + "\n")
-        except:
-            pass
-        # #endregion
-        
         print(f"🔍 Calling run_migration function: {run_migration}")
         
         # Run migration synchronously - CRITICAL: This must complete before app serves requests
         # We're in an async context, but migration is sync. We need to run it in a way that blocks startup.
         # Using asyncio.to_thread (Python 3.9+) or run_in_executor to avoid blocking event loop setup
-        import asyncio
-        import sys
-        
         # For Python 3.9+, use to_thread; otherwise use run_in_executor
         if sys.version_info >= (3, 9):
             success, message = await asyncio.to_thread(run_migration)
@@ -183,29 +283,12 @@ async def lifespan(app: FastAPI):
             loop = asyncio.get_event_loop()
             success, message = await loop.run_in_executor(None, run_migration)
         
-        # #region agent log - After migration call
-        try:
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(__import__("time").time() * 1000),
-                    "location": f"{__file__}:AFTER_MIGRATION",
-                    "message": "Migration call completed",
-                    "data": {"success": success, "message": message},
-                    "hypothesisId": "C"
-                }) + "\n")
-        except:
-            pass
-        # #endregion
-        
         if success:
             print(f"✅ Database migration: {message}")
             
             # Verify tables were created
             try:
-                conn = get_conn()
-                with conn.cursor() as verify_cur:
+                with pooled_conn() as conn, conn.cursor() as verify_cur:
                     verify_cur.execute("""
                         SELECT EXISTS (
                             SELECT FROM information_schema.tables 
@@ -228,32 +311,14 @@ async def lifespan(app: FastAPI):
             print("⚠️  Run migration manually via: POST /admin/migrate")
             print("=" * 60)
     except Exception as e:
-        # #region agent log - Migration exception
-        try:
-            import traceback as _tb
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(__import__("time").time() * 1000),
-                    "location": f"{__file__}:MIGRATION_EXCEPTION",
-                    "message": "Exception in migration",
-                    "data": {"error": str(e), "error_type": type(e).__name__, "traceback": _tb.format_exc()},
-                    "hypothesisId": "C"
-                }) + "\n")
-        except:
-            pass
-        # #endregion
         print(f"⚠️  Database migration error (non-fatal): {str(e)}")
-        import traceback
         print(f"📋 Traceback: {traceback.format_exc()}")
         # Continue startup even if migration fails
     # Validate critical Twilio configuration
-    import os
-    twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    twilio_account_sid = TWILIO.account_sid
+    twilio_auth_token = TWILIO.auth_token
     twilio_messaging_service_sid = os.getenv("TWILIO_MESSAGING_SERVICE_SID")
-    twilio_phone_number_raw = os.getenv("TWILIO_PHONE_NUMBER")
+    twilio_phone_number_raw = TWILIO.phone_number
     
     print("=" * 60)
     print("🔍 TWILIO CONFIGURATION CHECK")
@@ -287,29 +352,26 @@ async def lifespan(app: FastAPI):
     print("✅ LIFESPAN STARTUP COMPLETE")
     print("=" * 60)
     
+    # Load the OpenSSL-backed SHA-256 (used for every bearer-token lookup) before the first request
+    hashlib.sha256(b"").digest()
+    
+    # Resolve optional columns once instead of probing them on every request
+    try:
+        await run_db(_detect_conversation_columns)
+    except Exception as e:
+        print(f"⚠️  Could not inspect conversations columns: {e}")
+    
+    start_blast_workers()
+    
     # Yield control to the app
     yield
     
-    # Shutdown logic (if needed in the future)
+    # Shutdown logic
     print("=" * 60)
     print("🛑 LIFESPAN SHUTDOWN")
     print("=" * 60)
-
-# #region agent log - App initialization
-try:
-    with open(_log_file, "a") as f:
-        f.write(_json.dumps({
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "timestamp": int(__import__("time").time() * 1000),
-            "location": f"{__file__}:APP_INIT",
-            "message": "Creating FastAPI app with lifespan",
-            "data": {"lifespan_function": str(lifespan), "has_lifespan": True},
-            "hypothesisId": "B"
-        }) + "\n")
-except:
-    pass
-# #endregion
+    await stop_blast_workers()
+    close_pool()
 
 # Module-level verification before app creation
 print("=" * 60)
@@ -319,13 +381,102 @@ print(f"📦 Lifespan function: {lifespan}")
 print(f"📦 run_migration function: {run_migration}")
 print("=" * 60)
 
-app = FastAPI(lifespan=lifespan)
+# orjson-backed responses: handler results are serialized in C instead of the stdlib json module
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 print("=" * 60)
 print("📦 FASTAPI APP CREATED")
 print(f"📦 App instance: {app}")
 print("=" * 60)
 
+# Routes that reject requests without a valid bearer token before routing. All of them are
+# owner-only, so non-admin users are refused here too.
+# /admin/webhook/* and /admin/migrate* stay open, so only these prefixes are enforced here.
+_AUTH_REQUIRED_PREFIXES = ("/admin/users", "/admin/assignments", "/blast/run", "/blast/jobs")
+
+# Auth failure responses, encoded once and sent straight over ASGI
+_AUTH_FAILURE_BODIES = {
+    "missing": (401, orjson.dumps({"detail": "Missing or invalid Authorization header"})),
+    "invalid": (401, orjson.dumps({"detail": "Invalid API token"})),
+    "forbidden": (403, orjson.dumps({"detail": "Owner/Admin access required"})),
+}
+
+
+async def _send_auth_failure(send, reason: str) -> None:
+    status, body = _AUTH_FAILURE_BODIES[reason]
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AuthMiddleware:
+    """
+    Pure ASGI bearer-token auth.
+    
+    Only requests to _AUTH_REQUIRED_PREFIXES are checked: the Authorization header is
+    resolved and the user (or None for an unknown token) stored in scope["state"]["auth_user"],
+    where get_current_user() picks it up. Without a valid admin token they get a 401/403 sent
+    directly, without the router, exception middleware, or dependency graph running.
+    Other routes pass straight through; their get_current_* dependencies resolve the token.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or not scope["path"].startswith(_AUTH_REQUIRED_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+        
+        auth_header = b""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value
+                break
+        
+        user = None
+        if auth_header.startswith(b"Bearer "):
+            token = auth_header[7:].decode("latin-1")
+            token_sha256 = hashlib.sha256(token.encode()).digest()
+            user = await _get_user_by_token_cached(token, token_sha256)
+            state = scope.setdefault("state", {})
+            state["token_sha256"] = token_sha256
+            state["auth_user"] = user
+        
+        if user is None:
+            client = scope.get("client")
+            should_log = _should_log_auth_failure(client[0] if client else None)
+            if auth_header.startswith(b"Bearer "):
+                reason = "invalid"
+                if should_log:
+                    logger.warning(f"[AUTH] Invalid API token for {scope['path']}")
+            else:
+                reason = "missing"
+                if should_log:
+                    logger.warning("[AUTH] Missing or invalid Authorization header")
+            await _send_auth_failure(send, reason)
+            return
+        if user.role != "admin":
+            logger.info(f"[AUTH] admin access denied for {user.id} (role: {user.role}) - returning 403")
+            await _send_auth_failure(send, "forbidden")
+            return
+        
+        await self.app(scope, receive, send)
+
+
+# Added before CORSMiddleware so CORS wraps it and 401s still carry CORS headers
+app.add_middleware(AuthMiddleware)
+
 # 🔥 CRITICAL: CORS middleware MUST be added immediately after app creation
 # This handles preflight OPTIONS requests that browsers send before POST with Authorization headers
 # POST with Authorization header REQUIRES successful preflight - browser silently blocks if preflight fails
@@ -435,22 +586,18 @@ async def log_requests(request: Request, call_next):
     except Exception as e:
         duration = round((time.time() - start) * 1000, 2)
         
-        # CRITICAL: Enhanced logging for POST /rep/blast exceptions
+        # POST /rep/blast failures carry the traceback, as one log record rather than a
+        # burst of unbuffered stdout writes
         if request.method == "POST" and "/rep/blast" in str(request.url.path):
-            print("=" * 80, flush=True)
-            print(f"[MIDDLEWARE] 🚨 POST /rep/blast EXCEPTION", flush=True)
-            print("=" * 80, flush=True)
-            print(f"[MIDDLEWARE] Error: {str(e)}", flush=True)
-            print(f"[MIDDLEWARE] Error type: {type(e).__name__}", flush=True)
-            import traceback
-            print(f"[MIDDLEWARE] Traceback:", flush=True)
-            traceback.print_exc()
-            print("=" * 80, flush=True)
-        
-        logger.error(
-            f"❌ {request.method} {request.url.path} "
-            f"Exception after {duration}ms: {str(e)}"
-        )
+            logger.exception(
+                "[MIDDLEWARE] 🚨 POST /rep/blast EXCEPTION after %sms: %s: %s",
+                duration, type(e).__name__, e,
+            )
+        else:
+            logger.error(
+                f"❌ {request.method} {request.url.path} "
+                f"Exception after {duration}ms: {str(e)}"
+            )
         raise
 
 # Mount UI directory for static file serving
@@ -465,113 +612,121 @@ print("📦 main.py module loaded")
 print(f"📦 FastAPI app instance: {app}")
 print("=" * 60)
 
-_conn = None
+# Every handler borrows its own connection from this pool (there is no shared module-level
+# connection). Each borrowed connection is used by one thread at a time, so concurrent
+# requests do not serialize on a single connection.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+# Seconds a caller waits for a free connection before giving up with PoolError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool.getconn() raises as soon as every connection is out instead of
+# waiting. Every borrow goes through acquire_conn(), which takes one of these slots first,
+# so callers queue for a connection rather than failing under load.
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                database_url = os.getenv("DATABASE_URL")
+                if not database_url:
+                    raise ValueError("DATABASE_URL environment variable is not set")
+                _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, database_url, connect_timeout=10)
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def acquire_conn():
+    """Borrow an autocommit connection, waiting up to DB_POOL_TIMEOUT for a free one."""
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolError(f"no database connection became free within {DB_POOL_TIMEOUT:g}s")
+    try:
+        conn = get_pool().getconn()
+        if not conn.autocommit:
+            conn.autocommit = True
+    except BaseException:
+        _pool_slots.release()
+        raise
+    return conn
+
 
-def get_conn():
-    global _conn
-    # #region agent log - Get conn entry
+def release_conn(conn) -> None:
+    """Return a connection taken with acquire_conn()."""
     try:
-        import time
-        with open(_log_file, "a") as f:
-            f.write(_json.dumps({
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "timestamp": int(time.time() * 1000),
-                "location": f"{__file__}:GET_CONN_ENTRY",
-                "message": "get_conn called",
-                "data": {"conn_exists": _conn is not None},
-                "hypothesisId": "G"
-            }) + "\n")
-    except:
-        pass
-    # #endregion
-    
-    if _conn is None:
-        # #region agent log - Creating new connection
-        try:
-            import time
-            conn_start = time.time()
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(time.time() * 1000),
-                    "location": f"{__file__}:CREATING_CONN",
-                    "message": "Creating new database connection",
-                    "data": {"has_database_url": bool(os.getenv("DATABASE_URL"))},
-                    "hypothesisId": "G"
-                }) + "\n")
-        except:
-            pass
-        # #endregion
-        
-        database_url = os.getenv("DATABASE_URL")
-        if not database_url:
-            raise ValueError("DATABASE_URL environment variable is not set")
-        
-        try:
-            _conn = psycopg2.connect(database_url, connect_timeout=10)
-            _conn.autocommit = True
-            
-            # #region agent log - Connection created
-            try:
-                import time
-                conn_duration = time.time() - conn_start
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:CONN_CREATED",
-                        "message": "Database connection created",
-                        "data": {"duration_ms": int(conn_duration * 1000)},
-                        "hypothesisId": "G"
-                    }) + "\n")
-            except:
-                pass
-            # #endregion
-        except Exception as conn_e:
-            # #region agent log - Connection error
-            try:
-                import time
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:CONN_ERROR",
-                        "message": "Database connection failed",
-                        "data": {"error": str(conn_e), "error_type": type(conn_e).__name__},
-                        "hypothesisId": "G"
-                    }) + "\n")
-            except:
-                pass
-            # #endregion
-            raise
-    
-    # #region agent log - Returning connection
+        # Discard connections that died mid-request instead of handing them out again
+        get_pool().putconn(conn, close=bool(conn.closed))
+    finally:
+        _pool_slots.release()
+
+
+@contextmanager
+def pooled_conn():
+    """Borrow an autocommit connection from the pool."""
+    conn = acquire_conn()
     try:
-        import time
-        with open(_log_file, "a") as f:
-            f.write(_json.dumps({
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "timestamp": int(time.time() * 1000),
-                "location": f"{__file__}:RETURNING_CONN",
-                "message": "Returning database connection",
-                "data": {},
-                "hypothesisId": "G"
-            }) + "\n")
-    except:
-        pass
-    # #endregion
-    
-    return _conn
+        yield conn
+    finally:
+        release_conn(conn)
 
 
-@app.post("/events/outbound")
-async def outbound(event: dict):
-    conn = get_conn()
+async def run_db(fn, *args, **kwargs):
+    """Run fn(conn, *args, **kwargs) on a pooled connection without blocking the event loop."""
+    def _call():
+        with pooled_conn() as conn:
+            return fn(conn, *args, **kwargs)
+    return await asyncio.to_thread(_call)
+
+
+def db_conn():
+    """FastAPI dependency: a pooled autocommit connection held for the rest of the request."""
+    try:
+        conn = acquire_conn()
+    except Exception as e:
+        logger.error("[DB] Could not borrow a pooled connection: %s", e)
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    try:
+        yield conn
+    finally:
+        release_conn(conn)
+
+
+def iter_rows_server_side(conn: Any, query: str, params: Any = None, itersize: int = 1000, cursor_factory: Any = None):
+    """
+    Yield the rows of `query` through a named (server-side) cursor, fetching `itersize` rows
+    per round-trip, so large listings are never buffered whole on the client side.
+    Named cursors need a transaction: this opens a read-only one on the (autocommit) pooled
+    connection and puts it back in autocommit mode when the iteration finishes.
+    Pass cursor_factory=RealDictCursor to get rows keyed by column name.
+    """
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION READ ONLY")
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=cursor_factory) as cur:
+            cur.itersize = itersize
+            cur.execute(query, params)
+            yield from cur
+    finally:
+        if not conn.closed:
+            conn.rollback()
+            conn.autocommit = True
+
+
+def _record_outbound(conn: Any, event: Dict[str, Any]) -> None:
+    """Upsert the conversation row for one outbound event."""
     # Normalize phone number for consistent storage
     phone = normalize_phone(event["phone"])
     contact_id = event.get("contact_id")
@@ -597,17 +752,62 @@ async def outbound(event: dict):
             event.get("source_batch_id"),
             datetime.utcnow()
         ))
+
+
+@app.post("/events/outbound")
+async def outbound(event: dict):
+    await run_db(_record_outbound, event)
     return {"ok": True}
 
 
-@app.post("/events/inbound")
-async def inbound(event: dict):
-    # 🔥 ROUTE DETECTION: Log which route is handling the request
-    logger.error(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound (NOT the canonical inbound handler)")
-    print(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound (NOT the canonical inbound handler)", flush=True)
-    conn = get_conn()
-    # Normalize phone number for consistent matching
-    phone = normalize_phone(event["phone"])
+def _outbound_upsert_batch(conn, events: List[Dict[str, Any]]) -> None:
+    """
+    Record many outbound events with one INSERT ... ON CONFLICT statement.
+    Same row semantics as /events/outbound; later events for a phone win.
+    """
+    now = datetime.utcnow()
+    rows = {}
+    for event in events:
+        phone = normalize_phone(event["phone"])
+        contact_id = event.get("contact_id")
+        # Keyed by phone: one statement cannot update the same conflicting row twice
+        rows[phone] = (
+            phone,
+            contact_id,
+            event.get("card_id") or contact_id,
+            event["owner"],
+            event.get("source_batch_id"),
+            now
+        )
+    
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO conversations
+            (phone, contact_id, card_id, owner, state, source_batch_id, last_outbound_at)
+            VALUES %s
+            ON CONFLICT (phone)
+            DO UPDATE SET
+              last_outbound_at = EXCLUDED.last_outbound_at,
+              owner = EXCLUDED.owner,
+              state = 'awaiting_response',
+              source_batch_id = EXCLUDED.source_batch_id,
+              card_id = COALESCE(EXCLUDED.card_id, conversations.card_id);
+        """, list(rows.values()), template="(%s, %s, %s, %s, 'awaiting_response', %s, %s)")
+
+
+async def outbound_batch(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Record outbound events in a single DB round-trip.
+    Returns one result dict per event, in order.
+    """
+    if len(events) == 1:
+        return [await outbound(events[0])]
+    await run_db(_outbound_upsert_batch, events)
+    return [{"ok": True} for _ in events]
+
+
+def _record_inbound(conn: Any, phone: str) -> None:
+    """Mark the conversation for `phone` as replied."""
     with conn.cursor() as cur:
         cur.execute("""
             UPDATE conversations
@@ -618,21 +818,91 @@ async def inbound(event: dict):
             datetime.utcnow(),
             phone
         ))
+
+
+@app.post("/events/inbound")
+async def inbound(event: dict):
+    # 🔥 ROUTE DETECTION: Log which route is handling the request
+    logger.error(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound (NOT the canonical inbound handler)")
+    print(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound (NOT the canonical inbound handler)", flush=True)
+    # Normalize phone number for consistent matching
+    phone = normalize_phone(event["phone"])
+    await run_db(_record_inbound, phone)
     return {"ok": True}
 
 
-@app.post("/events/inbound_intelligent")
-async def inbound_intelligent(event: dict):
+@lru_cache(maxsize=None)
+def _inbound_conversation_sql(has_environment_id: bool, has_history: bool) -> str:
     """
-    Intelligence-aware inbound handler.
-    Fetches conversation, computes next state using Markov logic,
-    and updates the database.
-    Auto-creates conversation if it doesn't exist.
+    Lookup-or-create for inbound_intelligent in one statement. Returns the existing row for
+    the phone (the requested environment's first, then the most recent outbound) or a new
+    'initial_outreach' row, as (phone, state, history text, card_id).
+    ON CONFLICT names no target, so it holds for either conversations key (phone, or phone
+    plus environment_id); it only fires when a concurrent insert wins, and yields no row.
+    Parameters: $1 phone, $2 card_id, $3 now, then $4 environment_id when that column exists.
+    """
+    history = "COALESCE(history::text, '[]')" if has_history else "'[]'"
+    env_order = "environment_id = $4 DESC NULLS LAST, " if has_environment_id else ""
+    insert_columns = "phone, card_id, state, last_inbound_at"
+    insert_values = "$1::text, $2::text, 'initial_outreach', $3::timestamp"
+    if has_environment_id:
+        insert_columns += ", environment_id"
+        insert_values += ", $4::text"
+    if has_history:
+        insert_columns += ", history"
+        insert_values += ", '[]'::jsonb"
+    return f"""
+        WITH existing AS (
+            SELECT phone, state, {history} AS history, card_id
+            FROM conversations
+            WHERE phone = $1
+            ORDER BY {env_order}last_outbound_at DESC NULLS LAST, updated_at DESC
+            LIMIT 1
+        ),
+        created AS (
+            INSERT INTO conversations ({insert_columns})
+            SELECT {insert_values}
+            WHERE NOT EXISTS (SELECT 1 FROM existing)
+            ON CONFLICT DO NOTHING
+            RETURNING phone, state, {history} AS history, card_id
+        )
+        SELECT phone, state, history, card_id FROM existing
+        UNION ALL
+        SELECT phone, state, history, card_id FROM created
+    """
+
+
+@lru_cache(maxsize=None)
+def _inbound_update_sql(env_scoped: bool, has_history: bool) -> str:
+    """
+    The single post-Markov UPDATE for inbound_intelligent (state, history, card link).
+    Parameters: $1 state, $2 now, $3 card_id, $4 phone, then history and environment_id
+    (in that order) when included.
+    """
+    n = 4
+    history = ""
+    if has_history:
+        n += 1
+        history = f"history = ${n}::jsonb,"
+    env_filter = ""
+    if env_scoped:
+        n += 1
+        env_filter = f" AND environment_id = ${n}"
+    return f"""
+        UPDATE conversations
+        SET state = $1,
+            last_inbound_at = $2::timestamp,
+            {history}
+            card_id = COALESCE($3::text, card_id)
+        WHERE phone = $4{env_filter}
+    """
+
+
+def _process_inbound_intelligent(conn: Any, event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Blocking half of /events/inbound_intelligent: load or create the conversation,
+    run the Markov step and write the new state and history back.
     """
-    # 🔥 ROUTE DETECTION: Log which route is handling the request
-    logger.error(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound_intelligent (called from twilio_inbound, not directly)")
-    print(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound_intelligent", flush=True)
-    conn = get_conn()
     phone_raw = event["phone"]
     # Normalize phone number for consistent matching
     phone = normalize_phone(phone_raw)
@@ -645,154 +915,50 @@ async def inbound_intelligent(event: dict):
     environment_id = event.get("environment_id")
     current_state = event.get("current_state")  # Use provided state if available
     
+    if _conversations_has_environment_id is None or _conversations_has_history is None:
+        _detect_conversation_columns(conn)
+    has_environment_id = bool(_conversations_has_environment_id)
+    has_history = bool(_conversations_has_history)
+    
     with conn.cursor() as cur:
-        # Try to fetch with environment_id scoping if provided
-        if environment_id:
-            try:
-                cur.execute("""
-                    SELECT phone, state, COALESCE(history::text, '[]') as history
-                    FROM conversations
-                    WHERE phone = %s AND environment_id = %s;
-                """, (phone, environment_id))
-                row = cur.fetchone()
-                if row:
-                    print(f"[INBOUND_INTELLIGENT] ✅ Found conversation scoped to environment {environment_id}", flush=True)
-                else:
-                    print(f"[INBOUND_INTELLIGENT] ⚠️ No conversation found for environment {environment_id}, trying phone-only lookup", flush=True)
-                    # Fallback to phone-only if environment-scoped lookup fails
-                    # Order by last_outbound_at to select conversation with most recent outbound (same fix as main inbound handler)
-                    cur.execute("""
-                        SELECT phone, state, COALESCE(history::text, '[]') as history
-                        FROM conversations
-                        WHERE phone = %s
-                        ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC
-                        LIMIT 1;
-                    """, (phone,))
-                    row = cur.fetchone()
-            except psycopg2.ProgrammingError:
-                # environment_id column doesn't exist, fall back to phone-only
-                cur.execute("""
-                    SELECT phone, state, COALESCE(history::text, '[]') as history
-                    FROM conversations
-                    WHERE phone = %s;
-                """, (phone,))
-                row = cur.fetchone()
-        else:
-            # No environment_id provided, use phone-only lookup
-            try:
-                cur.execute("""
-                    SELECT phone, state, COALESCE(history::text, '[]') as history
-                    FROM conversations
-                    WHERE phone = %s;
-                """, (phone,))
-            except psycopg2.ProgrammingError:
-                # History column might not exist, fetch without it
-                cur.execute("""
-                    SELECT phone, state
-                    FROM conversations
-                    WHERE phone = %s;
-                """, (phone,))
-            
-            row = cur.fetchone()
-        
-        # Find card by phone number to link conversation
-        # Try multiple phone formats for matching
+        # Find card by phone number to link conversation: one query on the digits-only last 10
+        # of the card's phone (idx_cards_person_phone_last10, migration 019), which matches
+        # every spelling (+1984..., 1984..., 984-...). A card whose stored phone is exactly one
+        # of the raw / normalized forms wins when several cards share those digits.
         card_id = None
-        phone_variants = [
-            phone_raw,  # Original format from Twilio
-            f"+{phone}",  # + prefix with normalized
-            phone,  # Normalized (last 10 digits)
-            phone_raw.replace("+", ""),  # Without +
-        ]
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_variants = []
-        for variant in phone_variants:
-            if variant and variant not in seen:
-                seen.add(variant)
-                unique_variants.append(variant)
-        
-        # Try to find card by any phone variant
-        for phone_variant in unique_variants:
-            cur.execute("""
-                SELECT id FROM cards
-                WHERE type = 'person'
-                AND card_data->>'phone' = %s
-                LIMIT 1;
-            """, (phone_variant,))
-            card_row = cur.fetchone()
-            if card_row:
-                card_id = card_row[0]
-                break
-        
-        # Also try normalized last 10 digits matching (for cases like +19843695080 vs 19843695080)
-        if not card_id:
-            # Extract last 10 digits from normalized phone
-            last_10 = phone[-10:] if len(phone) >= 10 else phone
-            cur.execute("""
+        last_10 = "".join(ch for ch in phone if ch.isdigit())[-10:]
+        if last_10:
+            phone_variants = list(dict.fromkeys(
+                v for v in (phone_raw, phone, phone_raw.replace("+", "")) if v
+            ))
+            cur.execute(r"""
                 SELECT id FROM cards
                 WHERE type = 'person'
-                AND (
-                    card_data->>'phone' LIKE %s
-                    OR RIGHT(REPLACE(card_data->>'phone', '+', ''), 10) = %s
-                )
+                AND right(regexp_replace(card_data->>'phone', '\D', '', 'g'), 10) = %s
+                ORDER BY (card_data->>'phone' = ANY(%s)) DESC
                 LIMIT 1;
-            """, (f"%{last_10}", last_10))
+            """, (last_10, phone_variants))
             card_row = cur.fetchone()
             if card_row:
                 card_id = card_row[0]
         
-        # Auto-create conversation if it doesn't exist
+        # Fetch the conversation, creating it (linked to the card) when it doesn't exist
+        # Prepared once per connection for each schema shape (see _detect_conversation_columns)
+        lookup_name = f"inbound_conversation_e{int(has_environment_id)}h{int(has_history)}"
+        lookup_sql = _inbound_conversation_sql(has_environment_id, has_history)
+        lookup_params = [phone, card_id, datetime.utcnow()]
+        if has_environment_id:
+            lookup_params.append(environment_id)
+        execute_prepared(cur, lookup_name, lookup_sql, lookup_params)
+        row = cur.fetchone()
         if not row:
-            # Create new conversation with initial state and link to card if found
-            try:
-                cur.execute("""
-                    INSERT INTO conversations
-                    (phone, card_id, state, last_inbound_at, history)
-                    VALUES (%s, %s, 'initial_outreach', %s, %s::jsonb)
-                    ON CONFLICT (phone) DO UPDATE SET
-                        card_id = COALESCE(EXCLUDED.card_id, conversations.card_id)
-                    RETURNING phone, state, COALESCE(history::text, '[]') as history;
-                """, (phone, card_id, datetime.utcnow(), json.dumps([])))
-                row = cur.fetchone()
-                # If still no row (conflict), fetch it
-                if not row:
-                    cur.execute("""
-                        SELECT phone, state, COALESCE(history::text, '[]') as history
-                        FROM conversations
-                        WHERE phone = %s;
-                    """, (phone,))
-                    row = cur.fetchone()
-            except psycopg2.ProgrammingError:
-                # History column doesn't exist, create without it
-                cur.execute("""
-                    INSERT INTO conversations
-                    (phone, card_id, state, last_inbound_at)
-                    VALUES (%s, %s, 'initial_outreach', %s)
-                    ON CONFLICT (phone) DO UPDATE SET
-                        card_id = COALESCE(EXCLUDED.card_id, conversations.card_id)
-                    RETURNING phone, state;
-                """, (phone, card_id, datetime.utcnow()))
-                row = cur.fetchone()
-                # If still no row (conflict), fetch it
-                if not row:
-                    cur.execute("""
-                        SELECT phone, state
-                        FROM conversations
-                        WHERE phone = %s;
-                    """, (phone,))
-                    row = cur.fetchone()
+            # A concurrent inbound created it between the lookup and the insert
+            execute_prepared(cur, lookup_name, lookup_sql, lookup_params)
+            row = cur.fetchone()
         
-        # If conversation exists but card_id is missing, try to link it
-        if row and not card_id:
-            # Check if conversation already has a card_id
-            cur.execute("""
-                SELECT card_id FROM conversations WHERE phone = %s;
-            """, (phone,))
-            existing_card_id = cur.fetchone()
-            if existing_card_id and existing_card_id[0]:
-                card_id = existing_card_id[0]
+        # If no card matched by phone, keep the one the conversation is already linked to
+        if row and not card_id and row[3]:
+            card_id = row[3]
         
         if not row:
             raise HTTPException(status_code=500, detail=f"Failed to create or fetch conversation for phone: {phone}")
@@ -853,102 +1019,26 @@ async def inbound_intelligent(event: dict):
         updated_history = normalized_history + [inbound_msg]
         
         # Update conversations table with new state, history, and card_id
-        # Scope update to environment_id if provided
-        try:
-            if environment_id:
-                # Try to update scoped to environment
-                try:
-                    cur.execute("""
-                        UPDATE conversations
-                        SET state = %s,
-                            last_inbound_at = %s,
-                            history = %s::jsonb,
-                            card_id = COALESCE(%s, card_id)
-                        WHERE phone = %s AND environment_id = %s;
-                    """, (
-                        result["next_state"],
-                        datetime.utcnow(),
-                        json.dumps(updated_history),
-                        card_id,  # Link to card if found
-                        phone,
-                        environment_id,
-                    ))
-                    print(f"[INBOUND_INTELLIGENT] ✅ Updated conversation scoped to environment {environment_id}", flush=True)
-                except psycopg2.ProgrammingError:
-                    # environment_id column doesn't exist, fall back to phone-only
-                    cur.execute("""
-                        UPDATE conversations
-                        SET state = %s,
-                            last_inbound_at = %s,
-                            history = %s::jsonb,
-                            card_id = COALESCE(%s, card_id)
-                        WHERE phone = %s;
-                    """, (
-                        result["next_state"],
-                        datetime.utcnow(),
-                        json.dumps(updated_history),
-                        card_id,
-                        phone,
-                    ))
-            else:
-                # No environment_id, use phone-only update
-                cur.execute("""
-                    UPDATE conversations
-                    SET state = %s,
-                        last_inbound_at = %s,
-                        history = %s::jsonb,
-                        card_id = COALESCE(%s, card_id)
-                    WHERE phone = %s;
-                """, (
-                    result["next_state"],
-                    datetime.utcnow(),
-                    json.dumps(updated_history),
-                    card_id,  # Link to card if found
-                    phone,
-                ))
-        except psycopg2.ProgrammingError:
-            # History column doesn't exist, update without it
-            if environment_id:
-                try:
-                    cur.execute("""
-                        UPDATE conversations
-                        SET state = %s,
-                            last_inbound_at = %s,
-                            card_id = COALESCE(%s, card_id)
-                        WHERE phone = %s AND environment_id = %s;
-                    """, (
-                        result["next_state"],
-                        datetime.utcnow(),
-                        card_id,
-                        phone,
-                        environment_id,
-                    ))
-                except psycopg2.ProgrammingError:
-                    cur.execute("""
-                        UPDATE conversations
-                        SET state = %s,
-                            last_inbound_at = %s,
-                            card_id = COALESCE(%s, card_id)
-                        WHERE phone = %s;
-                    """, (
-                        result["next_state"],
-                        datetime.utcnow(),
-                        card_id,
-                        phone,
-                    ))
-            else:
-                cur.execute("""
-                    UPDATE conversations
-                    SET state = %s,
-                        last_inbound_at = %s,
-                        card_id = COALESCE(%s, card_id)
-                    WHERE phone = %s;
-                """, (
-                    result["next_state"],
-                    datetime.utcnow(),
-                    card_id,  # Link to card if found
-                    phone,
-                ))
+        # Scope update to environment_id if provided (and the column exists)
+        env_scoped = bool(environment_id) and has_environment_id
+        update_params = [
+            result["next_state"],
+            datetime.utcnow(),
+            card_id,  # Link to card if found
+            phone,
+        ]
+        if has_history:
+            update_params.append(json.dumps(updated_history))
+        if env_scoped:
+            update_params.append(environment_id)
+        execute_prepared(
+            cur,
+            f"inbound_update_e{int(env_scoped)}h{int(has_history)}",
+            _inbound_update_sql(env_scoped, has_history),
+            update_params,
+        )
+        if env_scoped:
+            print(f"[INBOUND_INTELLIGENT] ✅ Updated conversation scoped to environment {environment_id}", flush=True)
     
     return {
         "ok": True,
@@ -958,17 +1048,31 @@ async def inbound_intelligent(event: dict):
     }
 
 
-def resolve_rep_user_id_for_inbound(conn, *, environment_id: str, phone: str, card_id: str | None, routed_rep_id: str | None):
-    """
-    Resolves rep_user_id for inbound messages with repair capability.
-    
-    Returns (rep_user_id, source, effective_card_id) where source ∈:
-      'conversation', 'assignment_repair', 'assignment', 'routing', 'none'
-    
-    Strategy: card_assignments is source of truth, conversations.rep_user_id is cache.
-    This function repairs the cache if it's stale.
+@app.post("/events/inbound_intelligent")
+async def inbound_intelligent(event: dict):
     """
-    cur = conn.cursor()
+    Intelligence-aware inbound handler.
+    Fetches conversation, computes next state using Markov logic,
+    and updates the database.
+    Auto-creates conversation if it doesn't exist.
+    """
+    # 🔥 ROUTE DETECTION: Log which route is handling the request
+    logger.error(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound_intelligent (called from twilio_inbound, not directly)")
+    print(f"🚨🚨🚨 TWILIO ROUTE HIT: /events/inbound_intelligent", flush=True)
+    return await run_db(_process_inbound_intelligent, event)
+
+
+def resolve_rep_user_id_for_inbound(conn, *, environment_id: str, phone: str, card_id: str | None, routed_rep_id: str | None):
+    """
+    Resolves rep_user_id for inbound messages with repair capability.
+    
+    Returns (rep_user_id, source, effective_card_id) where source ∈:
+      'conversation', 'assignment_repair', 'assignment', 'routing', 'none'
+    
+    Strategy: card_assignments is source of truth, conversations.rep_user_id is cache.
+    This function repairs the cache if it's stale.
+    """
+    cur = conn.cursor()
 
     # 1) Load conversation (fast path)
     try:
@@ -1078,1343 +1182,1348 @@ async def twilio_status(request: Request):
         return PlainTextResponse("ok", status_code=200)
     except Exception as e:
         print(f"[TWILIO_STATUS] ❌ Error processing status callback: {e}", flush=True)
-        import traceback
         print(f"[TWILIO_STATUS] Traceback: {traceback.format_exc()}", flush=True)
         return PlainTextResponse("ok", status_code=200)  # Always return 200 to Twilio
 
 
-@app.post("/twilio/inbound", response_class=PlainTextResponse)
-async def twilio_inbound(request: Request):
+def _process_twilio_inbound(conn: Any, From: str, Body: str, normalized_phone: str, twilio_phone: Optional[str]) -> PlainTextResponse:
     """
-    Twilio webhook endpoint for inbound SMS.
-    Receives form-encoded data from Twilio and processes through intelligence layer.
-    Gated by webhook configuration (enabled, mode, logging).
+    Blocking half of /twilio/inbound (prod mode): bot-loop check, card / rep / environment
+    resolution, the Markov step, history writes and the auto-reply send.
     """
-    # 🔥 ROUTE DETECTION: This is the CANONICAL inbound handler
-    logger.error(f"🚨🚨🚨 TWILIO ROUTE HIT: /twilio/inbound (CANONICAL HANDLER)")
-    print(f"🚨🚨🚨 TWILIO ROUTE HIT: /twilio/inbound (CANONICAL HANDLER) - Path: {request.url.path}", flush=True)
-    
-    # 🔥 STEP 0: ABSOLUTE CANARY - First line, no conditionals, no guards
-    logger.error("🚨🚨🚨 INBOUND WEBHOOK HIT — RAW REQUEST RECEIVED 🚨🚨🚨")
-    print("🚨🚨🚨 INBOUND WEBHOOK HIT — RAW REQUEST RECEIVED 🚨🚨🚨", flush=True)
-    # 🔥🔥🔥 NUCLEAR LOG - FIRST LINE OF FUNCTION - PROVES WEBHOOK WAS CALLED
-    import sys
-    sys.stdout.flush()
-    sys.stderr.flush()
-    print("=" * 80, flush=True)
-    print("🔥🔥🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥🔥🔥", flush=True)
-    print("🔥🔥🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥🔥🔥", flush=True)
-    print("🔥🔥🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥🔥🔥", flush=True)
-    print("=" * 80, flush=True)
-    import logging
-    _logger = logging.getLogger(__name__)
-    _logger.error("🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥")
-    logger.error("🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥")
-    
-    # CRITICAL: Log raw body FIRST to catch requests even if form parsing fails
+    # 🔥 CRITICAL: Prevent bot loop - check if we just sent a message to this number
+    # We'll still process/store the inbound (so it appears in leads) but skip auto-reply
+    skip_auto_reply = False
     try:
-        raw_body = await request.body()
-        print("=" * 60, flush=True)
-        print("[TWILIO_INBOUND] RAW INBOUND BODY:", raw_body.decode('utf-8', errors='replace'), flush=True)
-        print("=" * 60, flush=True)
-    except Exception as e:
-        print(f"[TWILIO_INBOUND] ERROR reading raw body: {e}", flush=True)
+        with conn.cursor() as loop_check_cur:
+            loop_check_cur.execute("""
+                SELECT sent_at, direction, message_text
+                FROM message_events
+                WHERE phone_number = %s
+                  AND direction = 'outbound'
+                  AND message_sid IS NOT NULL
+                ORDER BY sent_at DESC
+                LIMIT 1
+            """, (normalized_phone,))
+            recent_outbound = loop_check_cur.fetchone()
+            if recent_outbound:
+                sent_at = recent_outbound[0]
+                # Handle timezone-aware and naive datetimes
+                from datetime import datetime, timezone
+                now_utc = datetime.now(timezone.utc) if hasattr(datetime, 'now') else datetime.utcnow()
+                if sent_at.tzinfo is None:
+                    # If naive, assume UTC and make it timezone-aware
+                    sent_at_aware = sent_at.replace(tzinfo=timezone.utc)
+                else:
+                    sent_at_aware = sent_at
+                time_since_sent = (now_utc - sent_at_aware).total_seconds()
+                if time_since_sent < 5:  # Less than 5 seconds ago
+                    print(f"[TWILIO_INBOUND] 🛑 BOT LOOP PREVENTION: Detected recent outbound {time_since_sent:.2f}s ago", flush=True)
+                    print(f"[TWILIO_INBOUND]   Will still store inbound message (for leads) but skip auto-reply", flush=True)
+                    skip_auto_reply = True
+    except Exception as loop_check_error:
+        print(f"[TWILIO_INBOUND] ⚠️ Error checking for bot loop (continuing anyway): {loop_check_error}", flush=True)
+    
+    
+    # 🔧 FIX C: Resolve card_id EARLY by looking up card by phone number
+    # This ensures we have card_id available for rep hydration, even if conversation doesn't have it
+    # CRITICAL: Use E.164 format for phone lookup (preserve + and country code)
+    print(f"[TWILIO_INBOUND] 🔍 Step 1: Resolving card by phone number...", flush=True)
+    print(f"[TWILIO_INBOUND]   Looking up card with phone (E.164): {From}", flush=True)
+    card_id = None
+    card = None
+    with conn.cursor() as cur:
+        # Try to find card by phone number in card_data JSONB
+        # Try both E.164 format and normalized format for backward compatibility
+        cur.execute("""
+            SELECT id, type, card_data, sales_state, owner
+            FROM cards
+            WHERE type = 'person'
+            AND (card_data->>'phone' = %s OR card_data->>'phone' = %s)
+            LIMIT 1
+        """, (From, normalized_phone))
+        card_row = cur.fetchone()
+        if card_row:
+            card_id = card_row[0]
+            card = {
+                "id": card_row[0],
+                "type": card_row[1],
+                "card_data": card_row[2],
+                "sales_state": card_row[3],
+                "owner": card_row[4],
+            }
+            print(f"[TWILIO_INBOUND] ✅ Card found by phone: card_id={card_id}", flush=True)
+        else:
+            print(f"[TWILIO_INBOUND] ⚠️ No card found by phone number: {normalized_phone}", flush=True)
+    
+    # 🔧 FIX #1: Initialize environment_id at the very start (MANDATORY)
+    # This prevents UnboundLocalError - environment_id must be total, never conditional
+    environment_id = None
+    env_source = None
+    routed_rep_id = None
+    routed_campaign_id = None
+    
+    # 🔥 CRITICAL: Find conversation by phone FIRST (across all environments)
+    # This prevents losing the conversation due to environment mismatch
+    print(f"[TWILIO_INBOUND] 🔍 Step 2: Finding conversation by phone (across environments)...", flush=True)
+    # 🔥 STEP 3: Conversation lookup checkpoint (CRITICAL)
+    logger.error(f"🔍 LOOKUP CONVERSATION BY PHONE = {normalized_phone}")
+    print(f"🔍 LOOKUP CONVERSATION BY PHONE = {normalized_phone}", flush=True)
+    # 🔥 INVARIANT VERIFICATION: Log lookup parameters BEFORE query
+    logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] Looking for conversation: phone={normalized_phone} (original={From})")
+    print(f"[INVARIANT] [CONVERSATION_LOOKUP] phone={normalized_phone} (original={From})", flush=True)
+    conversation_by_phone = None
+    env_id_from_convo = None
+    rep_from_convo = None
+    card_id_from_convo = None
+    state_from_convo = None
     
-    print("[TWILIO_INBOUND] Webhook hit", flush=True)
+    with conn.cursor() as cur:
+        try:
+            # 🔥 CRITICAL FIX: Order by last_outbound_at DESC to find conversation with most recent outbound
+            # This ensures inbound replies attach to the conversation that sent the most recent outbound message
+            # Priority: 1) Most recent outbound, 2) Then by updated_at for conversations without outbound timestamps
+            cur.execute("""
+                SELECT environment_id, rep_user_id, card_id, state, last_outbound_source, last_outbound_at, updated_at
+                FROM conversations
+                WHERE phone = %s
+                ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC
+                LIMIT 1
+            """, (normalized_phone,))
+            conversation_by_phone = cur.fetchone()
+            # 🔥 INVARIANT VERIFICATION: Log lookup result
+            if conversation_by_phone:
+                logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] ✅ FOUND: env={conversation_by_phone[0]} card_id={conversation_by_phone[2]} state={conversation_by_phone[3]}")
+                print(f"[INVARIANT] [CONVERSATION_LOOKUP] ✅ FOUND conversation", flush=True)
+            else:
+                logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] ❌ NOT FOUND: No conversation exists for phone={normalized_phone}")
+                print(f"[INVARIANT] [CONVERSATION_LOOKUP] ❌ NOT FOUND - checking all conversations...", flush=True)
+                # Debug: Show all conversations with similar phone numbers (ordered by last_outbound_at for consistency)
+                cur.execute("SELECT phone, card_id, state, environment_id FROM conversations ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC LIMIT 10")
+                all_convs = cur.fetchall()
+                logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] Recent conversations: {all_convs}")
+                print(f"[INVARIANT] [CONVERSATION_LOOKUP] Recent conversations in DB:", flush=True)
+                for conv in all_convs:
+                    print(f"  phone={conv[0]} card_id={conv[1]} state={conv[2]} env={conv[3]}", flush=True)
+        except psycopg2.ProgrammingError:
+            # Fallback if environment_id column doesn't exist
+            # Still use last_outbound_at for proper conversation resolution
+            cur.execute("""
+                SELECT NULL as environment_id, rep_user_id, card_id, state, NULL as last_outbound_source, last_outbound_at, updated_at
+                FROM conversations
+                WHERE phone = %s
+                ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC
+                LIMIT 1
+            """, (normalized_phone,))
+            conversation_by_phone = cur.fetchone()
+    
+    # 🔧 FIX #1: If conversation exists → its environment is authoritative (NEVER route)
+    # Rule: If a conversation exists → its environment is authoritative. Routing is only allowed when NO conversation exists.
+    from backend.environment import route_inbound_to_environment, get_or_create_environment, store_message_event
+    
+    if conversation_by_phone:
+        env_id_from_convo, rep_from_convo, card_id_from_convo, state_from_convo, last_source, last_outbound_at, updated_at = conversation_by_phone
+        # 🔥 STEP 3 (continued): Conversation found confirmation
+        # Log last_outbound_at to show why this conversation was selected (most recent outbound)
+        logger.error(f"✅ CONVERSATION FOUND env={env_id_from_convo} rep={rep_from_convo} card_id={card_id_from_convo} state={state_from_convo} last_outbound_at={last_outbound_at}")
+        print(f"✅ CONVERSATION FOUND env={env_id_from_convo} rep={rep_from_convo} card_id={card_id_from_convo} state={state_from_convo} last_outbound_at={last_outbound_at}", flush=True)
+        print(f"[TWILIO_INBOUND] ✅ Found conversation by phone (selected by most recent outbound): env={env_id_from_convo}, rep={rep_from_convo}, state={state_from_convo}, last_source={last_source}, last_outbound_at={last_outbound_at}", flush=True)
+        # 🔥 INVARIANT VERIFICATION: Conversation match confirmed - selected by last_outbound_at DESC
+        logger.error(f"[INVARIANT] ✅ Conversation match: phone={normalized_phone} env={env_id_from_convo} card_id={card_id_from_convo} state={state_from_convo} last_outbound_at={last_outbound_at} (selected by most recent outbound)")
+        
+        # Step 1: conversation-by-phone (highest priority - NEVER override with routing)
+        if env_id_from_convo:
+            environment_id = env_id_from_convo
+            env_source = "conversation"
+            print(f"[TWILIO_INBOUND] ✅ Using environment_id from conversation: {environment_id}", flush=True)
+            
+            # 🔒 HARD GUARD: Never override conversation environment with routing
+            # If conversation exists, its environment is authoritative
+            routed_rep_id = rep_from_convo
+            # Get campaign from environment if needed
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT campaign_id FROM environments WHERE id = %s
+                    """, (environment_id,))
+                    env_row = cur.fetchone()
+                    if env_row:
+                        routed_campaign_id = env_row[0]
+            except:
+                routed_campaign_id = None
+        else:
+            # Conversation exists but env is NULL - create new environment (don't route to old one)
+            print(f"[TWILIO_INBOUND] ⚠️ Conversation exists but environment_id is NULL - creating new environment", flush=True)
+            
+            # Note: We'll set card_id from conversation at the end (line ~1407) for consistency
+            # But we need it early here for environment creation, so set it now
+            # 🔥 CRITICAL: Use conversation's card_id as authoritative (it's the card that received the outbound)
+            # Step 1 lookup may find a different card if multiple cards share the same phone
+            if card_id_from_convo:
+                card_id = card_id_from_convo
+                print(f"[TWILIO_INBOUND] ✅ Using conversation's card_id (authoritative, early for env creation): {card_id}", flush=True)
+                # Reload card using conversation's card_id (it may differ from Step 1 lookup)
+                card = None  # Force reload below
+            
+            resolved_rep_user_id = rep_from_convo
+            if card_id:
+                from backend.handoffs import resolve_current_rep
+                resolved_rep_user_id = resolve_current_rep(conn, card_id) or rep_from_convo
+            
+            # Infer campaign_id from card if available (need to reload card first)
+            if not card and card_id:
+                from backend.cards import get_card
+                card = get_card(conn, card_id)
+            
+            campaign_id = None
+            if card and card.get("card_data"):
+                card_data = card["card_data"]
+                if card_data.get("fraternity"):
+                    campaign_id = "frat_rt4orgs"
+                elif card_data.get("faith_group"):
+                    campaign_id = "faith_rt4orgs"
+                elif card_data.get("role") == "Office":
+                    campaign_id = "faith_rt4orgs"
+                else:
+                    campaign_id = "default_rt4orgs"
+            
+            environment_id = get_or_create_environment(conn, normalized_phone, resolved_rep_user_id, campaign_id, card_id)
+            routed_rep_id = resolved_rep_user_id
+            routed_campaign_id = campaign_id
+            env_source = "conversation_repair"
+            print(f"[TWILIO_INBOUND] ✅ Created new environment for existing conversation: {environment_id}", flush=True)
+        
+        # 🔥 CRITICAL FIX: Always use conversation's card_id if it exists (authoritative)
+        # The conversation's card_id is the card that received the outbound message
+        # Step 1 phone lookup may find a different card if multiple cards share the same phone
+        if card_id_from_convo:
+            card_id = card_id_from_convo
+            print(f"[TWILIO_INBOUND] ✅ Using conversation's card_id (authoritative from outbound): {card_id}", flush=True)
+            # Reload card using conversation's card_id (it may differ from Step 1 lookup)
+            card = None  # Force reload below
+    else:
+        # Step 2: No conversation exists - this is a HARD FAILURE
+        # 🔥 STEP 3 (continued): Conversation NOT found - explicit drop log
+        logger.error(f"🧨 INBOUND_DROP: NO_CONVERSATION raw_from={From} normalized={normalized_phone}")
+        print(f"🧨 INBOUND_DROP: NO_CONVERSATION raw_from={From} normalized={normalized_phone}", flush=True)
+        # 🔥 CRITICAL: Conversation MUST exist (created during blast) - no fallback guessing
+        print(f"[TWILIO_INBOUND] ❌ FATAL: No conversation found by phone - ABORTING inbound processing", flush=True)
+        # 🔥 INVARIANT VERIFICATION: Conversation NOT found - this is the failure point
+        logger.error(f"[INBOUND_DROP] ❌ Conversation NOT FOUND - inbound ABORTED (no fallback) reason=NO_CONVERSATION")
+        logger.error(f"[INVARIANT] ❌ Conversation NOT FOUND - inbound ABORTED (no fallback)")
+        logger.error(f"[INVARIANT] ❌ CAUSE: No conversation row exists for phone={normalized_phone} (original={From})")
+        logger.error(f"[INVARIANT] ❌ REQUIRED: Conversation must be created during blast BEFORE SMS send")
+        logger.error(f"[INVARIANT] ❌ Check: Did blast create conversation? Is phone normalization consistent?")
+        logger.error(f"[INVARIANT] ❌ DIAGNOSTIC: raw_from={From} normalized={normalized_phone}")
+        # 🔥 CRITICAL: Do NOT route or create - conversation must exist from blast
+        # Return early - do not process inbound without conversation anchor
+        print(f"[TWILIO_INBOUND] ❌ Inbound message from {From} (Body: '{Body}') - NO CONVERSATION FOUND", flush=True)
+        print(f"[TWILIO_INBOUND] ❌ This message will NOT be processed - conversation anchor missing", flush=True)
+        return PlainTextResponse("No conversation found - message not processed", status_code=200)
+    
+    # 🔒 CRITICAL: Log environment_id source and assert conversation authority
+    logger.error(f"[INBOUND_ENV] using environment_id={environment_id} source={env_source} phone={normalized_phone}")
+    print(f"[TWILIO_INBOUND] 🔒 [INBOUND_ENV] environment_id={environment_id} source={env_source}", flush=True)
+    
+    # 🔒 HARD GUARD: If conversation exists, environment must match (never override)
+    if conversation_by_phone and env_id_from_convo and environment_id != env_id_from_convo:
+        error_msg = f"[INBOUND] FATAL: Environment mismatch. conversation.env={env_id_from_convo} but using={environment_id}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    
+    # Final safety check - this should never happen but fail loud if it does
+    if environment_id is None:
+        error_msg = f"[INBOUND] FATAL: environment_id is None after all fallbacks. phone={normalized_phone}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    
+    # Step 3: Use helper function to resolve rep_user_id with repair capability
+    # This replaces the previous complex resolution logic with a clean helper that:
+    # - Checks conversation cache first (fast path)
+    # - Repairs from card_assignments if cache is stale
+    # - Falls back to routing if no assignment found
+    rep_user_id, rep_source, effective_card_id = resolve_rep_user_id_for_inbound(
+        conn,
+        environment_id=environment_id,
+        phone=normalized_phone,
+        card_id=card_id,
+        routed_rep_id=routed_rep_id,
+    )
+    logger.info(f"[INBOUND] resolved rep_user_id={rep_user_id} source={rep_source} env={environment_id} phone={normalized_phone} card_id={effective_card_id}")
+    print(f"[TWILIO_INBOUND] ✅ Resolved rep_user_id: {rep_user_id} (source: {rep_source})", flush=True)
+    print(f"[TWILIO_INBOUND]   Effective card_id: {effective_card_id}", flush=True)
+    
+    # Update card_id if helper returned a different one
+    if effective_card_id and effective_card_id != card_id:
+        card_id = effective_card_id
+        print(f"[TWILIO_INBOUND] ✅ Updated card_id from helper: {card_id}", flush=True)
+    
+    # 🔧 FIX #2: Use state from conversation_by_phone if available (don't mutate before Markov)
+    # Rule: Read current_state from conversation, use it for Markov, THEN update after Markov selection
+    routing_mode = 'ai'  # Default to AI
+    conversation_state = state_from_convo  # Use state from conversation_by_phone if available
+    conversation_exists = conversation_by_phone is not None
+    
+    # If we didn't get state from conversation_by_phone, query it
+    if conversation_state is None:
+        with conn.cursor() as cur:
+            try:
+                cur.execute("""
+                    SELECT routing_mode, state 
+                    FROM conversations 
+                    WHERE phone = %s AND environment_id = %s
+                    LIMIT 1
+                """, (normalized_phone, environment_id))
+                row = cur.fetchone()
+                if row:
+                    conversation_exists = True
+                    routing_mode = row[0] or 'ai'
+                    conversation_state = row[1]
+                    print(f"[TWILIO_INBOUND] ✅ Conversation found for environment {environment_id}", flush=True)
+                    print(f"[TWILIO_INBOUND]   routing_mode: {routing_mode}", flush=True)
+                    print(f"[TWILIO_INBOUND]   current_state: {conversation_state}", flush=True)
+                else:
+                    print(f"[TWILIO_INBOUND] ⚠️ No conversation found for environment {environment_id}", flush=True)
+            except psycopg2.ProgrammingError:
+                # Fallback if environment_id column doesn't exist
+                cur.execute("""
+                    SELECT routing_mode, state FROM conversations WHERE phone = %s LIMIT 1
+                """, (normalized_phone,))
+                row = cur.fetchone()
+                if row:
+                    conversation_exists = True
+                    routing_mode = row[0] or 'ai'
+                    conversation_state = row[1]
+    
+    # 🔒 HARD GUARD: State must not mutate before Markov
+    # If we have state_from_convo, it must match conversation_state
+    if conversation_by_phone and state_from_convo and conversation_state != state_from_convo:
+        logger.warning(f"[INBOUND] State mismatch detected: conversation_by_phone.state={state_from_convo} but query returned={conversation_state}. Using conversation_by_phone state.")
+        conversation_state = state_from_convo  # Prefer conversation_by_phone state
+    
+    # Final ownership determination for logging
+    final_owner = "OWNER" if not rep_user_id else f"REP({rep_user_id})"
+    print(f"[TWILIO_INBOUND] 📋 POLICY A: Final resolved owner: {final_owner}", flush=True)
+    
+    print(f"[TWILIO_INBOUND] 📋 Conversation Summary:", flush=True)
+    print(f"[TWILIO_INBOUND]   Phone: {normalized_phone} (original: {From})", flush=True)
+    print(f"[TWILIO_INBOUND]   Routing mode: {routing_mode}", flush=True)
+    print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id} (source: {rep_source})", flush=True)
+    print(f"[TWILIO_INBOUND]   Current state: {conversation_state}", flush=True)
+    if rep_user_id:
+        print(f"[TWILIO_INBOUND] ✅ Will use rep-specific Markov responses for user_id: {rep_user_id}", flush=True)
+    else:
+        print(f"[TWILIO_INBOUND] ⚠️ Will use global Markov responses (no rep assigned)", flush=True)
+    
+    # Store inbound message in history and message_events
+    from backend.rep_messaging import add_message_to_history
+    add_message_to_history(conn, normalized_phone, "inbound", Body, "contact")
+    
+    # Store inbound message event (no message_sid for inbound - it's from Twilio)
+    store_message_event(
+        conn=conn,
+        phone_number=normalized_phone,
+        environment_id=environment_id,
+        direction="inbound",
+        message_text=Body,
+        message_sid=None,  # Inbound messages don't have our message_sid
+        rep_id=rep_user_id,
+        campaign_id=routed_campaign_id,
+        state=conversation_state
+    )
     
-    # Check if webhook is enabled
-    if not WEBHOOK_CONFIG.enabled:
-        print("[TWILIO_INBOUND] Webhook disabled in config")
-        return PlainTextResponse("Webhook disabled", status_code=200)
+    # POLICY A: Whoever blasts LAST owns the automation
+    # Auto-responses work for the current owner (rep or owner)
+    # No special "rep mode" that disables automation - ownership determines responses
+    print(f"[TWILIO_INBOUND] 📋 Routing mode: {routing_mode}, Rep user ID: {rep_user_id}", flush=True)
+    print(f"[TWILIO_INBOUND] ✅ Policy A: Auto-responses enabled for current owner", flush=True)
     
-    # 🔥 STEP 1: Dump raw Twilio payload (no parsing yet)
-    try:
-        payload = await request.form()
-        payload_dict = dict(payload)
-        logger.error(f"📦 INBOUND RAW FORM DATA: {payload_dict}")
-        print(f"📦 INBOUND RAW FORM DATA: {payload_dict}", flush=True)
-    except Exception as e:
-        logger.error(f"📦 INBOUND RAW FORM PARSE ERROR: {e}")
-        print(f"[TWILIO_INBOUND] ERROR parsing form data: {e}", flush=True)
-        print(f"[TWILIO_INBOUND] This usually means python-multipart is missing from requirements.txt", flush=True)
-        return PlainTextResponse("OK", status_code=200)
-
-    # Always log payload for debugging
-    print(f"[TWILIO_INBOUND] Payload: {payload_dict}")
+    # Continue with AI processing for 'ai' mode
+    # Classify intent from message text (simple keyword-based for now)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND] 🔍 MARKOV INTENT CLASSIFICATION", flush=True)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND]   Message text: '{Body}'", flush=True)
+    print(f"[TWILIO_INBOUND]   Current conversation state: {conversation_state}", flush=True)
+    print(f"[TWILIO_INBOUND]   Card ID: {card_id}", flush=True)
+    print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
+    intent = classify_intent_simple(Body)
+    print(f"[TWILIO_INBOUND] ✅ Classified intent: {json.dumps(intent, indent=2)}", flush=True)
+    print(f"[TWILIO_INBOUND]   category: {intent.get('category', 'NONE')}", flush=True)
+    print(f"[TWILIO_INBOUND]   subcategory: {intent.get('subcategory', 'NONE')}", flush=True)
+    if not intent:
+        print(f"[TWILIO_INBOUND] ⚠️ WARNING: Intent classifier returned empty dict - no category detected", flush=True)
+    print("=" * 80, flush=True)
     
-    # Log payload if enabled
-    if WEBHOOK_CONFIG.log_payloads:
-        print("TWILIO PAYLOAD:", payload_dict)
+    # Prepare event payload for inbound_intelligent
+    # Include environment_id and conversation state for proper scoping
+    event = {
+        "phone": normalized_phone,
+        "text": Body,
+        "body": Body,
+        "intent": intent,
+        "environment_id": environment_id,  # Pass environment for proper scoping
+        "current_state": conversation_state,  # Pass current state to avoid re-lookup
+        "rep_user_id": rep_user_id,  # Pass rep_user_id for context
+    }
     
-    # Handle dry_run mode
-    if WEBHOOK_CONFIG.mode == "dry_run":
-        print("[TWILIO_INBOUND] Dry run mode - returning OK without processing")
-        return PlainTextResponse("Dry run OK", status_code=200)
+    print(f"[TWILIO_INBOUND] 📞 Calling inbound_intelligent for {normalized_phone}", flush=True)
+    print(f"[TWILIO_INBOUND]   Event payload: {json.dumps(event, indent=2)}", flush=True)
+    print(f"[TWILIO_INBOUND]   Current conversation state: {conversation_state}", flush=True)
+    print(f"[TWILIO_INBOUND]   Environment ID: {environment_id}", flush=True)
+    print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
+    print(f"[TWILIO_INBOUND]   Card ID: {card_id}", flush=True)
+    
+    # 🔥 CRITICAL INVARIANT: Inbound handler must never return before Markov finishes OR a reply is sent
+    # The HTTP "OK" response is NOT the SMS - SMS must be sent explicitly via Twilio REST API
+    
+    # Call the intelligence handler directly (no HTTP overhead)
+    # 🔥 STEP 4: Markov invocation proof (non-negotiable)
+    logger.error(f"🔥🔥🔥 MARKOV_ENTER inbound conversation_id={conversation_by_phone[2] if conversation_by_phone else 'N/A'} text={Body[:100]}")
+    print(f"🔥🔥🔥 MARKOV_ENTER inbound text={Body[:100]}", flush=True)
+    # 🔥 INVARIANT 3 VERIFICATION: Markov evaluation
+    logger.error(f"[INVARIANT] [MARKOV] Context=inbound Current state={conversation_state} Rep={rep_user_id}")
+    result = _process_inbound_intelligent(conn, event)
+    response_text = result.get('response_text', '')
+    next_state = result.get('next_state')
+    logger.error(f"✅ MARKOV_EXIT conversation_id={conversation_by_phone[2] if conversation_by_phone else 'N/A'} next_state={next_state} response_length={len(response_text) if response_text else 0}")
+    print(f"✅ MARKOV_EXIT next_state={next_state} response_length={len(response_text) if response_text else 0}", flush=True)
+    
+    # 🔥 CRITICAL LOG: Show Markov output immediately
+    logger.error(f"[MARKOV_RESULT] next_state={next_state} previous_state={result.get('previous_state')} response_text={'SET' if response_text else 'EMPTY'}")
+    print(f"[MARKOV_RESULT] next_state={next_state} previous_state={result.get('previous_state')} response_text={'SET' if response_text else 'EMPTY'}", flush=True)
     
-    # Handle paused mode
-    if WEBHOOK_CONFIG.mode == "paused":
-        print("[TWILIO_INBOUND] Paused mode - returning OK without processing")
-        return PlainTextResponse("Webhook paused", status_code=200)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND] ✅ MARKOV INTELLIGENCE RESULT", flush=True)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND]   Full result: {json.dumps(result, indent=2, default=str)}", flush=True)
+    next_state = result.get('next_state')
+    previous_state = result.get('previous_state')
+    response_text = result.get('response_text', '')
+    print(f"[TWILIO_INBOUND]   next_state: {next_state}", flush=True)
+    print(f"[TWILIO_INBOUND]   previous_state: {previous_state}", flush=True)
+    print(f"[TWILIO_INBOUND]   intent: {result.get('intent')}", flush=True)
+    
+    # 🔥 INVARIANT 3 VERIFICATION: Markov transition and response
+    if previous_state and next_state:
+        logger.error(f"[INVARIANT] [MARKOV] Transition: {previous_state} → {next_state}")
+        print(f"[INVARIANT] [MARKOV] Transition: {previous_state} → {next_state}", flush=True)
+    if response_text:
+        logger.error(f"[INVARIANT] [MARKOV] Response found: length={len(response_text)}")
+        print(f"[INVARIANT] [MARKOV] Response found: length={len(response_text)}", flush=True)
+    else:
+        logger.error(f"[INVARIANT] [MARKOV] ⚠️ NO RESPONSE TEXT (check rep_markov_responses table)")
+        print(f"[INVARIANT] [MARKOV] ⚠️ NO RESPONSE TEXT - check rep_markov_responses table for state={next_state}", flush=True)
+    print("=" * 80, flush=True)
     
-    # Normal processing (mode == "prod")
-    try:
-        From = payload_dict.get("From", "")
-        Body = payload_dict.get("Body", "")
-        
-        # 🔥 STEP 2: Phone normalization checkpoint
-        raw_from = From
-        logger.error(f"📞 INBOUND RAW FROM: {raw_from}")
-        print(f"📞 INBOUND RAW FROM: {raw_from}", flush=True)
-        
-        if not From:
-            logger.error("📞 INBOUND MISSING FROM FIELD")
-            print("[TWILIO_INBOUND] ERROR: Missing From field", flush=True)
-            return PlainTextResponse("Missing From field", status_code=400)
-        
-        # Normalize inbound `From` BEFORE any lookup (CRITICAL)
-        # This ensures conversation lookup uses the same format as blast (E.164)
-        normalized_phone = normalize_phone(raw_from)
-        logger.error(f"📞 INBOUND NORMALIZED FROM: {normalized_phone}")
-        print(f"📞 INBOUND NORMALIZED FROM: {normalized_phone}", flush=True)
+    # 🔧 CRITICAL: Update last_inbound_at and card_id on the conversation scoped to environment_id
+    # The inbound_intelligent function updates by phone only, but we need to update
+    # the specific conversation for this environment to mark it as a lead
+    # Also ensure card_id is set (required for leads endpoint)
+    print(f"[TWILIO_INBOUND] 🔧 Updating last_inbound_at and card_id for environment {environment_id}...", flush=True)
+    with conn.cursor() as update_cur:
+        try:
+            # Update last_inbound_at and card_id scoped to environment
+            update_cur.execute("""
+                UPDATE conversations 
+                SET last_inbound_at = NOW(), 
+                    updated_at = NOW(),
+                    card_id = COALESCE(%s, card_id)
+                WHERE phone = %s AND environment_id = %s
+            """, (card_id, normalized_phone, environment_id))
+            if update_cur.rowcount > 0:
+                print(f"[TWILIO_INBOUND] ✅ Updated last_inbound_at and card_id for conversation (environment {environment_id}, card_id={card_id})", flush=True)
+            else:
+                print(f"[TWILIO_INBOUND] ⚠️ No conversation found to update (phone={normalized_phone}, environment_id={environment_id})", flush=True)
+                # Try to create conversation if it doesn't exist
+                if not conversation_exists:
+                    print(f"[TWILIO_INBOUND] 🔧 Creating new conversation for lead...", flush=True)
+                    try:
+                        update_cur.execute("""
+                            INSERT INTO conversations (phone, card_id, state, last_inbound_at, environment_id, rep_user_id)
+                            VALUES (%s, %s, %s, NOW(), %s, %s)
+                            ON CONFLICT (phone, environment_id) DO UPDATE SET
+                                last_inbound_at = NOW(),
+                                card_id = COALESCE(EXCLUDED.card_id, conversations.card_id),
+                                updated_at = NOW()
+                        """, (normalized_phone, card_id, result.get("next_state", "initial_outreach"), environment_id, rep_user_id))
+                        print(f"[TWILIO_INBOUND] ✅ Created/updated conversation for lead", flush=True)
+                    except psycopg2.ProgrammingError:
+                        # Fallback if environment_id column doesn't exist
+                        update_cur.execute("""
+                            INSERT INTO conversations (phone, card_id, state, last_inbound_at)
+                            VALUES (%s, %s, %s, NOW())
+                            ON CONFLICT (phone) DO UPDATE SET
+                                last_inbound_at = NOW(),
+                                card_id = COALESCE(EXCLUDED.card_id, conversations.card_id),
+                                updated_at = NOW()
+                        """, (normalized_phone, card_id, result.get("next_state", "initial_outreach")))
+                        print(f"[TWILIO_INBOUND] ✅ Created/updated conversation for lead (legacy mode)", flush=True)
+        except psycopg2.ProgrammingError:
+            # Fallback if environment_id column doesn't exist
+            update_cur.execute("""
+                UPDATE conversations 
+                SET last_inbound_at = NOW(), 
+                    updated_at = NOW(),
+                    card_id = COALESCE(%s, card_id)
+                WHERE phone = %s
+            """, (card_id, normalized_phone))
+            if update_cur.rowcount > 0:
+                print(f"[TWILIO_INBOUND] ✅ Updated last_inbound_at and card_id for conversation (legacy mode, card_id={card_id})", flush=True)
+            else:
+                print(f"[TWILIO_INBOUND] ⚠️ No conversation found to update (phone={normalized_phone})", flush=True)
+        except Exception as update_error:
+            print(f"[TWILIO_INBOUND] ⚠️ Error updating last_inbound_at: {update_error}", flush=True)
+            print(f"[TWILIO_INBOUND] Traceback: {traceback.format_exc()}", flush=True)
+    
+    # Get card by phone to generate contextual reply (use card we already resolved earlier)
+    # Card should already be loaded from Step 1, but double-check if needed
+    if not card and card_id:
+        print(f"[TWILIO_INBOUND] 🔍 Card not loaded yet, fetching by card_id: {card_id}", flush=True)
+        card = get_card(conn, card_id)
+    
+    # Generate reply message using configured Markov responses
+    reply_text = None
+    next_state = None  # Define at higher scope for campaign suppression check
+    
+    # 🔒 SAFETY INVARIANT: Check if card is assigned before auto-responding
+    # Do not auto-respond to unassigned cards (prevents spam loops)
+    # ✅ OPTION A: Auto-assign on first inbound to conversation owner
+    card_assigned = False
+    if card_id:
+        from backend.assignments import get_card_assignment, assign_card_to_rep
+        assignment = get_card_assignment(conn, card_id)
+        card_assigned = assignment is not None and assignment.get("user_id") is not None
         
-        print(f"[TWILIO_INBOUND] From={From}, Body={Body[:50]}...")
+        if not card_assigned:
+            print(f"[TWILIO_INBOUND] 🔍 Card {card_id} is not assigned", flush=True)
+            
+            # Auto-assign to conversation owner (rep_user_id) if available
+            if rep_user_id:
+                print(f"[TWILIO_INBOUND] 🔄 Auto-assigning card to conversation owner: {rep_user_id}", flush=True)
+                assign_success = assign_card_to_rep(
+                    conn=conn,
+                    card_id=card_id,
+                    user_id=rep_user_id,
+                    assigned_by=rep_user_id,  # Self-assigned via inbound
+                    notes="Auto-assigned on first inbound message"
+                )
+                if assign_success:
+                    print(f"[TWILIO_INBOUND] ✅ Card auto-assigned successfully to {rep_user_id}", flush=True)
+                    _invalidate_assigned_cards()
+                    card_assigned = True
+                    # Re-fetch assignment to ensure it's fresh
+                    assignment = get_card_assignment(conn, card_id)
+                else:
+                    print(f"[TWILIO_INBOUND] ⚠️ Failed to auto-assign card {card_id} to {rep_user_id}", flush=True)
+            else:
+                print(f"[TWILIO_INBOUND] 🛑 SAFETY: Card {card_id} is not assigned and no rep_user_id available - skipping auto-response (inbound will still be stored)", flush=True)
+    
+    # Skip reply generation if bot loop detected OR card is unassigned (but still process/store inbound for leads)
+    if skip_auto_reply:
+        logger.error(f"[REPLY_BLOCKED] Reason=bot_loop_prevention skip_auto_reply=True")
+        print(f"[TWILIO_INBOUND] 🛑 Skipping reply generation due to bot loop prevention (inbound will still be stored)", flush=True)
+        reply_text = None
+    elif not card_assigned and card_id:
+        # Card is still unassigned after auto-assignment attempt
+        # This means either:
+        # 1. No rep_user_id was available (conversation has no owner)
+        # 2. Auto-assignment failed
+        logger.error(f"[REPLY_BLOCKED] Reason=card_unassigned card_id={card_id}")
+        print(f"[TWILIO_INBOUND] 🛑 Skipping reply generation - card is unassigned (inbound will still be stored)", flush=True)
+        print(f"[TWILIO_INBOUND]   Reason: Card {card_id} has no assignment and no rep_user_id to assign to", flush=True)
+        reply_text = None
+    elif result.get("next_state"):
+        next_state = result["next_state"]
+        previous_state = result.get("previous_state", "initial_outreach")
         
-        # 🔧 FIX #2: STOP must short-circuit before Markov (compliance requirement)
-        # Twilio STOP messages must never enter Markov pipeline
-        if Body and Body.strip().upper() in {"STOP", "STOPALL", "UNSUBSCRIBE", "CANCEL", "END", "QUIT"}:
-            logger.warning(f"[INBOUND] STOP received from {normalized_phone}")
-            print(f"[TWILIO_INBOUND] 🛑 STOP message received from {normalized_phone} - short-circuiting before Markov", flush=True)
-            # TODO: Implement mark_opt_out(normalized_phone) if you have that function
-            # For now, just return empty response
-            from twilio.twiml.messaging_response import MessagingResponse
-            response = MessagingResponse()
-            return PlainTextResponse(str(response), status_code=200, media_type="application/xml")
         print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND] 🔥🔥🔥 INBOUND WEBHOOK RECEIVED 🔥🔥🔥", flush=True)
-        # 🔥 INVARIANT 2 VERIFICATION: Inbound webhook hits handler
-        logger.error(f"[INVARIANT] ✅ Inbound webhook received: From={From} Body={Body}")
+        print(f"[TWILIO_INBOUND] 🔄 MARKOV STATE TRANSITION DETECTED", flush=True)
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND]   Inbound text: '{Body}'", flush=True)
+        print(f"[TWILIO_INBOUND]   Previous state: {previous_state}", flush=True)
+        print(f"[TWILIO_INBOUND]   Next state: {next_state}", flush=True)
+        print(f"[TWILIO_INBOUND]   Intent category: {result.get('intent', {}).get('category', 'unknown')}", flush=True)
+        print(f"[TWILIO_INBOUND]   Intent subcategory: {result.get('intent', {}).get('subcategory', 'unknown')}", flush=True)
+        print(f"[TWILIO_INBOUND]   Transition: {previous_state} → {next_state}", flush=True)
+        logger.info(f"[MARKOV] inbound='{Body}' → state='{next_state}' (previous='{previous_state}')")
         print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND] Original From: {From}", flush=True)
-        print(f"[TWILIO_INBOUND] Normalized phone: {normalized_phone}", flush=True)
-        print(f"[TWILIO_INBOUND] Message body: {Body[:100]}...", flush=True)
-        print(f"[TWILIO_INBOUND] Message body length: {len(Body)}", flush=True)
         
-        # Initialize twilio_phone at the top to avoid UnboundLocalError
-        twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND] 🔄 STATE TRANSITION", flush=True)
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND]   Previous state: {previous_state}", flush=True)
+        print(f"[TWILIO_INBOUND]   Next state: {next_state}", flush=True)
+        print(f"[TWILIO_INBOUND]   Transition: {previous_state} → {next_state}", flush=True)
+        print("=" * 80, flush=True)
         
-        # 🔥 CRITICAL: Prevent bot loop - check if we just sent a message to this number
-        # We'll still process/store the inbound (so it appears in leads) but skip auto-reply
-        conn = get_conn()
-        skip_auto_reply = False
-        try:
-            with conn.cursor() as loop_check_cur:
-                loop_check_cur.execute("""
-                    SELECT sent_at, direction, message_text
-                    FROM message_events
-                    WHERE phone_number = %s
-                      AND direction = 'outbound'
-                      AND message_sid IS NOT NULL
-                    ORDER BY sent_at DESC
+        # CRITICAL: Get rep-specific Markov response text
+        # - NLP logic (state transitions) is SHARED across all reps (same conversation tree)
+        # - Response TEXT is REP-SPECIFIC (each rep can customize their pitch/responses)
+        # - If rep_user_id is set, uses that rep's responses; otherwise uses global responses
+        # - If multiple reps messaged, rep_user_id reflects the LAST rep to message (conflict resolution)
+        
+        # 🔥 CRITICAL: Re-read rep_user_id from database RIGHT BEFORE loading Markov responses
+        # This ensures we use the absolute latest value after any ownership changes from blasts
+        # This handles graceful transitions when different reps contact the same number
+        # CRITICAL: Must scope to environment_id
+        print(f"[TWILIO_INBOUND] 🔄 Re-reading conversation rep_user_id from DB (for Markov lookup)...", flush=True)
+        with conn.cursor() as verify_cur:
+            try:
+                verify_cur.execute("""
+                    SELECT rep_user_id FROM conversations 
+                    WHERE phone = %s AND environment_id = %s
                     LIMIT 1
+                """, (normalized_phone, environment_id))
+            except psycopg2.ProgrammingError:
+                # Fallback if environment_id column doesn't exist
+                verify_cur.execute("""
+                    SELECT rep_user_id FROM conversations WHERE phone = %s LIMIT 1
                 """, (normalized_phone,))
-                recent_outbound = loop_check_cur.fetchone()
-                if recent_outbound:
-                    sent_at = recent_outbound[0]
-                    # Handle timezone-aware and naive datetimes
-                    from datetime import datetime, timezone
-                    now_utc = datetime.now(timezone.utc) if hasattr(datetime, 'now') else datetime.utcnow()
-                    if sent_at.tzinfo is None:
-                        # If naive, assume UTC and make it timezone-aware
-                        sent_at_aware = sent_at.replace(tzinfo=timezone.utc)
-                    else:
-                        sent_at_aware = sent_at
-                    time_since_sent = (now_utc - sent_at_aware).total_seconds()
-                    if time_since_sent < 5:  # Less than 5 seconds ago
-                        print(f"[TWILIO_INBOUND] 🛑 BOT LOOP PREVENTION: Detected recent outbound {time_since_sent:.2f}s ago", flush=True)
-                        print(f"[TWILIO_INBOUND]   Will still store inbound message (for leads) but skip auto-reply", flush=True)
-                        skip_auto_reply = True
-        except Exception as loop_check_error:
-            print(f"[TWILIO_INBOUND] ⚠️ Error checking for bot loop (continuing anyway): {loop_check_error}", flush=True)
+            verify_row = verify_cur.fetchone()
+            if verify_row:
+                latest_rep_user_id = verify_row[0]
+                if latest_rep_user_id != rep_user_id:
+                    print(f"[TWILIO_INBOUND] ⚠️ rep_user_id changed! Old: {rep_user_id}, New: {latest_rep_user_id}", flush=True)
+                    print(f"[TWILIO_INBOUND] ✅ Using latest rep_user_id from DB: {latest_rep_user_id}", flush=True)
+                    rep_user_id = latest_rep_user_id
+                else:
+                    print(f"[TWILIO_INBOUND] ✅ rep_user_id unchanged: {rep_user_id}", flush=True)
+            else:
+                print(f"[TWILIO_INBOUND] ⚠️ No conversation found in DB for re-read, using current rep_user_id: {rep_user_id}", flush=True)
         
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND] 🔍 MARKOV RESPONSE LOOKUP", flush=True)
+        print("=" * 80, flush=True)
         
-        # 🔧 FIX C: Resolve card_id EARLY by looking up card by phone number
-        # This ensures we have card_id available for rep hydration, even if conversation doesn't have it
-        # CRITICAL: Use E.164 format for phone lookup (preserve + and country code)
-        print(f"[TWILIO_INBOUND] 🔍 Step 1: Resolving card by phone number...", flush=True)
-        print(f"[TWILIO_INBOUND]   Looking up card with phone (E.164): {From}", flush=True)
-        card_id = None
-        card = None
-        with conn.cursor() as cur:
-            # Try to find card by phone number in card_data JSONB
-            # Try both E.164 format and normalized format for backward compatibility
+        # 🔥 CRITICAL FIX: For inbound, use current state for reply, not transitioned state
+        # State transitions are for tracking, not reply selection
+        # Inbound auto-reply must use the response for the current detected state, not the transitioned state
+        reply_state = previous_state  # Use current detected state for reply lookup
+        
+        # Add safety guard for outbound-only states
+        OUTBOUND_ONLY_STATES = {"initial_outreach"}
+        if reply_state in OUTBOUND_ONLY_STATES:
+            # If previous_state is outbound-only, we can't use it for inbound reply lookup
+            # Use next_state instead (the state we're transitioning TO)
+            logger.info(f"[MARKOV] reply_state is outbound-only: {reply_state}, using next_state for reply: {next_state}")
+            print(f"[TWILIO_INBOUND] ⚠️ reply_state is outbound-only: {reply_state}, using next_state for reply: {next_state}", flush=True)
+            reply_state = next_state  # Use next_state since previous_state is outbound-only
+        
+        # Log the distinction between reply state and tracking state
+        logger.info(f"[MARKOV_REPLY_SELECTION] reply_state={reply_state} tracking_state={next_state}")
+        print(f"[MARKOV_REPLY_SELECTION] reply_state={reply_state} tracking_state={next_state}", flush=True)
+        print(f"[TWILIO_INBOUND]   reply_state (for lookup): '{reply_state}'", flush=True)
+        print(f"[TWILIO_INBOUND]   tracking_state (for DB): '{next_state}'", flush=True)
+        print(f"[TWILIO_INBOUND]   rep_user_id (before final check): {rep_user_id}", flush=True)
+        print(f"[TWILIO_INBOUND]   phone: {normalized_phone}", flush=True)
+        print(f"[TWILIO_INBOUND]   routing_mode: {routing_mode}", flush=True)
+        
+        # Step 4: Final safety check before Markov lookup
+        # One last cheap lookup to avoid accidental global responses
+        if not rep_user_id and card_id:
+            cur = conn.cursor()
             cur.execute("""
-                SELECT id, type, card_data, sales_state, owner
-                FROM cards
-                WHERE type = 'person'
-                AND (card_data->>'phone' = %s OR card_data->>'phone' = %s)
+                SELECT user_id as rep_user_id
+                FROM card_assignments
+                WHERE card_id = %s
+                ORDER BY assigned_at DESC
                 LIMIT 1
-            """, (From, normalized_phone))
-            card_row = cur.fetchone()
-            if card_row:
-                card_id = card_row[0]
-                card = {
-                    "id": card_row[0],
-                    "type": card_row[1],
-                    "card_data": card_row[2],
-                    "sales_state": card_row[3],
-                    "owner": card_row[4],
-                }
-                print(f"[TWILIO_INBOUND] ✅ Card found by phone: card_id={card_id}", flush=True)
+            """, (card_id,))
+            row = cur.fetchone()
+            if row and row[0]:
+                rep_user_id = row[0]
+                logger.warning(f"[MARKOV] rep_user_id repaired at final check via assignment: {rep_user_id} card_id={card_id}")
+                print(f"[TWILIO_INBOUND] ⚠️ [MARKOV] rep_user_id repaired at final check: {rep_user_id} (card_id={card_id})", flush=True)
             else:
-                print(f"[TWILIO_INBOUND] ⚠️ No card found by phone number: {normalized_phone}", flush=True)
+                logger.warning(f"[MARKOV] No rep_user_id found; using global responses. card_id={card_id}")
+                print(f"[TWILIO_INBOUND] ⚠️ [MARKOV] No rep_user_id found; will use global responses (card_id={card_id})", flush=True)
+        
+        print(f"[TWILIO_INBOUND]   rep_user_id (final): {rep_user_id}", flush=True)
+        print(f"[TWILIO_INBOUND]   Querying markov_responses table for reply_state='{reply_state}'...", flush=True)
+        
+        # Use trace wrapper for comprehensive logging (inbound context - fail loud if empty)
+        # 🔥 CRITICAL: Use reply_state (previous_state/current detected state) for reply lookup, not next_state
+        configured_response = get_markov_response_with_trace(
+            conn, 
+            reply_state,  # Changed from next_state to reply_state (previous_state)
+            rep_user_id, 
+            phone=normalized_phone, 
+            environment_id=environment_id,
+            context="inbound",
+            allow_empty=False  # Fail loud for inbound if graph is empty
+        )
+        logger.info(f"[MARKOV] lookup reply_state={reply_state} tracking_state={next_state} rep_user_id={rep_user_id} rep_specific_found={bool(configured_response)}")
+        print("=" * 80, flush=True)
+        if configured_response:
+            print("=" * 80, flush=True)
+            print(f"[TWILIO_INBOUND] ✅ RESPONSE FOUND", flush=True)
+            print("=" * 80, flush=True)
+            print(f"[TWILIO_INBOUND]   Response length: {len(configured_response)} chars", flush=True)
+            print(f"[TWILIO_INBOUND]   Response preview: {configured_response[:100]}...", flush=True)
+            print(f"[TWILIO_INBOUND]   Full response: {configured_response}", flush=True)
+            print("=" * 80, flush=True)
+        else:
+            print("=" * 80, flush=True)
+            print(f"[TWILIO_INBOUND] ⚠️ NO RESPONSE FOUND", flush=True)
+            print("=" * 80, flush=True)
+            print(f"[TWILIO_INBOUND]   Reply State: '{reply_state}' (used for lookup)", flush=True)
+            print(f"[TWILIO_INBOUND]   Tracking State: '{next_state}' (used for DB update)", flush=True)
+            print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
+            print(f"[TWILIO_INBOUND]   💡 Suggestion: Rep should configure a response for reply_state '{reply_state}', or owner should set a global default", flush=True)
+            print("=" * 80, flush=True)
         
-        # 🔧 FIX #1: Initialize environment_id at the very start (MANDATORY)
-        # This prevents UnboundLocalError - environment_id must be total, never conditional
-        environment_id = None
-        env_source = None
-        routed_rep_id = None
-        routed_campaign_id = None
-        
-        # 🔥 CRITICAL: Find conversation by phone FIRST (across all environments)
-        # This prevents losing the conversation due to environment mismatch
-        print(f"[TWILIO_INBOUND] 🔍 Step 2: Finding conversation by phone (across environments)...", flush=True)
-        # 🔥 STEP 3: Conversation lookup checkpoint (CRITICAL)
-        logger.error(f"🔍 LOOKUP CONVERSATION BY PHONE = {normalized_phone}")
-        print(f"🔍 LOOKUP CONVERSATION BY PHONE = {normalized_phone}", flush=True)
-        # 🔥 INVARIANT VERIFICATION: Log lookup parameters BEFORE query
-        logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] Looking for conversation: phone={normalized_phone} (original={From})")
-        print(f"[INVARIANT] [CONVERSATION_LOOKUP] phone={normalized_phone} (original={From})", flush=True)
-        conversation_by_phone = None
-        env_id_from_convo = None
-        rep_from_convo = None
-        card_id_from_convo = None
-        state_from_convo = None
-        
-        with conn.cursor() as cur:
-            try:
-                # 🔥 CRITICAL FIX: Order by last_outbound_at DESC to find conversation with most recent outbound
-                # This ensures inbound replies attach to the conversation that sent the most recent outbound message
-                # Priority: 1) Most recent outbound, 2) Then by updated_at for conversations without outbound timestamps
-                cur.execute("""
-                    SELECT environment_id, rep_user_id, card_id, state, last_outbound_source, last_outbound_at, updated_at
-                    FROM conversations
-                    WHERE phone = %s
-                    ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC
-                    LIMIT 1
-                """, (normalized_phone,))
-                conversation_by_phone = cur.fetchone()
-                # 🔥 INVARIANT VERIFICATION: Log lookup result
-                if conversation_by_phone:
-                    logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] ✅ FOUND: env={conversation_by_phone[0]} card_id={conversation_by_phone[2]} state={conversation_by_phone[3]}")
-                    print(f"[INVARIANT] [CONVERSATION_LOOKUP] ✅ FOUND conversation", flush=True)
-                else:
-                    logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] ❌ NOT FOUND: No conversation exists for phone={normalized_phone}")
-                    print(f"[INVARIANT] [CONVERSATION_LOOKUP] ❌ NOT FOUND - checking all conversations...", flush=True)
-                    # Debug: Show all conversations with similar phone numbers (ordered by last_outbound_at for consistency)
-                    cur.execute("SELECT phone, card_id, state, environment_id FROM conversations ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC LIMIT 10")
-                    all_convs = cur.fetchall()
-                    logger.error(f"[INVARIANT] [CONVERSATION_LOOKUP] Recent conversations: {all_convs}")
-                    print(f"[INVARIANT] [CONVERSATION_LOOKUP] Recent conversations in DB:", flush=True)
-                    for conv in all_convs:
-                        print(f"  phone={conv[0]} card_id={conv[1]} state={conv[2]} env={conv[3]}", flush=True)
-            except psycopg2.ProgrammingError:
-                # Fallback if environment_id column doesn't exist
-                # Still use last_outbound_at for proper conversation resolution
-                cur.execute("""
-                    SELECT NULL as environment_id, rep_user_id, card_id, state, NULL as last_outbound_source, last_outbound_at, updated_at
-                    FROM conversations
-                    WHERE phone = %s
-                    ORDER BY last_outbound_at DESC NULLS LAST, updated_at DESC
-                    LIMIT 1
-                """, (normalized_phone,))
-                conversation_by_phone = cur.fetchone()
-        
-        # 🔧 FIX #1: If conversation exists → its environment is authoritative (NEVER route)
-        # Rule: If a conversation exists → its environment is authoritative. Routing is only allowed when NO conversation exists.
-        from backend.environment import route_inbound_to_environment, get_or_create_environment, store_message_event
-        
-        if conversation_by_phone:
-            env_id_from_convo, rep_from_convo, card_id_from_convo, state_from_convo, last_source, last_outbound_at, updated_at = conversation_by_phone
-            # 🔥 STEP 3 (continued): Conversation found confirmation
-            # Log last_outbound_at to show why this conversation was selected (most recent outbound)
-            logger.error(f"✅ CONVERSATION FOUND env={env_id_from_convo} rep={rep_from_convo} card_id={card_id_from_convo} state={state_from_convo} last_outbound_at={last_outbound_at}")
-            print(f"✅ CONVERSATION FOUND env={env_id_from_convo} rep={rep_from_convo} card_id={card_id_from_convo} state={state_from_convo} last_outbound_at={last_outbound_at}", flush=True)
-            print(f"[TWILIO_INBOUND] ✅ Found conversation by phone (selected by most recent outbound): env={env_id_from_convo}, rep={rep_from_convo}, state={state_from_convo}, last_source={last_source}, last_outbound_at={last_outbound_at}", flush=True)
-            # 🔥 INVARIANT VERIFICATION: Conversation match confirmed - selected by last_outbound_at DESC
-            logger.error(f"[INVARIANT] ✅ Conversation match: phone={normalized_phone} env={env_id_from_convo} card_id={card_id_from_convo} state={state_from_convo} last_outbound_at={last_outbound_at} (selected by most recent outbound)")
+        if configured_response:
+            print(f"[TWILIO_INBOUND] ✅ Configured response found, processing...", flush=True)
+            print(f"[TWILIO_INBOUND]   Original response: {configured_response}", flush=True)
+            print(f"[TWILIO_INBOUND]   Response length: {len(configured_response)} chars", flush=True)
             
-            # Step 1: conversation-by-phone (highest priority - NEVER override with routing)
-            if env_id_from_convo:
-                environment_id = env_id_from_convo
-                env_source = "conversation"
-                print(f"[TWILIO_INBOUND] ✅ Using environment_id from conversation: {environment_id}", flush=True)
-                
-                # 🔒 HARD GUARD: Never override conversation environment with routing
-                # If conversation exists, its environment is authoritative
-                routed_rep_id = rep_from_convo
-                # Get campaign from environment if needed
-                try:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            SELECT campaign_id FROM environments WHERE id = %s
-                        """, (environment_id,))
-                        env_row = cur.fetchone()
-                        if env_row:
-                            routed_campaign_id = env_row[0]
-                except:
-                    routed_campaign_id = None
+            # Check if response is empty after coercion (safety check)
+            if not configured_response or not configured_response.strip():
+                print(f"[TWILIO_INBOUND] ⚠️ WARNING: Configured response is empty after processing", flush=True)
+                logger.warning(f"[MARKOV] Empty response for reply_state '{reply_state}' - will use fallback")
+                configured_response = None  # Trigger fallback
             else:
-                # Conversation exists but env is NULL - create new environment (don't route to old one)
-                print(f"[TWILIO_INBOUND] ⚠️ Conversation exists but environment_id is NULL - creating new environment", flush=True)
-                
-                # Note: We'll set card_id from conversation at the end (line ~1407) for consistency
-                # But we need it early here for environment creation, so set it now
-                # 🔥 CRITICAL: Use conversation's card_id as authoritative (it's the card that received the outbound)
-                # Step 1 lookup may find a different card if multiple cards share the same phone
-                if card_id_from_convo:
-                    card_id = card_id_from_convo
-                    print(f"[TWILIO_INBOUND] ✅ Using conversation's card_id (authoritative, early for env creation): {card_id}", flush=True)
-                    # Reload card using conversation's card_id (it may differ from Step 1 lookup)
-                    card = None  # Force reload below
-                
-                resolved_rep_user_id = rep_from_convo
-                if card_id:
-                    from backend.handoffs import resolve_current_rep
-                    resolved_rep_user_id = resolve_current_rep(conn, card_id) or rep_from_convo
-                
-                # Infer campaign_id from card if available (need to reload card first)
-                if not card and card_id:
-                    from backend.cards import get_card
-                    card = get_card(conn, card_id)
-                
-                campaign_id = None
+                # If we have a card, substitute template placeholders
                 if card and card.get("card_data"):
-                    card_data = card["card_data"]
-                    if card_data.get("fraternity"):
-                        campaign_id = "frat_rt4orgs"
-                    elif card_data.get("faith_group"):
-                        campaign_id = "faith_rt4orgs"
-                    elif card_data.get("role") == "Office":
-                        campaign_id = "faith_rt4orgs"
-                    else:
-                        campaign_id = "default_rt4orgs"
-                
-                environment_id = get_or_create_environment(conn, normalized_phone, resolved_rep_user_id, campaign_id, card_id)
-                routed_rep_id = resolved_rep_user_id
-                routed_campaign_id = campaign_id
-                env_source = "conversation_repair"
-                print(f"[TWILIO_INBOUND] ✅ Created new environment for existing conversation: {environment_id}", flush=True)
-            
-            # 🔥 CRITICAL FIX: Always use conversation's card_id if it exists (authoritative)
-            # The conversation's card_id is the card that received the outbound message
-            # Step 1 phone lookup may find a different card if multiple cards share the same phone
-            if card_id_from_convo:
-                card_id = card_id_from_convo
-                print(f"[TWILIO_INBOUND] ✅ Using conversation's card_id (authoritative from outbound): {card_id}", flush=True)
-                # Reload card using conversation's card_id (it may differ from Step 1 lookup)
-                card = None  # Force reload below
-        else:
-            # Step 2: No conversation exists - this is a HARD FAILURE
-            # 🔥 STEP 3 (continued): Conversation NOT found - explicit drop log
-            logger.error(f"🧨 INBOUND_DROP: NO_CONVERSATION raw_from={raw_from} normalized={normalized_phone}")
-            print(f"🧨 INBOUND_DROP: NO_CONVERSATION raw_from={raw_from} normalized={normalized_phone}", flush=True)
-            # 🔥 CRITICAL: Conversation MUST exist (created during blast) - no fallback guessing
-            print(f"[TWILIO_INBOUND] ❌ FATAL: No conversation found by phone - ABORTING inbound processing", flush=True)
-            # 🔥 INVARIANT VERIFICATION: Conversation NOT found - this is the failure point
-            logger.error(f"[INBOUND_DROP] ❌ Conversation NOT FOUND - inbound ABORTED (no fallback) reason=NO_CONVERSATION")
-            logger.error(f"[INVARIANT] ❌ Conversation NOT FOUND - inbound ABORTED (no fallback)")
-            logger.error(f"[INVARIANT] ❌ CAUSE: No conversation row exists for phone={normalized_phone} (original={From})")
-            logger.error(f"[INVARIANT] ❌ REQUIRED: Conversation must be created during blast BEFORE SMS send")
-            logger.error(f"[INVARIANT] ❌ Check: Did blast create conversation? Is phone normalization consistent?")
-            logger.error(f"[INVARIANT] ❌ DIAGNOSTIC: raw_from={From} normalized={normalized_phone}")
-            # 🔥 CRITICAL: Do NOT route or create - conversation must exist from blast
-            # Return early - do not process inbound without conversation anchor
-            print(f"[TWILIO_INBOUND] ❌ Inbound message from {From} (Body: '{Body}') - NO CONVERSATION FOUND", flush=True)
-            print(f"[TWILIO_INBOUND] ❌ This message will NOT be processed - conversation anchor missing", flush=True)
-            return PlainTextResponse("No conversation found - message not processed", status_code=200)
-        
-        # 🔒 CRITICAL: Log environment_id source and assert conversation authority
-        logger.error(f"[INBOUND_ENV] using environment_id={environment_id} source={env_source} phone={normalized_phone}")
-        print(f"[TWILIO_INBOUND] 🔒 [INBOUND_ENV] environment_id={environment_id} source={env_source}", flush=True)
-        
-        # 🔒 HARD GUARD: If conversation exists, environment must match (never override)
-        if conversation_by_phone and env_id_from_convo and environment_id != env_id_from_convo:
-            error_msg = f"[INBOUND] FATAL: Environment mismatch. conversation.env={env_id_from_convo} but using={environment_id}"
-            logger.error(error_msg)
-            raise RuntimeError(error_msg)
-        
-        # Final safety check - this should never happen but fail loud if it does
-        if environment_id is None:
-            error_msg = f"[INBOUND] FATAL: environment_id is None after all fallbacks. phone={normalized_phone}"
-            logger.error(error_msg)
-            raise RuntimeError(error_msg)
-        
-        # Step 3: Use helper function to resolve rep_user_id with repair capability
-        # This replaces the previous complex resolution logic with a clean helper that:
-        # - Checks conversation cache first (fast path)
-        # - Repairs from card_assignments if cache is stale
-        # - Falls back to routing if no assignment found
-        rep_user_id, rep_source, effective_card_id = resolve_rep_user_id_for_inbound(
-            conn,
-            environment_id=environment_id,
-            phone=normalized_phone,
-            card_id=card_id,
-            routed_rep_id=routed_rep_id,
-        )
-        logger.info(f"[INBOUND] resolved rep_user_id={rep_user_id} source={rep_source} env={environment_id} phone={normalized_phone} card_id={effective_card_id}")
-        print(f"[TWILIO_INBOUND] ✅ Resolved rep_user_id: {rep_user_id} (source: {rep_source})", flush=True)
-        print(f"[TWILIO_INBOUND]   Effective card_id: {effective_card_id}", flush=True)
-        
-        # Update card_id if helper returned a different one
-        if effective_card_id and effective_card_id != card_id:
-            card_id = effective_card_id
-            print(f"[TWILIO_INBOUND] ✅ Updated card_id from helper: {card_id}", flush=True)
-        
-        # 🔧 FIX #2: Use state from conversation_by_phone if available (don't mutate before Markov)
-        # Rule: Read current_state from conversation, use it for Markov, THEN update after Markov selection
-        routing_mode = 'ai'  # Default to AI
-        conversation_state = state_from_convo  # Use state from conversation_by_phone if available
-        conversation_exists = conversation_by_phone is not None
-        
-        # If we didn't get state from conversation_by_phone, query it
-        if conversation_state is None:
-            with conn.cursor() as cur:
-                try:
-                    cur.execute("""
-                        SELECT routing_mode, state 
-                        FROM conversations 
-                        WHERE phone = %s AND environment_id = %s
-                        LIMIT 1
-                    """, (normalized_phone, environment_id))
-                    row = cur.fetchone()
-                    if row:
-                        conversation_exists = True
-                        routing_mode = row[0] or 'ai'
-                        conversation_state = row[1]
-                        print(f"[TWILIO_INBOUND] ✅ Conversation found for environment {environment_id}", flush=True)
-                        print(f"[TWILIO_INBOUND]   routing_mode: {routing_mode}", flush=True)
-                        print(f"[TWILIO_INBOUND]   current_state: {conversation_state}", flush=True)
+                    print(f"[TWILIO_INBOUND] 📋 Card found, applying template substitution...", flush=True)
+                    from backend.blast import _substitute_template
+                    from archive_intelligence.message_processor.utils import load_sales_history, find_matching_fraternity
+                    
+                    data = card["card_data"]
+                    sales_history = load_sales_history()
+                    purchased_example = None
+                    if isinstance(sales_history, dict):
+                        purchased_example = find_matching_fraternity(data, sales_history)
+                    
+                    reply_text = _substitute_template(configured_response, data, purchased_example)
+                    
+                    # Check if substitution resulted in empty text
+                    if not reply_text or not reply_text.strip():
+                        print(f"[TWILIO_INBOUND] ⚠️ WARNING: Template substitution resulted in empty text", flush=True)
+                        logger.warning(f"[MARKOV] Empty text after substitution for reply_state '{reply_state}' - will use fallback")
+                        reply_text = None  # Trigger fallback
                     else:
-                        print(f"[TWILIO_INBOUND] ⚠️ No conversation found for environment {environment_id}", flush=True)
-                except psycopg2.ProgrammingError:
-                    # Fallback if environment_id column doesn't exist
-                    cur.execute("""
-                        SELECT routing_mode, state FROM conversations WHERE phone = %s LIMIT 1
-                    """, (normalized_phone,))
-                    row = cur.fetchone()
-                    if row:
-                        conversation_exists = True
-                        routing_mode = row[0] or 'ai'
-                        conversation_state = row[1]
-        
-        # 🔒 HARD GUARD: State must not mutate before Markov
-        # If we have state_from_convo, it must match conversation_state
-        if conversation_by_phone and state_from_convo and conversation_state != state_from_convo:
-            logger.warning(f"[INBOUND] State mismatch detected: conversation_by_phone.state={state_from_convo} but query returned={conversation_state}. Using conversation_by_phone state.")
-            conversation_state = state_from_convo  # Prefer conversation_by_phone state
-        
-        # Final ownership determination for logging
-        final_owner = "OWNER" if not rep_user_id else f"REP({rep_user_id})"
-        print(f"[TWILIO_INBOUND] 📋 POLICY A: Final resolved owner: {final_owner}", flush=True)
-        
-        print(f"[TWILIO_INBOUND] 📋 Conversation Summary:", flush=True)
-        print(f"[TWILIO_INBOUND]   Phone: {normalized_phone} (original: {From})", flush=True)
-        print(f"[TWILIO_INBOUND]   Routing mode: {routing_mode}", flush=True)
-        print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id} (source: {rep_source})", flush=True)
-        print(f"[TWILIO_INBOUND]   Current state: {conversation_state}", flush=True)
-        if rep_user_id:
-            print(f"[TWILIO_INBOUND] ✅ Will use rep-specific Markov responses for user_id: {rep_user_id}", flush=True)
-        else:
-            print(f"[TWILIO_INBOUND] ⚠️ Will use global Markov responses (no rep assigned)", flush=True)
-        
-        # Store inbound message in history and message_events
-        from backend.rep_messaging import add_message_to_history
-        add_message_to_history(conn, normalized_phone, "inbound", Body, "contact")
-        
-        # Store inbound message event (no message_sid for inbound - it's from Twilio)
-        store_message_event(
-            conn=conn,
-            phone_number=normalized_phone,
-            environment_id=environment_id,
-            direction="inbound",
-            message_text=Body,
-            message_sid=None,  # Inbound messages don't have our message_sid
-            rep_id=rep_user_id,
-            campaign_id=routed_campaign_id,
-            state=conversation_state
-        )
-        
-        # POLICY A: Whoever blasts LAST owns the automation
-        # Auto-responses work for the current owner (rep or owner)
-        # No special "rep mode" that disables automation - ownership determines responses
-        print(f"[TWILIO_INBOUND] 📋 Routing mode: {routing_mode}, Rep user ID: {rep_user_id}", flush=True)
-        print(f"[TWILIO_INBOUND] ✅ Policy A: Auto-responses enabled for current owner", flush=True)
-        
-        # Continue with AI processing for 'ai' mode
-        # Classify intent from message text (simple keyword-based for now)
-        print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND] 🔍 MARKOV INTENT CLASSIFICATION", flush=True)
-        print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND]   Message text: '{Body}'", flush=True)
-        print(f"[TWILIO_INBOUND]   Current conversation state: {conversation_state}", flush=True)
-        print(f"[TWILIO_INBOUND]   Card ID: {card_id}", flush=True)
-        print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
-        intent = classify_intent_simple(Body)
-        print(f"[TWILIO_INBOUND] ✅ Classified intent: {json.dumps(intent, indent=2)}", flush=True)
-        print(f"[TWILIO_INBOUND]   category: {intent.get('category', 'NONE')}", flush=True)
-        print(f"[TWILIO_INBOUND]   subcategory: {intent.get('subcategory', 'NONE')}", flush=True)
-        if not intent:
-            print(f"[TWILIO_INBOUND] ⚠️ WARNING: Intent classifier returned empty dict - no category detected", flush=True)
-        print("=" * 80, flush=True)
-        
-        # Prepare event payload for inbound_intelligent
-        # Include environment_id and conversation state for proper scoping
-        event = {
-            "phone": normalized_phone,
-            "text": Body,
-            "body": Body,
-            "intent": intent,
-            "environment_id": environment_id,  # Pass environment for proper scoping
-            "current_state": conversation_state,  # Pass current state to avoid re-lookup
-            "rep_user_id": rep_user_id,  # Pass rep_user_id for context
-        }
-        
-        print(f"[TWILIO_INBOUND] 📞 Calling inbound_intelligent for {normalized_phone}", flush=True)
-        print(f"[TWILIO_INBOUND]   Event payload: {json.dumps(event, indent=2)}", flush=True)
-        print(f"[TWILIO_INBOUND]   Current conversation state: {conversation_state}", flush=True)
-        print(f"[TWILIO_INBOUND]   Environment ID: {environment_id}", flush=True)
-        print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
-        print(f"[TWILIO_INBOUND]   Card ID: {card_id}", flush=True)
-        
-        # 🔥 CRITICAL INVARIANT: Inbound handler must never return before Markov finishes OR a reply is sent
-        # The HTTP "OK" response is NOT the SMS - SMS must be sent explicitly via Twilio REST API
-        
-        # Call the intelligence handler directly (no HTTP overhead)
-        # 🔥 STEP 4: Markov invocation proof (non-negotiable)
-        logger.error(f"🔥🔥🔥 MARKOV_ENTER inbound conversation_id={conversation_by_phone[2] if conversation_by_phone else 'N/A'} text={Body[:100]}")
-        print(f"🔥🔥🔥 MARKOV_ENTER inbound text={Body[:100]}", flush=True)
-        # 🔥 INVARIANT 3 VERIFICATION: Markov evaluation
-        logger.error(f"[INVARIANT] [MARKOV] Context=inbound Current state={conversation_state} Rep={rep_user_id}")
-        result = await inbound_intelligent(event)
-        response_text = result.get('response_text', '')
-        next_state = result.get('next_state')
-        logger.error(f"✅ MARKOV_EXIT conversation_id={conversation_by_phone[2] if conversation_by_phone else 'N/A'} next_state={next_state} response_length={len(response_text) if response_text else 0}")
-        print(f"✅ MARKOV_EXIT next_state={next_state} response_length={len(response_text) if response_text else 0}", flush=True)
-        
-        # 🔥 CRITICAL LOG: Show Markov output immediately
-        logger.error(f"[MARKOV_RESULT] next_state={next_state} previous_state={result.get('previous_state')} response_text={'SET' if response_text else 'EMPTY'}")
-        print(f"[MARKOV_RESULT] next_state={next_state} previous_state={result.get('previous_state')} response_text={'SET' if response_text else 'EMPTY'}", flush=True)
-        
-        print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND] ✅ MARKOV INTELLIGENCE RESULT", flush=True)
-        print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND]   Full result: {json.dumps(result, indent=2, default=str)}", flush=True)
-        next_state = result.get('next_state')
-        previous_state = result.get('previous_state')
-        response_text = result.get('response_text', '')
-        print(f"[TWILIO_INBOUND]   next_state: {next_state}", flush=True)
-        print(f"[TWILIO_INBOUND]   previous_state: {previous_state}", flush=True)
-        print(f"[TWILIO_INBOUND]   intent: {result.get('intent')}", flush=True)
-        
-        # 🔥 INVARIANT 3 VERIFICATION: Markov transition and response
-        if previous_state and next_state:
-            logger.error(f"[INVARIANT] [MARKOV] Transition: {previous_state} → {next_state}")
-            print(f"[INVARIANT] [MARKOV] Transition: {previous_state} → {next_state}", flush=True)
-        if response_text:
-            logger.error(f"[INVARIANT] [MARKOV] Response found: length={len(response_text)}")
-            print(f"[INVARIANT] [MARKOV] Response found: length={len(response_text)}", flush=True)
-        else:
-            logger.error(f"[INVARIANT] [MARKOV] ⚠️ NO RESPONSE TEXT (check rep_markov_responses table)")
-            print(f"[INVARIANT] [MARKOV] ⚠️ NO RESPONSE TEXT - check rep_markov_responses table for state={next_state}", flush=True)
-        print("=" * 80, flush=True)
-        
-        # 🔧 CRITICAL: Update last_inbound_at and card_id on the conversation scoped to environment_id
-        # The inbound_intelligent function updates by phone only, but we need to update
-        # the specific conversation for this environment to mark it as a lead
-        # Also ensure card_id is set (required for leads endpoint)
-        print(f"[TWILIO_INBOUND] 🔧 Updating last_inbound_at and card_id for environment {environment_id}...", flush=True)
-        with conn.cursor() as update_cur:
-            try:
-                # Update last_inbound_at and card_id scoped to environment
-                update_cur.execute("""
-                    UPDATE conversations 
-                    SET last_inbound_at = NOW(), 
-                        updated_at = NOW(),
-                        card_id = COALESCE(%s, card_id)
-                    WHERE phone = %s AND environment_id = %s
-                """, (card_id, normalized_phone, environment_id))
-                if update_cur.rowcount > 0:
-                    print(f"[TWILIO_INBOUND] ✅ Updated last_inbound_at and card_id for conversation (environment {environment_id}, card_id={card_id})", flush=True)
-                else:
-                    print(f"[TWILIO_INBOUND] ⚠️ No conversation found to update (phone={normalized_phone}, environment_id={environment_id})", flush=True)
-                    # Try to create conversation if it doesn't exist
-                    if not conversation_exists:
-                        print(f"[TWILIO_INBOUND] 🔧 Creating new conversation for lead...", flush=True)
-                        try:
-                            update_cur.execute("""
-                                INSERT INTO conversations (phone, card_id, state, last_inbound_at, environment_id, rep_user_id)
-                                VALUES (%s, %s, %s, NOW(), %s, %s)
-                                ON CONFLICT (phone, environment_id) DO UPDATE SET
-                                    last_inbound_at = NOW(),
-                                    card_id = COALESCE(EXCLUDED.card_id, conversations.card_id),
-                                    updated_at = NOW()
-                            """, (normalized_phone, card_id, result.get("next_state", "initial_outreach"), environment_id, rep_user_id))
-                            print(f"[TWILIO_INBOUND] ✅ Created/updated conversation for lead", flush=True)
-                        except psycopg2.ProgrammingError:
-                            # Fallback if environment_id column doesn't exist
-                            update_cur.execute("""
-                                INSERT INTO conversations (phone, card_id, state, last_inbound_at)
-                                VALUES (%s, %s, %s, NOW())
-                                ON CONFLICT (phone) DO UPDATE SET
-                                    last_inbound_at = NOW(),
-                                    card_id = COALESCE(EXCLUDED.card_id, conversations.card_id),
-                                    updated_at = NOW()
-                            """, (normalized_phone, card_id, result.get("next_state", "initial_outreach")))
-                            print(f"[TWILIO_INBOUND] ✅ Created/updated conversation for lead (legacy mode)", flush=True)
-            except psycopg2.ProgrammingError:
-                # Fallback if environment_id column doesn't exist
-                update_cur.execute("""
-                    UPDATE conversations 
-                    SET last_inbound_at = NOW(), 
-                        updated_at = NOW(),
-                        card_id = COALESCE(%s, card_id)
-                    WHERE phone = %s
-                """, (card_id, normalized_phone))
-                if update_cur.rowcount > 0:
-                    print(f"[TWILIO_INBOUND] ✅ Updated last_inbound_at and card_id for conversation (legacy mode, card_id={card_id})", flush=True)
+                        print(f"[TWILIO_INBOUND] ✅ Template substitution complete", flush=True)
+                        print(f"[TWILIO_INBOUND]   Substituted response: {reply_text}", flush=True)
+                        print(f"[TWILIO_INBOUND]   Substituted length: {len(reply_text)} chars", flush=True)
+                        logger.info(f"[MARKOV] Generated reply for reply_state '{reply_state}': {reply_text[:50]}...")
                 else:
-                    print(f"[TWILIO_INBOUND] ⚠️ No conversation found to update (phone={normalized_phone})", flush=True)
-            except Exception as update_error:
-                print(f"[TWILIO_INBOUND] ⚠️ Error updating last_inbound_at: {update_error}", flush=True)
-                import traceback
-                print(f"[TWILIO_INBOUND] Traceback: {traceback.format_exc()}", flush=True)
-        
-        # Get card by phone to generate contextual reply (use card we already resolved earlier)
-        # Card should already be loaded from Step 1, but double-check if needed
-        if not card and card_id:
-            print(f"[TWILIO_INBOUND] 🔍 Card not loaded yet, fetching by card_id: {card_id}", flush=True)
-            card = get_card(conn, card_id)
-        
-        # Generate reply message using configured Markov responses
-        reply_text = None
-        next_state = None  # Define at higher scope for campaign suppression check
-        
-        # 🔒 SAFETY INVARIANT: Check if card is assigned before auto-responding
-        # Do not auto-respond to unassigned cards (prevents spam loops)
-        # ✅ OPTION A: Auto-assign on first inbound to conversation owner
-        card_assigned = False
-        if card_id:
-            from backend.assignments import get_card_assignment, assign_card_to_rep
-            assignment = get_card_assignment(conn, card_id)
-            card_assigned = assignment is not None and assignment.get("user_id") is not None
-            
-            if not card_assigned:
-                print(f"[TWILIO_INBOUND] 🔍 Card {card_id} is not assigned", flush=True)
+                    reply_text = configured_response
+                    print(f"[TWILIO_INBOUND] ✅ Using configured response as-is (no card for substitution)", flush=True)
+                    print(f"[TWILIO_INBOUND]   Final reply_text: {reply_text}", flush=True)
+                    logger.info(f"[MARKOV] Using configured response for reply_state '{reply_state}': {reply_text[:50]}...")
                 
-                # Auto-assign to conversation owner (rep_user_id) if available
-                if rep_user_id:
-                    print(f"[TWILIO_INBOUND] 🔄 Auto-assigning card to conversation owner: {rep_user_id}", flush=True)
-                    assign_success = assign_card_to_rep(
-                        conn=conn,
-                        card_id=card_id,
-                        user_id=rep_user_id,
-                        assigned_by=rep_user_id,  # Self-assigned via inbound
-                        notes="Auto-assigned on first inbound message"
-                    )
-                    if assign_success:
-                        print(f"[TWILIO_INBOUND] ✅ Card auto-assigned successfully to {rep_user_id}", flush=True)
-                        card_assigned = True
-                        # Re-fetch assignment to ensure it's fresh
-                        assignment = get_card_assignment(conn, card_id)
-                    else:
-                        print(f"[TWILIO_INBOUND] ⚠️ Failed to auto-assign card {card_id} to {rep_user_id}", flush=True)
-                else:
-                    print(f"[TWILIO_INBOUND] 🛑 SAFETY: Card {card_id} is not assigned and no rep_user_id available - skipping auto-response (inbound will still be stored)", flush=True)
-        
-        # Skip reply generation if bot loop detected OR card is unassigned (but still process/store inbound for leads)
-        if skip_auto_reply:
-            logger.error(f"[REPLY_BLOCKED] Reason=bot_loop_prevention skip_auto_reply=True")
-            print(f"[TWILIO_INBOUND] 🛑 Skipping reply generation due to bot loop prevention (inbound will still be stored)", flush=True)
-            reply_text = None
-        elif not card_assigned and card_id:
-            # Card is still unassigned after auto-assignment attempt
-            # This means either:
-            # 1. No rep_user_id was available (conversation has no owner)
-            # 2. Auto-assignment failed
-            logger.error(f"[REPLY_BLOCKED] Reason=card_unassigned card_id={card_id}")
-            print(f"[TWILIO_INBOUND] 🛑 Skipping reply generation - card is unassigned (inbound will still be stored)", flush=True)
-            print(f"[TWILIO_INBOUND]   Reason: Card {card_id} has no assignment and no rep_user_id to assign to", flush=True)
-            reply_text = None
-        elif result.get("next_state"):
-            next_state = result["next_state"]
-            previous_state = result.get("previous_state", "initial_outreach")
-            
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND] 🔄 MARKOV STATE TRANSITION DETECTED", flush=True)
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND]   Inbound text: '{Body}'", flush=True)
-            print(f"[TWILIO_INBOUND]   Previous state: {previous_state}", flush=True)
-            print(f"[TWILIO_INBOUND]   Next state: {next_state}", flush=True)
-            print(f"[TWILIO_INBOUND]   Intent category: {result.get('intent', {}).get('category', 'unknown')}", flush=True)
-            print(f"[TWILIO_INBOUND]   Intent subcategory: {result.get('intent', {}).get('subcategory', 'unknown')}", flush=True)
-            print(f"[TWILIO_INBOUND]   Transition: {previous_state} → {next_state}", flush=True)
-            logger.info(f"[MARKOV] inbound='{Body}' → state='{next_state}' (previous='{previous_state}')")
-            print("=" * 80, flush=True)
-            
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND] 🔄 STATE TRANSITION", flush=True)
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND]   Previous state: {previous_state}", flush=True)
-            print(f"[TWILIO_INBOUND]   Next state: {next_state}", flush=True)
-            print(f"[TWILIO_INBOUND]   Transition: {previous_state} → {next_state}", flush=True)
-            print("=" * 80, flush=True)
-            
-            # CRITICAL: Get rep-specific Markov response text
-            # - NLP logic (state transitions) is SHARED across all reps (same conversation tree)
-            # - Response TEXT is REP-SPECIFIC (each rep can customize their pitch/responses)
-            # - If rep_user_id is set, uses that rep's responses; otherwise uses global responses
-            # - If multiple reps messaged, rep_user_id reflects the LAST rep to message (conflict resolution)
-            
-            # 🔥 CRITICAL: Re-read rep_user_id from database RIGHT BEFORE loading Markov responses
-            # This ensures we use the absolute latest value after any ownership changes from blasts
-            # This handles graceful transitions when different reps contact the same number
-            # CRITICAL: Must scope to environment_id
-            print(f"[TWILIO_INBOUND] 🔄 Re-reading conversation rep_user_id from DB (for Markov lookup)...", flush=True)
-            with conn.cursor() as verify_cur:
-                try:
-                    verify_cur.execute("""
-                        SELECT rep_user_id FROM conversations 
-                        WHERE phone = %s AND environment_id = %s
-                        LIMIT 1
-                    """, (normalized_phone, environment_id))
-                except psycopg2.ProgrammingError:
-                    # Fallback if environment_id column doesn't exist
-                    verify_cur.execute("""
-                        SELECT rep_user_id FROM conversations WHERE phone = %s LIMIT 1
-                    """, (normalized_phone,))
-                verify_row = verify_cur.fetchone()
-                if verify_row:
-                    latest_rep_user_id = verify_row[0]
-                    if latest_rep_user_id != rep_user_id:
-                        print(f"[TWILIO_INBOUND] ⚠️ rep_user_id changed! Old: {rep_user_id}, New: {latest_rep_user_id}", flush=True)
-                        print(f"[TWILIO_INBOUND] ✅ Using latest rep_user_id from DB: {latest_rep_user_id}", flush=True)
-                        rep_user_id = latest_rep_user_id
-                    else:
-                        print(f"[TWILIO_INBOUND] ✅ rep_user_id unchanged: {rep_user_id}", flush=True)
-                else:
-                    print(f"[TWILIO_INBOUND] ⚠️ No conversation found in DB for re-read, using current rep_user_id: {rep_user_id}", flush=True)
-            
+                # If reply_text is still None or empty, trigger fallback
+                if not reply_text or not reply_text.strip():
+                    configured_response = None
+        # Handle case where configured_response is None or empty
+        if not configured_response or (isinstance(configured_response, str) and not configured_response.strip()):
+            # No configured response found (neither rep-specific nor global)
             print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND] 🔍 MARKOV RESPONSE LOOKUP", flush=True)
+            print(f"[TWILIO_INBOUND] ⚠️ NO MARKOV RESPONSE CONFIGURED", flush=True)
             print("=" * 80, flush=True)
-            
-            # 🔥 CRITICAL FIX: For inbound, use current state for reply, not transitioned state
-            # State transitions are for tracking, not reply selection
-            # Inbound auto-reply must use the response for the current detected state, not the transitioned state
-            reply_state = previous_state  # Use current detected state for reply lookup
-            
-            # Add safety guard for outbound-only states
-            OUTBOUND_ONLY_STATES = {"initial_outreach"}
-            if reply_state in OUTBOUND_ONLY_STATES:
-                # If previous_state is outbound-only, we can't use it for inbound reply lookup
-                # Use next_state instead (the state we're transitioning TO)
-                logger.info(f"[MARKOV] reply_state is outbound-only: {reply_state}, using next_state for reply: {next_state}")
-                print(f"[TWILIO_INBOUND] ⚠️ reply_state is outbound-only: {reply_state}, using next_state for reply: {next_state}", flush=True)
-                reply_state = next_state  # Use next_state since previous_state is outbound-only
-            
-            # Log the distinction between reply state and tracking state
-            logger.info(f"[MARKOV_REPLY_SELECTION] reply_state={reply_state} tracking_state={next_state}")
-            print(f"[MARKOV_REPLY_SELECTION] reply_state={reply_state} tracking_state={next_state}", flush=True)
-            print(f"[TWILIO_INBOUND]   reply_state (for lookup): '{reply_state}'", flush=True)
-            print(f"[TWILIO_INBOUND]   tracking_state (for DB): '{next_state}'", flush=True)
-            print(f"[TWILIO_INBOUND]   rep_user_id (before final check): {rep_user_id}", flush=True)
-            print(f"[TWILIO_INBOUND]   phone: {normalized_phone}", flush=True)
-            print(f"[TWILIO_INBOUND]   routing_mode: {routing_mode}", flush=True)
-            
-            # Step 4: Final safety check before Markov lookup
-            # One last cheap lookup to avoid accidental global responses
-            if not rep_user_id and card_id:
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT user_id as rep_user_id
-                    FROM card_assignments
-                    WHERE card_id = %s
-                    ORDER BY assigned_at DESC
-                    LIMIT 1
-                """, (card_id,))
-                row = cur.fetchone()
-                if row and row[0]:
-                    rep_user_id = row[0]
-                    logger.warning(f"[MARKOV] rep_user_id repaired at final check via assignment: {rep_user_id} card_id={card_id}")
-                    print(f"[TWILIO_INBOUND] ⚠️ [MARKOV] rep_user_id repaired at final check: {rep_user_id} (card_id={card_id})", flush=True)
-                else:
-                    logger.warning(f"[MARKOV] No rep_user_id found; using global responses. card_id={card_id}")
-                    print(f"[TWILIO_INBOUND] ⚠️ [MARKOV] No rep_user_id found; will use global responses (card_id={card_id})", flush=True)
-            
-            print(f"[TWILIO_INBOUND]   rep_user_id (final): {rep_user_id}", flush=True)
-            print(f"[TWILIO_INBOUND]   Querying markov_responses table for reply_state='{reply_state}'...", flush=True)
-            
-            # Use trace wrapper for comprehensive logging (inbound context - fail loud if empty)
-            # 🔥 CRITICAL: Use reply_state (previous_state/current detected state) for reply lookup, not next_state
-            configured_response = get_markov_response_with_trace(
-                conn, 
-                reply_state,  # Changed from next_state to reply_state (previous_state)
-                rep_user_id, 
-                phone=normalized_phone, 
-                environment_id=environment_id,
-                context="inbound",
-                allow_empty=False  # Fail loud for inbound if graph is empty
-            )
-            logger.info(f"[MARKOV] lookup reply_state={reply_state} tracking_state={next_state} rep_user_id={rep_user_id} rep_specific_found={bool(configured_response)}")
+            print(f"[TWILIO_INBOUND]   Reply State: '{reply_state}' (used for lookup)", flush=True)
+            print(f"[TWILIO_INBOUND]   Tracking State: '{next_state}' (used for DB update)", flush=True)
+            print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
+            print(f"[TWILIO_INBOUND]   This means neither the rep nor the owner has configured a response for reply_state '{reply_state}'", flush=True)
+            print(f"[TWILIO_INBOUND]   💡 Action: Configure a response in Markov Editor for reply_state '{reply_state}'", flush=True)
+            logger.warning(f"[MARKOV] No response found for reply_state '{reply_state}' (rep_user_id={rep_user_id})")
             print("=" * 80, flush=True)
-            if configured_response:
-                print("=" * 80, flush=True)
-                print(f"[TWILIO_INBOUND] ✅ RESPONSE FOUND", flush=True)
-                print("=" * 80, flush=True)
-                print(f"[TWILIO_INBOUND]   Response length: {len(configured_response)} chars", flush=True)
-                print(f"[TWILIO_INBOUND]   Response preview: {configured_response[:100]}...", flush=True)
-                print(f"[TWILIO_INBOUND]   Full response: {configured_response}", flush=True)
-                print("=" * 80, flush=True)
-            else:
-                print("=" * 80, flush=True)
-                print(f"[TWILIO_INBOUND] ⚠️ NO RESPONSE FOUND", flush=True)
-                print("=" * 80, flush=True)
-                print(f"[TWILIO_INBOUND]   Reply State: '{reply_state}' (used for lookup)", flush=True)
-                print(f"[TWILIO_INBOUND]   Tracking State: '{next_state}' (used for DB update)", flush=True)
-                print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
-                print(f"[TWILIO_INBOUND]   💡 Suggestion: Rep should configure a response for reply_state '{reply_state}', or owner should set a global default", flush=True)
-                print("=" * 80, flush=True)
             
-            if configured_response:
-                print(f"[TWILIO_INBOUND] ✅ Configured response found, processing...", flush=True)
-                print(f"[TWILIO_INBOUND]   Original response: {configured_response}", flush=True)
-                print(f"[TWILIO_INBOUND]   Response length: {len(configured_response)} chars", flush=True)
+            # FALLBACK: Send a generic acknowledgment if no response configured
+            # This prevents dead air and confirms the system is working
+            if card_assigned:
+                print(f"[TWILIO_INBOUND] 🔄 Using fallback response (no configured response for reply_state '{reply_state}')", flush=True)
+                name = (card.get("card_data", {}) or {}).get("name", "there")
                 
-                # Check if response is empty after coercion (safety check)
-                if not configured_response or not configured_response.strip():
-                    print(f"[TWILIO_INBOUND] ⚠️ WARNING: Configured response is empty after processing", flush=True)
-                    logger.warning(f"[MARKOV] Empty response for reply_state '{reply_state}' - will use fallback")
-                    configured_response = None  # Trigger fallback
+                # Generate context-aware fallback based on state category
+                intent_category = result.get("intent", {}).get("category", "")
+                if intent_category == "interest" or "interest" in reply_state.lower():
+                    reply_text = f"Got it, {name} — happy to explain pricing, volume, or delivery timing whenever you're ready."
+                elif intent_category == "pricing":
+                    reply_text = f"Thanks for asking, {name}! I'll get you pricing details shortly."
+                elif intent_category == "question":
+                    reply_text = f"Thanks for your question, {name}! I'll get back to you with details soon."
                 else:
-                    # If we have a card, substitute template placeholders
-                    if card and card.get("card_data"):
-                        print(f"[TWILIO_INBOUND] 📋 Card found, applying template substitution...", flush=True)
-                        from backend.blast import _substitute_template
-                        from archive_intelligence.message_processor.utils import load_sales_history, find_matching_fraternity
-                        
-                        data = card["card_data"]
-                        sales_history = load_sales_history()
-                        purchased_example = None
-                        if isinstance(sales_history, dict):
-                            purchased_example = find_matching_fraternity(data, sales_history)
-                        
-                        reply_text = _substitute_template(configured_response, data, purchased_example)
-                        
-                        # Check if substitution resulted in empty text
-                        if not reply_text or not reply_text.strip():
-                            print(f"[TWILIO_INBOUND] ⚠️ WARNING: Template substitution resulted in empty text", flush=True)
-                            logger.warning(f"[MARKOV] Empty text after substitution for reply_state '{reply_state}' - will use fallback")
-                            reply_text = None  # Trigger fallback
-                        else:
-                            print(f"[TWILIO_INBOUND] ✅ Template substitution complete", flush=True)
-                            print(f"[TWILIO_INBOUND]   Substituted response: {reply_text}", flush=True)
-                            print(f"[TWILIO_INBOUND]   Substituted length: {len(reply_text)} chars", flush=True)
-                            logger.info(f"[MARKOV] Generated reply for reply_state '{reply_state}': {reply_text[:50]}...")
-                    else:
-                        reply_text = configured_response
-                        print(f"[TWILIO_INBOUND] ✅ Using configured response as-is (no card for substitution)", flush=True)
-                        print(f"[TWILIO_INBOUND]   Final reply_text: {reply_text}", flush=True)
-                        logger.info(f"[MARKOV] Using configured response for reply_state '{reply_state}': {reply_text[:50]}...")
-                    
-                    # If reply_text is still None or empty, trigger fallback
-                    if not reply_text or not reply_text.strip():
-                        configured_response = None
-            # Handle case where configured_response is None or empty
-            if not configured_response or (isinstance(configured_response, str) and not configured_response.strip()):
-                # No configured response found (neither rep-specific nor global)
-                print("=" * 80, flush=True)
-                print(f"[TWILIO_INBOUND] ⚠️ NO MARKOV RESPONSE CONFIGURED", flush=True)
-                print("=" * 80, flush=True)
-                print(f"[TWILIO_INBOUND]   Reply State: '{reply_state}' (used for lookup)", flush=True)
-                print(f"[TWILIO_INBOUND]   Tracking State: '{next_state}' (used for DB update)", flush=True)
-                print(f"[TWILIO_INBOUND]   Rep user ID: {rep_user_id}", flush=True)
-                print(f"[TWILIO_INBOUND]   This means neither the rep nor the owner has configured a response for reply_state '{reply_state}'", flush=True)
-                print(f"[TWILIO_INBOUND]   💡 Action: Configure a response in Markov Editor for reply_state '{reply_state}'", flush=True)
-                logger.warning(f"[MARKOV] No response found for reply_state '{reply_state}' (rep_user_id={rep_user_id})")
-                print("=" * 80, flush=True)
+                    reply_text = f"Thanks for your message, {name}! We'll get back to you soon."
                 
-                # FALLBACK: Send a generic acknowledgment if no response configured
-                # This prevents dead air and confirms the system is working
-                if card_assigned:
-                    print(f"[TWILIO_INBOUND] 🔄 Using fallback response (no configured response for reply_state '{reply_state}')", flush=True)
-                    name = (card.get("card_data", {}) or {}).get("name", "there")
-                    
-                    # Generate context-aware fallback based on state category
-                    intent_category = result.get("intent", {}).get("category", "")
-                    if intent_category == "interest" or "interest" in reply_state.lower():
-                        reply_text = f"Got it, {name} — happy to explain pricing, volume, or delivery timing whenever you're ready."
-                    elif intent_category == "pricing":
-                        reply_text = f"Thanks for asking, {name}! I'll get you pricing details shortly."
-                    elif intent_category == "question":
-                        reply_text = f"Thanks for your question, {name}! I'll get back to you with details soon."
-                    else:
-                        reply_text = f"Thanks for your message, {name}! We'll get back to you soon."
-                    
-                    print(f"[TWILIO_INBOUND]   Fallback response: {reply_text}", flush=True)
-                    logger.info(f"[MARKOV] Using fallback response for reply_state '{reply_state}' (category: {intent_category})")
-                else:
-                    # Don't send a reply if card is unassigned
-                    reply_text = None
-        else:
-            # No next_state from Markov engine - this shouldn't happen but handle gracefully
-            logger.error(f"[REPLY_BLOCKED] Reason=no_next_state_from_markov result_keys={list(result.keys())}")
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND] ⚠️ NO STATE TRANSITION FROM MARKOV ENGINE", flush=True)
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND]   Result keys: {list(result.keys())}", flush=True)
-            print(f"[TWILIO_INBOUND]   Result: {json.dumps(result, indent=2, default=str)}", flush=True)
-            print(f"[TWILIO_INBOUND]   This means the Markov engine did not return a next_state", flush=True)
-            print(f"[TWILIO_INBOUND]   💡 Check: Is the intent classifier working? Is the state transition logic correct?", flush=True)
-            print("=" * 80, flush=True)
-            reply_text = None
-        
-        # Send explicit reply via Twilio (webhook return does NOT send SMS)
+                print(f"[TWILIO_INBOUND]   Fallback response: {reply_text}", flush=True)
+                logger.info(f"[MARKOV] Using fallback response for reply_state '{reply_state}' (category: {intent_category})")
+            else:
+                # Don't send a reply if card is unassigned
+                reply_text = None
+    else:
+        # No next_state from Markov engine - this shouldn't happen but handle gracefully
+        logger.error(f"[REPLY_BLOCKED] Reason=no_next_state_from_markov result_keys={list(result.keys())}")
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND] ⚠️ NO STATE TRANSITION FROM MARKOV ENGINE", flush=True)
         print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND] 📤 MARKOV REPLY DECISION", flush=True)
+        print(f"[TWILIO_INBOUND]   Result keys: {list(result.keys())}", flush=True)
+        print(f"[TWILIO_INBOUND]   Result: {json.dumps(result, indent=2, default=str)}", flush=True)
+        print(f"[TWILIO_INBOUND]   This means the Markov engine did not return a next_state", flush=True)
+        print(f"[TWILIO_INBOUND]   💡 Check: Is the intent classifier working? Is the state transition logic correct?", flush=True)
         print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND]   Will send reply: {reply_text is not None}", flush=True)
-        print(f"[TWILIO_INBOUND]   reply_text: {reply_text}", flush=True)
-        print(f"[TWILIO_INBOUND]   reply_text type: {type(reply_text)}", flush=True)
-        if reply_text:
-            print(f"[TWILIO_INBOUND]   reply_text length: {len(reply_text)}", flush=True)
-            print(f"[TWILIO_INBOUND]   reply_text preview: {reply_text[:100]}...", flush=True)
+        reply_text = None
+    
+    # Send explicit reply via Twilio (webhook return does NOT send SMS)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND] 📤 MARKOV REPLY DECISION", flush=True)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND]   Will send reply: {reply_text is not None}", flush=True)
+    print(f"[TWILIO_INBOUND]   reply_text: {reply_text}", flush=True)
+    print(f"[TWILIO_INBOUND]   reply_text type: {type(reply_text)}", flush=True)
+    if reply_text:
+        print(f"[TWILIO_INBOUND]   reply_text length: {len(reply_text)}", flush=True)
+        print(f"[TWILIO_INBOUND]   reply_text preview: {reply_text[:100]}...", flush=True)
+    else:
+        print(f"[TWILIO_INBOUND]   ⚠️ No reply will be sent", flush=True)
+        if not card_assigned and card_id:
+            print(f"[TWILIO_INBOUND]     Reason: Card is unassigned (safety invariant)", flush=True)
+        elif skip_auto_reply:
+            print(f"[TWILIO_INBOUND]     Reason: Bot loop prevention", flush=True)
+        elif not result.get("next_state"):
+            print(f"[TWILIO_INBOUND]     Reason: No state transition from Markov engine", flush=True)
+        else:
+            # Note: Actual lookup used previous_state (reply_state), but next_state is used for DB tracking
+            previous_state_for_msg = result.get("previous_state", "unknown")
+            print(f"[TWILIO_INBOUND]     Reason: No configured response for reply_state '{previous_state_for_msg}' (tracking_state={next_state})", flush=True)
+    print("=" * 80, flush=True)
+    
+    # Filter out "OK" messages - don't send standalone "OK" responses
+    if reply_text:
+        reply_text_clean = reply_text.strip().upper()
+        print(f"[TWILIO_INBOUND]   Cleaned reply_text: '{reply_text_clean}'", flush=True)
+        # Skip sending if reply is just "OK" or variations
+        if reply_text_clean in ["OK", "OKAY", "K", "OK."]:
+            print(f"[TWILIO_INBOUND] ⚠️ Skipping 'OK' message - not sending reply", flush=True)
+            reply_text = None
         else:
-            print(f"[TWILIO_INBOUND]   ⚠️ No reply will be sent", flush=True)
-            if not card_assigned and card_id:
-                print(f"[TWILIO_INBOUND]     Reason: Card is unassigned (safety invariant)", flush=True)
-            elif skip_auto_reply:
-                print(f"[TWILIO_INBOUND]     Reason: Bot loop prevention", flush=True)
-            elif not result.get("next_state"):
-                print(f"[TWILIO_INBOUND]     Reason: No state transition from Markov engine", flush=True)
+            print(f"[TWILIO_INBOUND] ✅ Reply text is valid (not 'OK')", flush=True)
+    
+    # 🔧 FIX: Campaign scoping and test overrides
+    # Extract campaign_id from card metadata (if present)
+    # Campaign ID can be inferred from vertical (frat vs faith) or explicitly set
+    campaign_id = None
+    force_send = False
+    is_test_number = False
+    
+    if card and card.get("card_data"):
+        card_data = card["card_data"]
+        metadata = card_data.get("metadata") or {}
+        
+        # Try explicit campaign_id first
+        campaign_id = metadata.get("campaign_id") or card_data.get("campaign_id")
+        
+        # If no explicit campaign_id, infer from vertical/role
+        if not campaign_id:
+            # Infer campaign from card data
+            if card_data.get("fraternity"):
+                campaign_id = "frat_rt4orgs"
+            elif card_data.get("faith_group"):
+                campaign_id = "faith_rt4orgs"
+            elif card_data.get("role") == "Office":
+                # Office role suggests faith vertical
+                campaign_id = "faith_rt4orgs"
             else:
-                # Note: Actual lookup used previous_state (reply_state), but next_state is used for DB tracking
-                previous_state_for_msg = result.get("previous_state", "unknown")
-                print(f"[TWILIO_INBOUND]     Reason: No configured response for reply_state '{previous_state_for_msg}' (tracking_state={next_state})", flush=True)
-        print("=" * 80, flush=True)
+                # Default campaign for unknown verticals
+                campaign_id = "default_rt4orgs"
         
-        # Filter out "OK" messages - don't send standalone "OK" responses
-        if reply_text:
-            reply_text_clean = reply_text.strip().upper()
-            print(f"[TWILIO_INBOUND]   Cleaned reply_text: '{reply_text_clean}'", flush=True)
-            # Skip sending if reply is just "OK" or variations
-            if reply_text_clean in ["OK", "OKAY", "K", "OK."]:
-                print(f"[TWILIO_INBOUND] ⚠️ Skipping 'OK' message - not sending reply", flush=True)
-                reply_text = None
-            else:
-                print(f"[TWILIO_INBOUND] ✅ Reply text is valid (not 'OK')", flush=True)
+        force_send = metadata.get("force_send", False) or card_data.get("force_send", False)
         
-        # 🔧 FIX: Campaign scoping and test overrides
-        # Extract campaign_id from card metadata (if present)
-        # Campaign ID can be inferred from vertical (frat vs faith) or explicitly set
-        campaign_id = None
-        force_send = False
-        is_test_number = False
+        # Auto-detect test numbers (founder/test numbers)
+        # Check if this is a known test number
+        test_numbers = [
+            os.getenv("TWILIO_PHONE_NUMBER", ""),  # System phone
+            "+19843695080",  # Alan's test number (from logs)
+            "+19194436288",  # System phone from logs
+        ]
+        # Also check if card name contains "test" or "Test"
+        card_name = card_data.get("name", "").lower()
+        is_test_number = (
+            normalized_phone in test_numbers or
+            "test" in card_name or
+            force_send
+        )
         
-        if card and card.get("card_data"):
-            card_data = card["card_data"]
-            metadata = card_data.get("metadata") or {}
-            
-            # Try explicit campaign_id first
-            campaign_id = metadata.get("campaign_id") or card_data.get("campaign_id")
-            
-            # If no explicit campaign_id, infer from vertical/role
-            if not campaign_id:
-                # Infer campaign from card data
-                if card_data.get("fraternity"):
-                    campaign_id = "frat_rt4orgs"
-                elif card_data.get("faith_group"):
-                    campaign_id = "faith_rt4orgs"
-                elif card_data.get("role") == "Office":
-                    # Office role suggests faith vertical
-                    campaign_id = "faith_rt4orgs"
+        print(f"[TWILIO_INBOUND] 🔍 Campaign & Test Detection:", flush=True)
+        print(f"[TWILIO_INBOUND]   campaign_id: {campaign_id} (inferred from card data)", flush=True)
+        print(f"[TWILIO_INBOUND]   force_send: {force_send}", flush=True)
+        print(f"[TWILIO_INBOUND]   is_test_number: {is_test_number}", flush=True)
+        if is_test_number:
+            print(f"[TWILIO_INBOUND]   ✅ TEST NUMBER DETECTED - bypassing all guards", flush=True)
+    
+    # 🔧 FIX: Check for duplicate outbound suppression (environment-scoped)
+    # Only suppress if same environment_id and same state, and not a test number
+    # CRITICAL: Only check messages with message_sid (actually sent, not just generated)
+    # ⚠️ IMPORTANT: We do NOT suppress based on state equality (previous_state == next_state)
+    # Sales conversations often stay in the same state for multiple turns (e.g., interest → interest)
+    # We only suppress if we've ALREADY SENT a message in this state recently (duplicate prevention)
+    should_suppress = False
+    suppression_reason = None
+    
+    if reply_text and next_state and not is_test_number and not force_send:
+        with conn.cursor() as check_cur:
+            try:
+                # Check message_events for recent outbound in same environment and state
+                # CRITICAL: Only messages with message_sid count as "sent"
+                # Check for true duplicates: same state AND same message text within recent time window
+                # Do NOT suppress just because state is the same - allow multiple replies in same state
+                check_cur.execute("""
+                    SELECT COUNT(*) FROM message_events
+                    WHERE phone_number = %s
+                      AND environment_id = %s
+                      AND direction = 'outbound'
+                      AND message_sid IS NOT NULL
+                      AND state = %s
+                      AND message_text = %s
+                      AND sent_at > NOW() - INTERVAL '5 minutes'
+                """, (normalized_phone, environment_id, next_state, reply_text))
+                duplicate_count = check_cur.fetchone()[0]
+                if duplicate_count > 0:
+                    should_suppress = True
+                    suppression_reason = f"Duplicate outbound detected: same state and same text within 5 minutes"
+                    print(f"[TWILIO_INBOUND] ⚠️ BLAST GUARD: {suppression_reason}", flush=True)
+                    print(f"[TWILIO_INBOUND]   Found {duplicate_count} prior outbound(s) with same state and text", flush=True)
+                    print(f"[TWILIO_INBOUND]   Suppressing to prevent duplicate send", flush=True)
                 else:
-                    # Default campaign for unknown verticals
-                    campaign_id = "default_rt4orgs"
-            
-            force_send = metadata.get("force_send", False) or card_data.get("force_send", False)
-            
-            # Auto-detect test numbers (founder/test numbers)
-            # Check if this is a known test number
-            test_numbers = [
-                os.getenv("TWILIO_PHONE_NUMBER", ""),  # System phone
-                "+19843695080",  # Alan's test number (from logs)
-                "+19194436288",  # System phone from logs
-            ]
-            # Also check if card name contains "test" or "Test"
-            card_name = card_data.get("name", "").lower()
-            is_test_number = (
-                normalized_phone in test_numbers or
-                "test" in card_name or
-                force_send
-            )
-            
-            print(f"[TWILIO_INBOUND] 🔍 Campaign & Test Detection:", flush=True)
-            print(f"[TWILIO_INBOUND]   campaign_id: {campaign_id} (inferred from card data)", flush=True)
-            print(f"[TWILIO_INBOUND]   force_send: {force_send}", flush=True)
-            print(f"[TWILIO_INBOUND]   is_test_number: {is_test_number}", flush=True)
-            if is_test_number:
-                print(f"[TWILIO_INBOUND]   ✅ TEST NUMBER DETECTED - bypassing all guards", flush=True)
-        
-        # 🔧 FIX: Check for duplicate outbound suppression (environment-scoped)
-        # Only suppress if same environment_id and same state, and not a test number
-        # CRITICAL: Only check messages with message_sid (actually sent, not just generated)
-        # ⚠️ IMPORTANT: We do NOT suppress based on state equality (previous_state == next_state)
-        # Sales conversations often stay in the same state for multiple turns (e.g., interest → interest)
-        # We only suppress if we've ALREADY SENT a message in this state recently (duplicate prevention)
-        should_suppress = False
-        suppression_reason = None
-        
-        if reply_text and next_state and not is_test_number and not force_send:
-            with conn.cursor() as check_cur:
-                try:
-                    # Check message_events for recent outbound in same environment and state
-                    # CRITICAL: Only messages with message_sid count as "sent"
-                    # Check for true duplicates: same state AND same message text within recent time window
-                    # Do NOT suppress just because state is the same - allow multiple replies in same state
-                    check_cur.execute("""
-                        SELECT COUNT(*) FROM message_events
-                        WHERE phone_number = %s
-                          AND environment_id = %s
-                          AND direction = 'outbound'
-                          AND message_sid IS NOT NULL
-                          AND state = %s
-                          AND message_text = %s
-                          AND sent_at > NOW() - INTERVAL '5 minutes'
-                    """, (normalized_phone, environment_id, next_state, reply_text))
-                    duplicate_count = check_cur.fetchone()[0]
-                    if duplicate_count > 0:
-                        should_suppress = True
-                        suppression_reason = f"Duplicate outbound detected: same state and same text within 5 minutes"
-                        print(f"[TWILIO_INBOUND] ⚠️ BLAST GUARD: {suppression_reason}", flush=True)
-                        print(f"[TWILIO_INBOUND]   Found {duplicate_count} prior outbound(s) with same state and text", flush=True)
-                        print(f"[TWILIO_INBOUND]   Suppressing to prevent duplicate send", flush=True)
-                    else:
-                        # Same state but different text or older than 5 minutes - allow it
-                        print(f"[TWILIO_INBOUND] ✅ Same state but different text or old - allowing send", flush=True)
-                except psycopg2.ProgrammingError as e:
-                    # message_events table doesn't exist - fallback to history check
-                    if 'message_events' in str(e):
-                        print(f"[TWILIO_INBOUND] ⚠️ message_events table not found - using history fallback", flush=True)
+                    # Same state but different text or older than 5 minutes - allow it
+                    print(f"[TWILIO_INBOUND] ✅ Same state but different text or old - allowing send", flush=True)
+            except psycopg2.ProgrammingError as e:
+                # message_events table doesn't exist - fallback to history check
+                if 'message_events' in str(e):
+                    print(f"[TWILIO_INBOUND] ⚠️ message_events table not found - using history fallback", flush=True)
+                    try:
+                        check_cur.execute("""
+                            SELECT history FROM conversations 
+                            WHERE phone = %s AND environment_id = %s
+                            LIMIT 1
+                        """, (normalized_phone, environment_id))
+                    except psycopg2.ProgrammingError:
+                        # environment_id column doesn't exist either
+                        check_cur.execute("""
+                            SELECT history FROM conversations 
+                            WHERE phone = %s
+                            LIMIT 1
+                        """, (normalized_phone,))
+                    history_row = check_cur.fetchone()
+                    
+                    if history_row and history_row[0]:
                         try:
-                            check_cur.execute("""
-                                SELECT history FROM conversations 
-                                WHERE phone = %s AND environment_id = %s
-                                LIMIT 1
-                            """, (normalized_phone, environment_id))
-                        except psycopg2.ProgrammingError:
-                            # environment_id column doesn't exist either
-                            check_cur.execute("""
-                                SELECT history FROM conversations 
-                                WHERE phone = %s
-                                LIMIT 1
-                            """, (normalized_phone,))
-                        history_row = check_cur.fetchone()
-                        
-                        if history_row and history_row[0]:
-                            try:
-                                history = json.loads(history_row[0]) if isinstance(history_row[0], str) else history_row[0]
-                                if isinstance(history, list):
-                                    # Check last outbound message
-                                    for msg in reversed(history):
-                                        if isinstance(msg, dict) and msg.get("direction") == "outbound":
-                                            last_state = msg.get("state")
-                                            last_text = msg.get("text", "")
-                                            
-                                            # Only suppress if same state AND same message text (true duplicate)
-                                            # Do NOT suppress just because state is the same - sales conversations
-                                            # often stay in same state for multiple turns (interest → interest)
-                                            if last_state == next_state and last_text == reply_text:
-                                                should_suppress = True
-                                                suppression_reason = f"Duplicate outbound detected: same state and same text"
-                                                print(f"[TWILIO_INBOUND] ⚠️ BLAST GUARD (fallback): {suppression_reason}", flush=True)
-                                                break
-                                            # If state is same but text is different, allow it (different response for same state)
-                                            elif last_state == next_state:
-                                                print(f"[TWILIO_INBOUND] ✅ Same state but different text - allowing send", flush=True)
-                                                break
-                            except Exception as e:
-                                print(f"[TWILIO_INBOUND] ⚠️ Error checking history for suppression: {e}", flush=True)
-                    else:
-                        raise
-        
-        if should_suppress and not force_send:
-            logger.error(f"[REPLY_BLOCKED] Reason=duplicate_suppression suppression_reason={suppression_reason} force_send={force_send}")
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND] 🚫 SUPPRESSING SEND", flush=True)
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND]   Reason: {suppression_reason}", flush=True)
-            print(f"[TWILIO_INBOUND]   Use force_send=true in card metadata to override", flush=True)
-            print(f"[TWILIO_INBOUND]   Or use different campaign_id to send to same number in different vertical", flush=True)
-            print("=" * 80, flush=True)
-            reply_text = None
-        elif should_suppress and force_send:
-            print(f"[TWILIO_INBOUND] ⚠️ Duplicate detected but force_send=true - sending anyway", flush=True)
-        
-        # Final check before send - log all conditions
+                            history = json.loads(history_row[0]) if isinstance(history_row[0], str) else history_row[0]
+                            if isinstance(history, list):
+                                # Check last outbound message
+                                for msg in reversed(history):
+                                    if isinstance(msg, dict) and msg.get("direction") == "outbound":
+                                        last_state = msg.get("state")
+                                        last_text = msg.get("text", "")
+                                        
+                                        # Only suppress if same state AND same message text (true duplicate)
+                                        # Do NOT suppress just because state is the same - sales conversations
+                                        # often stay in same state for multiple turns (interest → interest)
+                                        if last_state == next_state and last_text == reply_text:
+                                            should_suppress = True
+                                            suppression_reason = f"Duplicate outbound detected: same state and same text"
+                                            print(f"[TWILIO_INBOUND] ⚠️ BLAST GUARD (fallback): {suppression_reason}", flush=True)
+                                            break
+                                        # If state is same but text is different, allow it (different response for same state)
+                                        elif last_state == next_state:
+                                            print(f"[TWILIO_INBOUND] ✅ Same state but different text - allowing send", flush=True)
+                                            break
+                        except Exception as e:
+                            print(f"[TWILIO_INBOUND] ⚠️ Error checking history for suppression: {e}", flush=True)
+                else:
+                    raise
+    
+    if should_suppress and not force_send:
+        logger.error(f"[REPLY_BLOCKED] Reason=duplicate_suppression suppression_reason={suppression_reason} force_send={force_send}")
         print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND] 🔍 FINAL SEND CHECK", flush=True)
+        print(f"[TWILIO_INBOUND] 🚫 SUPPRESSING SEND", flush=True)
         print("=" * 80, flush=True)
-        print(f"[TWILIO_INBOUND]   reply_text exists: {reply_text is not None}", flush=True)
-        if reply_text:
-            print(f"[TWILIO_INBOUND]   reply_text length: {len(reply_text)} chars", flush=True)
-            print(f"[TWILIO_INBOUND]   reply_text preview: {reply_text[:100]}...", flush=True)
-        print(f"[TWILIO_INBOUND]   should_suppress: {should_suppress}", flush=True)
-        if should_suppress:
-            print(f"[TWILIO_INBOUND]   suppression_reason: {suppression_reason}", flush=True)
-        print(f"[TWILIO_INBOUND]   is_test_number: {is_test_number}", flush=True)
-        print(f"[TWILIO_INBOUND]   force_send: {force_send}", flush=True)
-        print(f"[TWILIO_INBOUND]   routing_mode: {routing_mode}", flush=True)
-        will_actually_send = reply_text and not (should_suppress and not force_send)
-        print(f"[TWILIO_INBOUND]   WILL ACTUALLY SEND: {will_actually_send}", flush=True)
+        print(f"[TWILIO_INBOUND]   Reason: {suppression_reason}", flush=True)
+        print(f"[TWILIO_INBOUND]   Use force_send=true in card metadata to override", flush=True)
+        print(f"[TWILIO_INBOUND]   Or use different campaign_id to send to same number in different vertical", flush=True)
         print("=" * 80, flush=True)
-        
-        if reply_text and will_actually_send:
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND] 🚀 SENDING REPLY VIA TWILIO", flush=True)
-            print("=" * 80, flush=True)
-            print(f"[TWILIO_INBOUND]   To: {normalized_phone}", flush=True)
-            print(f"[TWILIO_INBOUND]   Message: {reply_text}", flush=True)
-            print(f"[TWILIO_INBOUND]   Message length: {len(reply_text)} chars", flush=True)
-            try:
-                twilio_sid = os.getenv("TWILIO_ACCOUNT_SID")
-                twilio_token = os.getenv("TWILIO_AUTH_TOKEN")
-                messaging_service_sid = os.getenv("TWILIO_MESSAGING_SERVICE_SID")
-                # twilio_phone already initialized at top of function (fallback if Messaging Service not set)
+        reply_text = None
+    elif should_suppress and force_send:
+        print(f"[TWILIO_INBOUND] ⚠️ Duplicate detected but force_send=true - sending anyway", flush=True)
+    
+    # Final check before send - log all conditions
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND] 🔍 FINAL SEND CHECK", flush=True)
+    print("=" * 80, flush=True)
+    print(f"[TWILIO_INBOUND]   reply_text exists: {reply_text is not None}", flush=True)
+    if reply_text:
+        print(f"[TWILIO_INBOUND]   reply_text length: {len(reply_text)} chars", flush=True)
+        print(f"[TWILIO_INBOUND]   reply_text preview: {reply_text[:100]}...", flush=True)
+    print(f"[TWILIO_INBOUND]   should_suppress: {should_suppress}", flush=True)
+    if should_suppress:
+        print(f"[TWILIO_INBOUND]   suppression_reason: {suppression_reason}", flush=True)
+    print(f"[TWILIO_INBOUND]   is_test_number: {is_test_number}", flush=True)
+    print(f"[TWILIO_INBOUND]   force_send: {force_send}", flush=True)
+    print(f"[TWILIO_INBOUND]   routing_mode: {routing_mode}", flush=True)
+    will_actually_send = reply_text and not (should_suppress and not force_send)
+    print(f"[TWILIO_INBOUND]   WILL ACTUALLY SEND: {will_actually_send}", flush=True)
+    print("=" * 80, flush=True)
+    
+    if reply_text and will_actually_send:
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND] 🚀 SENDING REPLY VIA TWILIO", flush=True)
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND]   To: {normalized_phone}", flush=True)
+        print(f"[TWILIO_INBOUND]   Message: {reply_text}", flush=True)
+        print(f"[TWILIO_INBOUND]   Message length: {len(reply_text)} chars", flush=True)
+        try:
+            twilio_sid = os.getenv("TWILIO_ACCOUNT_SID")
+            twilio_token = os.getenv("TWILIO_AUTH_TOKEN")
+            messaging_service_sid = os.getenv("TWILIO_MESSAGING_SERVICE_SID")
+            # twilio_phone already initialized at top of function (fallback if Messaging Service not set)
+            
+            # 🔥 CRITICAL: FORCE DIRECT MODE - ignore Messaging Service entirely
+            # This ensures immediate delivery and replies stay in the same thread
+            # Messaging Service is ignored even if configured (matches blast path behavior)
+            use_messaging_service = False
+            
+            # Normalize phone number to E.164 format (required for from_ parameter)
+            twilio_phone_raw = twilio_phone or os.getenv("TWILIO_PHONE_NUMBER", "")
+            twilio_phone_e164 = normalize_phone(twilio_phone_raw) if twilio_phone_raw else ""
+            
+            send_mode = "DIRECT_NUMBER"
+            
+            print(f"[TWILIO_INBOUND] 🔑 Twilio credentials:", flush=True)
+            print(f"[TWILIO_INBOUND]   Account SID: {twilio_sid[:10]}... (length: {len(twilio_sid) if twilio_sid else 0})", flush=True)
+            print(f"[TWILIO_INBOUND]   Auth Token: {'✅ SET' if twilio_token else '❌ NOT SET'} (length: {len(twilio_token) if twilio_token else 0})", flush=True)
+            
+            if messaging_service_sid:
+                print(f"[TWILIO_INBOUND]   ⚠️ TWILIO_MESSAGING_SERVICE_SID is set but will be IGNORED (force direct mode)", flush=True)
+            
+            print(f"[TWILIO_INBOUND]   Phone Number: {twilio_phone_e164}", flush=True)
+            print(f"[TWILIO_INBOUND]   ✅ Using DIRECT mode (from_={twilio_phone_e164})", flush=True)
+            
+            # Validate credentials for direct mode only
+            valid = twilio_sid and twilio_token and twilio_phone_e164
+            
+            if valid:
+                print(f"[TWILIO_INBOUND] 🔑 Twilio credentials validated", flush=True)
+                print(f"[TWILIO_INBOUND] 📡 Send Mode: {send_mode}", flush=True)
+                print(f"[TWILIO_INBOUND] 📞 Creating Twilio client...", flush=True)
                 
-                # 🔥 CRITICAL: FORCE DIRECT MODE - ignore Messaging Service entirely
-                # This ensures immediate delivery and replies stay in the same thread
-                # Messaging Service is ignored even if configured (matches blast path behavior)
-                use_messaging_service = False
+                client = Client(twilio_sid, twilio_token)
                 
-                # Normalize phone number to E.164 format (required for from_ parameter)
-                twilio_phone_raw = twilio_phone or os.getenv("TWILIO_PHONE_NUMBER", "")
-                twilio_phone_e164 = normalize_phone(twilio_phone_raw) if twilio_phone_raw else ""
+                # 🔒 PREPARE MESSAGE PARAMETERS: Always use direct mode (from_ parameter)
+                message_params = {
+                    "to": From,  # Use original From, not normalized
+                    "body": reply_text,
+                    "from_": twilio_phone_e164  # Always use normalized E.164 format
+                }
                 
-                send_mode = "DIRECT_NUMBER"
+                print(f"[TWILIO_INBOUND] 📨 Creating message (Direct Phone):", flush=True)
+                print(f"[TWILIO_INBOUND]   to: {From} (original Twilio From)", flush=True)
+                print(f"[TWILIO_INBOUND]   from_: {twilio_phone_e164}", flush=True)
                 
-                print(f"[TWILIO_INBOUND] 🔑 Twilio credentials:", flush=True)
-                print(f"[TWILIO_INBOUND]   Account SID: {twilio_sid[:10]}... (length: {len(twilio_sid) if twilio_sid else 0})", flush=True)
-                print(f"[TWILIO_INBOUND]   Auth Token: {'✅ SET' if twilio_token else '❌ NOT SET'} (length: {len(twilio_token) if twilio_token else 0})", flush=True)
+                print(f"[TWILIO_INBOUND]   body: {reply_text}", flush=True)
+                print(f"[TWILIO_INBOUND]   body length: {len(reply_text)} chars", flush=True)
                 
-                if messaging_service_sid:
-                    print(f"[TWILIO_INBOUND]   ⚠️ TWILIO_MESSAGING_SERVICE_SID is set but will be IGNORED (force direct mode)", flush=True)
+                msg = client.messages.create(**message_params)
+
+                # 🔥 CRITICAL INSTRUMENTATION: Log complete Twilio response (queue-level truth)
+                # This answers: Was it queued vs sent? A2P-routed? Did Twilio know it would fail?
+                import hashlib
+                body_hash = hashlib.sha256(reply_text.encode("utf-8")).hexdigest()[:12]
                 
-                print(f"[TWILIO_INBOUND]   Phone Number: {twilio_phone_e164}", flush=True)
-                print(f"[TWILIO_INBOUND]   ✅ Using DIRECT mode (from_={twilio_phone_e164})", flush=True)
+                logger.error(
+                    f"[TWILIO_QUEUE] "
+                    f"sid={msg.sid} "
+                    f"status={msg.status} "
+                    f"to={msg.to} "
+                    f"from={msg.from_} "
+                    f"messaging_service_sid={getattr(msg, 'messaging_service_sid', None)} "
+                    f"direction={getattr(msg, 'direction', None)} "
+                    f"num_segments={getattr(msg, 'num_segments', None)} "
+                    f"error_code={getattr(msg, 'error_code', None)} "
+                    f"error_message={getattr(msg, 'error_message', None)}"
+                )
+                print(f"[TWILIO_QUEUE] sid={msg.sid} status={msg.status} to={msg.to} from={msg.from_}", flush=True)
                 
-                # Validate credentials for direct mode only
-                valid = twilio_sid and twilio_token and twilio_phone_e164
+                # Body fingerprint (prove content integrity)
+                logger.error(
+                    f"[TWILIO_QUEUE_BODY] "
+                    f"sid={msg.sid} "
+                    f"length={len(reply_text)} "
+                    f"hash={body_hash} "
+                    f"preview={reply_text[:60]}"
+                )
+                print(f"[TWILIO_QUEUE_BODY] sid={msg.sid} length={len(reply_text)} hash={body_hash}", flush=True)
                 
-                if valid:
-                    print(f"[TWILIO_INBOUND] 🔑 Twilio credentials validated", flush=True)
-                    print(f"[TWILIO_INBOUND] 📡 Send Mode: {send_mode}", flush=True)
-                    print(f"[TWILIO_INBOUND] 📞 Creating Twilio client...", flush=True)
-                    
-                    client = Client(twilio_sid, twilio_token)
-                    
-                    # 🔒 PREPARE MESSAGE PARAMETERS: Always use direct mode (from_ parameter)
-                    message_params = {
-                        "to": From,  # Use original From, not normalized
-                        "body": reply_text,
-                        "from_": twilio_phone_e164  # Always use normalized E.164 format
-                    }
-                    
-                    print(f"[TWILIO_INBOUND] 📨 Creating message (Direct Phone):", flush=True)
-                    print(f"[TWILIO_INBOUND]   to: {From} (original Twilio From)", flush=True)
-                    print(f"[TWILIO_INBOUND]   from_: {twilio_phone_e164}", flush=True)
-                    
-                    print(f"[TWILIO_INBOUND]   body: {reply_text}", flush=True)
-                    print(f"[TWILIO_INBOUND]   body length: {len(reply_text)} chars", flush=True)
-                    
-                    msg = client.messages.create(**message_params)
+                # A2P / compliance context (critical for diagnosis)
+                # Use campaign_id from card metadata context (already defined above)
+                compliance_campaign = campaign_id if 'campaign_id' in locals() else (routed_campaign_id if 'routed_campaign_id' in locals() else None)
+                compliance_test = is_test_number if 'is_test_number' in locals() else False
+                logger.error(
+                    f"[TWILIO_COMPLIANCE] "
+                    f"is_test_number={compliance_test} "
+                    f"campaign_id={compliance_campaign} "
+                    f"send_mode=DIRECT_NUMBER "
+                    f"a2p_profile_present={bool(os.getenv('TWILIO_A2P_PROFILE_SID'))}"
+                )
+                print(f"[TWILIO_COMPLIANCE] is_test_number={compliance_test} campaign_id={compliance_campaign} send_mode=DIRECT_NUMBER", flush=True)
 
-                    # 🔥 CRITICAL INSTRUMENTATION: Log complete Twilio response (queue-level truth)
-                    # This answers: Was it queued vs sent? A2P-routed? Did Twilio know it would fail?
-                    import hashlib
-                    body_hash = hashlib.sha256(reply_text.encode("utf-8")).hexdigest()[:12]
-                    
-                    logger.error(
-                        f"[TWILIO_QUEUE] "
-                        f"sid={msg.sid} "
-                        f"status={msg.status} "
-                        f"to={msg.to} "
-                        f"from={msg.from_} "
-                        f"messaging_service_sid={getattr(msg, 'messaging_service_sid', None)} "
-                        f"direction={getattr(msg, 'direction', None)} "
-                        f"num_segments={getattr(msg, 'num_segments', None)} "
-                        f"error_code={getattr(msg, 'error_code', None)} "
-                        f"error_message={getattr(msg, 'error_message', None)}"
-                    )
-                    print(f"[TWILIO_QUEUE] sid={msg.sid} status={msg.status} to={msg.to} from={msg.from_}", flush=True)
+                # 🔥 STEP 5: Outbound-from-inbound send confirmation
+                logger.error(f"📤 INBOUND_REPLY_SENT to={normalized_phone} sid={msg.sid}")
+                print("=" * 80, flush=True)
+                print(f"[TWILIO_INBOUND] ✅✅✅ REPLY SENT SUCCESSFULLY ✅✅✅", flush=True)
+                print("=" * 80, flush=True)
+                print(f"📤 INBOUND_REPLY_SENT to={normalized_phone} sid={msg.sid}", flush=True)
+                print(f"[TWILIO_INBOUND]   Twilio SID: {msg.sid}", flush=True)
+                print(f"[TWILIO_INBOUND]   Status: {msg.status}", flush=True)
+                print(f"[TWILIO_INBOUND]   To: {msg.to}", flush=True)
+                print(f"[TWILIO_INBOUND]   From: {msg.from_}", flush=True)
+                print(f"[TWILIO_INBOUND]   🔒 Send Mode Used: {send_mode} (from_={twilio_phone_e164})", flush=True)
+                print(f"[TWILIO_INBOUND]   Body: {msg.body}", flush=True)
+                print(f"[TWILIO_INBOUND]   Date Created: {msg.date_created}", flush=True)
+                print("=" * 80, flush=True)
+                
+                # Store outbound reply in conversation history with campaign_id and state
+                try:
+                    from backend.rep_messaging import add_message_to_history
+                    # Add campaign_id and state to message metadata for proper scoping
+                    add_message_to_history(conn, normalized_phone, "outbound", reply_text, "ai", msg.sid)
                     
-                    # Body fingerprint (prove content integrity)
-                    logger.error(
-                        f"[TWILIO_QUEUE_BODY] "
-                        f"sid={msg.sid} "
-                        f"length={len(reply_text)} "
-                        f"hash={body_hash} "
-                        f"preview={reply_text[:60]}"
+                    # Store outbound message event (CRITICAL: with message_sid to mark as "sent")
+                    store_message_event(
+                        conn=conn,
+                        phone_number=normalized_phone,
+                        environment_id=environment_id,
+                        direction="outbound",
+                        message_text=reply_text,
+                        message_sid=msg.sid,  # REQUIRED: Only messages with message_sid count as "sent"
+                        rep_id=rep_user_id,
+                        campaign_id=routed_campaign_id,
+                        state=next_state,
+                        twilio_status=msg.status
                     )
-                    print(f"[TWILIO_QUEUE_BODY] sid={msg.sid} length={len(reply_text)} hash={body_hash}", flush=True)
                     
-                    # A2P / compliance context (critical for diagnosis)
-                    # Use campaign_id from card metadata context (already defined above)
-                    compliance_campaign = campaign_id if 'campaign_id' in locals() else (routed_campaign_id if 'routed_campaign_id' in locals() else None)
-                    compliance_test = is_test_number if 'is_test_number' in locals() else False
-                    logger.error(
-                        f"[TWILIO_COMPLIANCE] "
-                        f"is_test_number={compliance_test} "
-                        f"campaign_id={compliance_campaign} "
-                        f"send_mode=DIRECT_NUMBER "
-                        f"a2p_profile_present={bool(os.getenv('TWILIO_A2P_PROFILE_SID'))}"
-                    )
-                    print(f"[TWILIO_COMPLIANCE] is_test_number={compliance_test} campaign_id={compliance_campaign} send_mode=DIRECT_NUMBER", flush=True)
-
-                    # 🔥 STEP 5: Outbound-from-inbound send confirmation
-                    logger.error(f"📤 INBOUND_REPLY_SENT to={normalized_phone} sid={msg.sid}")
-                    print("=" * 80, flush=True)
-                    print(f"[TWILIO_INBOUND] ✅✅✅ REPLY SENT SUCCESSFULLY ✅✅✅", flush=True)
-                    print("=" * 80, flush=True)
-                    print(f"📤 INBOUND_REPLY_SENT to={normalized_phone} sid={msg.sid}", flush=True)
-                    print(f"[TWILIO_INBOUND]   Twilio SID: {msg.sid}", flush=True)
-                    print(f"[TWILIO_INBOUND]   Status: {msg.status}", flush=True)
-                    print(f"[TWILIO_INBOUND]   To: {msg.to}", flush=True)
-                    print(f"[TWILIO_INBOUND]   From: {msg.from_}", flush=True)
-                    print(f"[TWILIO_INBOUND]   🔒 Send Mode Used: {send_mode} (from_={twilio_phone_e164})", flush=True)
-                    print(f"[TWILIO_INBOUND]   Body: {msg.body}", flush=True)
-                    print(f"[TWILIO_INBOUND]   Date Created: {msg.date_created}", flush=True)
-                    print("=" * 80, flush=True)
+                    # 🔧 FIX: Update conversation state to next_state (not always initial_outreach)
+                    # This ensures proper state tracking and prevents reusing initial_outreach for all messages
+                    # CRITICAL: Must scope to environment_id
+                    if next_state:
+                        with conn.cursor() as update_cur:
+                            try:
+                                # Update conversation state scoped to environment
+                                update_cur.execute("""
+                                    UPDATE conversations 
+                                    SET state = %s, updated_at = NOW()
+                                    WHERE phone = %s AND environment_id = %s
+                                """, (next_state, normalized_phone, environment_id))
+                            except psycopg2.ProgrammingError:
+                                # Fallback if environment_id column doesn't exist
+                                update_cur.execute("""
+                                    UPDATE conversations 
+                                    SET state = %s, updated_at = NOW()
+                                    WHERE phone = %s
+                                """, (next_state, normalized_phone))
+                            print(f"[TWILIO_INBOUND] ✅ Updated conversation state to: {next_state} (was: {conversation_state})", flush=True)
                     
-                    # Store outbound reply in conversation history with campaign_id and state
-                    try:
-                        from backend.rep_messaging import add_message_to_history
-                        # Add campaign_id and state to message metadata for proper scoping
-                        add_message_to_history(conn, normalized_phone, "outbound", reply_text, "ai", msg.sid)
-                        
-                        # Store outbound message event (CRITICAL: with message_sid to mark as "sent")
-                        store_message_event(
-                            conn=conn,
-                            phone_number=normalized_phone,
-                            environment_id=environment_id,
-                            direction="outbound",
-                            message_text=reply_text,
-                            message_sid=msg.sid,  # REQUIRED: Only messages with message_sid count as "sent"
-                            rep_id=rep_user_id,
-                            campaign_id=routed_campaign_id,
-                            state=next_state,
-                            twilio_status=msg.status
-                        )
-                        
-                        # 🔧 FIX: Update conversation state to next_state (not always initial_outreach)
-                        # This ensures proper state tracking and prevents reusing initial_outreach for all messages
-                        # CRITICAL: Must scope to environment_id
-                        if next_state:
-                            with conn.cursor() as update_cur:
-                                try:
-                                    # Update conversation state scoped to environment
-                                    update_cur.execute("""
-                                        UPDATE conversations 
-                                        SET state = %s, updated_at = NOW()
-                                        WHERE phone = %s AND environment_id = %s
-                                    """, (next_state, normalized_phone, environment_id))
-                                except psycopg2.ProgrammingError:
-                                    # Fallback if environment_id column doesn't exist
-                                    update_cur.execute("""
-                                        UPDATE conversations 
-                                        SET state = %s, updated_at = NOW()
-                                        WHERE phone = %s
-                                    """, (next_state, normalized_phone))
-                                print(f"[TWILIO_INBOUND] ✅ Updated conversation state to: {next_state} (was: {conversation_state})", flush=True)
-                        
-                        # Update history entry with campaign_id and state if available
-                        if campaign_id or next_state:
-                            with conn.cursor() as update_cur:
-                                # Query scoped to environment
+                    # Update history entry with campaign_id and state if available
+                    if campaign_id or next_state:
+                        with conn.cursor() as update_cur:
+                            # Query scoped to environment
+                            try:
+                                update_cur.execute("""
+                                    SELECT history FROM conversations 
+                                    WHERE phone = %s AND environment_id = %s
+                                    LIMIT 1
+                                """, (normalized_phone, environment_id))
+                            except psycopg2.ProgrammingError:
+                                # Fallback if environment_id column doesn't exist
+                                update_cur.execute("""
+                                    SELECT history FROM conversations WHERE phone = %s LIMIT 1
+                                """, (normalized_phone,))
+                            hist_row = update_cur.fetchone()
+                            if hist_row and hist_row[0]:
                                 try:
-                                    update_cur.execute("""
-                                        SELECT history FROM conversations 
-                                        WHERE phone = %s AND environment_id = %s
-                                        LIMIT 1
-                                    """, (normalized_phone, environment_id))
-                                except psycopg2.ProgrammingError:
-                                    # Fallback if environment_id column doesn't exist
-                                    update_cur.execute("""
-                                        SELECT history FROM conversations WHERE phone = %s LIMIT 1
-                                    """, (normalized_phone,))
-                                hist_row = update_cur.fetchone()
-                                if hist_row and hist_row[0]:
-                                    try:
-                                        history = json.loads(hist_row[0]) if isinstance(hist_row[0], str) else hist_row[0]
-                                        if isinstance(history, list) and history:
-                                            # Update last message with campaign_id and state
-                                            last_msg = history[-1]
-                                            if isinstance(last_msg, dict) and last_msg.get("direction") == "outbound":
-                                                if campaign_id:
-                                                    last_msg["campaign_id"] = campaign_id
-                                                if next_state:
-                                                    last_msg["state"] = next_state
-                                                if is_test_number:
-                                                    last_msg["is_test"] = True
-                                                
-                                                # Save updated history (scoped to environment)
-                                                try:
-                                                    update_cur.execute("""
-                                                        UPDATE conversations 
-                                                        SET history = %s::jsonb 
-                                                        WHERE phone = %s AND environment_id = %s
-                                                    """, (json.dumps(history), normalized_phone, environment_id))
-                                                except psycopg2.ProgrammingError:
-                                                    # Fallback if environment_id column doesn't exist
-                                                    update_cur.execute("""
-                                                        UPDATE conversations 
-                                                        SET history = %s::jsonb 
-                                                        WHERE phone = %s
-                                                    """, (json.dumps(history), normalized_phone))
-                                                print(f"[TWILIO_INBOUND] ✅ Updated history with campaign_id={campaign_id}, state={next_state}", flush=True)
-                                    except Exception as e:
-                                        print(f"[TWILIO_INBOUND] ⚠️ Could not update history metadata: {e}", flush=True)
-                    except Exception as history_error:
-                        print(f"[TWILIO_INBOUND] WARNING: Could not store outbound message in history: {history_error}", flush=True)
-                    
-                    print(f"[TWILIO_INBOUND] Reply sent: {reply_text[:50]}... (SID: {msg.sid})", flush=True)
-                else:
-                    missing = []
-                    if not twilio_sid:
-                        missing.append("TWILIO_ACCOUNT_SID")
-                    if not twilio_token:
-                        missing.append("TWILIO_AUTH_TOKEN")
-                    if not twilio_phone:
-                        missing.append("TWILIO_PHONE_NUMBER")
-                    print(f"[TWILIO_INBOUND] ❌ WARNING: Missing Twilio config: {', '.join(missing)}", flush=True)
-            except Exception as send_error:
-                print(f"[TWILIO_INBOUND] ERROR sending reply: {send_error}")
-                import traceback
-                print(f"[TWILIO_INBOUND] Traceback: {traceback.format_exc()}")
+                                    history = json.loads(hist_row[0]) if isinstance(hist_row[0], str) else hist_row[0]
+                                    if isinstance(history, list) and history:
+                                        # Update last message with campaign_id and state
+                                        last_msg = history[-1]
+                                        if isinstance(last_msg, dict) and last_msg.get("direction") == "outbound":
+                                            if campaign_id:
+                                                last_msg["campaign_id"] = campaign_id
+                                            if next_state:
+                                                last_msg["state"] = next_state
+                                            if is_test_number:
+                                                last_msg["is_test"] = True
+                                            
+                                            # Save updated history (scoped to environment)
+                                            try:
+                                                update_cur.execute("""
+                                                    UPDATE conversations 
+                                                    SET history = %s::jsonb 
+                                                    WHERE phone = %s AND environment_id = %s
+                                                """, (json.dumps(history), normalized_phone, environment_id))
+                                            except psycopg2.ProgrammingError:
+                                                # Fallback if environment_id column doesn't exist
+                                                update_cur.execute("""
+                                                    UPDATE conversations 
+                                                    SET history = %s::jsonb 
+                                                    WHERE phone = %s
+                                                """, (json.dumps(history), normalized_phone))
+                                            print(f"[TWILIO_INBOUND] ✅ Updated history with campaign_id={campaign_id}, state={next_state}", flush=True)
+                                except Exception as e:
+                                    print(f"[TWILIO_INBOUND] ⚠️ Could not update history metadata: {e}", flush=True)
+                except Exception as history_error:
+                    print(f"[TWILIO_INBOUND] WARNING: Could not store outbound message in history: {history_error}", flush=True)
+                
+                print(f"[TWILIO_INBOUND] Reply sent: {reply_text[:50]}... (SID: {msg.sid})", flush=True)
+            else:
+                missing = []
+                if not twilio_sid:
+                    missing.append("TWILIO_ACCOUNT_SID")
+                if not twilio_token:
+                    missing.append("TWILIO_AUTH_TOKEN")
+                if not twilio_phone:
+                    missing.append("TWILIO_PHONE_NUMBER")
+                print(f"[TWILIO_INBOUND] ❌ WARNING: Missing Twilio config: {', '.join(missing)}", flush=True)
+        except Exception as send_error:
+            print(f"[TWILIO_INBOUND] ERROR sending reply: {send_error}")
+            print(f"[TWILIO_INBOUND] Traceback: {traceback.format_exc()}")
+    
+    # 🔥 CRITICAL: Final return happens AFTER Markov completes and SMS is sent (if applicable)
+    # The HTTP "OK" response satisfies Twilio - it does NOT send an SMS
+    # SMS must be sent explicitly via Twilio REST API (done above if reply_text was set)
+    logger.error(f"[INBOUND_COMPLETE] reply_sent={'YES' if reply_text and will_actually_send else 'NO'} reply_text={'SET' if reply_text else 'None'} will_send={will_actually_send if 'will_actually_send' in locals() else 'unknown'}")
+    print(f"[INBOUND_COMPLETE] reply_sent={'YES' if reply_text and 'will_actually_send' in locals() and will_actually_send else 'NO'}", flush=True)
+    print(f"[TWILIO_INBOUND] Success: {result}")
+    
+    # 🔥 INVARIANT: Only return OK after all processing completes
+    # This return tells Twilio we received the webhook - it does NOT send an SMS
+    return PlainTextResponse("OK", status_code=200)
+
+
+@app.post("/twilio/inbound", response_class=PlainTextResponse)
+async def twilio_inbound(request: Request):
+    """
+    Twilio webhook endpoint for inbound SMS.
+    Receives form-encoded data from Twilio and processes through intelligence layer.
+    Gated by webhook configuration (enabled, mode, logging).
+    """
+    # 🔥 ROUTE DETECTION: This is the CANONICAL inbound handler
+    logger.error(f"🚨🚨🚨 TWILIO ROUTE HIT: /twilio/inbound (CANONICAL HANDLER)")
+    print(f"🚨🚨🚨 TWILIO ROUTE HIT: /twilio/inbound (CANONICAL HANDLER) - Path: {request.url.path}", flush=True)
+    
+    # 🔥 STEP 0: ABSOLUTE CANARY - First line, no conditionals, no guards
+    logger.error("🚨🚨🚨 INBOUND WEBHOOK HIT — RAW REQUEST RECEIVED 🚨🚨🚨")
+    print("🚨🚨🚨 INBOUND WEBHOOK HIT — RAW REQUEST RECEIVED 🚨🚨🚨", flush=True)
+    # 🔥🔥🔥 NUCLEAR LOG - FIRST LINE OF FUNCTION - PROVES WEBHOOK WAS CALLED
+    import sys
+    sys.stdout.flush()
+    sys.stderr.flush()
+    print("=" * 80, flush=True)
+    print("🔥🔥🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥🔥🔥", flush=True)
+    print("🔥🔥🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥🔥🔥", flush=True)
+    print("🔥🔥🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥🔥🔥", flush=True)
+    print("=" * 80, flush=True)
+    import logging
+    _logger = logging.getLogger(__name__)
+    _logger.error("🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥")
+    logger.error("🔥🔥🔥 TWILIO INBOUND WEBHOOK HIT 🔥🔥🔥")
+    
+    # CRITICAL: Log raw body FIRST to catch requests even if form parsing fails
+    try:
+        raw_body = await request.body()
+        print("=" * 60, flush=True)
+        print("[TWILIO_INBOUND] RAW INBOUND BODY:", raw_body.decode('utf-8', errors='replace'), flush=True)
+        print("=" * 60, flush=True)
+    except Exception as e:
+        print(f"[TWILIO_INBOUND] ERROR reading raw body: {e}", flush=True)
+    
+    print("[TWILIO_INBOUND] Webhook hit", flush=True)
+    
+    # Check if webhook is enabled
+    if not WEBHOOK_CONFIG.enabled:
+        print("[TWILIO_INBOUND] Webhook disabled in config")
+        return PlainTextResponse("Webhook disabled", status_code=200)
+    
+    # 🔥 STEP 1: Dump raw Twilio payload (no parsing yet)
+    try:
+        payload = await request.form()
+        payload_dict = dict(payload)
+        logger.error(f"📦 INBOUND RAW FORM DATA: {payload_dict}")
+        print(f"📦 INBOUND RAW FORM DATA: {payload_dict}", flush=True)
+    except Exception as e:
+        logger.error(f"📦 INBOUND RAW FORM PARSE ERROR: {e}")
+        print(f"[TWILIO_INBOUND] ERROR parsing form data: {e}", flush=True)
+        print(f"[TWILIO_INBOUND] This usually means python-multipart is missing from requirements.txt", flush=True)
+        return PlainTextResponse("OK", status_code=200)
+
+    # Always log payload for debugging
+    print(f"[TWILIO_INBOUND] Payload: {payload_dict}")
+    
+    # Log payload if enabled
+    if WEBHOOK_CONFIG.log_payloads:
+        print("TWILIO PAYLOAD:", payload_dict)
+    
+    # Handle dry_run mode
+    if WEBHOOK_CONFIG.mode == "dry_run":
+        print("[TWILIO_INBOUND] Dry run mode - returning OK without processing")
+        return PlainTextResponse("Dry run OK", status_code=200)
+    
+    # Handle paused mode
+    if WEBHOOK_CONFIG.mode == "paused":
+        print("[TWILIO_INBOUND] Paused mode - returning OK without processing")
+        return PlainTextResponse("Webhook paused", status_code=200)
+    
+    # Normal processing (mode == "prod")
+    try:
+        From = payload_dict.get("From", "")
+        Body = payload_dict.get("Body", "")
+        
+        # 🔥 STEP 2: Phone normalization checkpoint
+        raw_from = From
+        logger.error(f"📞 INBOUND RAW FROM: {raw_from}")
+        print(f"📞 INBOUND RAW FROM: {raw_from}", flush=True)
+        
+        if not From:
+            logger.error("📞 INBOUND MISSING FROM FIELD")
+            print("[TWILIO_INBOUND] ERROR: Missing From field", flush=True)
+            return PlainTextResponse("Missing From field", status_code=400)
+        
+        # Normalize inbound `From` BEFORE any lookup (CRITICAL)
+        # This ensures conversation lookup uses the same format as blast (E.164)
+        normalized_phone = normalize_phone(raw_from)
+        logger.error(f"📞 INBOUND NORMALIZED FROM: {normalized_phone}")
+        print(f"📞 INBOUND NORMALIZED FROM: {normalized_phone}", flush=True)
+        
+        print(f"[TWILIO_INBOUND] From={From}, Body={Body[:50]}...")
+        
+        # 🔧 FIX #2: STOP must short-circuit before Markov (compliance requirement)
+        # Twilio STOP messages must never enter Markov pipeline
+        if Body and Body.strip().upper() in {"STOP", "STOPALL", "UNSUBSCRIBE", "CANCEL", "END", "QUIT"}:
+            logger.warning(f"[INBOUND] STOP received from {normalized_phone}")
+            print(f"[TWILIO_INBOUND] 🛑 STOP message received from {normalized_phone} - short-circuiting before Markov", flush=True)
+            # TODO: Implement mark_opt_out(normalized_phone) if you have that function
+            # For now, just return empty response
+            from twilio.twiml.messaging_response import MessagingResponse
+            response = MessagingResponse()
+            return PlainTextResponse(str(response), status_code=200, media_type="application/xml")
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND] 🔥🔥🔥 INBOUND WEBHOOK RECEIVED 🔥🔥🔥", flush=True)
+        # 🔥 INVARIANT 2 VERIFICATION: Inbound webhook hits handler
+        logger.error(f"[INVARIANT] ✅ Inbound webhook received: From={From} Body={Body}")
+        print("=" * 80, flush=True)
+        print(f"[TWILIO_INBOUND] Original From: {From}", flush=True)
+        print(f"[TWILIO_INBOUND] Normalized phone: {normalized_phone}", flush=True)
+        print(f"[TWILIO_INBOUND] Message body: {Body[:100]}...", flush=True)
+        print(f"[TWILIO_INBOUND] Message body length: {len(Body)}", flush=True)
         
-        # 🔥 CRITICAL: Final return happens AFTER Markov completes and SMS is sent (if applicable)
-        # The HTTP "OK" response satisfies Twilio - it does NOT send an SMS
-        # SMS must be sent explicitly via Twilio REST API (done above if reply_text was set)
-        logger.error(f"[INBOUND_COMPLETE] reply_sent={'YES' if reply_text and will_actually_send else 'NO'} reply_text={'SET' if reply_text else 'None'} will_send={will_actually_send if 'will_actually_send' in locals() else 'unknown'}")
-        print(f"[INBOUND_COMPLETE] reply_sent={'YES' if reply_text and 'will_actually_send' in locals() and will_actually_send else 'NO'}", flush=True)
-        print(f"[TWILIO_INBOUND] Success: {result}")
+        # Initialize twilio_phone at the top to avoid UnboundLocalError
+        twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
         
-        # 🔥 INVARIANT: Only return OK after all processing completes
-        # This return tells Twilio we received the webhook - it does NOT send an SMS
-        return PlainTextResponse("OK", status_code=200)
+        # The DB lookups, the Markov step and the Twilio reply all block, so they run off the loop
+        return await run_db(_process_twilio_inbound, From, Body, normalized_phone, twilio_phone)
     except Exception as e:
         # Log error but return ok to Twilio (prevents retries on transient errors)
         # In production, you might want to log this to a monitoring service
-        import traceback
         print(f"[TWILIO_INBOUND] ERROR processing webhook: {e}")
         print(f"[TWILIO_INBOUND] Traceback: {traceback.format_exc()}")
         return PlainTextResponse("OK", status_code=200)
@@ -2482,13 +2591,8 @@ async def get_all():
     return {}
 
 
-@app.get("/leads")
-async def get_leads():
-    """
-    Get all leads - cards that have received inbound messages (responses).
-    Leads = any cards with last_inbound_at set (not null).
-    """
-    conn = get_conn()
+def _load_leads(conn: Any) -> Dict[str, Any]:
+    """Every card that has received an inbound message, newest reply first."""
     leads = []
     
     with conn.cursor() as cur:
@@ -2549,15 +2653,17 @@ async def get_leads():
     }
 
 
-@app.get("/lead/{name}")
-async def get_lead(name: str):
+@app.get("/leads")
+async def get_leads():
     """
-    Get lead information by name.
-    Finds person card by name and returns card data with conversations.
-    Compatible with legacy lead.html UI.
+    Get all leads - cards that have received inbound messages (responses).
+    Leads = any cards with last_inbound_at set (not null).
     """
-    conn = get_conn()
-    
+    return await run_db(_load_leads)
+
+
+def _load_lead_by_name(conn: Any, name: str) -> Dict[str, Any]:
+    """Person card named `name` with its conversations, in the legacy lead.html shape."""
     # Find person card by name (case-insensitive search in card_data JSONB)
     with conn.cursor() as cur:
         cur.execute("""
@@ -2636,17 +2742,26 @@ async def get_lead(name: str):
         }
 
 
+@app.get("/lead/{name}")
+async def get_lead(name: str):
+    """
+    Get lead information by name.
+    Finds person card by name and returns card data with conversations.
+    Compatible with legacy lead.html UI.
+    """
+    return await run_db(_load_lead_by_name, name)
+
+
 # ============================================================================
 # Admin Migration Endpoint
 # ============================================================================
 
 @app.get("/admin/migrate/status")
-async def migration_status():
+def migration_status(conn: Any = Depends(db_conn)):
     """
     Check migration status - verify if tables exist and migration ran.
     """
     try:
-        conn = get_conn()
         with conn.cursor() as cur:
             # Check if cards table exists
             cur.execute("""
@@ -2732,28 +2847,8 @@ async def admin_migrate():
 # Card API Endpoints
 # ============================================================================
 
-@app.post("/cards/upload")
-async def upload_cards(
-    cards: List[Dict[str, Any]],
-    request: Request
-):
-    """
-    Upload array of heterogeneous JSON card objects.
-    Validates schema, normalizes IDs, resolves references, and stores cards.
-    Requires owner or rep authentication.
-    
-    Cards are normalized to 7-field format: ig, biz/org, sector, name, univ, email, phone
-    Accepts both legacy formats (fraternity cards with role/chapter/etc.) and new formats.
-    """
-    # Authenticate user
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[UPLOAD] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
+def _store_uploaded_cards(conn: Any, cards: List[Dict[str, Any]]) -> JSONResponse:
+    """Normalize, classify and store an uploaded batch of cards."""
     print("=" * 60)
     print("UPLOAD HIT")
     print("=" * 60)
@@ -2767,21 +2862,6 @@ async def upload_cards(
     upload_batch_id = f"upload_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{batch_hash}"
     print(f"📦 Upload batch ID: {upload_batch_id}")
     
-    try:
-        conn = get_conn()
-    except Exception as db_error:
-        print(f"❌ Database connection failed: {db_error}")
-        return JSONResponse(
-            content={
-                "ok": False,
-                "stored": 0,
-                "errors": len(cards),
-                "cards": [],
-                "error_details": [{"error": f"Database connection failed: {str(db_error)}"}]
-            },
-            status_code=500
-        )
-    
     results = []
     errors = []
     
@@ -2873,6 +2953,9 @@ async def upload_cards(
             })
     
     print(f"📊 Upload complete: {len(results)} stored, {len(errors)} errors")
+    if results:
+        _resolve_target_cached.cache_clear()
+        _invalidate_assigned_cards()
     
     # Always return 200 OK with JSON response
     # Use 'ok' field to indicate if all cards succeeded
@@ -2890,6 +2973,31 @@ async def upload_cards(
     )
 
 
+@app.post("/cards/upload")
+async def upload_cards(
+    cards: List[Dict[str, Any]],
+    request: Request
+):
+    """
+    Upload array of heterogeneous JSON card objects.
+    Validates schema, normalizes IDs, resolves references, and stores cards.
+    Requires owner or rep authentication.
+    
+    Cards are normalized to 7-field format: ig, biz/org, sector, name, univ, email, phone
+    Accepts both legacy formats (fraternity cards with role/chapter/etc.) and new formats.
+    """
+    # Authenticate user
+    try:
+        current_user = await get_current_owner_or_rep(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[UPLOAD] Auth error: {e}")
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    return await run_db(_store_uploaded_cards, cards)
+
+
 @app.get("/cards/verticals")
 async def get_verticals_endpoint(vertical: Optional[str] = Query(None), request: Request = None):
     """
@@ -2960,33 +3068,8 @@ async def generate_pitch_endpoint(
     return {"pitch": pitch, "vertical": vertical}
 
 
-@app.get("/cards/duplicates")
-async def get_duplicates(request: Request):
-    """
-    Find all duplicate cards grouped by phone number.
-    Returns groups of cards that share the same normalized phone number.
-    Requires owner authentication.
-    """
-    logger.info("[DUPLICATES] Starting duplicate detection")
-    
-    # Authenticate user (owner only)
-    try:
-        current_user = await get_current_admin_user(request)
-        logger.info(f"[DUPLICATES] Authenticated user: {current_user.get('id')}")
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[DUPLICATES] Auth error: {e}", exc_info=True)
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    # Get database connection
-    try:
-        conn = get_conn()
-        logger.info("[DUPLICATES] Database connection established")
-    except Exception as e:
-        logger.error(f"[DUPLICATES] Database connection error: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
-    
+def _find_duplicate_cards(conn: Any) -> JSONResponse:
+    """Group person cards that share a normalized phone number."""
     try:
         with conn.cursor() as cur:
             logger.info("[DUPLICATES] Executing query for person cards with phone numbers")
@@ -3088,25 +3171,30 @@ async def get_duplicates(request: Request):
         raise HTTPException(status_code=500, detail=f"Error finding duplicates: {str(e)}")
 
 
-@app.get("/cards/{card_id}")
-async def get_card_endpoint(card_id: str, request: Request):
+@app.get("/cards/duplicates")
+async def get_duplicates(request: Request):
     """
-    Get a single card by ID.
-    
-    SECURITY: 
-    - Owner/admin can view any card
-    - Reps can ONLY view cards assigned to them
+    Find all duplicate cards grouped by phone number.
+    Returns groups of cards that share the same normalized phone number.
+    Requires owner authentication.
     """
-    # Authenticate user
+    logger.info("[DUPLICATES] Starting duplicate detection")
+    
+    # Authenticate user (owner only)
     try:
-        current_user = await get_current_owner_or_rep(request)
+        current_user = await get_current_admin_user(request)
+        logger.info(f"[DUPLICATES] Authenticated user: {current_user.get('id')}")
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"[GET_CARD] Auth error: {e}")
+        logger.error(f"[DUPLICATES] Auth error: {e}", exc_info=True)
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    conn = get_conn()
+    return await run_db(_find_duplicate_cards)
+
+
+def _load_card_for_user(conn: Any, current_user: AuthUser, card_id: str) -> Dict[str, Any]:
+    """Card with its relationships and conversations; reps get a 403 for cards not assigned to them."""
     card = get_card(conn, card_id)
 
     if not card:
@@ -3125,9 +3213,10 @@ async def get_card_endpoint(card_id: str, request: Request):
     card["relationships"] = relationships
     
     # Get linked conversations with message history
+    if _conversations_has_history is None:
+        _detect_conversation_columns(conn)
     with conn.cursor() as cur:
-        try:
-            # Try to fetch with history column
+        if _conversations_has_history:
             cur.execute("""
                 SELECT phone, state, last_outbound_at, last_inbound_at, 
                        COALESCE(history::text, '[]') as history
@@ -3135,7 +3224,7 @@ async def get_card_endpoint(card_id: str, request: Request):
                 WHERE card_id = %s
                 ORDER BY last_outbound_at DESC NULLS LAST;
             """, (card_id,))
-        except psycopg2.ProgrammingError:
+        else:
             # History column doesn't exist, fetch without it
             cur.execute("""
                 SELECT phone, state, last_outbound_at, last_inbound_at
@@ -3169,24 +3258,29 @@ async def get_card_endpoint(card_id: str, request: Request):
     return card
 
 
-@app.delete("/cards/{card_id}")
-async def delete_card_endpoint(card_id: str, request: Request):
+@app.get("/cards/{card_id}")
+async def get_card_endpoint(card_id: str, request: Request):
     """
-    Delete a card by ID. Also deletes related relationships, conversations, and assignments.
-    Logs terminal handoff event (not a handoff - to_rep=NULL indicates deletion).
-    Requires owner authentication.
+    Get a single card by ID.
+    
+    SECURITY: 
+    - Owner/admin can view any card
+    - Reps can ONLY view cards assigned to them
     """
-    # Authenticate user (owner only for deletion)
+    # Authenticate user
     try:
-        current_user = await get_current_admin_user(request)
+        current_user = await get_current_owner_or_rep(request)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"[CARD_DELETE] Auth error: {e}")
+        logger.error(f"[GET_CARD] Auth error: {e}")
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    conn = get_conn()
-    
+    return await run_db(_load_card_for_user, current_user, card_id)
+
+
+def _delete_card_for_user(conn: Any, current_user: AuthUser, card_id: str) -> Dict[str, Any]:
+    """Delete a card (404 if missing) and drop the caches that may list it."""
     # Check if card exists
     card = get_card(conn, card_id)
     if not card:
@@ -3198,41 +3292,32 @@ async def delete_card_endpoint(card_id: str, request: Request):
     if not success:
         raise HTTPException(status_code=500, detail=error_message or f"Error deleting card: {card_id}")
 
+    _resolve_target_cached.cache_clear()
+    _invalidate_assigned_cards()
     return {"ok": True, "message": f"Card {card_id} deleted successfully"}
 
 
-@app.post("/cards/merge")
-async def merge_cards(
-    data: Dict[str, Any],
-    request: Request
-):
+@app.delete("/cards/{card_id}")
+async def delete_card_endpoint(card_id: str, request: Request):
     """
-    Merge multiple duplicate cards into one.
-    
-    Body:
-    {
-        "primary_card_id": "card_id_to_keep",
-        "duplicate_card_ids": ["card_id1", "card_id2", ...]
-    }
-    
-    Merges duplicate cards into the primary card:
-    - Updates conversations to point to primary card
-    - Updates assignments to point to primary card
-    - Updates relationships to point to primary card
-    - Deletes duplicate cards
-    - Merges card_data (takes non-empty values from duplicates)
-    
+    Delete a card by ID. Also deletes related relationships, conversations, and assignments.
+    Logs terminal handoff event (not a handoff - to_rep=NULL indicates deletion).
     Requires owner authentication.
     """
-    # Authenticate user (owner only)
+    # Authenticate user (owner only for deletion)
     try:
         current_user = await get_current_admin_user(request)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"[MERGE] Auth error: {e}")
+        logger.error(f"[CARD_DELETE] Auth error: {e}")
         raise HTTPException(status_code=401, detail="Authentication required")
     
+    return await run_db(_delete_card_for_user, current_user, card_id)
+
+
+def _merge_cards(conn: Any, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold duplicate cards into the primary card."""
     primary_card_id = data.get("primary_card_id")
     duplicate_card_ids = data.get("duplicate_card_ids", [])
     
@@ -3245,8 +3330,6 @@ async def merge_cards(
     if primary_card_id in duplicate_card_ids:
         raise HTTPException(status_code=400, detail="Primary card cannot be in duplicate list")
     
-    conn = get_conn()
-    
     try:
         # Get primary card
         primary_card = get_card(conn, primary_card_id)
@@ -3381,6 +3464,8 @@ async def merge_cards(
             """, tuple(duplicate_card_ids))
         
         conn.commit()
+        _resolve_target_cached.cache_clear()
+        _invalidate_assigned_cards()
         
         logger.info(f"[MERGE] Merged {len(duplicate_cards)} cards into {primary_card_id}")
         
@@ -3403,79 +3488,65 @@ async def merge_cards(
         raise HTTPException(status_code=500, detail=f"Error merging cards: {str(e)}")
 
 
+@app.post("/cards/merge")
+async def merge_cards(
+    data: Dict[str, Any],
+    request: Request
+):
+    """
+    Merge multiple duplicate cards into one.
+    
+    Body:
+    {
+        "primary_card_id": "card_id_to_keep",
+        "duplicate_card_ids": ["card_id1", "card_id2", ...]
+    }
+    
+    Merges duplicate cards into the primary card:
+    - Updates conversations to point to primary card
+    - Updates assignments to point to primary card
+    - Updates relationships to point to primary card
+    - Deletes duplicate cards
+    - Merges card_data (takes non-empty values from duplicates)
+    
+    Requires owner authentication.
+    """
+    # Authenticate user (owner only)
+    try:
+        current_user = await get_current_admin_user(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[MERGE] Auth error: {e}")
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    return await run_db(_merge_cards, data)
+
+
 @app.get("/cards")
-async def list_cards(
+def list_cards(
     type: Optional[str] = Query(None, description="Filter by card type"),
     sales_state: Optional[str] = Query(None, description="Filter by sales state"),
     owner: Optional[str] = Query(None, description="Filter by owner"),
     where: Optional[str] = Query(None, description="JSON where clause"),
     limit: Optional[int] = Query(10000, description="Limit results"),
-    offset: Optional[int] = Query(0, description="Offset results")
+    offset: Optional[int] = Query(0, description="Offset results"),
+    conn: Any = Depends(db_conn)
 ):
     """
     List cards with optional filters.
     Supports type, sales_state, owner filters, or complex where clause.
     """
     # #region agent log - Cards endpoint entry
-    try:
-        import time
-        with open(_log_file, "a") as f:
-            f.write(_json.dumps({
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "timestamp": int(time.time() * 1000),
-                "location": f"{__file__}:CARDS_ENDPOINT_ENTRY",
-                "message": "Cards endpoint called",
-                "data": {"type": type, "sales_state": sales_state, "owner": owner, "limit": limit},
-                "hypothesisId": "F"
-            }) + "\n")
-    except:
-        pass
+    _agent_log("CARDS_ENDPOINT_ENTRY", "Cards endpoint called", {"type": type, "sales_state": sales_state, "owner": owner, "limit": limit}, "F")
     # #endregion
     
     try:
-        # #region agent log - Before get_conn
-        try:
-            import time
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(time.time() * 1000),
-                    "location": f"{__file__}:BEFORE_GET_CONN",
-                    "message": "About to get database connection",
-                    "data": {},
-                    "hypothesisId": "F"
-                }) + "\n")
-        except:
-            pass
-        # #endregion
-        
-        conn = get_conn()
-        
-        # #region agent log - After get_conn
-        try:
-            import time
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(time.time() * 1000),
-                    "location": f"{__file__}:AFTER_GET_CONN",
-                    "message": "Database connection obtained",
-                    "data": {"connection_status": "success"},
-                    "hypothesisId": "F"
-                }) + "\n")
-        except:
-            pass
-        # #endregion
-        
         # Quick check: Try a simple query first - if it fails with UndefinedTable, we know table doesn't exist
         # This is faster than checking information_schema
         # #region agent log - Quick table check
         table_exists = False
         try:
-            import time
             check_start = time.time()
             with conn.cursor() as check_cur:
                 # Set a short timeout for the check
@@ -3494,56 +3565,17 @@ async def list_cards(
             check_duration = time.time() - check_start
             
             # Best-effort logging; do not let log failures affect table_exists
-            try:
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:TABLE_EXISTS_CHECK",
-                        "message": "Checked if cards table exists",
-                        "data": {"table_exists": table_exists, "check_duration_ms": int(check_duration * 1000)},
-                        "hypothesisId": "F"
-                    }) + "\n")
-            except Exception:
-                # Ignore logging errors entirely in production
-                pass
+            _agent_log("TABLE_EXISTS_CHECK", "Checked if cards table exists", {"table_exists": table_exists, "check_duration_ms": int(check_duration * 1000)}, "F")
         except Exception as check_outer_e:
             # If the check itself fails, assume table doesn't exist and try migration
-            import time
             print(f"⚠️  Table check failed: {check_outer_e}")
-            try:
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:TABLE_CHECK_EXCEPTION",
-                        "message": "Table check threw exception",
-                        "data": {"error": str(check_outer_e), "error_type": type(check_outer_e).__name__},
-                        "hypothesisId": "F"
-                    }) + "\n")
-            except:
-                pass
+            _agent_log("TABLE_CHECK_EXCEPTION", "Table check threw exception", {"error": str(check_outer_e), "error_type": type(check_outer_e).__name__}, "F")
             table_exists = False
         
         # If table doesn't exist, try auto-migration BEFORE building query
         if not table_exists:
             # #region agent log - Table missing, attempting auto-migration
-            try:
-                import time
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:AUTO_MIGRATION_TRIGGER",
-                        "message": "Table missing, attempting auto-migration",
-                        "data": {},
-                        "hypothesisId": "H"
-                    }) + "\n")
-            except:
-                pass
+            _agent_log("AUTO_MIGRATION_TRIGGER", "Table missing, attempting auto-migration", {}, "H")
             # #endregion
             
             # Auto-run migration as fallback
@@ -3574,7 +3606,6 @@ async def list_cards(
                     )
             except Exception as migration_error:
                 print(f"❌ Auto-migration error: {migration_error}")
-                import traceback
                 print(f"📋 Traceback: {traceback.format_exc()}")
                 return JSONResponse(
                     content={
@@ -3623,21 +3654,8 @@ async def list_cards(
         cards = []
         
         # #region agent log - Before query execution
-        try:
-            import time
-            query_start = time.time()
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(time.time() * 1000),
-                    "location": f"{__file__}:BEFORE_QUERY_EXEC_DETAILED",
-                    "message": "About to execute SELECT query",
-                    "data": {"query_preview": query[:100], "params_count": len(params)},
-                    "hypothesisId": "F"
-                }) + "\n")
-        except:
-            pass
+        query_start = time.time()
+        _agent_log("BEFORE_QUERY_EXEC_DETAILED", "About to execute SELECT query", {"query_preview": query[:100], "params_count": len(params)}, "F")
         # #endregion
         
         try:
@@ -3649,40 +3667,14 @@ async def list_cards(
                 cur.execute(query, params)
                 
                 # #region agent log - After query execution
-                try:
-                    import time
-                    query_duration = time.time() - query_start
-                    with open(_log_file, "a") as f:
-                        f.write(_json.dumps({
-                            "sessionId": "debug-session",
-                            "runId": "run1",
-                            "timestamp": int(time.time() * 1000),
-                            "location": f"{__file__}:AFTER_QUERY_EXEC",
-                            "message": "Query executed successfully",
-                            "data": {"duration_ms": int(query_duration * 1000)},
-                            "hypothesisId": "F"
-                        }) + "\n")
-                except:
-                    pass
+                query_duration = time.time() - query_start
+                _agent_log("AFTER_QUERY_EXEC", "Query executed successfully", {"duration_ms": int(query_duration * 1000)}, "F")
                 # #endregion
                 
                 rows = cur.fetchall()
                 
                 # #region agent log - After fetchall
-                try:
-                    import time
-                    with open(_log_file, "a") as f:
-                        f.write(_json.dumps({
-                            "sessionId": "debug-session",
-                            "runId": "run1",
-                            "timestamp": int(time.time() * 1000),
-                            "location": f"{__file__}:AFTER_FETCHALL",
-                            "message": "Fetched rows from query",
-                            "data": {"row_count": len(rows)},
-                            "hypothesisId": "F"
-                        }) + "\n")
-                except:
-                    pass
+                _agent_log("AFTER_FETCHALL", "Fetched rows from query", {"row_count": len(rows)}, "F")
                 # #endregion
                 
                 for row in rows:
@@ -3728,20 +3720,7 @@ async def list_cards(
                     cards.append(card_obj)
         except psycopg2.errors.UndefinedTable as table_error:
             # #region agent log - Table missing error from query
-            try:
-                import time
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:TABLE_MISSING_ERROR",
-                        "message": "Table does not exist error from query - attempting auto-migration",
-                        "data": {"error": str(table_error)},
-                        "hypothesisId": "F"
-                    }) + "\n")
-            except:
-                pass
+            _agent_log("TABLE_MISSING_ERROR", "Table does not exist error from query - attempting auto-migration", {"error": str(table_error)}, "F")
             # #endregion
             
             # Table doesn't exist - try auto-migration as last resort
@@ -3810,7 +3789,6 @@ async def list_cards(
                         status_code=500
                     )
             except Exception as migration_error:
-                import traceback
                 print(f"❌ Auto-migration error: {migration_error}")
                 print(f"📋 Traceback: {traceback.format_exc()}")
                 return JSONResponse(
@@ -3822,22 +3800,9 @@ async def list_cards(
                     },
                     status_code=500
                 )
-        except psycopg2.errors.QueryCanceled as timeout_error:
-            # #region agent log - Query timeout
-            try:
-                import time
-                with open(_log_file, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(time.time() * 1000),
-                        "location": f"{__file__}:QUERY_TIMEOUT",
-                        "message": "Query timed out",
-                        "data": {"error": str(timeout_error)},
-                        "hypothesisId": "F"
-                    }) + "\n")
-            except:
-                pass
+        except psycopg2.errors.QueryCanceled as timeout_error:
+            # #region agent log - Query timeout
+            _agent_log("QUERY_TIMEOUT", "Query timed out", {"error": str(timeout_error)}, "F")
             # #endregion
             return JSONResponse(
                 content={
@@ -3855,20 +3820,7 @@ async def list_cards(
         }
         
         # #region agent log - Before JSON response
-        try:
-            import time
-            with open(_log_file, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(time.time() * 1000),
-                    "location": f"{__file__}:BEFORE_JSON_RESPONSE",
-                    "message": "About to return JSON response",
-                    "data": {"card_count": len(cards)},
-                    "hypothesisId": "F"
-                }) + "\n")
-        except:
-            pass
+        _agent_log("BEFORE_JSON_RESPONSE", "About to return JSON response", {"card_count": len(cards)}, "F")
         # #endregion
         
         # Force JSON serialization to handle any non-serializable types
@@ -3876,89 +3828,104 @@ async def list_cards(
             content=jsonable_encoder(result),
             status_code=200
         )
+    except HTTPException:
+        # Client errors (e.g. invalid where JSON) keep their own status code
+        raise
     except Exception as e:
-        # Return detailed error for debugging
-        import traceback
         # Use __class__ instead of type() to avoid shadowing issues
-        error_type = e.__class__.__name__ if e else "UnknownError"
+        error_type = e.__class__.__name__
         
+        # str(e) and the class name are already JSON-safe - no jsonable_encoder pass needed
         error_detail = {
-            "error": str(e) if e else "Unknown error occurred",
+            "error": str(e) or "Unknown error occurred",
             "error_type": error_type,
-            "traceback": traceback.format_exc()
         }
+        # Formatting the traceback walks the whole stack; only do it when debugging
+        if DEBUG_TRACEBACKS:
+            error_detail["traceback"] = traceback.format_exc()
         
-        # Return as JSONResponse to ensure proper serialization
-        return JSONResponse(
-            content=jsonable_encoder(error_detail),
-            status_code=500
-        )
+        return _err(500, error_detail)
 
 
 # ============================================================================
 # Messaging API Endpoints
 # ============================================================================
 
-@app.post("/messages/send")
-async def send_message(request: Dict[str, Any]):
+# Resolved targets are reused for up to this many seconds (cache key includes the time bucket).
+# Card-writing endpoints clear the cache so edits are visible immediately.
+RESOLVE_TARGET_TTL_SECONDS = 30
+
+
+@lru_cache(maxsize=1024)
+def _resolve_target_cached(target_key: str, bucket: int) -> Tuple[Dict[str, Any], ...]:
     """
-    Send message to target (contact, entity, or query).
-    Resolves target to contact cards, then sends via /events/outbound.
+    Contact cards for a JSON-encoded target spec; `bucket` expires entries after the TTL.
+    Returns a tuple so callers cannot change the cached value. Unresolvable or empty targets
+    raise a 400, and lru_cache does not store exceptions, so only hits are cached.
     """
-    conn = get_conn()
-    
-    target = request.get("target")
-    if not target:
-        raise HTTPException(status_code=400, detail="Missing 'target' in request")
-    
-    message_type = request.get("message_type", "outbound")
-    template = request.get("template")
-    owner = request.get("owner", "system")
-    source_batch_id = request.get("source_batch_id")
-    
-    # Resolve target to contact cards
-    contact_cards, error = resolve_target(conn, target)
+    with pooled_conn() as conn:
+        contact_cards, error = resolve_target(conn, json.loads(target_key))
     if error:
         raise HTTPException(status_code=400, detail=error)
-    
     if not contact_cards:
         raise HTTPException(status_code=400, detail="Target resolved to no contact cards")
-    
-    # Extract phone numbers
-    phones = extract_phones_from_cards(contact_cards)
-    
-    # Send to each contact via /events/outbound
-    results = []
+    return tuple(contact_cards)
+
+
+class SendMessageRequest(BaseModel):
+    """Body for POST /messages/send; `target` is a resolve_target spec."""
+    target: Dict[str, Any]
+    message_type: str = "outbound"
+    template: Optional[str] = None
+    owner: str = "system"
+    source_batch_id: Optional[str] = None
+
+
+@app.post("/messages/send")
+async def send_message(request: SendMessageRequest):
+    """
+    Send message to target (contact, entity, or query).
+    Resolves target to contact cards, then sends via /events/outbound.
+    """
+    target = request.target
+    owner = request.owner
+    source_batch_id = request.source_batch_id
+    
+    # Resolve target to contact cards (cached per target for RESOLVE_TARGET_TTL_SECONDS)
+    target_key = json.dumps(target, sort_keys=True, default=str)
+    bucket = int(time.time() // RESOLVE_TARGET_TTL_SECONDS)
+    contact_cards = await asyncio.to_thread(_resolve_target_cached, target_key, bucket)
+    
+    # Build one outbound event per contact with a phone
+    sendable = []
+    events = []
     for card in contact_cards:
         phone = card["card_data"].get("phone")
         if not phone:
             continue
-        
-        # Create outbound event
-        event = {
+        sendable.append((card["id"], phone))
+        events.append({
             "phone": phone,
             "card_id": card["id"],  # Use card_id for new system
             "contact_id": card["id"],  # Keep for backward compatibility
             "owner": card.get("owner") or owner,
             "source_batch_id": source_batch_id,
-        }
-        
-        # Call outbound endpoint (internal call)
+        })
+    
+    # Record all events in one round-trip; per-card results mirror the batch outcome
+    results = []
+    if events:
         try:
-            result = await outbound(event)
-            results.append({
-                "card_id": card["id"],
-                "phone": phone,
-                "status": "sent",
-                "result": result
-            })
+            batch_results = await outbound_batch(events)
+            results = [
+                {"card_id": card_id, "phone": phone, "status": "sent", "result": result}
+                for (card_id, phone), result in zip(sendable, batch_results)
+            ]
         except Exception as e:
-            results.append({
-                "card_id": card["id"],
-                "phone": phone,
-                "status": "error",
-                "error": str(e)
-            })
+            results = [
+                {"card_id": card_id, "phone": phone, "status": "error", "error": str(e)}
+                for card_id, phone in sendable
+            ]
     
     return {
         "ok": True,
@@ -3973,16 +3940,14 @@ async def send_message(request: Dict[str, Any]):
 # Markov Response Configuration Endpoints
 # ============================================================================
 
+@lru_cache(maxsize=None)
 def generate_state_color(state_key: str) -> str:
     """
-    Generate a deterministic color for a state key using a simple hash.
+    Generate a deterministic color for a state key using a stable digest.
     Returns a hex color code.
     """
-    # Simple hash function for deterministic colors
-    hash_val = hash(state_key) % (256 * 256 * 256)
-    r = (hash_val >> 16) & 0xFF
-    g = (hash_val >> 8) & 0xFF
-    b = hash_val & 0xFF
+    # blake2s is stable across processes (built-in hash() is salted per process by PYTHONHASHSEED)
+    r, g, b = hashlib.blake2s(state_key.encode("utf-8"), digest_size=3).digest()
     
     # Adjust brightness to ensure colors are visible (not too dark)
     r = max(100, min(220, r))
@@ -3992,9 +3957,9 @@ def generate_state_color(state_key: str) -> str:
     return f"#{r:02x}{g:02x}{b:02x}"
 
 
-def get_all_markov_states() -> List[Dict[str, Any]]:
+def _build_markov_states() -> List[Dict[str, Any]]:
     """
-    Get all Markov states from the intelligence registry.
+    Build the Markov state list from the intelligence registry.
     Flattens the conversation tree and includes the root state.
     Returns list of {state_key, label, description, color}
     """
@@ -4028,15 +3993,72 @@ def get_all_markov_states() -> List[Dict[str, Any]]:
     return result
 
 
+# The registry is code-defined, so the state list (labels, descriptions, colors) and its
+# JSON encoding are built once at import. Callers must not mutate the shared list.
+_MARKOV_STATES = _build_markov_states()
+_MARKOV_STATES_JSON = orjson.dumps(_MARKOV_STATES)
+# Content only changes with a deploy: let browsers cache it and revalidate cheaply by ETag
+_MARKOV_STATES_HEADERS = {
+    "Cache-Control": "public, max-age=86400",
+    "ETag": '"' + hashlib.blake2s(_MARKOV_STATES_JSON, digest_size=8).hexdigest() + '"',
+}
+
+
+def get_all_markov_states() -> List[Dict[str, Any]]:
+    """
+    Get all Markov states from the intelligence registry.
+    Returns list of {state_key, label, description, color}
+    """
+    return _MARKOV_STATES
+
+
 @app.get("/markov/states")
-async def get_markov_states():
+async def get_markov_states(request: Request):
     """
     Get all possible Markov/SubTAM states from the intelligence registry.
     This is the authoritative source of which states exist (code-defined, not DB).
     Returns list of {state_key, label, description, color}
     """
-    states = get_all_markov_states()
-    return states
+    if request.headers.get("if-none-match") == _MARKOV_STATES_HEADERS["ETag"]:
+        return Response(status_code=304, headers=_MARKOV_STATES_HEADERS)
+    return Response(content=_MARKOV_STATES_JSON, media_type="application/json", headers=_MARKOV_STATES_HEADERS)
+
+
+def _fetch_markov_responses(conn: Any, user_id: Optional[str]) -> Dict[str, Any]:
+    """Load the responses visible to user_id (None = owner/global) plus initial outreach, in one query."""
+    with conn.cursor() as cur:
+        # One round-trip for owner and rep alike. For a rep, rows for their user_id sort ahead
+        # of the owner's global default (user_id IS NULL), so DISTINCT ON keeps the customization
+        # and falls back to the default for states they haven't customized. For the owner,
+        # user_id = NULL matches nothing and only global rows are returned.
+        cur.execute("""
+            SELECT DISTINCT ON (state_key)
+                state_key, response_text, description, updated_at, (user_id IS NOT NULL) AS is_custom
+            FROM markov_responses
+            WHERE user_id = %s OR user_id IS NULL
+            ORDER BY state_key, (user_id IS NOT NULL) DESC;
+        """, (user_id,))
+        rows = cur.fetchall()
+    
+    responses = {
+        row[0]: {
+            "response_text": row[1],
+            "description": row[2],
+            "updated_at": row[3].isoformat() if row[3] else None,
+            # Rep: custom only if it's their own row. Owner's responses are always "custom" (they're the defaults)
+            "is_custom": row[4] if user_id else True,
+        }
+        for row in rows
+    }
+    
+    # Initial outreach is stored as a special key, so the query above already resolved it
+    # (rep-specific first, then global). It stays in `responses` as it always has.
+    initial_outreach = responses.get("__initial_outreach__", {}).get("response_text")
+    
+    return {
+        "responses": responses,
+        "initial_outreach": initial_outreach,
+    }
 
 
 @app.get("/markov/responses")
@@ -4053,101 +4075,43 @@ async def get_markov_responses(
         logger.error(f"[MARKOV_RESPONSES] Auth error: {e}")
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    conn = get_conn()
     user_role = current_user.get("role")
     user_id = None if user_role == "admin" else current_user.get("id")
     
+    return await run_db(_fetch_markov_responses, user_id)
+
+
+def _save_markov_response(conn: Any, state_key: str, response_text: str, description: str, user_id: Optional[str]) -> None:
+    """Upsert one Markov response; user_id=None writes the global (owner) default."""
+    # Naive UTC, matching the TIMESTAMP (no time zone) column
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # Single prepared upsert; the conflict target must match the partial unique index for the scope
     with conn.cursor() as cur:
         if user_id:
-            # Rep: get rep-specific responses, but also include owner's defaults for states they haven't customized
-            # First get rep-specific responses
-            cur.execute("""
-                SELECT state_key, response_text, description, updated_at
-                FROM markov_responses
-                WHERE user_id = %s
-                ORDER BY state_key;
-            """, (user_id,))
-            rep_rows = cur.fetchall()
-            
-            # Then get owner's global responses
-            cur.execute("""
-                SELECT state_key, response_text, description, updated_at
-                FROM markov_responses
-                WHERE user_id IS NULL
-                ORDER BY state_key;
-            """)
-            global_rows = cur.fetchall()
-            
-            # Merge: rep-specific overrides global, but include global for states rep hasn't customized
-            rep_responses = {row[0]: row for row in rep_rows}
-            global_responses = {row[0]: row for row in global_rows}
-            
-            # Start with global defaults, then override with rep-specific
-            responses = {}
-            for state_key, row in global_responses.items():
-                responses[state_key] = {
-                    "response_text": row[1],
-                    "description": row[2],
-                    "updated_at": row[3].isoformat() if row[3] else None,
-                    "is_custom": False,  # This is from owner's defaults
-                }
-            # Override with rep-specific customizations
-            for state_key, row in rep_responses.items():
-                responses[state_key] = {
-                    "response_text": row[1],
-                    "description": row[2],
-                    "updated_at": row[3].isoformat() if row[3] else None,
-                    "is_custom": True,  # This is rep's customization
-                }
-        else:
-            # Owner: get global responses (user_id IS NULL)
-            cur.execute("""
-                SELECT state_key, response_text, description, updated_at
-                FROM markov_responses
-                WHERE user_id IS NULL
-                ORDER BY state_key;
-            """)
-            rows = cur.fetchall()
-            
-            responses = {
-                row[0]: {
-                    "response_text": row[1],
-                    "description": row[2],
-                    "updated_at": row[3].isoformat() if row[3] else None,
-                    "is_custom": True,  # Owner's responses are always "custom" (they're the defaults)
-                }
-                for row in rows
-            }
-    
-    # Also get initial outreach (stored as special key)
-    with conn.cursor() as cur:
-        if user_id:
-            # Try rep-specific first
-            cur.execute("""
-                SELECT response_text FROM markov_responses 
-                WHERE state_key = '__initial_outreach__' AND user_id = %s
-            """, (user_id,))
-            row = cur.fetchone()
-            if not row:
-                # Fallback to global
-                cur.execute("""
-                    SELECT response_text FROM markov_responses 
-                    WHERE state_key = '__initial_outreach__' AND user_id IS NULL
-                """)
-                row = cur.fetchone()
+            # Rep: save with user_id
+            execute_prepared(cur, "markov_upsert_rep", """
+                INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (state_key, user_id) WHERE user_id IS NOT NULL
+                DO UPDATE SET
+                  response_text = EXCLUDED.response_text,
+                  description = EXCLUDED.description,
+                  updated_at = EXCLUDED.updated_at
+            """, (state_key, response_text, description, now, user_id))
         else:
-            # Owner: get global
-            cur.execute("""
-                SELECT response_text FROM markov_responses 
-                WHERE state_key = '__initial_outreach__' AND user_id IS NULL
-            """)
-            row = cur.fetchone()
-        initial_outreach = row[0] if row else None
+            # Owner: save global (user_id IS NULL)
+            execute_prepared(cur, "markov_upsert_global", """
+                INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
+                VALUES ($1, $2, $3, $4, NULL)
+                ON CONFLICT (state_key) WHERE user_id IS NULL
+                DO UPDATE SET
+                  response_text = EXCLUDED.response_text,
+                  description = EXCLUDED.description,
+                  updated_at = EXCLUDED.updated_at
+            """, (state_key, response_text, description, now))
     
-    return {
-        "responses": responses,
-        "initial_outreach": initial_outreach,
-    }
+    logger.info(f"✅ Saved state: {state_key}")
+    _invalidate_markov_response_cache([state_key], user_id)
 
 
 @app.post("/markov/response")
@@ -4171,10 +4135,8 @@ async def update_single_markov_response(
         logger.error(f"[MARKOV_RESPONSE] Auth error: {e}")
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    logger.info("🧠 ENTER save_markov_response")
-    logger.info(f"📦 payload={json.dumps(payload, indent=2)}")
+    logger.info(f"🧠 ENTER save_markov_response (keys: {list(payload.keys())})")
     
-    conn = get_conn()
     user_role = current_user.get("role")
     user_id = None if user_role == "admin" else current_user.get("id")
     
@@ -4211,53 +4173,7 @@ async def update_single_markov_response(
     logger.debug(f"Response text type: {type(response_text)}, length: {len(response_text)}")
     
     try:
-        with conn.cursor() as cur:
-            if user_id:
-                # Rep: save with user_id (use partial unique index)
-                # Use UPDATE ... WHERE pattern since ON CONFLICT with partial indexes is tricky
-                cur.execute("""
-                    UPDATE markov_responses
-                    SET response_text = %s, description = %s, updated_at = %s
-                    WHERE state_key = %s AND user_id = %s;
-                """, (response_text, description, datetime.utcnow(), state_key, user_id))
-                if cur.rowcount == 0:
-                    cur.execute("""
-                        INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
-                        VALUES (%s, %s, %s, %s, %s);
-                    """, (state_key, response_text, description, datetime.utcnow(), user_id))
-            else:
-                # Owner: save global (user_id IS NULL)
-                cur.execute("""
-                    UPDATE markov_responses
-                    SET response_text = %s, description = %s, updated_at = %s
-                    WHERE state_key = %s AND user_id IS NULL;
-                """, (response_text, description, datetime.utcnow(), state_key))
-                if cur.rowcount == 0:
-                    cur.execute("""
-                        INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
-                        VALUES (%s, %s, %s, %s, NULL);
-                    """, (state_key, response_text, description, datetime.utcnow()))
-        
-        logger.info(f"✅ Saved state: {state_key}")
-        
-        # Verify the save worked by querying it back
-        with conn.cursor() as verify_cur:
-            if user_id:
-                verify_cur.execute("""
-                    SELECT response_text FROM markov_responses
-                    WHERE state_key = %s AND user_id = %s
-                """, (state_key, user_id))
-            else:
-                verify_cur.execute("""
-                    SELECT response_text FROM markov_responses
-                    WHERE state_key = %s AND user_id IS NULL
-                """, (state_key,))
-            verify_row = verify_cur.fetchone()
-            if verify_row:
-                logger.info(f"✅ Verified: Response saved successfully (length: {len(verify_row[0])} chars)")
-                logger.info(f"✅ Verified: Preview: {verify_row[0][:50]}...")
-            else:
-                logger.warning(f"⚠️ WARNING: Could not verify saved response for state_key={state_key}, user_id={user_id}")
+        await run_db(_save_markov_response, state_key, response_text, description, user_id)
         
         logger.info("✅ SAVE COMPLETE")
         return {"ok": True, "state_key": state_key, "message": "Response saved successfully"}
@@ -4267,6 +4183,74 @@ async def update_single_markov_response(
         raise
 
 
+def _save_markov_responses_batch(conn: Any, user_id: Optional[str], responses: Dict[str, Any], initial_outreach: Any) -> Tuple[int, int]:
+    """
+    Upsert a batch of Markov responses (and optional initial outreach) in one statement.
+    Returns (saved, failed).
+    """
+    # One timestamp for the whole batch. Naive UTC, matching the TIMESTAMP (no time zone) column
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = {}
+    for state_key, config in responses.items():
+        response_text = config.get("response_text", "")
+        
+        # 🔧 CRITICAL FIX: Coerce response_text to string (handle dict/object inputs)
+        if isinstance(response_text, dict):
+            response_text = response_text.get("text", json.dumps(response_text))
+            logger.warning(f"⚠️ response_text was dict for {state_key} - coerced to string")
+        elif not isinstance(response_text, str):
+            response_text = str(response_text)
+            logger.warning(f"⚠️ response_text was {type(response_text)} for {state_key} - coerced to string")
+        
+        description = config.get("description", "")
+        # Ensure description is also a string
+        if not isinstance(description, str):
+            description = str(description) if description else ""
+        
+        rows[state_key] = (state_key, response_text, description, now, user_id)
+    
+    # Update initial outreach (special key)
+    if initial_outreach is not None:
+        # 🔧 CRITICAL FIX: Coerce initial_outreach to string (handle dict/object inputs)
+        if isinstance(initial_outreach, dict):
+            initial_outreach = initial_outreach.get("text", json.dumps(initial_outreach))
+            logger.warning(f"⚠️ initial_outreach was dict - coerced to string")
+        elif not isinstance(initial_outreach, str):
+            initial_outreach = str(initial_outreach)
+            logger.warning(f"⚠️ initial_outreach was {type(initial_outreach)} - coerced to string")
+        
+        # NULL description: initial outreach never sets one, so COALESCE below keeps the stored value
+        rows["__initial_outreach__"] = ("__initial_outreach__", initial_outreach, None, now, user_id)
+    
+    if not rows:
+        return 0, 0
+    
+    # Conflict target must match the partial unique index for this scope (see migration 006)
+    if user_id:
+        conflict_target = "(state_key, user_id) WHERE user_id IS NOT NULL"
+    else:
+        conflict_target = "(state_key) WHERE user_id IS NULL"
+    
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, f"""
+                INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
+                VALUES %s
+                ON CONFLICT {conflict_target}
+                DO UPDATE SET
+                  response_text = EXCLUDED.response_text,
+                  description = COALESCE(EXCLUDED.description, markov_responses.description),
+                  updated_at = EXCLUDED.updated_at;
+            """, list(rows.values()))
+    except Exception as e:
+        logger.error(f"❌ Failed saving states: {list(rows.keys())}")
+        logger.exception(e)
+        return 0, len(rows)
+    
+    _invalidate_markov_response_cache(rows.keys(), user_id)
+    return len(rows), 0
+
+
 @app.post("/markov/responses")
 async def update_markov_responses(
     request: Request,
@@ -4291,7 +4275,6 @@ async def update_markov_responses(
     logger.info("📥 POST /markov/responses called (batch)")
     logger.info(f"📦 Payload keys: {list(payload.keys())}")
     
-    conn = get_conn()
     user_role = current_user.get("role")
     user_id = None if user_role == "admin" else current_user.get("id")
     
@@ -4307,106 +4290,8 @@ async def update_markov_responses(
     logger.info(f"States in import: {list(responses.keys())}")
     logger.info(f"Initial outreach present: {initial_outreach is not None}")
     
-    saved_count = 0
-    failed_count = 0
-    
     try:
-        with conn.cursor() as cur:
-            # Update/insert state responses
-            for state_key, config in responses.items():
-                logger.info(f"✏️ Saving state: {state_key}")
-                response_text = config.get("response_text", "")
-                
-                # 🔧 CRITICAL FIX: Coerce response_text to string (handle dict/object inputs)
-                if isinstance(response_text, dict):
-                    response_text = response_text.get("text", json.dumps(response_text))
-                    logger.warning(f"⚠️ response_text was dict for {state_key} - coerced to string")
-                elif not isinstance(response_text, str):
-                    response_text = str(response_text)
-                    logger.warning(f"⚠️ response_text was {type(response_text)} for {state_key} - coerced to string")
-                
-                description = config.get("description", "")
-                # Ensure description is also a string
-                if not isinstance(description, str):
-                    description = str(description) if description else ""
-                
-                logger.debug(f"Response text type: {type(response_text)}, length: {len(response_text)}")
-                
-                try:
-                    if user_id:
-                        # Rep: save with user_id (use partial unique index)
-                        cur.execute("""
-                            UPDATE markov_responses
-                            SET response_text = %s, description = %s, updated_at = %s
-                            WHERE state_key = %s AND user_id = %s;
-                        """, (response_text, description, datetime.utcnow(), state_key, user_id))
-                        if cur.rowcount == 0:
-                            cur.execute("""
-                                INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
-                                VALUES (%s, %s, %s, %s, %s);
-                            """, (state_key, response_text, description, datetime.utcnow(), user_id))
-                    else:
-                        # Owner: save global
-                        cur.execute("""
-                            UPDATE markov_responses
-                            SET response_text = %s, description = %s, updated_at = %s
-                            WHERE state_key = %s AND user_id IS NULL;
-                        """, (response_text, description, datetime.utcnow(), state_key))
-                        if cur.rowcount == 0:
-                            cur.execute("""
-                                INSERT INTO markov_responses (state_key, response_text, description, updated_at, user_id)
-                                VALUES (%s, %s, %s, %s, NULL);
-                            """, (state_key, response_text, description, datetime.utcnow()))
-                    logger.info(f"✅ Saved state: {state_key}")
-                    saved_count += 1
-                except Exception as e:
-                    logger.error(f"❌ Failed saving state: {state_key}")
-                    logger.exception(e)
-                    failed_count += 1
-            
-            # Update initial outreach (special key)
-            if initial_outreach is not None:
-                logger.info("✏️ Saving initial_outreach")
-                
-                # 🔧 CRITICAL FIX: Coerce initial_outreach to string (handle dict/object inputs)
-                if isinstance(initial_outreach, dict):
-                    initial_outreach = initial_outreach.get("text", json.dumps(initial_outreach))
-                    logger.warning(f"⚠️ initial_outreach was dict - coerced to string")
-                elif not isinstance(initial_outreach, str):
-                    initial_outreach = str(initial_outreach)
-                    logger.warning(f"⚠️ initial_outreach was {type(initial_outreach)} - coerced to string")
-                
-                try:
-                    if user_id:
-                        # Rep: save with user_id (use partial unique index)
-                        cur.execute("""
-                            UPDATE markov_responses
-                            SET response_text = %s, updated_at = %s
-                            WHERE state_key = '__initial_outreach__' AND user_id = %s;
-                        """, (initial_outreach, datetime.utcnow(), user_id))
-                        if cur.rowcount == 0:
-                            cur.execute("""
-                                INSERT INTO markov_responses (state_key, response_text, updated_at, user_id)
-                                VALUES ('__initial_outreach__', %s, %s, %s);
-                            """, (initial_outreach, datetime.utcnow(), user_id))
-                    else:
-                        # Owner: save global
-                        cur.execute("""
-                            UPDATE markov_responses
-                            SET response_text = %s, updated_at = %s
-                            WHERE state_key = '__initial_outreach__' AND user_id IS NULL;
-                        """, (initial_outreach, datetime.utcnow()))
-                        if cur.rowcount == 0:
-                            cur.execute("""
-                                INSERT INTO markov_responses (state_key, response_text, updated_at, user_id)
-                                VALUES ('__initial_outreach__', %s, %s, NULL);
-                            """, (initial_outreach, datetime.utcnow()))
-                    logger.info("✅ Saved initial_outreach")
-                    saved_count += 1
-                except Exception as e:
-                    logger.error("❌ Failed saving initial_outreach")
-                    logger.exception(e)
-                    failed_count += 1
+        saved_count, failed_count = await run_db(_save_markov_responses_batch, user_id, responses, initial_outreach)
         
         logger.info(f"✅ Batch save complete: {saved_count} saved, {failed_count} failed")
         return {"ok": True, "message": "Responses updated successfully", "saved": saved_count, "failed": failed_count}
@@ -4416,49 +4301,77 @@ async def update_markov_responses(
         raise
 
 
-def classify_intent_simple(text: str) -> Dict[str, Any]:
-    """
-    Simple keyword-based intent classifier.
-    Returns intent dict with 'category' and/or 'subcategory' keys.
-    """
-    if not text:
-        return {}
-    
-    text_lower = text.lower().strip()
-    
+# Keyword rules for classify_intent_simple, in priority order (first matching rule wins).
+_INTENT_RULES = [
     # Interest indicators
-    if any(word in text_lower for word in ["interested", "yes", "sounds good", "tell me more", "i want", "i need"]):
-        return {"category": "interest", "subcategory": "light_interest"}
-    
+    (["interested", "yes", "sounds good", "tell me more", "i want", "i need"],
+     {"category": "interest", "subcategory": "light_interest"}),
     # Confused interest - user is confused but maybe interested
-    if any(word in text_lower for word in ["confused", "confusion", "not sure", "unsure", "don't understand", "unclear"]):
-        return {"category": "interest", "subcategory": "confused_interest"}
-    
+    (["confused", "confusion", "not sure", "unsure", "don't understand", "unclear"],
+     {"category": "interest", "subcategory": "confused_interest"}),
     # Pricing questions
-    if any(word in text_lower for word in ["price", "cost", "how much", "$", "dollar", "pay"]):
-        return {"category": "pricing", "subcategory": "asks_for_price"}
-    
+    (["price", "cost", "how much", "$", "dollar", "pay"],
+     {"category": "pricing", "subcategory": "asks_for_price"}),
     # Questions
-    if any(word in text_lower for word in ["what", "how", "when", "where", "why", "?", "question"]):
-        return {"category": "question"}
-    
+    (["what", "how", "when", "where", "why", "?", "question"],
+     {"category": "question"}),
     # Objections
-    if any(word in text_lower for word in ["no", "not interested", "don't", "can't", "won't", "too expensive"]):
-        return {"category": "objection"}
-    
+    (["no", "not interested", "don't", "can't", "won't", "too expensive"],
+     {"category": "objection"}),
     # Demo requests
-    if any(word in text_lower for word in ["example", "sample", "demo", "show me", "preview"]):
-        return {"category": "demo", "subcategory": "asks_for_example_list"}
-    
+    (["example", "sample", "demo", "show me", "preview"],
+     {"category": "demo", "subcategory": "asks_for_example_list"}),
     # Purchase intent
-    if any(word in text_lower for word in ["buy", "purchase", "order", "sign up", "ready"]):
-        return {"category": "purchase"}
-    
+    (["buy", "purchase", "order", "sign up", "ready"],
+     {"category": "purchase"}),
     # Default: treat as interest if positive sentiment
-    if any(word in text_lower for word in ["ok", "okay", "sure", "yeah", "yep"]):
-        return {"category": "interest", "subcategory": "light_interest"}
+    (["ok", "okay", "sure", "yeah", "yep"],
+     {"category": "interest", "subcategory": "light_interest"}),
+]
+
+_INTENT_KEYWORD_PRIORITY: Dict[str, int] = {}
+for _priority, (_words, _intent) in enumerate(_INTENT_RULES):
+    for _word in _words:
+        _INTENT_KEYWORD_PRIORITY.setdefault(_word, _priority)
+
+# Zero-width lookahead so overlapping keywords are all seen in a single scan. Alternatives are
+# ordered by priority, so at each position the best keyword starting there is the one captured.
+_INTENT_PATTERN = re.compile("(?=(" + "|".join(
+    re.escape(word) for word in sorted(_INTENT_KEYWORD_PRIORITY, key=_INTENT_KEYWORD_PRIORITY.get)
+) + "))")
+
+
+def _classify_intent_lowered(text_lower: str) -> Dict[str, Any]:
+    """Classify already-lowercased text with the single-pass keyword scan."""
+    best = None
+    for match in _INTENT_PATTERN.finditer(text_lower):
+        priority = _INTENT_KEYWORD_PRIORITY[match.group(1)]
+        if best is None or priority < best:
+            best = priority
+            if best == 0:
+                break
     
-    return {}
+    if best is None:
+        return {}
+    return dict(_INTENT_RULES[best][1])
+
+
+def classify_intent_simple(text: str) -> Dict[str, Any]:
+    """
+    Simple keyword-based intent classifier.
+    Returns intent dict with 'category' and/or 'subcategory' keys.
+    """
+    if not text:
+        return {}
+    return _classify_intent_lowered(text.lower().strip())
+
+
+def classify_intent_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Classify many messages (e.g. an imported SMS batch) in one call.
+    Same result per text as classify_intent_simple, in input order.
+    """
+    return [_classify_intent_lowered(text.lower().strip()) if text else {} for text in texts]
 
 
 def get_markov_response_with_trace(conn, next_state: str, rep_user_id: str | None, phone: str = None, environment_id: str = None, context: str = "inbound", allow_empty: bool = False):
@@ -4541,6 +4454,27 @@ def get_markov_response_with_trace(conn, next_state: str, rep_user_id: str | Non
     return resp
 
 
+# Resolved Markov responses keyed by (state_key, user_id). Entries expire after the TTL and
+# are dropped by the save helpers, so edits show up on the next lookup in this process.
+MARKOV_RESPONSE_TTL_SECONDS = 60
+_MARKOV_RESPONSE_CACHE_MAX = 4096
+_markov_response_cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, Optional[str]]]" = OrderedDict()
+_markov_response_cache_lock = threading.Lock()
+
+
+def _invalidate_markov_response_cache(state_keys, user_id: Optional[str]) -> None:
+    """Drop cached lookups affected by saving state_keys for user_id (None = global defaults)."""
+    state_keys = set(state_keys)
+    with _markov_response_cache_lock:
+        if user_id:
+            for state_key in state_keys:
+                _markov_response_cache.pop((state_key, str(user_id).strip()), None)
+        else:
+            # A global default is the fallback for every rep, so drop the state for all users
+            for key in [k for k in _markov_response_cache if k[0] in state_keys]:
+                del _markov_response_cache[key]
+
+
 def get_markov_response(conn: Any, state_key: str, user_id: Optional[str] = None) -> Optional[str]:
     """
     Get configured response text for a Markov state, or None if not configured.
@@ -4550,6 +4484,8 @@ def get_markov_response(conn: Any, state_key: str, user_id: Optional[str] = None
     - Falls back to global (owner's default) if rep hasn't customized
     - If user_id is None (owner), returns global response only
     
+    Results (including misses) are cached for MARKOV_RESPONSE_TTL_SECONDS.
+    
     Args:
         conn: Database connection
         state_key: The Markov state key
@@ -4559,121 +4495,62 @@ def get_markov_response(conn: Any, state_key: str, user_id: Optional[str] = None
     Returns:
         Response text or None
     """
+    if not isinstance(state_key, str):
+        state_key = str(state_key)
+    state_key = state_key.strip()
+    cache_key = (state_key, (str(user_id).strip() or None) if user_id else None)
+    
+    now = time.monotonic()
+    with _markov_response_cache_lock:
+        cached = _markov_response_cache.get(cache_key)
+        if cached is not None and now - cached[0] < MARKOV_RESPONSE_TTL_SECONDS:
+            _markov_response_cache.move_to_end(cache_key)
+            return cached[1]
+    
+    response_text = _lookup_markov_response(conn, state_key, user_id)
+    
+    with _markov_response_cache_lock:
+        _markov_response_cache[cache_key] = (now, response_text)
+        _markov_response_cache.move_to_end(cache_key)
+        while len(_markov_response_cache) > _MARKOV_RESPONSE_CACHE_MAX:
+            _markov_response_cache.popitem(last=False)
+    return response_text
+
+
+def _lookup_markov_response(conn: Any, state_key: str, user_id: Optional[str] = None) -> Optional[str]:
+    """Uncached lookup behind get_markov_response()."""
     # Normalize state_key - ensure it's a string and strip whitespace
     if not isinstance(state_key, str):
         state_key = str(state_key)
     state_key = state_key.strip()
     
-    print("=" * 80, flush=True)
-    print(f"[GET_MARKOV_RESPONSE] 🔍 STARTING RESPONSE LOOKUP", flush=True)
-    print("=" * 80, flush=True)
-    print(f"[GET_MARKOV_RESPONSE]   state_key (raw): '{state_key}'", flush=True)
-    print(f"[GET_MARKOV_RESPONSE]   state_key (normalized): '{state_key}'", flush=True)
-    print(f"[GET_MARKOV_RESPONSE]   state_key length: {len(state_key)}", flush=True)
-    print(f"[GET_MARKOV_RESPONSE]   user_id: {user_id}", flush=True)
-    print(f"[GET_MARKOV_RESPONSE]   user_id type: {type(user_id)}", flush=True)
-    if user_id:
-        print(f"[GET_MARKOV_RESPONSE]   user_id (normalized): '{user_id.strip() if isinstance(user_id, str) else user_id}'", flush=True)
+    # Normalize user_id to string and strip
+    user_id_str = str(user_id).strip() if user_id else None
+    if user_id and not user_id_str:
+        logger.debug("[GET_MARKOV_RESPONSE] user_id empty after normalization, skipping rep-specific lookup")
+        user_id_str = None  # Ensure it's None for consistency
     
+    # Rep-specific and global (owner's default) rows in one round-trip via idx_markov_responses_state_user_id.
+    # NULLS LAST puts the rep's row first; LIMIT 2 keeps the global row so an empty rep
+    # response still falls back. For the owner, user_id = NULL matches nothing.
     with conn.cursor() as cur:
-        if user_id:
-            # Normalize user_id to string and strip
-            user_id_str = str(user_id).strip() if user_id else None
-            if not user_id_str:
-                print(f"[GET_MARKOV_RESPONSE] ⚠️ user_id is empty after normalization, skipping rep-specific lookup", flush=True)
-                user_id_str = None  # Ensure it's None for consistency
-            else:
-                # Try rep-specific first
-                print(f"[GET_MARKOV_RESPONSE] 🔎 Querying rep-specific response...", flush=True)
-                print(f"[GET_MARKOV_RESPONSE]   SQL: SELECT response_text FROM markov_responses WHERE state_key = '{state_key}' AND user_id = '{user_id_str}'", flush=True)
-                print(f"[GET_MARKOV_RESPONSE]   SQL params: state_key='{state_key}', user_id='{user_id_str}'", flush=True)
-                cur.execute("""
-                    SELECT response_text FROM markov_responses
-                    WHERE state_key = %s AND user_id = %s
-                """, (state_key, user_id_str))
-                row = cur.fetchone()
-                print(f"[GET_MARKOV_RESPONSE]   Query returned: {row}", flush=True)
-                if row and row[0]:
-                    response_text = row[0].strip()
-                    print(f"[GET_MARKOV_RESPONSE]   Raw response_text: '{response_text}'", flush=True)
-                    print(f"[GET_MARKOV_RESPONSE]   Response_text length: {len(response_text)}", flush=True)
-                    if response_text:  # Make sure it's not empty
-                        print("=" * 80, flush=True)
-                        print(f"[GET_MARKOV_RESPONSE] ✅✅✅ FOUND REP-SPECIFIC RESPONSE ✅✅✅", flush=True)
-                        print("=" * 80, flush=True)
-                        print(f"[GET_MARKOV_RESPONSE]   state_key: '{state_key}'", flush=True)
-                        print(f"[GET_MARKOV_RESPONSE]   user_id: '{user_id_str}'", flush=True)
-                        print(f"[GET_MARKOV_RESPONSE]   response_text: '{response_text}'", flush=True)
-                        print(f"[GET_MARKOV_RESPONSE]   length: {len(response_text)} chars", flush=True)
-                        print("=" * 80, flush=True)
-                        return response_text
-                    else:
-                        print(f"[GET_MARKOV_RESPONSE] ⚠️ Rep-specific response exists but is empty, falling back to global", flush=True)
-                else:
-                    print(f"[GET_MARKOV_RESPONSE] ⚠️ No rep-specific response found, falling back to global", flush=True)
-                    # Debug: Check what responses exist for this user
-                    cur.execute("""
-                        SELECT state_key, response_text FROM markov_responses
-                        WHERE user_id = %s
-                        ORDER BY state_key
-                    """, (user_id_str,))
-                    all_rep_responses = cur.fetchall()
-                    print(f"[GET_MARKOV_RESPONSE]   Debug: All rep responses for user_id='{user_id_str}': {len(all_rep_responses)} total", flush=True)
-                    for resp_row in all_rep_responses[:10]:  # Show first 10
-                        state_in_db = resp_row[0]
-                        response_preview = resp_row[1][:50] if resp_row[1] else 'EMPTY'
-                        match_status = "✅ MATCH" if state_in_db == state_key else "❌ NO MATCH"
-                        print(f"[GET_MARKOV_RESPONSE]     {match_status} state_key='{state_in_db}' response='{response_preview}...'", flush=True)
-                    state_in_db = resp_row[0]
-                    response_preview = resp_row[1][:50] if resp_row[1] else 'EMPTY'
-                    match_status = "✅ MATCH" if state_in_db == state_key else "❌ NO MATCH"
-                    print(f"[GET_MARKOV_RESPONSE]     {match_status} state_key='{state_in_db}' response='{response_preview}...'", flush=True)
-        
-        # Fallback to global (user_id IS NULL) - owner's defaults
-        print(f"[GET_MARKOV_RESPONSE] 🔎 Querying global (owner) response...", flush=True)
-        print(f"[GET_MARKOV_RESPONSE]   SQL: SELECT response_text FROM markov_responses WHERE state_key = '{state_key}' AND user_id IS NULL", flush=True)
-        cur.execute("""
-            SELECT response_text FROM markov_responses
-            WHERE state_key = %s AND user_id IS NULL
-        """, (state_key,))
-        row = cur.fetchone()
-        print(f"[GET_MARKOV_RESPONSE]   Query returned: {row}", flush=True)
-        if row and row[0]:
-            response_text = row[0].strip()
-            print(f"[GET_MARKOV_RESPONSE]   Raw response_text: '{response_text}'", flush=True)
-            print(f"[GET_MARKOV_RESPONSE]   Response_text length: {len(response_text)}", flush=True)
-            if response_text:  # Make sure it's not empty
-                print("=" * 80, flush=True)
-                print(f"[GET_MARKOV_RESPONSE] ✅✅✅ FOUND GLOBAL (OWNER) RESPONSE ✅✅✅", flush=True)
-                print("=" * 80, flush=True)
-                print(f"[GET_MARKOV_RESPONSE]   state_key: '{state_key}'", flush=True)
-                print(f"[GET_MARKOV_RESPONSE]   response_text: '{response_text}'", flush=True)
-                print(f"[GET_MARKOV_RESPONSE]   length: {len(response_text)} chars", flush=True)
-                print("=" * 80, flush=True)
-                return response_text
-            else:
-                print(f"[GET_MARKOV_RESPONSE] ⚠️ Global response exists but is empty", flush=True)
-        else:
-            print(f"[GET_MARKOV_RESPONSE] ❌ No global response found either", flush=True)
-            # Debug: Check what global responses exist
-            cur.execute("""
-                SELECT state_key, response_text FROM markov_responses
-                WHERE user_id IS NULL
-                ORDER BY state_key
-            """)
-            all_global_responses = cur.fetchall()
-            print(f"[GET_MARKOV_RESPONSE]   Debug: All global responses: {len(all_global_responses)} total", flush=True)
-            for resp_row in all_global_responses[:5]:  # Show first 5
-                print(f"[GET_MARKOV_RESPONSE]     - {resp_row[0]}: '{resp_row[1][:50] if resp_row[1] else 'EMPTY'}...'", flush=True)
-        
-        print("=" * 80, flush=True)
-        print(f"[GET_MARKOV_RESPONSE] ❌❌❌ NO RESPONSE FOUND ❌❌❌", flush=True)
-        print("=" * 80, flush=True)
-        print(f"[GET_MARKOV_RESPONSE]   state_key: '{state_key}'", flush=True)
-        print(f"[GET_MARKOV_RESPONSE]   user_id: {user_id}", flush=True)
-        print(f"[GET_MARKOV_RESPONSE]   Result: None", flush=True)
-        print("=" * 80, flush=True)
-        return None
+        execute_prepared(cur, "markov_get_response", """
+            SELECT response_text, user_id FROM markov_responses
+            WHERE state_key = $1 AND (user_id = $2 OR user_id IS NULL)
+            ORDER BY user_id NULLS LAST
+            LIMIT 2
+        """, (state_key, user_id_str))
+        rows = cur.fetchall()
+    
+    for response_text, row_user_id in rows:
+        response_text = response_text.strip() if response_text else ""
+        if response_text:  # Make sure it's not empty
+            logger.info("markov hit key=%s user=%s len=%d", state_key, row_user_id, len(response_text))
+            return response_text
+        logger.debug("[GET_MARKOV_RESPONSE] %s response for %s is empty", "rep-specific" if row_user_id else "global", state_key)
+    
+    logger.debug("markov miss key=%s user=%s rows=%d", state_key, user_id_str, len(rows))
+    return None
 
 
 def get_initial_outreach_message(conn: Any, user_id: Optional[str] = None) -> Optional[str]:
@@ -4689,76 +4566,227 @@ def get_initial_outreach_message(conn: Any, user_id: Optional[str] = None) -> Op
 # Authentication Dependency (must be defined before endpoints that use it)
 # ============================================================================
 
-async def get_current_user(request: Request) -> Dict[str, Any]:
-    """FastAPI dependency to get current user from Authorization header."""
-    auth_header = request.headers.get("Authorization", "")
-    
-    logger.info(f"[AUTH] Authorization header: {auth_header[:30] + '...' if auth_header and len(auth_header) > 30 else auth_header}")
-    print(f"[AUTH] Authorization header received: {auth_header[:50]}...", flush=True)
-    
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logger.warning("[AUTH] Missing or invalid Authorization header")
-        print("[AUTH] ❌ Missing or invalid Authorization header", flush=True)
-        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    
-    token = auth_header[7:]
-    print(f"[AUTH] Extracted token: {token[:20]}... (length: {len(token)})", flush=True)
-    
-    conn = get_conn()
-    user = get_user_by_token(conn, token)
-    
-    if not user:
-        # Enhanced logging for token validation failure
-        import hashlib
-        hashed_token = hashlib.sha256(token.encode()).hexdigest()
-        print(f"[AUTH] ❌ Invalid API token", flush=True)
-        print(f"[AUTH] Token preview: {token[:20]}...", flush=True)
-        print(f"[AUTH] Token length: {len(token)}", flush=True)
-        print(f"[AUTH] Hashed token: {hashed_token[:20]}...", flush=True)
-        logger.warning(f"[AUTH] Invalid API token (token preview: {token[:15]}..., hashed: {hashed_token[:20]}...)")
-        raise HTTPException(status_code=401, detail="Invalid API token")
-    
-    logger.info(f"[AUTH] Authenticated user: {user['id']} role={user['role']} username={user.get('username', 'N/A')}")
-    print(f"[AUTH] ✅ Authenticated user: {user['id']} (role: {user.get('role')}, username: {user.get('username', 'N/A')})", flush=True)
+# Authenticated users keyed by SHA-256 of the bearer token, so hot tokens skip the DB.
+# Only hits are cached; admin writes that change a user's token or row drop their entries.
+# Invalidation is per process: with several workers, the TTL bounds how long another
+# worker can keep honouring a changed user (set AUTH_CACHE_TTL_SECONDS=0 to disable).
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "15"))
+_TOKEN_CACHE_MAX = 4096
+_token_cache: "OrderedDict[bytes, Tuple[float, AuthUser]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+# In-flight lookups per token key, so concurrent misses share one query
+_token_lookups: Dict[bytes, "asyncio.Task"] = {}
+
+
+def _invalidate_token_cache(user_id: str) -> None:
+    """Drop every cached token entry that resolves to user_id."""
+    with _token_cache_lock:
+        for key in [k for k, (_, user) in _token_cache.items() if user.id == user_id]:
+            del _token_cache[key]
+
+
+async def _get_user_by_token_cached(token: str, token_sha256: Optional[bytes] = None) -> Optional[AuthUser]:
+    """get_user_by_token() behind the TTL cache. Pass token_sha256 if the digest is already known."""
+    key = token_sha256 or hashlib.sha256(token.encode()).digest()
+    
+    now = time.monotonic()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None and now - cached[0] < TOKEN_CACHE_TTL_SECONDS:
+            _token_cache.move_to_end(key)
+            return cached[1]
+    
+    task = _token_lookups.get(key)
+    if task is None:
+        task = asyncio.ensure_future(run_db(get_user_by_token, token, hashed_token=key.hex()))
+        _token_lookups[key] = task
+        task.add_done_callback(lambda _t: _token_lookups.pop(key, None))
+    # shield: a cancelled request must not cancel the lookup other requests are awaiting
+    user = await asyncio.shield(task)
+    
+    if user and TOKEN_CACHE_TTL_SECONDS > 0:
+        with _token_cache_lock:
+            _token_cache[key] = (now, user)
+            _token_cache.move_to_end(key)
+            while len(_token_cache) > _TOKEN_CACHE_MAX:
+                _token_cache.popitem(last=False)
     return user
 
 
-async def get_current_admin_user(request: Request) -> Dict[str, Any]:
-    """FastAPI dependency to get current admin/owner user."""
-    user = await get_current_user(request)
-    # Owner (admin role) has full access
-    if user.get("role") != "admin":
-        # Log at INFO level - this is expected behavior when reps try to access admin endpoints
-        logger.info(f"[AUTH] Admin access denied for {user['id']} (role: {user.get('role')}) - returning 403")
-        raise HTTPException(status_code=403, detail="Owner/Admin access required")
-    logger.info(f"[AUTH] Admin access granted to {user['id']}")
-    return user
+# Failed-auth logging is capped per client IP so a token spray cannot turn the logger
+# into an amplifier. Past the burst, failures are only counted (auth_failures_total).
+AUTH_FAIL_LOG_WINDOW_SECONDS = 60
+AUTH_FAIL_LOG_BURST = 10
+_AUTH_FAIL_TRACKED_MAX = 10000
+_auth_fail_counts: "OrderedDict[Optional[str], Tuple[float, int]]" = OrderedDict()
+auth_failures_total = 0
 
 
-async def get_current_owner_or_rep(request: Request) -> Dict[str, Any]:
-    """FastAPI dependency that allows both owner and rep access."""
-    print(f"[AUTH_DEPENDENCY] get_current_owner_or_rep called", flush=True)
-    try:
-        user = await get_current_user(request)
-        print(f"[AUTH_DEPENDENCY] ✅ User authenticated: {user.get('id')} (role: {user.get('role')})", flush=True)
+def _should_log_auth_failure(client_host: Optional[str]) -> bool:
+    """Count an auth failure from client_host; True while it is within the per-IP log budget."""
+    # Only called from the event loop thread, so no lock is needed
+    global auth_failures_total
+    auth_failures_total += 1
+    
+    now = time.monotonic()
+    window_start, count = _auth_fail_counts.get(client_host, (now, 0))
+    if now - window_start >= AUTH_FAIL_LOG_WINDOW_SECONDS:
+        window_start, count = now, 0
+    count += 1
+    _auth_fail_counts[client_host] = (window_start, count)
+    _auth_fail_counts.move_to_end(client_host)
+    while len(_auth_fail_counts) > _AUTH_FAIL_TRACKED_MAX:
+        _auth_fail_counts.popitem(last=False)
+    
+    if count == AUTH_FAIL_LOG_BURST + 1:
+        logger.warning(f"[AUTH] {client_host} exceeded {AUTH_FAIL_LOG_BURST} failed auths in {AUTH_FAIL_LOG_WINDOW_SECONDS}s; suppressing further logs")
+    return count <= AUTH_FAIL_LOG_BURST
+
+
+class _UserDependency:
+    """
+    FastAPI dependency resolving the bearer-token user, optionally requiring a role.
+    
+    One callable covers both the plain and the admin check, so an admin route awaits a
+    single coroutine. The resolved user (or None for an unknown token) is memoized in
+    scope["state"]["auth_user"], which AuthMiddleware may already have filled in.
+    Instances can also be awaited directly: `await get_current_user(request)`.
+    """
+    
+    def __init__(self, required_role: Optional[str] = None):
+        self.required_role = required_role
+    
+    async def __call__(self, request: Request) -> AuthUser:
+        auth_header = request.headers.get("Authorization", "")
+        client_host = request.client.host if request.client else None
+        
+        if not auth_header or not auth_header.startswith("Bearer "):
+            if _should_log_auth_failure(client_host):
+                logger.warning("[AUTH] Missing or invalid Authorization header")
+            raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+        
+        token = auth_header[7:]
+        state = request.scope.setdefault("state", {})
+        # Hash the token once per request; AuthMiddleware may already have done it
+        token_sha256 = state.get("token_sha256") or hashlib.sha256(token.encode()).digest()
+        if "auth_user" in state:
+            user = state["auth_user"]
+        else:
+            user = await _get_user_by_token_cached(token, token_sha256)
+            state["token_sha256"] = token_sha256
+            state["auth_user"] = user
+        
+        if not user:
+            if _should_log_auth_failure(client_host):
+                hashed_token = token_sha256.hex()
+                logger.warning(f"[AUTH] Invalid API token (token preview: {token[:15]}..., length: {len(token)}, hashed: {hashed_token[:20]}...)")
+            raise HTTPException(status_code=401, detail="Invalid API token")
+        
+        # Owner (admin role) has full access
+        if self.required_role and user.role != self.required_role:
+            # Log at INFO level - this is expected behavior when reps try to access admin endpoints
+            logger.info(f"[AUTH] {self.required_role} access denied for {user['id']} (role: {user.get('role')}) - returning 403")
+            raise HTTPException(status_code=403, detail="Owner/Admin access required")
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[AUTH] Authenticated user: {user['id']} role={user['role']} username={user.get('username', 'N/A')}")
         return user
-    except Exception as e:
-        print(f"[AUTH_DEPENDENCY] ❌ Exception in get_current_owner_or_rep: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
-        raise
+
+
+# FastAPI dependency to get current user from Authorization header
+get_current_user = _UserDependency()
+# FastAPI dependency to get current admin/owner user
+get_current_admin_user = _UserDependency(required_role="admin")
+# FastAPI dependency that allows both owner and rep access
+get_current_owner_or_rep = get_current_user
+
+
+# Legacy blasts run as background jobs: POST /blast/run enqueues and answers 202 with a
+# job_id, a fixed set of workers drains the queue, and GET /blast/jobs/{job_id} reports
+# progress. Job state lives in this process (the app runs as a single uvicorn process).
+BLAST_WORKERS = int(os.getenv("BLAST_WORKERS", "2"))
+BLAST_QUEUE_MAX = 1000
+_BLAST_JOBS_MAX = 1000
+_blast_queue: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue(maxsize=BLAST_QUEUE_MAX)
+_blast_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_blast_worker_tasks: List["asyncio.Task"] = []
+# Blasts (queued jobs and /rep/blast) run here, not on the pool-sized default executor, so
+# SMS sends never take the threads run_db needs
+_blast_executor = ThreadPoolExecutor(max_workers=BLAST_WORKERS, thread_name_prefix="blast")
+
+
+async def _run_blast(**params: Any) -> Dict[str, Any]:
+    """run_blast_for_cards() on the blast executor, borrowing pooled connections per DB step."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _blast_executor, partial(run_blast_for_cards, pooled_conn, **params)
+    )
+
+
+async def _blast_worker() -> None:
+    """Run queued blasts one at a time; each blast runs in a worker thread."""
+    while True:
+        job_id, params = await _blast_queue.get()
+        job = _blast_jobs.get(job_id)
+        try:
+            if job is not None:
+                job["status"] = "running"
+                job["started_at"] = datetime.now(timezone.utc).isoformat()
+            try:
+                result = await _run_blast(**params)
+            finally:
+                # Blasts claim cards for the sender (owner blasts clear assignments)
+                _invalidate_assigned_cards()
+            if job is not None:
+                job["status"] = "completed"
+                job["result"] = result
+        except Exception as e:
+            logger.error(f"[LEGACY_BLAST] Job {job_id} failed: {e}", exc_info=True)
+            if job is not None:
+                job["status"] = "failed"
+                job["error"] = f"Blast failed: {str(e)}"
+        finally:
+            if job is not None:
+                job["finished_at"] = datetime.now(timezone.utc).isoformat()
+            _blast_queue.task_done()
+
+
+def start_blast_workers() -> None:
+    for _ in range(BLAST_WORKERS):
+        _blast_worker_tasks.append(asyncio.create_task(_blast_worker()))
+
+
+async def stop_blast_workers() -> None:
+    for task in _blast_worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_blast_worker_tasks, return_exceptions=True)
+    _blast_worker_tasks.clear()
+
+
+class BlastRunBody(BaseModel):
+    """
+    Body for POST /blast/run. card_ids and limit are checked in the handler so bad values
+    keep getting the endpoint's 400 rather than a 422 validation error.
+    """
+    card_ids: Any = None
+    limit: Any = None
+    owner: Optional[str] = None
+    source: Optional[str] = None
+    auth_token: Optional[str] = None
 
 
 @app.post("/blast/run")
 async def blast_run(
     request: Request, 
-    payload: Dict[str, Any] = Body(...),
+    payload: BlastRunBody,
     current_user: Dict = Depends(get_current_admin_user)  # GATE-LOCKED: Owner only
 ):
     """
     LEGACY BLAST ENDPOINT - Owner/Admin only.
     This is the old global blast endpoint. Use /rep/blast for rep-scoped blasting.
     
+    Queues the blast and returns 202 {"ok": true, "job_id": ..., "status": "queued"};
+    poll GET /blast/jobs/{job_id} for the result.
+    
     Payload:
     {
       "card_ids": ["card_1", "card_2"],  # required
@@ -4772,50 +4800,69 @@ async def blast_run(
     """
     logger.info(f"[LEGACY_BLAST] Called by {current_user['id']} (role: {current_user.get('role')})")
     logger.warning(f"[LEGACY_BLAST] Legacy endpoint used - should migrate to admin dashboard or /rep/blast")
-    card_ids = payload.get("card_ids") or []
+    card_ids = payload.card_ids
     if not isinstance(card_ids, list) or not card_ids:
         raise HTTPException(status_code=400, detail="card_ids must be a non-empty array")
+    # Card ids are TEXT; accept numeric ids from older clients
+    card_ids = [str(card_id) for card_id in card_ids]
 
-    limit = payload.get("limit")
+    limit = payload.limit
     if limit is not None:
         try:
             limit = int(limit)
         except (TypeError, ValueError):
             raise HTTPException(status_code=400, detail="limit must be an integer")
-
-    owner = payload.get("owner") or "system"
-    source = payload.get("source") or "cards_ui"
+    owner = payload.owner or "system"
+    source = payload.source or "cards_ui"
+    
+    # Log auth token source (without exposing the full token); the blast itself uses env credentials
+    if logger.isEnabledFor(logging.DEBUG):
+        source_name = "payload" if payload.auth_token else "Authorization header"
+        auth_token = payload.auth_token or request.headers.get("Authorization", "")[7:]
+        logger.debug(f"[BLAST_AUTH] Token from {source_name}: {auth_token[:15]}... (length: {len(auth_token)})")
+
+    # run_blast_for_cards() now always uses environment variables - no auth params needed.
+    # It sends SMS card by card, so a blast worker runs it in a worker thread on a pooled
+    # connection and this request returns as soon as the job is queued.
+    job_id = uuid.uuid4().hex
+    params = {
+        "card_ids": card_ids,
+        "limit": limit,
+        "owner": owner,
+        "source": source,
+        "rep_user_id": None,  # Legacy endpoint doesn't track rep_user_id
+    }
+    try:
+        _blast_queue.put_nowait((job_id, params))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Blast queue is full, try again later")
+    
+    _blast_jobs[job_id] = {
+        "job_id": job_id,
+        "status": "queued",
+        "card_count": len(card_ids),
+        "created_by": current_user["id"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "result": None,
+        "error": None,
+    }
+    while len(_blast_jobs) > _BLAST_JOBS_MAX:
+        _blast_jobs.popitem(last=False)
     
-    # Get auth token from payload or Authorization header
-    auth_token = payload.get("auth_token")
-    if not auth_token:
-        auth_header = request.headers.get("Authorization", "")
-        if auth_header.startswith("Bearer "):
-            auth_token = auth_header[7:]
-    
-    # Log auth token status (without exposing the full token)
-    if auth_token:
-        print(f"[BLAST_AUTH] ✅ Auth token received from request")
-        print(f"[BLAST_AUTH]   Token preview: {auth_token[:15]}... (length: {len(auth_token)})")
-        print(f"[BLAST_AUTH]   Source: {'payload' if payload.get('auth_token') else 'Authorization header'}")
-    else:
-        print("[BLAST_AUTH] ⚠️ No auth token provided in request, will use environment variable")
+    logger.info(f"[LEGACY_BLAST] Queued job {job_id} ({len(card_ids)} cards)")
+    return ORJSONResponse(status_code=202, content={"ok": True, "job_id": job_id, "status": "queued"})
 
-    conn = get_conn()
 
-    try:
-        # run_blast_for_cards() now always uses environment variables - no auth params needed
-        result = run_blast_for_cards(
-            conn=conn,
-            card_ids=card_ids,
-            limit=limit,
-            owner=owner,
-            source=source,
-            rep_user_id=None,  # Legacy endpoint doesn't track rep_user_id
-        )
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Blast failed: {str(e)}")
+@app.get("/blast/jobs/{job_id}")
+async def blast_job_status(
+    job_id: str,
+    current_user: Dict = Depends(get_current_admin_user)
+):
+    """Status of a job queued by POST /blast/run; `result` is the blast summary once completed."""
+    job = _blast_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Blast job not found")
+    return {"ok": True, **job}
 
 
 # Authentication dependencies are defined above, before /blast/run endpoint
@@ -4825,32 +4872,92 @@ async def blast_run(
 # Admin Endpoints
 # ============================================================================
 
+# Fixed success bodies for the admin writes, encoded once at import
+_OK_USER_UPDATED = orjson.dumps({"ok": True, "message": "User updated successfully"})
+_OK_USER_DELETED = orjson.dumps({"ok": True, "message": "User deleted successfully"})
+_OK_TWILIO_CLEARED = orjson.dumps({"ok": True, "message": "Twilio configuration cleared successfully"})
+_OK_CARD_ASSIGNED = orjson.dumps({"ok": True, "message": "Card assigned successfully"})
+_OK_ASSIGNMENT_UPDATED = orjson.dumps({"ok": True, "message": "Assignment updated successfully"})
+_OK_CARD_UNASSIGNED = orjson.dumps({"ok": True, "message": "Card unassigned successfully"})
+
+
+def _ok_response(body: bytes) -> Response:
+    """Wrap a pre-encoded JSON body; a fresh Response each call since middleware mutates headers."""
+    return Response(content=body, media_type="application/json")
+
+
+class AdminCreateUserBody(BaseModel):
+    """Body for POST /admin/users."""
+    username: Optional[str] = None
+    role: str = "rep"
+    twilio_phone_number: Optional[str] = None
+    twilio_account_sid: Optional[str] = None
+    twilio_auth_token: Optional[str] = None
+    user_id: Optional[str] = None
+
+
+class AdminUpdateUserBody(BaseModel):
+    """Body for PUT /admin/users/{user_id}; omitted fields are left unchanged."""
+    twilio_phone_number: Optional[str] = None
+    twilio_account_sid: Optional[str] = None
+    twilio_auth_token: Optional[str] = None
+
+
+class AdminSetTokenBody(BaseModel):
+    """Body for POST /admin/users/{user_id}/set-token."""
+    api_token: Optional[str] = None
+
+
+class AdminAssignBody(BaseModel):
+    """Body for POST /admin/assignments."""
+    card_id: Optional[str] = None
+    user_id: Optional[str] = None
+    notes: Optional[str] = None
+
+
+class AdminBulkAssignItem(BaseModel):
+    card_id: str
+    user_id: str
+    notes: Optional[str] = None
+
+
+class AdminBulkAssignBody(BaseModel):
+    """Body for POST /admin/assignments/bulk."""
+    assignments: List[AdminBulkAssignItem]
+
+
+class AdminUpdateAssignmentBody(BaseModel):
+    """Body for PUT /admin/assignments/{card_id}."""
+    status: Optional[str] = None
+    notes: Optional[str] = None
+
+
 @app.post("/admin/users")
 async def admin_create_user(
-    payload: Dict[str, Any] = Body(...),
+    payload: AdminCreateUserBody,
     current_user: Dict = Depends(get_current_admin_user)
 ):
     """Create a new rep user."""
     logger.info(f"[ADMIN] create_user called by {current_user['id']}")
     logger.info(f"[ADMIN] payload = {payload}")
     
-    username = payload.get("username")
-    role = payload.get("role", "rep")
-    twilio_phone = payload.get("twilio_phone_number")
-    twilio_account_sid = payload.get("twilio_account_sid")
-    twilio_auth_token = payload.get("twilio_auth_token")
-    user_id = payload.get("user_id")
+    username = payload.username
+    role = payload.role
+    twilio_phone = payload.twilio_phone_number
+    twilio_account_sid = payload.twilio_account_sid
+    twilio_auth_token = payload.twilio_auth_token
+    user_id = payload.user_id
     
     if not username:
         logger.warning(f"[ADMIN] create_user failed: username required")
         raise HTTPException(status_code=400, detail="username is required")
     
-    conn = get_conn()
     try:
-        user = create_user(
-            conn, username, role, twilio_phone,
+        user = await run_db(
+            create_user, username, role, twilio_phone,
             twilio_account_sid, twilio_auth_token, user_id
         )
+        _invalidate_admin_listings("users")
         logger.info(f"[ADMIN] create_user success: {user['id']} ({user['username']})")
         return {"ok": True, "user": user}
     except Exception as e:
@@ -4858,36 +4965,84 @@ async def admin_create_user(
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
 
+# Encoded admin listings keyed by ("users",) or ("assignments", user_id, status).
+# Admin writes drop the affected kind; the TTL bounds staleness from writes made
+# elsewhere (uploads, rep blasts, handoffs). Only touched from the event loop thread.
+# Each entry carries the kind's generation read before its query ran, and only entries
+# from the current generation are served.
+ADMIN_LIST_CACHE_TTL_SECONDS = 30
+_ADMIN_LIST_CACHE_MAX = 256
+_admin_list_cache: Dict[Tuple, Tuple[float, int, bytes, Dict[str, str]]] = {}
+_admin_list_generation: Dict[str, int] = {"users": 0, "assignments": 0}
+
+
+def _invalidate_admin_listings(*kinds: str) -> None:
+    for kind in kinds:
+        _admin_list_generation[kind] += 1
+        for key in [k for k in _admin_list_cache if k[0] == kind]:
+            del _admin_list_cache[key]
+
+
+async def _cached_admin_listing(request: Request, key: Tuple, load) -> Response:
+    """
+    Serve an admin listing from the cache, or run `load()` (a coroutine returning the payload).
+    Bodies carry a content-hash ETag; 304 with no body when the client's copy matches.
+    no-cache makes browsers revalidate on every poll, so admin edits show up immediately.
+    """
+    now = time.monotonic()
+    # Read before the query: a write that lands while load() runs bumps it
+    generation = _admin_list_generation[key[0]]
+    entry = _admin_list_cache.get(key)
+    if entry is None or entry[1] != generation or now - entry[0] >= ADMIN_LIST_CACHE_TTL_SECONDS:
+        body = orjson.dumps(await load())
+        headers = {
+            "Cache-Control": "private, no-cache",
+            "ETag": '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"',
+        }
+        entry = (now, generation, body, headers)
+        # Skip storing if a write invalidated this kind while the query was running
+        if generation == _admin_list_generation[key[0]]:
+            if len(_admin_list_cache) >= _ADMIN_LIST_CACHE_MAX:
+                _admin_list_cache.clear()
+            _admin_list_cache[key] = entry
+    
+    _, _, body, headers = entry
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.get("/admin/users")
-async def admin_list_users(current_user: Dict = Depends(get_current_admin_user)):
+async def admin_list_users(request: Request, current_user: Dict = Depends(get_current_admin_user)):
     """List all users."""
-    conn = get_conn()
-    users = list_users(conn, include_inactive=True)
-    return {"ok": True, "users": users}
+    async def load():
+        users = await run_db(list_users, include_inactive=True)
+        return {"ok": True, "users": users}
+    return await _cached_admin_listing(request, ("users",), load)
 
 
 @app.put("/admin/users/{user_id}")
 async def admin_update_user(
     user_id: str,
-    payload: Dict[str, Any] = Body(...),
+    payload: AdminUpdateUserBody,
     current_user: Dict = Depends(get_current_admin_user)
 ):
     """Update a user's Twilio configuration (phone pairing)."""
     logger.info(f"[ADMIN] update_user called by {current_user['id']} for {user_id}")
     logger.info(f"[ADMIN] payload = {payload}")
     
-    conn = get_conn()
-    
-    phone = payload.get("twilio_phone_number")
-    account_sid = payload.get("twilio_account_sid")
-    auth_token = payload.get("twilio_auth_token")
+    phone = payload.twilio_phone_number
+    account_sid = payload.twilio_account_sid
+    auth_token = payload.twilio_auth_token
     
     try:
-        success = update_user_twilio_config(conn, user_id, phone, account_sid, auth_token)
+        success = await run_db(update_user_twilio_config, user_id, phone, account_sid, auth_token)
+        _invalidate_token_cache(user_id)
+        _invalidate_admin_listings("users")
         
         if success:
             logger.info(f"[ADMIN] update_user success: {user_id}")
-            return {"ok": True, "message": "User updated successfully"}
+            return _ok_response(_OK_USER_UPDATED)
         else:
             logger.warning(f"[ADMIN] update_user failed: no rows updated for {user_id}")
             raise HTTPException(status_code=500, detail="Failed to update user")
@@ -4908,13 +5063,15 @@ async def admin_delete_user(
     if user_id == current_user["id"]:
         raise HTTPException(status_code=400, detail="Cannot delete your own user account")
     
-    conn = get_conn()
     try:
-        success = delete_user(conn, user_id)
+        success = await run_db(delete_user, user_id)
+        _invalidate_token_cache(user_id)
+        _invalidate_admin_listings("users", "assignments")
+        _invalidate_assigned_cards()
         
         if success:
             logger.info(f"[ADMIN] delete_user success: {user_id}")
-            return {"ok": True, "message": "User deleted successfully"}
+            return _ok_response(_OK_USER_DELETED)
         else:
             logger.warning(f"[ADMIN] delete_user failed: user not found: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
@@ -4933,9 +5090,10 @@ async def admin_regenerate_token(
     """Regenerate API token for a user. Returns new token (only shown once)."""
     logger.info(f"[ADMIN] regenerate_token called by {current_user['id']} for {user_id}")
     
-    conn = get_conn()
     try:
-        new_token = regenerate_api_token(conn, user_id)
+        new_token = await run_db(regenerate_api_token, user_id)
+        _invalidate_token_cache(user_id)
+        _invalidate_admin_listings("users")
         
         if new_token:
             logger.info(f"[ADMIN] regenerate_token success: {user_id}")
@@ -4950,44 +5108,44 @@ async def admin_regenerate_token(
         raise HTTPException(status_code=500, detail=f"Failed to regenerate token: {str(e)}")
 
 
+def _set_user_token(conn, user_id: str, token: str) -> None:
+    """Store the hash of `token` as the user's API token; raises HTTPException on failure."""
+    from backend.auth import hash_token
+    
+    hashed_token = hash_token(token)
+    
+    with conn.cursor() as cur:
+        # No row back means the user does not exist
+        cur.execute("""
+            UPDATE users
+            SET api_token = %s, updated_at = NOW()
+            WHERE id = %s
+            RETURNING id
+        """, (hashed_token, user_id))
+        
+        if cur.fetchone() is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+
 @app.post("/admin/users/{user_id}/set-token")
 async def admin_set_token(
     user_id: str,
-    payload: Dict[str, Any] = Body(...),
+    payload: AdminSetTokenBody,
     current_user: Dict = Depends(get_current_admin_user)
 ):
     """Set a specific API token for a user. Admin only."""
-    token = payload.get("api_token")
+    token = payload.api_token
     if not token:
         raise HTTPException(status_code=400, detail="api_token is required in payload")
     
     logger.info(f"[ADMIN] set_token called by {current_user['id']} for {user_id}")
     
-    conn = get_conn()
-    
     try:
-        from backend.auth import hash_token
-        
-        hashed_token = hash_token(token)
-        
-        with conn.cursor() as cur:
-            # Check if user exists
-            cur.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-            if not cur.fetchone():
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            # Update token
-            cur.execute("""
-                UPDATE users
-                SET api_token = %s, updated_at = NOW()
-                WHERE id = %s
-            """, (hashed_token, user_id))
-            
-            if cur.rowcount > 0:
-                logger.info(f"[ADMIN] set_token success: {user_id}")
-                return {"ok": True, "message": f"API token set for user {user_id}"}
-            else:
-                raise HTTPException(status_code=500, detail="Failed to update token")
+        await run_db(_set_user_token, user_id, token)
+        _invalidate_token_cache(user_id)
+        _invalidate_admin_listings("users")
+        logger.info(f"[ADMIN] set_token success: {user_id}")
+        return {"ok": True, "message": f"API token set for user {user_id}"}
     except HTTPException:
         raise
     except Exception as e:
@@ -5003,13 +5161,14 @@ async def admin_clear_twilio(
     """Clear all Twilio configuration (phone, account_sid, auth_token) for a user."""
     logger.info(f"[ADMIN] clear_twilio called by {current_user['id']} for {user_id}")
     
-    conn = get_conn()
     try:
-        success = clear_twilio_config(conn, user_id)
+        success = await run_db(clear_twilio_config, user_id)
+        _invalidate_token_cache(user_id)
+        _invalidate_admin_listings("users")
         
         if success:
             logger.info(f"[ADMIN] clear_twilio success: {user_id}")
-            return {"ok": True, "message": "Twilio configuration cleared successfully"}
+            return _ok_response(_OK_TWILIO_CLEARED)
         else:
             logger.warning(f"[ADMIN] clear_twilio failed: user not found: {user_id}")
             raise HTTPException(status_code=404, detail="User not found")
@@ -5022,28 +5181,29 @@ async def admin_clear_twilio(
 
 @app.post("/admin/assignments")
 async def admin_assign_card(
-    payload: Dict[str, Any] = Body(...),
+    payload: AdminAssignBody,
     current_user: Dict = Depends(get_current_admin_user)
 ):
     """Assign a card to a rep."""
     logger.info(f"[ADMIN] assign_card called by {current_user['id']}")
     logger.info(f"[ADMIN] payload = {payload}")
     
-    card_id = payload.get("card_id")
-    user_id = payload.get("user_id")
-    notes = payload.get("notes")
+    card_id = payload.card_id
+    user_id = payload.user_id
+    notes = payload.notes
     
     if not card_id or not user_id:
         logger.warning(f"[ADMIN] assign_card failed: missing card_id or user_id")
         raise HTTPException(status_code=400, detail="card_id and user_id are required")
     
-    conn = get_conn()
     try:
-        success = assign_card_to_rep(conn, card_id, user_id, current_user["id"], notes)
+        success = await run_db(assign_card_to_rep, card_id, user_id, current_user["id"], notes)
+        _invalidate_admin_listings("assignments")
+        _invalidate_assigned_cards()
         
         if success:
             logger.info(f"[ADMIN] assign_card success: {card_id} -> {user_id}")
-            return {"ok": True, "message": "Card assigned successfully"}
+            return _ok_response(_OK_CARD_ASSIGNED)
         else:
             logger.warning(f"[ADMIN] assign_card failed: assignment function returned False")
             raise HTTPException(status_code=500, detail="Failed to assign card")
@@ -5052,41 +5212,89 @@ async def admin_assign_card(
         raise HTTPException(status_code=500, detail=f"Failed to assign card: {str(e)}")
 
 
+@app.post("/admin/assignments/bulk")
+async def admin_assign_cards_bulk(
+    payload: AdminBulkAssignBody,
+    current_user: Dict = Depends(get_current_admin_user)
+):
+    """Assign many cards in one request; rows are written with a single INSERT."""
+    logger.info(f"[ADMIN] assign_cards_bulk called by {current_user['id']} ({len(payload.assignments)} assignments)")
+    
+    if not payload.assignments:
+        raise HTTPException(status_code=400, detail="assignments must be a non-empty array")
+    
+    items = [
+        {"card_id": item.card_id, "user_id": item.user_id, "notes": item.notes}
+        for item in payload.assignments
+    ]
+    try:
+        assigned = await run_db(assign_cards_bulk, items, current_user["id"])
+        _invalidate_admin_listings("assignments")
+        _invalidate_assigned_cards()
+        logger.info(f"[ADMIN] assign_cards_bulk success: {assigned} assignments")
+        return {"ok": True, "assigned": assigned}
+    except Exception as e:
+        logger.error(f"[ADMIN] assign_cards_bulk exception: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to assign cards: {str(e)}")
+
+
 @app.get("/admin/assignments")
 async def admin_list_assignments(
+    request: Request,
     user_id: Optional[str] = None,
     status: Optional[str] = None,
     current_user: Dict = Depends(get_current_admin_user)
 ):
     """List all assignments."""
-    conn = get_conn()
-    assignments = list_assignments(conn, user_id=user_id, status=status)
-    return {"ok": True, "assignments": assignments}
+    async def load():
+        assignments = await run_db(list_assignments, user_id=user_id, status=status)
+        return {"ok": True, "assignments": assignments}
+    return await _cached_admin_listing(request, ("assignments", user_id, status), load)
+
+
+def _update_card_assignment_status(conn, card_id: str, status: str, notes: Optional[str]) -> bool:
+    """Update the status of a card's current assignment; raises 404 if the card is unassigned."""
+    if status not in ('assigned', 'active', 'closed', 'lost'):
+        return False
+    
+    with conn.cursor() as cur:
+        # Target the card's most recent assignment (same row get_card_assignment() returns)
+        cur.execute("""
+            UPDATE card_assignments
+            SET status = %s, notes = COALESCE(%s, notes)
+            WHERE id = (
+                SELECT id FROM card_assignments
+                WHERE card_id = %s
+                ORDER BY assigned_at DESC
+                LIMIT 1
+            )
+            RETURNING user_id
+        """, (status, notes or None, card_id))
+        
+        if cur.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Assignment not found")
+    return True
 
 
 @app.put("/admin/assignments/{card_id}")
 async def admin_update_assignment(
     card_id: str,
-    payload: Dict[str, Any] = Body(...),
+    payload: AdminUpdateAssignmentBody,
     current_user: Dict = Depends(get_current_admin_user)
 ):
     """Update assignment status."""
-    status = payload.get("status")
-    notes = payload.get("notes")
+    status = payload.status
+    notes = payload.notes
     
     if not status:
         raise HTTPException(status_code=400, detail="status is required")
     
-    # Get assignment to find user_id
-    conn = get_conn()
-    assignment = get_card_assignment(conn, card_id)
-    if not assignment:
-        raise HTTPException(status_code=404, detail="Assignment not found")
-    
-    success = update_assignment_status(conn, card_id, assignment["user_id"], status, notes)
+    success = await run_db(_update_card_assignment_status, card_id, status, notes)
+    _invalidate_admin_listings("assignments")
+    _invalidate_assigned_cards()
     
     if success:
-        return {"ok": True, "message": "Assignment updated successfully"}
+        return _ok_response(_OK_ASSIGNMENT_UPDATED)
     else:
         raise HTTPException(status_code=500, detail="Failed to update assignment")
 
@@ -5100,14 +5308,15 @@ async def admin_unassign_card(
     """Unassign a card from a rep."""
     logger.info(f"[ADMIN] unassign_card called by {current_user['id']} for card {card_id} from user {user_id}")
     
-    conn = get_conn()
     try:
         from backend.assignments import unassign_card
-        success = unassign_card(conn, card_id, user_id)
+        success = await run_db(unassign_card, card_id, user_id)
+        _invalidate_admin_listings("assignments")
+        _invalidate_assigned_cards()
         
         if success:
             logger.info(f"[ADMIN] unassign_card success: {card_id} unassigned from {user_id}")
-            return {"ok": True, "message": "Card unassigned successfully"}
+            return _ok_response(_OK_CARD_UNASSIGNED)
         else:
             logger.warning(f"[ADMIN] unassign_card failed: card {card_id} not assigned to {user_id}")
             raise HTTPException(status_code=404, detail="Assignment not found")
@@ -5120,98 +5329,184 @@ async def admin_unassign_card(
 # Rep Endpoints
 # ============================================================================
 
-@app.get("/rep/cards")
-async def rep_get_cards(
-    request: Request,
-    status: Optional[str] = None
-):
+# Clients that send "Accept: application/x-ndjson" get list endpoints as one JSON object
+# per line, written a batch at a time instead of after the whole list is built.
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_BATCH_SIZE = 500
+
+
+def _wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _ndjson_lines(fetch_batch, *args):
     """
-    Get rep's assigned cards. 
-    
-    CRITICAL SECURITY: Reps can ONLY see assigned cards, never all cards.
-    Owner (admin role) can see all cards for admin dashboard.
-    
-    Database relationship: card_assignments table links cards to reps via:
-    - card_assignments.card_id -> cards.id
-    - card_assignments.user_id -> users.id
+    Yield the items of a batched listing as orjson-encoded lines.
+    fetch_batch(conn, *args, offset) returns (items, next_offset), with next_offset None on
+    the last batch. Starlette iterates this sync generator in its threadpool, so the DB reads
+    stay off the event loop. Each batch borrows its own pooled connection and returns it
+    before the batch is written, so a slow client never pins a connection.
     """
-    # Authenticate user manually
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[REP_CARDS] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    conn = get_conn()
-    
+    offset = 0
+    while offset is not None:
+        with pooled_conn() as conn:
+            items, offset = fetch_batch(conn, *args, offset)
+        for item in items:
+            yield orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+
+
+# Short-lived cache of get_rep_assigned_cards() results, keyed by (user_id, status).
+# Any assignment or card mutation clears it wholesale (a reassignment touches two reps);
+# the TTL bounds staleness from writers that don't go through those endpoints.
+ASSIGNED_CARDS_CACHE_TTL_SECONDS = 30
+_ASSIGNED_CARDS_CACHE_MAX = 1024
+_assigned_cards_cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, int, List[Dict[str, Any]]]]" = OrderedDict()
+_assigned_cards_lock = threading.Lock()
+# Bumped on invalidation. Entries carry the generation read before their query; only
+# current-generation entries are served, and a lookup that raced a write is not stored.
+_assigned_cards_generation = 0
+
+
+def _invalidate_assigned_cards() -> None:
+    global _assigned_cards_generation
+    with _assigned_cards_lock:
+        _assigned_cards_generation += 1
+        _assigned_cards_cache.clear()
+    # Assignment counts feed /rep/stats as well
+    _invalidate_rep_stats()
+
+
+def _get_rep_assigned_cards_cached(conn: Any, user_id: str, status: Optional[str] = None) -> List[Dict[str, Any]]:
+    """get_rep_assigned_cards() behind the TTL cache. Returns a new list on every call."""
+    key = (user_id, status)
+    now = time.monotonic()
+    with _assigned_cards_lock:
+        generation = _assigned_cards_generation
+        entry = _assigned_cards_cache.get(key)
+        if entry is not None and entry[1] == generation and now - entry[0] < ASSIGNED_CARDS_CACHE_TTL_SECONDS:
+            _assigned_cards_cache.move_to_end(key)
+            return list(entry[2])
+    
+    cards = get_rep_assigned_cards(conn, user_id, status=status)
+    
+    with _assigned_cards_lock:
+        if generation == _assigned_cards_generation:
+            _assigned_cards_cache[key] = (now, generation, cards)
+            _assigned_cards_cache.move_to_end(key)
+            while len(_assigned_cards_cache) > _ASSIGNED_CARDS_CACHE_MAX:
+                _assigned_cards_cache.popitem(last=False)
+    return list(cards)
+
+
+def _iter_owner_cards(conn: Any):
+    """Every card (up to 10k, newest first) for the owner dashboard, read through a server-side cursor."""
+    from backend.query import build_list_query
+    query, params = build_list_query(where={}, limit=10000)
+    
+    # Timestamps stay datetimes; the response encoder writes them as ISO-8601
+    for row in iter_rows_server_side(conn, query, params, itersize=500, cursor_factory=RealDictCursor):
+        yield {
+            "id": row["id"],
+            "type": row["type"],
+            "card_data": row["card_data"],
+            "sales_state": row["sales_state"],
+            "owner": row["owner"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+
+# The _iter_owner_cards() listing in pages; id breaks updated_at ties so OFFSET pages
+# neither repeat nor skip cards (a card edited mid-stream can still move between pages)
+_OWNER_CARDS_PAGE_SQL = """
+    SELECT id, type, card_data, sales_state, owner, created_at, updated_at
+    FROM cards
+    ORDER BY updated_at DESC, id DESC
+    LIMIT %s OFFSET %s
+"""
+_OWNER_CARDS_MAX = 10000
+
+
+def _rep_cards_batch(conn: Any, current_user: AuthUser, status: Optional[str], offset: int):
+    """One _ndjson_lines() batch of _load_rep_cards(); the owner listing is paged."""
+    if current_user.get("role") != "admin":
+        return _load_rep_cards(conn, current_user, status), None
+    limit = min(NDJSON_BATCH_SIZE, _OWNER_CARDS_MAX - offset)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(_OWNER_CARDS_PAGE_SQL, (limit, offset))
+        cards = cur.fetchall()
+    next_offset = offset + len(cards)
+    if len(cards) < limit or next_offset >= _OWNER_CARDS_MAX:
+        next_offset = None
+    return cards, next_offset
+
+
+def _load_rep_cards(conn: Any, current_user: AuthUser, status: Optional[str]) -> List[Dict[str, Any]]:
+    """Cards visible to current_user: every card for the owner, assigned cards only for reps."""
     user_role = current_user.get("role")
     user_id = current_user.get("id")
     username = current_user.get("username", "N/A")
-    
+
     logger.info(f"[REP_CARDS] Request from user_id={user_id}, username={username}, role={user_role}")
-    
+
     # CRITICAL: Reps can ONLY see assigned cards, never all cards
     # Double-check: if role is not explicitly "admin", treat as rep
     if user_role == "admin":
         # Owner: get all cards (for admin dashboard)
         logger.info(f"[REP_CARDS] Owner access - returning all cards")
-        from backend.query import build_list_query
-        query, params = build_list_query(where={}, limit=10000)
-        
-        cards = []
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            for row in cur.fetchall():
-                cards.append({
-                    "id": row[0],
-                    "type": row[1],
-                    "card_data": row[2],
-                    "sales_state": row[3],
-                    "owner": row[4],
-                    "created_at": row[5].isoformat() if row[5] else None,
-                    "updated_at": row[6].isoformat() if row[6] else None,
-                })
+        cards = list(_iter_owner_cards(conn))
         logger.info(f"[REP_CARDS] Owner - returning {len(cards)} total cards")
     else:
         # Rep: STRICT enforcement - ONLY assigned cards via card_assignments table
         # This is the security boundary - reps NEVER see unassigned cards
         logger.info(f"[REP_CARDS] Rep access (role={user_role}) - STRICT filtering via card_assignments table for user_id={user_id}")
-        
+    
         # Verify user_id exists
         if not user_id:
             logger.error(f"[REP_CARDS] ERROR: No user_id in current_user dict!")
             raise HTTPException(status_code=500, detail="User ID not found")
-        
-        # Check assignment count first
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM card_assignments WHERE user_id = %s", (user_id,))
-            assignment_count = cur.fetchone()[0] or 0
-            logger.info(f"[REP_CARDS] Rep {user_id} has {assignment_count} assignments in card_assignments table")
-        
+    
         # Get assigned cards via INNER JOIN (only cards in card_assignments)
-        cards = get_rep_assigned_cards(conn, user_id, status=status)
+        cards = _get_rep_assigned_cards_cached(conn, user_id, status=status)
         logger.info(f"[REP_CARDS] Rep {user_id} ({username}) - found {len(cards)} assigned cards via get_rep_assigned_cards")
-        
-        # Security check: verify count matches
-        if len(cards) != assignment_count:
-            logger.warning(f"[REP_CARDS] Count mismatch: {len(cards)} cards returned but {assignment_count} assignments exist (may be due to deleted cards)")
+    
+        # Sanity check against the raw assignment count; an extra round-trip, so debug only
+        if logger.isEnabledFor(logging.DEBUG):
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM card_assignments WHERE user_id = %s", (user_id,))
+                assignment_count = cur.fetchone()[0] or 0
+            if len(cards) != assignment_count:
+                logger.debug(f"[REP_CARDS] Count mismatch: {len(cards)} cards returned but {assignment_count} assignments exist (may be due to deleted cards)")
+    return cards
+
+
+@app.get("/rep/cards")
+async def rep_get_cards(
+    request: Request,
+    status: Optional[str] = None,
+    current_user: Dict = Depends(get_current_owner_or_rep)
+):
+    """
+    Get rep's assigned cards. 
+    
+    CRITICAL SECURITY: Reps can ONLY see assigned cards, never all cards.
+    Owner (admin role) can see all cards for admin dashboard.
+    
+    Database relationship: card_assignments table links cards to reps via:
+    - card_assignments.card_id -> cards.id
+    - card_assignments.user_id -> users.id
+    """
+    if _wants_ndjson(request):
+        return StreamingResponse(_ndjson_lines(_rep_cards_batch, current_user, status), media_type=NDJSON_MEDIA_TYPE)
+    
+    cards = await run_db(_load_rep_cards, current_user, status)
     
     return {"ok": True, "cards": cards}
 
 
 @app.get("/rep/user")
-async def rep_get_user(request: Request):
+async def rep_get_user(current_user: Dict = Depends(get_current_owner_or_rep)):
     """Get current rep user information."""
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[REP_USER] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
     return {
         "ok": True,
         "id": current_user.get("id"),
@@ -5220,165 +5515,159 @@ async def rep_get_user(request: Request):
     }
 
 
-@app.get("/rep/conversations")
-async def rep_get_conversations(request: Request):
-    """Get rep's active conversations. Owner sees all, reps see only their own."""
-    # Authenticate user manually
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[REP_CONVERSATIONS] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    conn = get_conn()
-    
+def _load_rep_conversations(conn: Any, current_user: AuthUser) -> List[Dict[str, Any]]:
+    """Conversations visible to current_user: all of them for the owner, their own for reps."""
     # Owner can see all conversations, reps see only their own
     if current_user.get("role") == "admin":
         # Owner: get all conversations
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT phone, card_id, state, routing_mode, rep_user_id, rep_phone_number,
-                       last_outbound_at, last_inbound_at, created_at, updated_at, history
-                FROM conversations
-                ORDER BY COALESCE(last_inbound_at, last_outbound_at, updated_at) DESC NULLS LAST
-            """)
-            
-            conversations = []
-            # Helper to convert datetime to ISO string
-            def to_iso(dt):
-                return dt.isoformat() if dt else None
-            
-            for row in cur.fetchall():
-                history = row[10] or []
-                if isinstance(history, str):
-                    try:
-                        import json
-                        history = json.loads(history)
-                    except:
-                        history = []
-                
-                conversations.append({
-                    "phone": row[0],
-                    "card_id": row[1],
-                    "state": row[2],
-                    "routing_mode": row[3],
-                    "rep_user_id": row[4],
-                    "rep_phone_number": row[5],
-                    "last_outbound_at": to_iso(row[6]),
-                    "last_inbound_at": to_iso(row[7]),
-                    "created_at": to_iso(row[8]),
-                    "updated_at": to_iso(row[9]),
-                    "unread_count": 0,  # Owner sees all, no unread concept
-                })
+        # Columns are named after the JSON fields, so the dict rows are returned as they are.
+        # unread_count comes from SQL, so history is never selected. Timestamps stay
+        # datetime objects: ORJSONResponse (the app default) writes them as ISO-8601,
+        # the same text datetime.isoformat() produced here before.
+        conversations = list(iter_rows_server_side(conn, f"""
+            SELECT c.phone, c.card_id, c.state, c.routing_mode, c.rep_user_id, c.rep_phone_number,
+                   c.last_outbound_at, c.last_inbound_at, c.created_at, c.updated_at,
+                   {UNREAD_COUNT_SQL} AS unread_count
+            FROM conversations c
+            ORDER BY COALESCE(c.last_inbound_at, c.last_outbound_at, c.updated_at) DESC NULLS LAST
+        """, cursor_factory=RealDictCursor))
     else:
         # Rep: get only their conversations
         conversations = get_rep_conversations(conn, current_user["id"])
+    return conversations
+
+
+@app.get("/rep/conversations")
+async def rep_get_conversations(current_user: Dict = Depends(get_current_owner_or_rep)):
+    """Get rep's active conversations. Owner sees all, reps see only their own."""
+    conversations = await run_db(_load_rep_conversations, current_user)
     
     return {"ok": True, "conversations": conversations}
 
 
-@app.get("/rep/leads")
-async def rep_get_leads(request: Request):
+# Lead listings join conversations to their cards in one query (the INNER JOIN on cards
+# also drops leads whose card was deleted); inbound_count is the trigger-maintained column
+# (migration 015), so history is never read. Run as prepared statements ($n placeholders).
+_LEADS_COLUMNS = """
+    c.card_id, c.phone, c.state, c.last_inbound_at, c.last_outbound_at,
+    c.inbound_count,
+    cd.type, cd.card_data, cd.sales_state, cd.owner, cd.created_at, cd.updated_at
+"""
+
+# The rep's assignments are restricted in a subquery first so they drive the join
+# (an index-only scan on idx_card_assignments_user_covering) rather than conversations.
+_REP_LEADS_FROM = """
+    FROM (SELECT card_id FROM card_assignments WHERE user_id = $1) ca
+    INNER JOIN conversations c ON c.card_id = ca.card_id
+    INNER JOIN cards cd ON cd.id = c.card_id
+    WHERE c.card_id IS NOT NULL
+      AND c.last_inbound_at IS NOT NULL
+    ORDER BY c.last_inbound_at DESC
+"""
+
+_REP_LEADS_SQL = "SELECT" + _LEADS_COLUMNS + ", c.environment_id" + _REP_LEADS_FROM
+_REP_LEADS_SQL_LEGACY = "SELECT" + _LEADS_COLUMNS + _REP_LEADS_FROM
+
+_OWNER_LEADS_SQL = "SELECT" + _LEADS_COLUMNS + """
+    FROM conversations c
+    INNER JOIN cards cd ON cd.id = c.card_id
+    WHERE c.card_id IS NOT NULL
+      AND c.last_inbound_at IS NOT NULL
+    ORDER BY c.last_inbound_at DESC
+"""
+
+# Whether conversations.environment_id (migration 001) and conversations.history exist;
+# resolved once at startup so request handlers never try a query and fall back on schema drift
+_conversations_has_environment_id: Optional[bool] = None
+_conversations_has_history: Optional[bool] = None
+
+
+def _detect_conversation_columns(conn: Any) -> bool:
     """
-    Get rep's leads - cards that have received inbound messages (responses) to the rep's webhook.
-    Owner sees all leads, reps see only leads that responded to their messages.
+    Look up (and remember) whether conversations has the optional environment_id and
+    history columns. Returns the environment_id flag.
     """
-    # Authenticate user manually
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[REP_LEADS] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    conn = get_conn()
-    leads = []
-    rep_user_id = current_user["id"] if current_user.get("role") != "admin" else None
-    
+    global _conversations_has_environment_id, _conversations_has_history
     with conn.cursor() as cur:
-        # Get conversations with inbound messages
-        # For reps: filter by rep_user_id. For owner: show all.
-        if rep_user_id:
-            # Rep: only their assigned cards with inbound messages (≥1 inbound = lead)
-            # Join with card_assignments to filter by assigned cards only
-            try:
-                # Try with environment_id (new schema)
-                cur.execute("""
-                    SELECT DISTINCT c.card_id, c.phone, c.state, c.last_inbound_at, c.last_outbound_at,
-                           COALESCE(c.history::text, '[]') as history, c.environment_id
-                    FROM conversations c
-                    INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                    WHERE c.card_id IS NOT NULL
-                      AND c.last_inbound_at IS NOT NULL
-                      AND ca.user_id = %s
-                    ORDER BY c.last_inbound_at DESC;
-                """, (rep_user_id,))
-            except psycopg2.ProgrammingError:
-                # Fallback if environment_id column doesn't exist
-                cur.execute("""
-                    SELECT DISTINCT c.card_id, c.phone, c.state, c.last_inbound_at, c.last_outbound_at,
-                           COALESCE(c.history::text, '[]') as history
-                    FROM conversations c
-                    INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                    WHERE c.card_id IS NOT NULL
-                      AND c.last_inbound_at IS NOT NULL
-                      AND ca.user_id = %s
-                    ORDER BY c.last_inbound_at DESC;
-                """, (rep_user_id,))
-        else:
-            # Owner: all conversations with inbound messages
-            cur.execute("""
-                SELECT DISTINCT c.card_id, c.phone, c.state, c.last_inbound_at, c.last_outbound_at,
-                       COALESCE(c.history::text, '[]') as history
-                FROM conversations c
-                WHERE c.card_id IS NOT NULL
-                  AND c.last_inbound_at IS NOT NULL
-                ORDER BY c.last_inbound_at DESC;
-            """)
-        
-        rows = cur.fetchall()
-        
-        # Get card details for each lead
-        for row in rows:
-            card_id = row[0]
-            phone = row[1]
-            state = row[2]
-            last_inbound_at = row[3]
-            last_outbound_at = row[4]
-            history_raw = row[5] if len(row) > 5 else '[]'
-            
-            # Get card details
-            card = get_card(conn, card_id)
-            if not card:
-                continue
-            
-            # Parse history
-            try:
-                history = json.loads(history_raw) if isinstance(history_raw, str) else history_raw
-            except:
-                history = []
-            
-            # Count inbound messages
-            inbound_count = sum(1 for msg in history if (
-                isinstance(msg, dict) and msg.get("direction") == "inbound"
-            ) or isinstance(msg, str))
-            
-            card_data = card.get("card_data", {})
-            lead = {
-                "card_id": card_id,
-                "name": card_data.get("name", card_id),
-                "phone": phone,
-                "state": state,
-                "last_inbound_at": last_inbound_at.isoformat() if last_inbound_at else None,
-                "last_outbound_at": last_outbound_at.isoformat() if last_outbound_at else None,
-                "inbound_count": inbound_count,
-                "card_data": card_data,
-                "sales_state": card.get("sales_state", "cold"),
-            }
-            leads.append(lead)
+        cur.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = 'conversations' AND column_name IN ('environment_id', 'history')
+        """)
+        columns = {row[0] for row in cur.fetchall()}
+    _conversations_has_history = "history" in columns
+    _conversations_has_environment_id = "environment_id" in columns
+    return _conversations_has_environment_id
+
+
+def _load_rep_leads(conn: Any, current_user: AuthUser) -> List[Dict[str, Any]]:
+    """Cards with at least one inbound reply, newest first; reps only see their assigned cards."""
+    return list(_iter_rep_leads(conn, current_user))
+
+
+def _rep_leads_batch(conn: Any, current_user: AuthUser, offset: int):
+    """The leads as a single _ndjson_lines() batch (they come from one prepared query)."""
+    return _load_rep_leads(conn, current_user), None
+
+
+def _iter_rep_leads(conn: Any, current_user: AuthUser):
+    """Yield the lead dicts of _load_rep_leads() one at a time."""
+    rep_user_id = current_user["id"] if current_user.get("role") != "admin" else None
+
+    if rep_user_id:
+        has_environment_id = _conversations_has_environment_id
+        if has_environment_id is None:
+            has_environment_id = _detect_conversation_columns(conn)
+        # Rep: only their assigned cards with inbound messages (≥1 inbound = lead)
+        if has_environment_id:
+            name, query = "rep_leads_by_user", _REP_LEADS_SQL
+        else:
+            name, query = "rep_leads_by_user_legacy", _REP_LEADS_SQL_LEGACY
+        params = (rep_user_id,)
+    else:
+        # Owner: all conversations with inbound messages
+        name, query = "rep_leads_all", _OWNER_LEADS_SQL
+        params = ()
+
+    with conn.cursor() as cur:
+        execute_prepared(cur, name, query, params)
+        rows = cur.fetchall()
+    
+    for row in rows:
+        card_id = row[0]
+        phone = row[1]
+        state = row[2]
+        last_inbound_at = row[3]
+        last_outbound_at = row[4]
+        # Inbound messages in history (trigger-maintained counter, see migration 015)
+        inbound_count = row[5]
+        card = card_from_row((card_id,) + tuple(row[6:12]))
+    
+        card_data = card.get("card_data", {})
+        lead = {
+            "card_id": card_id,
+            "name": card_data.get("name", card_id),
+            "phone": phone,
+            "state": state,
+            "last_inbound_at": last_inbound_at.isoformat() if last_inbound_at else None,
+            "last_outbound_at": last_outbound_at.isoformat() if last_outbound_at else None,
+            "inbound_count": inbound_count,
+            "card_data": card_data,
+            "sales_state": card.get("sales_state", "cold"),
+        }
+        yield lead
+
+
+@app.get("/rep/leads")
+async def rep_get_leads(request: Request, current_user: Dict = Depends(get_current_owner_or_rep)):
+    """
+    Get rep's leads - cards that have received inbound messages (responses) to the rep's webhook.
+    Owner sees all leads, reps see only leads that responded to their messages.
+    """
+    if _wants_ndjson(request):
+        return StreamingResponse(_ndjson_lines(_rep_leads_batch, current_user), media_type=NDJSON_MEDIA_TYPE)
+    
+    leads = await run_db(_load_rep_leads, current_user)
     
     return {
         "leads": leads,
@@ -5409,120 +5698,45 @@ async def test_blast_ping(request: Request):
 # 🔥 MODULE LOAD CONFIRMATION: This proves the route is registered
 print("🔥🔥🔥 [MODULE_LOAD] /rep/blast route definition loaded in main.py", flush=True)
 
+def _fetch_card_ids(conn: Any, query: str, params: Any) -> List[str]:
+    """Run a build_list_query() query and return just the card ids (first column)."""
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return [row[0] for row in cur.fetchall()]
+
+
 @app.post("/rep/blast")
 async def rep_blast(
-    request: Request
+    request: Request,
+    current_user: Dict = Depends(get_current_owner_or_rep)
 ):
     """Blast cards. Owner can blast any cards, reps can only blast their assigned cards."""
-    _logger = logging.getLogger(__name__)
-    # 🔥 STEP 1: Prove endpoint is being hit
-    logger.error("🚨🚨🚨 [BLAST_REQUEST] endpoint hit")
-    print("🚨🚨🚨 [BLAST_REQUEST] endpoint hit", flush=True)
-    print("🚀🚀🚀 /rep/blast HIT — THIS SHOULD NEVER BE SILENT", flush=True)
-    print("🚀🚀🚀 /rep/blast HIT — THIS SHOULD NEVER BE SILENT", flush=True)
-    
-    # Authenticate user
-    try:
-        user = await get_current_owner_or_rep(request)
-        print("👤 [BLAST] user:", {
-            "id": user.get("id"),
-            "username": user.get("username"),
-            "role": user.get("role"),
-        }, flush=True)
-    except HTTPException as auth_exc:
-        print(f"❌ [BLAST] Auth HTTPException: {auth_exc.status_code} - {auth_exc.detail}", flush=True)
-        raise
-    except Exception as e:
-        print(f"❌ [BLAST] Auth error: {type(e).__name__}: {str(e)}", flush=True)
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
     # Get raw body
     raw = await request.body()
-    print("🚀🚀🚀 BLAST HIT — RAW BODY:", raw, flush=True)
     
     # Parse JSON
     try:
-        import json
         payload = json.loads(raw.decode('utf-8'))
     except Exception as e:
-        print("❌ [BLAST] JSON parse failed:", e, flush=True)
+        logger.warning("[BLAST] JSON parse failed: %s", e)
         raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
     
-    # 🔥 STEP 2: Log raw request payload (CRITICAL)
-    logger.error(f"[BLAST_INPUT] raw payload: {payload}")
-    print(f"[BLAST_INPUT] raw payload: {payload}", flush=True)
+    logger.debug("[BLAST] raw payload: %s", payload)
     
     # Try both snake_case and camelCase for compatibility
     card_ids = payload.get("card_ids") or payload.get("cardIds")
     
-    # 🔥 STEP 3: Log resolved card IDs *before* DB
-    card_ids_list = card_ids if isinstance(card_ids, list) else []
-    logger.error(f"[BLAST_CARD_IDS] card_ids={card_ids_list} count={len(card_ids_list)}")
-    print(f"[BLAST_CARD_IDS] card_ids={card_ids_list} count={len(card_ids_list)}", flush=True)
-    
-    logger.error(f"[BLAST] Cards resolved: {len(card_ids) if isinstance(card_ids, list) else 0}")
-    print("🚀🚀🚀 CARD IDS RECEIVED:", card_ids, flush=True)
-    print("🚀🚀🚀 CARD IDS TYPE:", type(card_ids), flush=True)
-    if card_ids is not None:
-        print("🚀🚀🚀 CARD IDS LENGTH:", len(card_ids) if isinstance(card_ids, list) else "NOT A LIST", flush=True)
-    
     if not card_ids:
-        print("❌ [BLAST] NO CARD IDS — ABORTING", flush=True)
+        logger.debug("[BLAST] No card_ids in payload - aborting")
         return {"ok": False, "error": "no card_ids", "sent": 0, "skipped": 0}
     
-    print("🚀 [BLAST] BEGIN LOOP", flush=True)
-    
-    current_user = user
-    
     # Now continue with the rest of the handler logic
     try:
-        # CRITICAL: Log immediately when endpoint is hit - BEFORE anything else
-        import sys
-        sys.stdout.flush()
-        sys.stderr.flush()
-        
-        print("=" * 80, flush=True)
-        print(f"[BLAST_ENDPOINT] 🚀 ENDPOINT CALLED", flush=True)
-        print("=" * 80, flush=True)
-        print(f"[BLAST_ENDPOINT] Request method: {request.method}", flush=True)
-        print(f"[BLAST_ENDPOINT] Request path: {request.url.path}", flush=True)
-        print(f"[BLAST_ENDPOINT] Request headers: {dict(request.headers)}", flush=True)
-        print(f"[BLAST_ENDPOINT] Payload type: {type(payload)}", flush=True)
-        print(f"[BLAST_ENDPOINT] Payload keys: {list(payload.keys()) if isinstance(payload, dict) else 'NOT A DICT'}", flush=True)
-        print(f"[BLAST_ENDPOINT] Payload: {payload}", flush=True)
-        print(f"[BLAST_ENDPOINT] Current user: {current_user}", flush=True)
-        logger.info("=" * 80)
-        logger.info("[BLAST_ENDPOINT] 🚀 ENDPOINT CALLED")
-        logger.info("=" * 80)
-        
         # #region agent log - Blast endpoint entry
-        try:
-            import json as _json
-            from datetime import datetime
-            from pathlib import Path
-            debug_log_path = Path(__file__).resolve().parent / ".cursor" / "debug.log"
-            debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(debug_log_path, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(datetime.now().timestamp() * 1000),
-                    "location": "main.py:rep_blast:ENTRY",
-                    "message": "Blast endpoint called",
-                    "data": {"user_id": current_user.get('id'), "role": current_user.get('role'), "payload_keys": list(payload.keys())},
-                    "hypothesisId": "A"
-                }) + "\n")
-        except Exception as e:
-            logger.error(f"[DEBUG_LOG] Failed to write debug log: {e}")
+        _agent_log("rep_blast:ENTRY", "Blast endpoint called", {"user_id": current_user.get('id'), "role": current_user.get('role'), "payload_keys": list(payload.keys())}, "A")
         # #endregion
         
         logger.info(f"[BLAST] rep_blast called by {current_user['id']} (role: {current_user.get('role')})")
-        logger.info(f"[BLAST] payload = {payload}")
-        print(f"[BLAST_ENDPOINT] User: {current_user['id']} (role: {current_user.get('role')})", flush=True)
-        print(f"[BLAST_ENDPOINT] Payload keys: {list(payload.keys())}", flush=True)
-        print(f"[BLAST_ENDPOINT] Payload: {payload}", flush=True)
         
         # ✅ FIX 3: Normalize payload defensively - handle multiple payload shapes
         # Frontend might send: card_ids, ids, leads, or other variations
@@ -5546,419 +5760,224 @@ async def rep_blast(
         limit = payload.get("limit")
         status_filter = payload.get("status", "assigned")
         
-        print(f"[BLAST_ENDPOINT] Normalized card_ids: {card_ids} (type: {type(card_ids)}, length: {len(card_ids)})", flush=True)
-        
-        print(f"[BLAST_ENDPOINT] Extracted parameters:", flush=True)
-        print(f"[BLAST_ENDPOINT]   limit: {limit}", flush=True)
-        print(f"[BLAST_ENDPOINT]   status_filter: {status_filter}", flush=True)
-        print(f"[BLAST_ENDPOINT]   card_ids: {card_ids} (type: {type(card_ids)}, length: {len(card_ids) if card_ids else 0})", flush=True)
-        logger.info(f"[BLAST] limit={limit}, status_filter={status_filter}, card_ids={card_ids} (count: {len(card_ids) if card_ids else 0})")
+        logger.info(f"[BLAST] limit={limit}, status_filter={status_filter}, card_ids count: {len(card_ids)}")
+        logger.debug("[BLAST] card_ids=%s", card_ids)
         
         # #region agent log - Blast parameters
-        try:
-            import json as _json
-            from datetime import datetime
-            from pathlib import Path
-            debug_log_path = Path(__file__).resolve().parent / ".cursor" / "debug.log"
-            debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(debug_log_path, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(datetime.now().timestamp() * 1000),
-                    "location": "main.py:rep_blast:PARAMS",
-                    "message": "Blast parameters extracted",
-                    "data": {"limit": limit, "status_filter": status_filter, "card_ids": card_ids, "card_ids_count": len(card_ids) if card_ids else 0},
-                    "hypothesisId": "B"
-                }) + "\n")
-        except Exception as e:
-            logger.error(f"[DEBUG_LOG] Failed to write debug log: {e}")
+        _agent_log("rep_blast:PARAMS", "Blast parameters extracted", {"limit": limit, "status_filter": status_filter, "card_ids": card_ids, "card_ids_count": len(card_ids) if card_ids else 0}, "B")
         # #endregion
         
-        print(f"[BLAST_ENDPOINT] Getting database connection...", flush=True)
-        conn = get_conn()
-        print(f"[BLAST_ENDPOINT] Database connection obtained", flush=True)
-        
         # ✅ FIX 4: Allow admin blasting explicitly
         user_role = current_user.get("role")
-        print(f"[BLAST_ENDPOINT] Checking user role: {user_role}", flush=True)
         
         if user_role == "admin":
-            logger.info("🔥 Admin blast mode enabled")
-            print(f"[BLAST_ENDPOINT] ✅ Admin user - full access granted", flush=True)
-            print(f"[BLAST_ENDPOINT] User is admin - can blast any cards", flush=True)
             # Owner: can blast any cards
+            logger.info("🔥 Admin blast mode enabled")
             if card_ids and isinstance(card_ids, list):
                 # Use provided card IDs (owner has full access)
-                print(f"[BLAST_ENDPOINT] Admin using provided card_ids: {card_ids}", flush=True)
                 pass
             else:
-                print(f"[BLAST_ENDPOINT] Admin - no card_ids provided, fetching all cards...", flush=True)
                 # Get all cards (or filtered by query if needed)
-                print(f"[BLAST_ENDPOINT] Building query for all cards...", flush=True)
-                from backend.query import build_list_query
                 query, params = build_list_query(where={}, limit=limit or 10000)
-                print(f"[BLAST_ENDPOINT] Query built, executing...", flush=True)
-                
-                card_ids = []
-                with conn.cursor() as cur:
-                    cur.execute(query, params)
-                    rows = cur.fetchall()
-                    print(f"[BLAST_ENDPOINT] Fetched {len(rows)} cards from database", flush=True)
-                    for row in rows:
-                        card_ids.append(row[0])  # row[0] is the id
-                print(f"[BLAST_ENDPOINT] Admin - final card_ids count: {len(card_ids)}", flush=True)
+                card_ids = await run_db(_fetch_card_ids, query, params)
+                logger.debug("[BLAST] Admin - no card_ids provided, fetched %d cards", len(card_ids))
         else:
             # Rep: STRICT enforcement - can ONLY blast assigned cards
-            print(f"[BLAST_ENDPOINT] User is rep - enforcing assignment boundaries", flush=True)
             logger.info(f"[BLAST] Rep {current_user['id']} attempting blast - enforcing assignment boundaries")
             
-            # Get all cards assigned to this rep
-            print(f"[BLAST_ENDPOINT] Fetching assigned cards for rep {current_user['id']}...", flush=True)
-            all_assigned = get_rep_assigned_cards(conn, current_user["id"])
-            # 4️⃣ After fetching assigned cards (THIS IS THE LIKELY KILLER)
-            _logger.error(
-                f"[BLAST_ENDPOINT] Assigned cards count = {len(all_assigned)}; "
-                f"first_ids={[c['id'] for c in all_assigned[:5]]}"
-            )
-            print(f"[BLAST_ENDPOINT] Found {len(all_assigned)} assigned cards", flush=True)
-            assigned_ids = {c["id"] for c in all_assigned}
-            print(f"[BLAST_ENDPOINT] Assigned card IDs: {list(assigned_ids)[:5]}..." if len(assigned_ids) > 5 else f"[BLAST_ENDPOINT] Assigned card IDs: {list(assigned_ids)}", flush=True)
-            
+            # One query resolves the target set: the authorized subset of the requested ids,
+            # or (with no ids) the rep's assigned cards filtered by status and limited in SQL
             if card_ids and isinstance(card_ids, list):
-                print(f"[BLAST_ENDPOINT] 🔍 Checking authorization for {len(card_ids)} card(s)...", flush=True)
-                print(f"[BLAST_ENDPOINT]   Requested card_ids: {card_ids}", flush=True)
-                print(f"[BLAST_ENDPOINT]   Assigned card_ids: {list(assigned_ids)[:10]}..." if len(assigned_ids) > 10 else f"[BLAST_ENDPOINT]   Assigned card_ids: {list(assigned_ids)}", flush=True)
+                assigned_ids = set(await run_db(
+                    get_authorized_card_ids, current_user["id"],
+                    card_ids=[cid for cid in card_ids if isinstance(cid, str)],
+                ))
                 
                 # Verify ALL specified cards are assigned to this rep
                 unauthorized = [cid for cid in card_ids if cid not in assigned_ids]
                 if unauthorized:
-                    # 6️⃣ Before EVERY early return (non-negotiable)
-                    _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: unauthorized card_ids")
-                    print(f"[BLAST_ENDPOINT] ❌ EARLY EXIT: Unauthorized cards detected", flush=True)
-                    print(f"[BLAST_ENDPOINT]   Unauthorized: {unauthorized}", flush=True)
                     logger.warning(f"[BLAST] Rep {current_user['id']} attempted to blast unauthorized cards: {unauthorized}")
                     return {"ok": False, "error": f"Unauthorized: {len(unauthorized)} card(s) not assigned to you", "sent": 0, "skipped": 0}
                 
                 # Filter to only assigned cards (safety check)
                 card_ids = [cid for cid in card_ids if cid in assigned_ids]
-                # 5️⃣ After filtering requested cards against assigned cards
-                _logger.error(
-                    f"[BLAST_ENDPOINT] Cards after assignment filter = {len(card_ids)}; "
-                    f"ids={card_ids}"
-                )
-                print(f"[BLAST_ENDPOINT]   After filtering: {len(card_ids)} authorized card(s)", flush=True)
                 
                 if not card_ids:
-                    # 6️⃣ Before EVERY early return (non-negotiable)
-                    _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: no valid cards after filtering")
-                    print(f"[BLAST_ENDPOINT] ❌ EARLY EXIT: No valid assigned cards after filtering", flush=True)
                     logger.warning(f"[BLAST] Rep {current_user['id']} - no valid assigned cards after filtering")
                     return {"ok": False, "error": "None of the specified cards are assigned to you", "sent": 0, "skipped": 0}
             else:
                 # Get rep's assigned cards (only uncontacted/active ones)
-                print(f"[BLAST_ENDPOINT] 🔍 Fetching assigned cards for rep {current_user['id']} with status={status_filter}...", flush=True)
-                cards = get_rep_assigned_cards(conn, current_user["id"], status=status_filter)
-                print(f"[BLAST_ENDPOINT]   Found {len(cards)} assigned cards", flush=True)
-                if not cards:
-                    # 6️⃣ Before EVERY early return (non-negotiable)
-                    _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: no assigned cards found")
-                    print(f"[BLAST_ENDPOINT] ❌ EARLY EXIT: No assigned cards found", flush=True)
+                card_ids = await run_db(
+                    get_authorized_card_ids, current_user["id"],
+                    status=status_filter, limit=limit or None,
+                )
+                if not card_ids:
                     logger.info(f"[BLAST] Rep {current_user['id']} - no assigned cards found with status={status_filter}")
                     return {"ok": False, "error": "No assigned cards found", "sent": 0, "skipped": 0}
-                
-                card_ids = [c["id"] for c in cards]
-                
-                # Apply limit if provided
-                if limit:
-                    card_ids = card_ids[:limit]
             
             logger.info(f"[BLAST] Rep {current_user['id']} - authorized to blast {len(card_ids)} assigned cards")
         
-        print(f"[BLAST_ENDPOINT] Final card_ids count: {len(card_ids) if card_ids else 0}", flush=True)
         if not card_ids:
-            # 6️⃣ Before EVERY early return (non-negotiable)
-            _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: no card_ids provided")
-            print(f"[BLAST_ENDPOINT] ❌ EARLY EXIT: No cards to blast - returning error", flush=True)
+            logger.debug("[BLAST] No cards to blast")
             return {"ok": False, "error": "No cards to blast", "sent": 0, "skipped": 0}
         
-        print(f"[BLAST_ENDPOINT] ✅ Card validation passed - {len(card_ids)} cards to blast", flush=True)
-        
         # Run blast
-        print(f"[BLAST_ENDPOINT] Starting blast execution...", flush=True)
+        # All users (admin and reps) use system phone number via Messaging Service
+        rep_user_id = None if current_user.get("role") == "admin" else current_user["id"]
+        
+        # All users (admin and reps) use the system phone number, Account SID and Auth Token,
+        # sending directly from the phone number (not via Messaging Service to avoid filtering)
+        if TWILIO.missing:
+            error_msg = f"{TWILIO.missing} is not set in environment variables. Blast cannot proceed."
+            logger.error(f"[BLAST] {error_msg}")
+            return {"ok": False, "error": error_msg, "sent": 0, "skipped": 0}
+        
+        logger.info(f"[BLAST] Running blast for {len(card_ids)} cards from {TWILIO.phone_number}, user={current_user['id']}, rep_user_id={rep_user_id}")
+        
+        # #region agent log - Before run_blast_for_cards
+        _agent_log("rep_blast:BEFORE_RUN", "About to call run_blast_for_cards", {"card_ids_count": len(card_ids), "rep_user_id": rep_user_id, "has_account_sid": bool(TWILIO.account_sid), "has_auth_token": bool(TWILIO.auth_token), "has_phone_number": bool(TWILIO.phone_number)}, "C")
+        # #endregion
+        
         try:
-            # All users (admin and reps) use system phone number via Messaging Service
-            rep_user_id = None if current_user.get("role") == "admin" else current_user["id"]
-            print(f"[BLAST_ENDPOINT] rep_user_id: {rep_user_id}", flush=True)
-            
-            # Validate phone number is configured (send directly from phone, not Messaging Service)
-            import os
-            print(f"[BLAST_ENDPOINT] Validating Twilio environment variables...", flush=True)
-            phone_number = os.getenv("TWILIO_PHONE_NUMBER")
-            if not phone_number:
-                # 6️⃣ Before EVERY early return (non-negotiable)
-                _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: missing Twilio config (PHONE_NUMBER)")
-                error_msg = "TWILIO_PHONE_NUMBER is not set in environment variables. Blast cannot proceed."
-                print(f"[BLAST_ENDPOINT] ❌ {error_msg}", flush=True)
-                return {"ok": False, "error": error_msg, "sent": 0, "skipped": 0}
-            print(f"[BLAST_ENDPOINT] ✅ TWILIO_PHONE_NUMBER: {phone_number}", flush=True)
-            
-            # All users (admin and reps) use system Account SID and Auth Token (from env vars)
-            # All messages sent directly from system phone number (not via Messaging Service to avoid filtering)
-            account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-            auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-            
-            if not account_sid:
-                # 6️⃣ Before EVERY early return (non-negotiable)
-                _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: missing Twilio config (ACCOUNT_SID)")
-                error_msg = "TWILIO_ACCOUNT_SID is not set in environment variables. Blast cannot proceed."
-                print(f"[BLAST_ENDPOINT] ❌ {error_msg}", flush=True)
-                return {"ok": False, "error": error_msg, "sent": 0, "skipped": 0}
-            print(f"[BLAST_ENDPOINT] ✅ TWILIO_ACCOUNT_SID: {account_sid[:10]}...", flush=True)
-            
-            if not auth_token:
-                # 6️⃣ Before EVERY early return (non-negotiable)
-                _logger.error("[BLAST_ENDPOINT] ❌ EARLY EXIT: missing Twilio config (AUTH_TOKEN)")
-                error_msg = "TWILIO_AUTH_TOKEN is not set in environment variables. Blast cannot proceed."
-                print(f"[BLAST_ENDPOINT] ❌ {error_msg}", flush=True)
-                return {"ok": False, "error": error_msg, "sent": 0, "skipped": 0}
-            print(f"[BLAST_ENDPOINT] ✅ TWILIO_AUTH_TOKEN: {auth_token[:10]}...", flush=True)
-            
-            logger.info(f"[BLAST] User {current_user['id']} (role: {current_user.get('role')}) using system Account SID: {account_sid[:10]}...")
-            logger.info(f"[BLAST] Phone Number: {phone_number}")
-            logger.info(f"[BLAST] Sending directly from phone number (not Messaging Service) to avoid filtering")
-            logger.info(f"[BLAST] Running blast for {len(card_ids)} cards, rep_user_id={rep_user_id}")
-            print(f"[BLAST_ENDPOINT] ✅ All validations passed - calling run_blast_for_cards()", flush=True)
-            
-            # #region agent log - Before run_blast_for_cards
-            try:
-                import json as _json
-                from datetime import datetime
-                from pathlib import Path
-                debug_log_path = Path(__file__).resolve().parent / ".cursor" / "debug.log"
-                debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(debug_log_path, "a") as f:
-                    f.write(_json.dumps({
-                        "sessionId": "debug-session",
-                        "runId": "run1",
-                        "timestamp": int(datetime.now().timestamp() * 1000),
-                        "location": "main.py:rep_blast:BEFORE_RUN",
-                        "message": "About to call run_blast_for_cards",
-                        "data": {"card_ids_count": len(card_ids), "rep_user_id": rep_user_id, "has_account_sid": bool(account_sid), "has_auth_token": bool(auth_token), "has_phone_number": bool(phone_number)},
-                        "hypothesisId": "C"
-                    }) + "\n")
-            except Exception as e:
-                logger.error(f"[DEBUG_LOG] Failed to write debug log: {e}")
-            # #endregion
-            
-            print(f"[BLAST_ENDPOINT] About to call run_blast_for_cards() with:", flush=True)
-            print(f"[BLAST_ENDPOINT]   card_ids: {card_ids}", flush=True)
-            print(f"[BLAST_ENDPOINT]   owner: {current_user['id']}", flush=True)
-            print(f"[BLAST_ENDPOINT]   source: {'owner_ui' if current_user.get('role') == 'admin' else 'rep_ui'}", flush=True)
-            print(f"[BLAST_ENDPOINT]   rep_user_id: {rep_user_id}", flush=True)
-            # 7️⃣ Immediately before blast execution (the goal)
-            _logger.error(f"[BLAST_ENDPOINT] 🔥🔥🔥 ABOUT TO EXECUTE BLAST for cards={card_ids}")
-            print(f"[BLAST_ENDPOINT] Calling run_blast_for_cards() NOW...", flush=True)
-            print(f"[BLAST_ENDPOINT] 🔥🔥🔥 ABOUT TO EXECUTE BLAST 🔥🔥🔥", flush=True)
-            print(f"[BLAST_ENDPOINT]   card_ids: {card_ids}", flush=True)
-            print(f"[BLAST_ENDPOINT]   rep_user_id: {rep_user_id}", flush=True)
-            print(f"[BLAST_ENDPOINT]   owner: {current_user['id']}", flush=True)
-            
-            try:
-                # 🔥 CRITICAL DEBUG: Print card_ids right before the loop
-                print("🧠 [BLAST] card_ids value before loop:", card_ids, "type:", type(card_ids), flush=True)
-                if isinstance(card_ids, list):
-                    print("🧠 [BLAST] card_ids list length:", len(card_ids), flush=True)
-                else:
-                    print("🧠 [BLAST] WARNING: card_ids is NOT a list!", flush=True)
-                
-                # Loop through each card_id
-                for card_id in card_ids:
-                    print(f"📤 [BLAST] SENDING card_id = {card_id}", flush=True)
-                
-                print("📤📤📤 /rep/blast ABOUT TO SEND TWILIO", flush=True)
-                result = run_blast_for_cards(
-                    conn=conn,
-                    card_ids=card_ids,
-                    limit=None,  # Already applied limit above if needed
-                    owner=current_user["id"],
-                    source="owner_ui" if current_user.get("role") == "admin" else "rep_ui",
-                    rep_user_id=rep_user_id,
-                )
-                
-                print("✅ [BLAST] COMPLETE", flush=True)
-                return result
-            except Exception as run_error:
-                print("=" * 80, flush=True)
-                print(f"[BLAST_ENDPOINT] ❌ EXCEPTION in run_blast_for_cards()", flush=True)
-                print("=" * 80, flush=True)
-                print(f"[BLAST_ENDPOINT] Error type: {type(run_error).__name__}", flush=True)
-                print(f"[BLAST_ENDPOINT] Error message: {str(run_error)}", flush=True)
-                import traceback
-                print(f"[BLAST_ENDPOINT] Full traceback:", flush=True)
-                traceback.print_exc()
-                print("=" * 80, flush=True)
-                raise
-        except Exception as inner_e:
-            # Re-raise to be caught by outer except
-            raise
+            # Borrows a pooled connection per DB step, never across the Twilio sends
+            result = await _run_blast(
+                card_ids=card_ids,
+                limit=None,  # Already applied limit above if needed
+                owner=current_user["id"],
+                source="owner_ui" if current_user.get("role") == "admin" else "rep_ui",
+                rep_user_id=rep_user_id,
+            )
+        finally:
+            # Blasts claim cards for the sender (owner blasts clear assignments)
+            _invalidate_assigned_cards()
+        
+        return result
     except HTTPException:
         # Re-raise HTTP exceptions (auth errors, etc.)
         raise
     except Exception as e:
-        # Catch any other errors and log them
-        print("=" * 80, flush=True)
-        print(f"❌ [BLAST] UNHANDLED EXCEPTION", flush=True)
-        print("=" * 80, flush=True)
-        print(f"❌ [BLAST] Error type: {type(e).__name__}", flush=True)
-        print(f"❌ [BLAST] Error message: {str(e)}", flush=True)
-        import traceback
-        print(f"❌ [BLAST] Full traceback:", flush=True)
-        traceback.print_exc()
-        print("=" * 80, flush=True)
-        
+        # Formatted once and shared by the trace and the log record (exc_info would re-format it)
+        error_trace = traceback.format_exc()
         # #region agent log - Blast exception
-        try:
-            import json as _json
-            from datetime import datetime
-            import traceback
-            from pathlib import Path
-            debug_log_path = Path(__file__).resolve().parent / ".cursor" / "debug.log"
-            debug_log_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(debug_log_path, "a") as f:
-                f.write(_json.dumps({
-                    "sessionId": "debug-session",
-                    "runId": "run1",
-                    "timestamp": int(datetime.now().timestamp() * 1000),
-                    "location": "main.py:rep_blast:EXCEPTION",
-                    "message": "Blast failed with exception",
-                    "data": {"error": str(e), "error_type": type(e).__name__, "traceback": traceback.format_exc()},
-                    "hypothesisId": "E"
-                }) + "\n")
-        except Exception as log_err:
-            logger.error(f"[DEBUG_LOG] Failed to write debug log: {log_err}")
+        _agent_log("rep_blast:EXCEPTION", "Blast failed with exception", {"error": str(e), "error_type": type(e).__name__, "traceback": error_trace[-_DEBUG_LOG_TRACEBACK_MAX:]}, "E")
         # #endregion
         
-        # CRITICAL: Log exception immediately
-        print("=" * 80, flush=True)
-        print(f"[BLAST_ENDPOINT] ❌ EXCEPTION CAUGHT", flush=True)
-        print(f"[BLAST_ENDPOINT] Error: {str(e)}", flush=True)
-        print(f"[BLAST_ENDPOINT] Error type: {type(e).__name__}", flush=True)
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"[BLAST_ENDPOINT] Full traceback:\n{error_trace}", flush=True)
-        print("=" * 80, flush=True)
-        
-        # This should never be reached because we catch exceptions above
-        logger.error(f"[BLAST] ❌ EXCEPTION in rep_blast: {e}")
-        logger.error(f"[BLAST] Traceback:\n{error_trace}")
+        logger.error("[BLAST] ❌ EXCEPTION in rep_blast: %s: %s\n%s", type(e).__name__, e, error_trace)
         raise HTTPException(status_code=500, detail=f"Blast failed: {str(e)}")
 
 
-@app.post("/rep/messages/send")
-async def rep_send_message(
-    request: Request,
-    payload: Dict[str, Any] = Body(...)
-):
-    """Send a message to a specific card/phone. Owner can send to any, reps to their assigned cards."""
-    # Authenticate user manually
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[REP_SEND_MESSAGE] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    card_id = payload.get("card_id")
-    phone = payload.get("phone")
-    message = payload.get("message")
-    
-    if not message:
-        raise HTTPException(status_code=400, detail="message is required")
-    
-    if not card_id and not phone:
-        raise HTTPException(status_code=400, detail="card_id or phone is required")
-    
-    conn = get_conn()
-    
-    # If phone provided but not card_id, try to find card_id
+def _resolve_send_card(conn: Any, current_user: AuthUser, card_id: Optional[str], phone: Optional[str]) -> str:
+    """The card a send targets (looked up by phone when no card_id is given); 404/403 when not allowed."""
+    # If phone provided but not card_id, try to find card_id: the conversation's card
+    # first, otherwise a person card with that phone number - both in one round-trip
     if phone and not card_id:
-        # First try from conversations table
         with conn.cursor() as cur:
-            cur.execute("SELECT card_id FROM conversations WHERE phone = %s LIMIT 1", (phone,))
+            execute_prepared(cur, "send_card_by_phone", """
+                (SELECT 1 AS src, card_id FROM conversations
+                 WHERE phone = $1 AND card_id IS NOT NULL
+                 LIMIT 1)
+                UNION ALL
+                (SELECT 2 AS src, id FROM cards
+                 WHERE type = 'person'
+                 AND card_data->>'phone' = $1
+                 LIMIT 1)
+                ORDER BY src
+                LIMIT 1
+            """, (phone,))
             row = cur.fetchone()
-            if row and row[0]:
-                card_id = row[0]
-        
-        # If still not found, try to find card by phone number
-        if not card_id:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id FROM cards
-                    WHERE type = 'person'
-                    AND card_data->>'phone' = %s
-                    LIMIT 1
-                """, (phone,))
-                row = cur.fetchone()
-                if row and row[0]:
-                    card_id = row[0]
+            if row:
+                card_id = row[1]
     
     if not card_id:
         raise HTTPException(status_code=404, detail="Card not found for phone number")
     
-    # Reps can only send to their assigned cards
+    # Reps can only send to their assigned cards (point lookup, not the rep's whole list)
     if current_user.get("role") != "admin":
-        assigned = get_rep_assigned_cards(conn, current_user["id"])
-        assigned_ids = {c["id"] for c in assigned}
-        if card_id not in assigned_ids:
+        if not get_authorized_card_ids(conn, current_user["id"], [card_id]):
             raise HTTPException(status_code=403, detail="Card is not assigned to you")
     
+    return card_id
+
+
+def _owner_send_phone(conn: Any, current_user: AuthUser, card_id: Optional[str], phone: Optional[str]) -> str:
+    """Phone number an owner send goes to (the card's, else the one given)."""
+    card_id = _resolve_send_card(conn, current_user, card_id, phone)
+    card = get_card(conn, card_id)
+    phone_num = card.get("card_data", {}).get("phone") if card else phone
+    if not phone_num:
+        raise HTTPException(status_code=400, detail="Phone number not found")
+    return phone_num
+
+
+def _deliver_owner_message(phone_num: str, message: str) -> None:
+    """
+    Background half of an owner send: the Twilio request, then the history write with its SID.
+    Runs after the response has gone out, so failures are logged rather than returned.
+    """
+    from scripts.blast import send_sms
     try:
-        # All users (admin and reps) send from system phone via Messaging Service
-        if current_user.get("role") == "admin":
-            # Admin: use system Twilio
-            from scripts.blast import send_sms
-            from backend.cards import get_card
-            card = get_card(conn, card_id)
-            phone_num = card.get("card_data", {}).get("phone") if card else phone
-            if not phone_num:
-                raise HTTPException(status_code=400, detail="Phone number not found")
-            
-            result = send_sms(phone_num, message)
-            # Store in conversation history
-            from backend.rep_messaging import add_message_to_history
+        result = send_sms(phone_num, message)
+        with pooled_conn() as conn:
             add_message_to_history(conn, phone_num, "outbound", message, "owner", result.get("sid"))
-            
-            return {"ok": True, "result": result}
-        else:
-            # Rep: use rep messaging system (also uses system phone via Messaging Service)
-            result = send_rep_message(conn, current_user["id"], card_id, message)
-            return {"ok": True, "result": result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
+        logger.error("[REP_SEND_MESSAGE] Queued owner send to %s failed: %s", phone_num, e, exc_info=True)
+    finally:
+        _invalidate_rep_stats()
 
 
-@app.get("/rep/messages/{phone}")
-async def rep_get_messages(
-    phone: str,
-    request: Request
-):
-    """Get conversation history for a phone number. Owner can see all, reps only their own."""
-    # Authenticate user manually
+def _send_rep_message_for_user(conn: Any, current_user: AuthUser, card_id: Optional[str], phone: Optional[str], message: str) -> Dict[str, Any]:
+    """Authorize and send a rep's message (blocking Twilio call); returns the send result."""
+    card_id = _resolve_send_card(conn, current_user, card_id, phone)
     try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
+        # Rep: use rep messaging system (also uses system phone via Messaging Service)
+        result = send_rep_message(conn, current_user["id"], card_id, message)
     except Exception as e:
-        logger.error(f"[REP_GET_MESSAGES] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    conn = get_conn()
+        raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
+    _invalidate_rep_stats()
+    return result
+
+
+@app.post("/rep/messages/send")
+async def rep_send_message(
+    background_tasks: BackgroundTasks,
+    payload: Dict[str, Any] = Body(...),
+    current_user: Dict = Depends(get_current_owner_or_rep)
+):
+    """
+    Send a message to a specific card/phone. Owner can send to any, reps to their assigned cards.
+    Owner sends are queued: the response ({"ok": true, "queued": true}) goes out once the target
+    is resolved, and the Twilio request plus the history write run afterwards.
+    """
+    card_id = payload.get("card_id")
+    phone = payload.get("phone")
+    message = payload.get("message")
+    
+    if not message:
+        raise HTTPException(status_code=400, detail="message is required")
+    
+    if not card_id and not phone:
+        raise HTTPException(status_code=400, detail="card_id or phone is required")
+    
+    # All users (admin and reps) send from system phone via Messaging Service
+    if current_user.get("role") == "admin":
+        # Owner: only the lookup is on the request path; no pooled connection is held
+        # while Twilio answers
+        phone_num = await run_db(_owner_send_phone, current_user, card_id, phone)
+        background_tasks.add_task(_deliver_owner_message, phone_num, message)
+        return {"ok": True, "queued": True}
     
+    # Lookups, the Twilio request and the history write all block, so they run off the loop
+    result = await run_db(_send_rep_message_for_user, current_user, card_id, phone, message)
+    return {"ok": True, "result": result}
+
+
+def _load_messages_for_user(conn: Any, current_user: AuthUser, phone: str) -> List[Dict[str, Any]]:
+    """Conversation history for phone; reps get a 403 for conversations that aren't theirs."""
     # Reps can only see their assigned conversations
     if current_user.get("role") != "admin":
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT rep_user_id, card_id FROM conversations WHERE phone = %s
+            execute_prepared(cur, "rep_conversation_owner", """
+                SELECT rep_user_id, card_id FROM conversations WHERE phone = $1
             """, (phone,))
             row = cur.fetchone()
             if row and row[0] and row[0] != current_user["id"]:
@@ -5968,102 +5987,117 @@ async def rep_get_messages(
                     if not assigned or assigned["user_id"] != current_user["id"]:
                         raise HTTPException(status_code=403, detail="Not authorized to view this conversation")
     
-    messages = get_conversation_messages(conn, phone)
+    return get_conversation_messages(conn, phone)
+
+
+@app.get("/rep/messages/{phone}")
+async def rep_get_messages(
+    phone: str,
+    current_user: Dict = Depends(get_current_owner_or_rep)
+):
+    """Get conversation history for a phone number. Owner can see all, reps only their own."""
+    messages = await run_db(_load_messages_for_user, current_user, phone)
     return {"ok": True, "messages": messages}
 
 
-@app.get("/rep/stats")
-async def rep_get_stats(request: Request):
-    """Get conversion metrics. Owner sees all stats, reps see only their own."""
-    # Authenticate user manually
-    try:
-        current_user = await get_current_owner_or_rep(request)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[REP_STATS] Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication required")
-    conn = get_conn()
-    
+# Every /rep/stats counter for one rep in a single statement ($1 = user id,
+# $2 = start of the "active conversation" window), returned as one flat row in the order
+# _REP_STATS_COLUMNS lists. One aggregate pass over the rep's assignments (ca) and one
+# over their conversations (rc); each counter is a FILTER on those passes. The rc pass reads
+# only columns carried by idx_conversations_card_stats (migration 018), never history.
+_REP_STATS_SQL = """
+    WITH ca AS (
+        SELECT card_id, status FROM card_assignments WHERE user_id = $1
+    ),
+    rc AS (
+        SELECT c.phone, c.card_id, c.outbound_count, c.inbound_count,
+               c.last_inbound_at, c.last_activity_at
+        FROM ca
+        INNER JOIN conversations c ON c.card_id = ca.card_id
+        WHERE c.card_id IS NOT NULL
+    )
+    SELECT a.assigned, a.active, a.closed, a.lost, a.total_assigned,
+           r.total_leads, r.total_conversations, r.active_conversations,
+           r.messages_sent, r.messages_received
+    FROM (
+        SELECT COUNT(*) FILTER (WHERE status = 'assigned') AS assigned,
+               COUNT(*) FILTER (WHERE status = 'active') AS active,
+               COUNT(*) FILTER (WHERE status = 'closed') AS closed,
+               COUNT(*) FILTER (WHERE status = 'lost') AS lost,
+               COUNT(DISTINCT card_id) AS total_assigned
+        FROM ca
+    ) a
+    CROSS JOIN (
+        -- Leads: assigned cards with at least one inbound message
+        SELECT COUNT(DISTINCT card_id) FILTER (WHERE last_inbound_at IS NOT NULL) AS total_leads,
+               COUNT(DISTINCT phone) AS total_conversations,
+               -- Active: any activity inside the window (last_activity_at, migration 017)
+               COUNT(DISTINCT phone) FILTER (WHERE last_activity_at >= $2::timestamp) AS active_conversations,
+               -- Message counters are maintained on the row (migration 015); history is not read
+               COALESCE(SUM(outbound_count), 0) AS messages_sent,
+               -- Conversations with at least one inbound message
+               COUNT(*) FILTER (WHERE inbound_count > 0) AS messages_received
+        FROM rc
+    ) r
+"""
+
+_REP_STATS_COLUMNS = (
+    "assigned", "active", "closed", "lost", "total_assigned",
+    "total_leads", "total_conversations", "active_conversations",
+    "messages_sent", "messages_received",
+)
+
+
+# Owner-wide /rep/stats counters in one statement, as one flat row (_OWNER_STATS_COLUMNS)
+_OWNER_STATS_SQL = """
+    SELECT a.assigned, a.active, a.closed, a.lost,
+           (SELECT COUNT(*) FROM cards) AS total_cards,
+           (SELECT COUNT(*) FROM conversations) AS total_conversations
+    FROM (
+        SELECT COUNT(*) FILTER (WHERE status = 'assigned') AS assigned,
+               COUNT(*) FILTER (WHERE status = 'active') AS active,
+               COUNT(*) FILTER (WHERE status = 'closed') AS closed,
+               COUNT(*) FILTER (WHERE status = 'lost') AS lost
+        FROM card_assignments
+    ) a
+"""
+
+_OWNER_STATS_COLUMNS = ("assigned", "active", "closed", "lost", "total_cards", "total_conversations")
+
+
+# Short-lived cache of /rep/stats results, keyed by (user_id, role). Dashboards poll the
+# endpoint every few seconds per open tab; sends and assignment changes clear it, and the
+# TTL bounds staleness from writers that go through neither (inbound webhooks, blasts).
+REP_STATS_CACHE_TTL_SECONDS = 15
+_REP_STATS_CACHE_MAX = 2048
+_rep_stats_cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_rep_stats_lock = threading.Lock()
+_rep_stats_generation = 0
+
+
+def _invalidate_rep_stats() -> None:
+    global _rep_stats_generation
+    with _rep_stats_lock:
+        _rep_stats_generation += 1
+        _rep_stats_cache.clear()
+
+
+def _load_rep_stats(conn: Any, current_user: AuthUser) -> Dict[str, Any]:
+    """Conversion metrics for current_user: global for the owner, their own for reps."""
     if current_user.get("role") == "admin":
-        # Owner: get all stats
+        # Owner: get all stats (one prepared statement)
         with conn.cursor() as cur:
-            # Total cards
-            cur.execute("SELECT COUNT(*) FROM cards")
-            total_cards = cur.fetchone()[0] or 0
-            
-            # Total conversations
-            cur.execute("SELECT COUNT(*) FROM conversations")
-            total_conversations = cur.fetchone()[0] or 0
-            
-            # Assignment stats
-            cur.execute("""
-                SELECT status, COUNT(*) as count
-                FROM card_assignments
-                GROUP BY status
-            """)
-            
-            stats = {
-                "assigned": 0,
-                "active": 0,
-                "closed": 0,
-                "lost": 0,
-                "total_cards": total_cards,
-                "total_conversations": total_conversations,
-            }
-            
-            for row in cur.fetchall():
-                status = row[0]
-                count = row[1]
-                if status in stats:
-                    stats[status] = count
+            execute_prepared(cur, "rep_stats_all", _OWNER_STATS_SQL)
+            stats = dict(zip(_OWNER_STATS_COLUMNS, cur.fetchone()))
     else:
-        # Rep: get only their stats
+        # Rep: get only their stats, every counter in a single round-trip
         user_id = current_user["id"]
+        seven_days_ago = datetime.utcnow() - timedelta(days=7)
         with conn.cursor() as cur:
-            # Get assignment status counts
-            cur.execute("""
-                SELECT status, COUNT(*) as count
-                FROM card_assignments
-                WHERE user_id = %s
-                GROUP BY status
-            """, (user_id,))
-            
-            stats = {
-                "assigned": 0,
-                "active": 0,
-                "closed": 0,
-                "lost": 0,
-            }
-            
-            for row in cur.fetchall():
-                status = row[0]
-                count = row[1]
-                if status in stats:
-                    stats[status] = count
-            
-            # Get total cards assigned (all statuses)
-            cur.execute("""
-                SELECT COUNT(DISTINCT card_id)
-                FROM card_assignments
-                WHERE user_id = %s
-            """, (user_id,))
-            row = cur.fetchone()
-            total_assigned = row[0] if row else 0
-            stats["total_assigned"] = total_assigned
-            
-            # Get total leads (assigned cards with inbound messages)
-            cur.execute("""
-                SELECT COUNT(DISTINCT c.card_id)
-                FROM conversations c
-                INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                WHERE ca.user_id = %s
-                  AND c.card_id IS NOT NULL
-                  AND c.last_inbound_at IS NOT NULL
-            """, (user_id,))
-            row = cur.fetchone()
-            total_leads = row[0] if row else 0
-            stats["total_leads"] = total_leads
+            execute_prepared(cur, "rep_stats_by_user", _REP_STATS_SQL, (user_id, seven_days_ago))
+            stats = dict(zip(_REP_STATS_COLUMNS, cur.fetchone()))
+            total_assigned = stats["total_assigned"]
+            total_leads = stats["total_leads"]
             
             # Calculate response rate (leads / assigned)
             response_rate = (total_leads / total_assigned * 100) if total_assigned > 0 else 0
@@ -6074,88 +6108,6 @@ async def rep_get_stats(request: Request):
             close_rate_leads = (stats["closed"] / total_leads * 100) if total_leads > 0 else 0
             stats["close_rate_assigned"] = round(close_rate_assigned, 1)
             stats["close_rate_leads"] = round(close_rate_leads, 1)
-            
-            # Get total conversations (rep mode + assigned cards in AI mode)
-            cur.execute("""
-                SELECT COUNT(DISTINCT c.phone)
-                FROM conversations c
-                INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                WHERE ca.user_id = %s
-                  AND c.card_id IS NOT NULL
-            """, (user_id,))
-            row = cur.fetchone()
-            stats["total_conversations"] = row[0] if row else 0
-            
-            # Get active conversations (with recent activity in last 7 days)
-            from datetime import datetime, timedelta
-            seven_days_ago = datetime.utcnow() - timedelta(days=7)
-            cur.execute("""
-                SELECT COUNT(DISTINCT c.phone)
-                FROM conversations c
-                INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                WHERE ca.user_id = %s
-                  AND c.card_id IS NOT NULL
-                  AND (
-                    c.last_inbound_at >= %s
-                    OR c.last_outbound_at >= %s
-                    OR c.updated_at >= %s
-                  )
-            """, (user_id, seven_days_ago, seven_days_ago, seven_days_ago))
-            row = cur.fetchone()
-            stats["active_conversations"] = row[0] if row else 0
-            
-            # Get messages sent count (outbound messages) - count from history JSONB
-            cur.execute("""
-                SELECT 
-                    SUM(jsonb_array_length(COALESCE(c.history, '[]'::jsonb))) FILTER (
-                        WHERE EXISTS (
-                            SELECT 1 FROM jsonb_array_elements(c.history) AS msg
-                            WHERE msg->>'direction' = 'outbound'
-                        )
-                    )
-                FROM conversations c
-                INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                WHERE ca.user_id = %s
-                  AND c.card_id IS NOT NULL
-                  AND c.history IS NOT NULL
-            """, (user_id,))
-            row = cur.fetchone()
-            # Alternative: count individual messages
-            if row and row[0] is not None:
-                stats["messages_sent"] = int(row[0])
-            else:
-                # Fallback: count by checking history array
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM conversations c
-                    INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                    WHERE ca.user_id = %s
-                      AND c.card_id IS NOT NULL
-                      AND EXISTS (
-                          SELECT 1 FROM jsonb_array_elements(COALESCE(c.history, '[]'::jsonb)) AS msg
-                          WHERE msg->>'direction' = 'outbound'
-                      )
-                """, (user_id,))
-                row = cur.fetchone()
-                stats["messages_sent"] = row[0] if row and row[0] else 0
-            
-            # Get messages received count (inbound messages) - count from history JSONB
-            cur.execute("""
-                SELECT COUNT(*)
-                FROM conversations c
-                INNER JOIN card_assignments ca ON c.card_id = ca.card_id
-                WHERE ca.user_id = %s
-                  AND c.card_id IS NOT NULL
-                  AND EXISTS (
-                      SELECT 1 FROM jsonb_array_elements(COALESCE(c.history, '[]'::jsonb)) AS msg
-                      WHERE msg->>'direction' = 'inbound'
-                  )
-            """, (user_id,))
-            row = cur.fetchone()
-            stats["messages_received"] = row[0] if row and row[0] else 0
-            
-            # Log stats for debugging
-            logger.info(f"[REP_STATS] Rep {user_id} stats: {stats}")
     
     # Ensure all expected keys exist (even if 0)
     default_stats = {
@@ -6177,6 +6129,41 @@ async def rep_get_stats(request: Request):
     # Merge defaults with actual stats
     final_stats = {**default_stats, **stats}
     
-    logger.info(f"[REP_STATS] Returning stats: {final_stats}")
-    return {"ok": True, "stats": final_stats}
+    # One log line per computation (cache misses only); formatted only when DEBUG is on
+    logger.debug("[REP_STATS] %s stats: %s", current_user.get("id"), final_stats)
+    return final_stats
+
+
+def _get_rep_stats_cached(conn: Any, current_user: AuthUser) -> Dict[str, Any]:
+    """_load_rep_stats() behind the TTL cache. Returns a new dict on every call."""
+    key = (current_user["id"], current_user.get("role"))
+    now = time.monotonic()
+    with _rep_stats_lock:
+        entry = _rep_stats_cache.get(key)
+        if entry is not None and now - entry[0] < REP_STATS_CACHE_TTL_SECONDS:
+            _rep_stats_cache.move_to_end(key)
+            return dict(entry[1])
+        generation = _rep_stats_generation
+    
+    stats = _load_rep_stats(conn, current_user)
+    
+    with _rep_stats_lock:
+        if generation == _rep_stats_generation:
+            _rep_stats_cache[key] = (now, stats)
+            _rep_stats_cache.move_to_end(key)
+            while len(_rep_stats_cache) > _REP_STATS_CACHE_MAX:
+                _rep_stats_cache.popitem(last=False)
+    return dict(stats)
+
+
+@app.get("/rep/stats")
+async def rep_get_stats(current_user: Dict = Depends(get_current_owner_or_rep)):
+    """Get conversion metrics. Owner sees all stats, reps see only their own."""
+    final_stats = await run_db(_get_rep_stats_cached, current_user)
+    
+    # Let the browser reuse the response for as long as the server-side cache would
+    return ORJSONResponse(
+        {"ok": True, "stats": final_stats},
+        headers={"Cache-Control": f"private, max-age={REP_STATS_CACHE_TTL_SECONDS}"},
+    )
 